@@ -0,0 +1,640 @@
+"""
+awslimitchecker/aggregate.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import heapq
+import math
+
+#: dimensions that :py:class:`~.Aggregator` can group by
+DIMENSIONS = ('account', 'region', 'service', 'limit')
+
+#: version of the format written by :py:meth:`.Aggregator.to_dict`
+AGGREGATE_FORMAT_VERSION = 1
+
+
+class QuantileSketch(object):
+
+    __slots__ = ('relative_accuracy', '_log_gamma', 'count', 'zero_count',
+                 'buckets')
+
+    def __init__(self, relative_accuracy=0.01):
+        """
+        Mergeable summary of a stream of non-negative values, that estimates
+        quantiles to within ``relative_accuracy`` of the true value. Each
+        value is counted in a logarithmically-sized bucket (values of zero or
+        less in :py:attr:`~.zero_count`), so memory grows with the range of
+        the values rather than their number, and two sketches with the same
+        accuracy are merged by adding their bucket counts.
+
+        :param relative_accuracy: relative error of quantile estimates,
+          between 0 and 1 (exclusive)
+        :type relative_accuracy: float
+        :raises: ValueError
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError('relative_accuracy must be between 0 and 1')
+        self.relative_accuracy = relative_accuracy
+        self._log_gamma = math.log(
+            (1 + relative_accuracy) / (1 - relative_accuracy)
+        )
+        self.count = 0
+        self.zero_count = 0
+        self.buckets = {}
+
+    def add(self, value, count=1):
+        """
+        Add ``count`` occurrences of ``value`` to the sketch.
+
+        :param value: the value to add
+        :type value: :py:obj:`int` or :py:obj:`float`
+        :param count: number of occurrences
+        :type count: int
+        """
+        self.count += count
+        if value <= 0:
+            self.zero_count += count
+            return
+        idx = int(math.ceil(math.log(value) / self._log_gamma))
+        self.buckets[idx] = self.buckets.get(idx, 0) + count
+
+    def merge(self, other):
+        """
+        Add the contents of another sketch to this one.
+
+        :param other: the sketch to merge in
+        :type other: :py:class:`~.QuantileSketch`
+        :raises: ValueError if the sketches' accuracies differ
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(
+                'Cannot merge sketches with different relative accuracy'
+            )
+        self.count += other.count
+        self.zero_count += other.zero_count
+        for idx, count in other.buckets.items():
+            self.buckets[idx] = self.buckets.get(idx, 0) + count
+
+    def quantile(self, q):
+        """
+        Return the estimated ``q`` quantile of the values added, or None if
+        the sketch is empty.
+
+        :param q: the quantile, between 0 and 1 (inclusive)
+        :type q: float
+        :rtype: :py:obj:`float` or :py:data:`None`
+        :raises: ValueError
+        """
+        if not 0 <= q <= 1:
+            raise ValueError('quantile must be between 0 and 1')
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if seen > rank:
+            return 0.0
+        gamma = math.exp(self._log_gamma)
+        for idx in sorted(self.buckets):
+            seen += self.buckets[idx]
+            if seen > rank:
+                return 2 * math.pow(gamma, idx) / (gamma + 1)
+        # only reachable through floating point rounding of ``rank``
+        return 2 * math.pow(gamma, max(self.buckets)) / (gamma + 1)
+
+    def to_dict(self):
+        """
+        Return the sketch as JSON-serializable plain values; see
+        :py:meth:`~.from_dict`.
+
+        :rtype: dict
+        """
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'count': self.count,
+            'zero_count': self.zero_count,
+            'buckets': dict((str(k), v) for k, v in self.buckets.items())
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Return a sketch from the output of :py:meth:`~.to_dict`.
+
+        :param data: the sketch's plain values
+        :type data: dict
+        :rtype: :py:class:`~.QuantileSketch`
+        """
+        sketch = cls(data['relative_accuracy'])
+        sketch.count = data['count']
+        sketch.zero_count = data['zero_count']
+        sketch.buckets = dict(
+            (int(k), v) for k, v in data['buckets'].items()
+        )
+        return sketch
+
+
+class Rollup(object):
+
+    __slots__ = ('top_k', 'count', 'total', 'maximum', 'max_utilization',
+                 'usage', 'utilization', '_top')
+
+    def __init__(self, top_k=10, relative_accuracy=0.01):
+        """
+        Streaming, mergeable summary of the usage rows in one group of an
+        :py:class:`~.Aggregator`. ``count``, ``total`` and ``maximum`` (the
+        number, sum and largest of the usage values) and ``max_utilization``
+        (the largest usage as a percentage of its limit) are exact. Quantiles
+        are estimated by :py:class:`~.QuantileSketch` instances, and only the
+        ``top_k`` rows with the highest utilization are kept.
+
+        :param top_k: number of highest-utilization rows to keep
+        :type top_k: int
+        :param relative_accuracy: relative accuracy of quantile estimates
+        :type relative_accuracy: float
+        """
+        self.top_k = top_k
+        self.count = 0
+        self.total = 0
+        self.maximum = None
+        self.max_utilization = None
+        #: sketch of usage values
+        self.usage = QuantileSketch(relative_accuracy)
+        #: sketch of utilization percentages (rows with a known limit only)
+        self.utilization = QuantileSketch(relative_accuracy)
+        # min-heap of (utilization or -1, value, row key)
+        self._top = []
+
+    def add(self, value, utilization=None, key=None):
+        """
+        Add one usage row.
+
+        :param value: the usage value
+        :type value: :py:obj:`int` or :py:obj:`float`
+        :param utilization: the usage as a percentage of its limit, or None
+          if the limit is unknown or unlimited
+        :type utilization: :py:obj:`float` or :py:data:`None`
+        :param key: (account, region, service, limit, resource ID) tuple
+          identifying the row; rows added without one are listed in
+          :py:meth:`~.get_top` with an empty tuple
+        :type key: :py:obj:`tuple` or :py:data:`None`
+        """
+        self.count += 1
+        self.total += value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+        self.usage.add(value)
+        if utilization is not None:
+            self.utilization.add(utilization)
+            if (
+                self.max_utilization is None or
+                utilization > self.max_utilization
+            ):
+                self.max_utilization = utilization
+        self._push((
+            -1 if utilization is None else utilization, value,
+            () if key is None else tuple(key)
+        ))
+
+    def _push(self, item):
+        """
+        Offer one (rank, value, key) item to the top rows heap.
+
+        :param item: heap item
+        :type item: tuple
+        """
+        if len(self._top) < self.top_k:
+            heapq.heappush(self._top, item)
+        elif item > self._top[0]:
+            heapq.heapreplace(self._top, item)
+
+    def merge(self, other):
+        """
+        Add the contents of another rollup to this one.
+
+        :param other: the rollup to merge in
+        :type other: :py:class:`~.Rollup`
+        :raises: ValueError if the rollups' quantile accuracies differ
+        """
+        self.usage.merge(other.usage)
+        self.utilization.merge(other.utilization)
+        self.count += other.count
+        self.total += other.total
+        if other.maximum is not None and (
+            self.maximum is None or other.maximum > self.maximum
+        ):
+            self.maximum = other.maximum
+        if other.max_utilization is not None and (
+            self.max_utilization is None or
+            other.max_utilization > self.max_utilization
+        ):
+            self.max_utilization = other.max_utilization
+        for item in other._top:
+            self._push(item)
+
+    @property
+    def mean(self):
+        """
+        The mean usage value, or None if no rows have been added.
+
+        :rtype: :py:obj:`float` or :py:data:`None`
+        """
+        if self.count == 0:
+            return None
+        return self.total / float(self.count)
+
+    def quantile(self, q):
+        """
+        Return the estimated ``q`` quantile of the usage values.
+
+        :param q: the quantile, between 0 and 1
+        :type q: float
+        :rtype: :py:obj:`float` or :py:data:`None`
+        """
+        return self.usage.quantile(q)
+
+    def utilization_quantile(self, q):
+        """
+        Return the estimated ``q`` quantile of the utilization percentages.
+
+        :param q: the quantile, between 0 and 1
+        :type q: float
+        :rtype: :py:obj:`float` or :py:data:`None`
+        """
+        return self.utilization.quantile(q)
+
+    @property
+    def p95(self):
+        """
+        The estimated 95th percentile of the usage values.
+
+        :rtype: :py:obj:`float` or :py:data:`None`
+        """
+        return self.quantile(0.95)
+
+    def get_top(self):
+        """
+        Return the kept highest-utilization rows, highest first. Rows with an
+        unknown limit are ranked below all others, by value.
+
+        :returns: list of (utilization, value, (account, region, service,
+          limit, resource ID)) tuples; utilization is None for rows with an
+          unknown limit
+        :rtype: list
+        """
+        return [
+            (None if rank == -1 else rank, value, key)
+            for rank, value, key in sorted(self._top, reverse=True)
+        ]
+
+    def to_dict(self):
+        """
+        Return the rollup as JSON-serializable plain values; see
+        :py:meth:`~.from_dict`.
+
+        :rtype: dict
+        """
+        return {
+            'top_k': self.top_k,
+            'count': self.count,
+            'total': self.total,
+            'maximum': self.maximum,
+            'max_utilization': self.max_utilization,
+            'usage': self.usage.to_dict(),
+            'utilization': self.utilization.to_dict(),
+            'top': [[r, v, list(k)] for r, v, k in self._top]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Return a rollup from the output of :py:meth:`~.to_dict`.
+
+        :param data: the rollup's plain values
+        :type data: dict
+        :rtype: :py:class:`~.Rollup`
+        """
+        rollup = cls(top_k=data['top_k'])
+        rollup.count = data['count']
+        rollup.total = data['total']
+        rollup.maximum = data['maximum']
+        rollup.max_utilization = data['max_utilization']
+        rollup.usage = QuantileSketch.from_dict(data['usage'])
+        rollup.utilization = QuantileSketch.from_dict(data['utilization'])
+        rollup._top = [(r, v, tuple(k)) for r, v, k in data['top']]
+        heapq.heapify(rollup._top)
+        return rollup
+
+
+class Aggregator(object):
+
+    def __init__(self, group_by=('service', 'limit'), top_k=10,
+                 relative_accuracy=0.01):
+        """
+        Roll up the usage of limits from many (account, region) results into
+        one :py:class:`~.Rollup` per group, for example the total vCPUs of an
+        organization, or the region with the highest Elastic IP utilization.
+        Usage rows are summarized as they are added and not kept, and
+        aggregators with the same settings can be merged with
+        :py:meth:`~.merge`, or saved with :py:meth:`~.to_dict` and combined
+        later, so partial aggregates from separate runs (or shards) roll up
+        into the same result.
+
+        :param group_by: the :py:data:`~.DIMENSIONS` to group by, in the
+          order they appear in group keys; an empty sequence rolls
+          everything up into one group
+        :type group_by: tuple
+        :param top_k: number of highest-utilization rows to keep per group
+        :type top_k: int
+        :param relative_accuracy: relative accuracy of quantile estimates
+        :type relative_accuracy: float
+        :raises: ValueError
+        """
+        group_by = tuple(group_by)
+        unknown = [x for x in group_by if x not in DIMENSIONS]
+        if len(unknown) > 0:
+            raise ValueError(
+                'Unknown group_by dimension(s): %s' % ', '.join(unknown)
+            )
+        if len(set(group_by)) != len(group_by):
+            raise ValueError('group_by dimensions must be unique')
+        if top_k < 1:
+            raise ValueError('top_k must be at least 1')
+        # validates relative_accuracy
+        QuantileSketch(relative_accuracy)
+        self.group_by = group_by
+        self.top_k = top_k
+        self.relative_accuracy = relative_accuracy
+        self._indexes = [DIMENSIONS.index(x) for x in group_by]
+        self._rollups = {}
+
+    def _rollup(self, key):
+        """
+        Return the rollup for the group that a row key belongs to, creating
+        it if needed.
+
+        :param key: (account, region, service, limit, resource ID) tuple
+        :type key: tuple
+        :rtype: :py:class:`~.Rollup`
+        """
+        group = tuple(key[i] for i in self._indexes)
+        rollup = self._rollups.get(group)
+        if rollup is None:
+            rollup = Rollup(self.top_k, self.relative_accuracy)
+            self._rollups[group] = rollup
+        return rollup
+
+    def add_usage(self, account_id, region, service_name, limit_name, value,
+                  limit=None, resource_id=None):
+        """
+        Add one usage row.
+
+        :param account_id: the account the usage is in
+        :type account_id: str
+        :param region: the region the usage is in
+        :type region: str
+        :param service_name: name of the limit's service
+        :type service_name: str
+        :param limit_name: name of the limit
+        :type limit_name: str
+        :param value: the usage value
+        :type value: :py:obj:`int` or :py:obj:`float`
+        :param limit: the limit that applies to this usage, or None if it is
+          unknown or unlimited
+        :type limit: :py:obj:`int` or :py:obj:`float`
+        :param resource_id: the resource the usage is for, if any
+        :type resource_id: str
+        """
+        key = (
+            account_id or '', region or '', service_name, limit_name,
+            resource_id or ''
+        )
+        utilization = None
+        if limit:
+            utilization = value * 100.0 / limit
+        self._rollup(key).add(value, utilization=utilization, key=key)
+
+    def add_limit(self, limit, account_id=None, region=None):
+        """
+        Add every current usage row of one limit.
+
+        For limits created with ``retain_top``, usage that was not retained
+        is included in each group's ``count`` and ``total``, but not in its
+        quantiles or top rows. A multi-account :py:class:`~.LimitSummary`
+        only has its largest usage.
+
+        :param limit: the limit; an :py:class:`~.AwsLimit`, or anything with
+          the same ``service``, ``name``, ``get_limit()`` and
+          ``get_current_usage()`` interface, such as a
+          :py:class:`~.LimitSummary`
+        :type limit: :py:class:`~.AwsLimit`
+        :param account_id: the account the limit is in
+        :type account_id: str
+        :param region: the region the limit is in
+        :type region: str
+        """
+        effective = limit.get_limit()
+        count = 0
+        total = 0
+        for usage in limit.get_current_usage():
+            maximum = usage.get_maximum()
+            self.add_usage(
+                account_id, region, limit.service.service_name, limit.name,
+                usage.get_value(),
+                limit=maximum if maximum else effective,
+                resource_id=usage.resource_id
+            )
+            count += 1
+            total += usage.get_value()
+        if getattr(limit, 'retain_top', None) is None:
+            return
+        # count the usage that was not retained in the exact totals
+        stats = limit.get_usage_stats()
+        if stats.count > count:
+            rollup = self._rollup((
+                account_id or '', region or '', limit.service.service_name,
+                limit.name, ''
+            ))
+            rollup.count += stats.count - count
+            rollup.total += stats.total - total
+            if rollup.maximum is None or stats.maximum > rollup.maximum:
+                rollup.maximum = stats.maximum
+
+    def add_limits(self, limits, account_id=None, region=None):
+        """
+        Add every limit in the return value of
+        :py:meth:`.AwsLimitChecker.get_limits` or
+        :py:meth:`.AwsLimitChecker.check_thresholds` for one account and
+        region.
+
+        :param limits: dict of service name to dict of limit name to
+          :py:class:`~.AwsLimit`
+        :type limits: dict
+        :param account_id: the account the limits are in
+        :type account_id: str
+        :param region: the region the limits are in
+        :type region: str
+        """
+        for svc_name in sorted(limits.keys()):
+            for lim_name in sorted(limits[svc_name].keys()):
+                self.add_limit(
+                    limits[svc_name][lim_name], account_id=account_id,
+                    region=region
+                )
+
+    def add_result(self, result):
+        """
+        Add every limit of one multi-account :py:class:`~.JobResult`.
+
+        :param result: the result of checking one account in one region
+        :type result: :py:class:`~.JobResult`
+        """
+        for lim in result.limits:
+            self.add_limit(
+                lim, account_id=result.account_id, region=result.region
+            )
+
+    def _check_compatible(self, group_by, top_k, relative_accuracy):
+        """
+        Raise ValueError unless the given settings match this aggregator's.
+        """
+        if (
+            tuple(group_by) != self.group_by or top_k != self.top_k or
+            relative_accuracy != self.relative_accuracy
+        ):
+            raise ValueError(
+                'Cannot merge aggregates with different group_by, top_k or '
+                'relative_accuracy'
+            )
+
+    def merge(self, other):
+        """
+        Add the rollups of another aggregator, which must have the same
+        ``group_by``, ``top_k`` and ``relative_accuracy``.
+
+        :param other: the aggregator to merge in
+        :type other: :py:class:`~.Aggregator`
+        :raises: ValueError
+        """
+        self._check_compatible(
+            other.group_by, other.top_k, other.relative_accuracy
+        )
+        for group, rollup in other._rollups.items():
+            mine = self._rollups.get(group)
+            if mine is None:
+                mine = Rollup(self.top_k, self.relative_accuracy)
+                self._rollups[group] = mine
+            mine.merge(rollup)
+
+    def get_rollups(self):
+        """
+        Return the rollup of every group.
+
+        :returns: dict of group key (a tuple of the ``group_by`` dimension
+          values, in order) to :py:class:`~.Rollup`
+        :rtype: dict
+        """
+        return dict(self._rollups)
+
+    def ranked(self, attribute='max_utilization', count=None):
+        """
+        Return groups ordered by a rollup attribute (or property), highest
+        first, omitting groups where it is None. For example, grouping
+        Elastic IP usage by region, ``ranked('max_utilization', 1)`` is the
+        region with the highest utilization.
+
+        :param attribute: name of the :py:class:`~.Rollup` attribute to rank
+          by, such as ``total``, ``maximum``, ``max_utilization``, ``mean``
+          or ``p95``
+        :type attribute: str
+        :param count: return at most this many groups
+        :type count: int
+        :returns: list of (group key, :py:class:`~.Rollup`) tuples
+        :rtype: list
+        """
+        res = [
+            (group, rollup) for group, rollup in self._rollups.items()
+            if getattr(rollup, attribute) is not None
+        ]
+        res.sort(key=lambda x: (getattr(x[1], attribute), x[0]), reverse=True)
+        if count is not None:
+            res = res[:count]
+        return res
+
+    def to_dict(self):
+        """
+        Return the aggregate as JSON-serializable plain values, to be combined
+        with other partial aggregates later; see :py:meth:`~.from_dict`.
+
+        :rtype: dict
+        """
+        return {
+            'format': 'awslimitchecker-aggregate',
+            'version': AGGREGATE_FORMAT_VERSION,
+            'group_by': list(self.group_by),
+            'top_k': self.top_k,
+            'relative_accuracy': self.relative_accuracy,
+            'groups': [
+                {'key': list(group), 'rollup': self._rollups[group].to_dict()}
+                for group in sorted(self._rollups.keys())
+            ]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Return an aggregator from the output of :py:meth:`~.to_dict`.
+
+        :param data: the aggregate's plain values
+        :type data: dict
+        :rtype: :py:class:`~.Aggregator`
+        :raises: ValueError if ``data`` is not a supported aggregate
+        """
+        if data.get('format') != 'awslimitchecker-aggregate':
+            raise ValueError('Not an awslimitchecker aggregate')
+        if data.get('version') != AGGREGATE_FORMAT_VERSION:
+            raise ValueError(
+                'Unsupported aggregate version: %s' % data.get('version')
+            )
+        agg = cls(
+            group_by=data['group_by'], top_k=data['top_k'],
+            relative_accuracy=data['relative_accuracy']
+        )
+        for group in data['groups']:
+            agg._rollups[tuple(group['key'])] = Rollup.from_dict(
+                group['rollup']
+            )
+        return agg
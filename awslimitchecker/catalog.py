@@ -0,0 +1,301 @@
+"""
+awslimitchecker/catalog.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import json
+import logging
+import os
+
+from awslimitchecker.version import _VERSION
+
+logger = logging.getLogger(__name__)
+
+#: Path to the precompiled catalog shipped alongside the package.
+CATALOG_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'catalog.json'
+)
+
+#: Region name used to compute the generic (non-region-specific) defaults.
+GENERIC_REGION = 'generic'
+
+#: Regions whose hard-coded defaults differ from the generic ones; the
+#: differences are stored per-region in the catalog.
+CATALOG_REGIONS = ['us-east-1', 'us-west-2', 'eu-west-1']
+
+#: Region name prefixes whose defaults are not described by the catalog
+#: (i.e. EC2 per-instance-type limits); these require the full checker.
+UNSUPPORTED_REGION_PREFIXES = ['cn-', 'us-gov-']
+
+
+def _limit_metadata(lim):
+    """
+    Return the catalog representation of one :py:class:`~.AwsLimit`.
+
+    :param lim: the limit to describe
+    :type lim: :py:class:`~.AwsLimit`
+    :rtype: dict
+    """
+    return {
+        'default_limit': lim.default_limit,
+        'limit_type': lim.limit_type,
+        'limit_subtype': lim.limit_subtype,
+        'ta_service_name': lim.ta_service_name,
+        'ta_limit_name': lim.ta_limit_name,
+        'quotas_service_code': lim.quotas_service_code,
+        'quota_name': lim.quota_name,
+        'quotas_unit': lim.quotas_unit,
+        'quotas_code': lim.quotas_code
+    }
+
+
+def _service_instances(region_name):
+    """
+    Instantiate every registered service for ``region_name``, without a
+    Service Quotas client. No AWS API calls are made.
+
+    :param region_name: region name to pass as a boto connection kwarg
+    :type region_name: str
+    :returns: dict of service name to :py:class:`~._AwsService` instance
+    :rtype: dict
+    """
+    from awslimitchecker.services import _services
+    kwargs = {'region_name': region_name}
+    return dict(
+        (sname, _services[sname](80, 99, kwargs, None))
+        for sname in sorted(_services.keys())
+    )
+
+
+def generate_catalog():
+    """
+    Build the catalog from the service classes themselves. This imports
+    every service module (and therefore boto3), so it is only intended to
+    be run at build time via ``python -m awslimitchecker.catalog``.
+
+    :returns: catalog data, suitable for JSON serialization
+    :rtype: dict
+    """
+    from awslimitchecker.checker import _BASE_REQUIRED_IAM_ACTIONS
+    vcpu_env = os.environ.pop('USE_VCPU_LIMITS', None)
+    try:
+        generic = _service_instances(GENERIC_REGION)
+        regional = dict(
+            (region, _service_instances(region)) for region in CATALOG_REGIONS
+        )
+    finally:
+        if vcpu_env is not None:
+            os.environ['USE_VCPU_LIMITS'] = vcpu_env
+    services = {}
+    for sname, svc in generic.items():
+        services[sname] = {
+            'api_name': svc.api_name,
+            'quotas_service_code': svc.quotas_service_code,
+            'is_global': svc.is_global,
+            'iam_permissions': sorted(set(svc.required_iam_permissions())),
+            'limits': dict(
+                (lname, _limit_metadata(lim))
+                for lname, lim in svc.get_limits().items()
+            )
+        }
+    region_defaults = {}
+    for region, svcs in regional.items():
+        diffs = {}
+        for sname, svc in svcs.items():
+            generic_limits = services[sname]['limits']
+            limits = svc.get_limits()
+            if sorted(limits.keys()) != sorted(generic_limits.keys()):
+                raise RuntimeError(
+                    'Limit names for service %s in region %s differ from '
+                    'the generic limit names' % (sname, region)
+                )
+            for lname, lim in limits.items():
+                if lim.default_limit != generic_limits[lname]['default_limit']:
+                    diffs.setdefault(sname, {})[lname] = lim.default_limit
+        if diffs:
+            region_defaults[region] = diffs
+    return {
+        'version': _VERSION,
+        'base_iam_actions': sorted(_BASE_REQUIRED_IAM_ACTIONS),
+        'unsupported_region_prefixes': UNSUPPORTED_REGION_PREFIXES,
+        'services': services,
+        'region_defaults': region_defaults
+    }
+
+
+def write_catalog(path=CATALOG_PATH):
+    """
+    Generate the catalog and write it to ``path`` as JSON.
+
+    :param path: path to write the catalog to
+    :type path: str
+    """
+    data = generate_catalog()
+    with open(path, 'w') as fh:
+        fh.write(json.dumps(data, sort_keys=True, indent=1))
+        fh.write("\n")
+    logger.info('Wrote catalog for %d services to %s',
+                len(data['services']), path)
+
+
+class LimitCatalog(object):
+
+    def __init__(self, data):
+        """
+        Precompiled, read-only description of every service's limits and
+        required IAM permissions. This lets metadata-only commands
+        (``--list-services``, ``--list-defaults`` and ``--iam-policy``) be
+        answered without importing the service modules or constructing an
+        :py:class:`~.AwsLimitChecker`.
+
+        :param data: catalog data, as returned by :py:func:`~.generate_catalog`
+        :type data: dict
+        """
+        self.data = data
+
+    @classmethod
+    def load(cls, path=CATALOG_PATH):
+        """
+        Load the catalog from ``path``. Return None if it is missing,
+        unreadable, or was generated for a different awslimitchecker version.
+
+        :param path: path to the JSON catalog
+        :type path: str
+        :rtype: :py:class:`~.LimitCatalog` or ``None``
+        """
+        try:
+            with open(path, 'r') as fh:
+                data = json.loads(fh.read())
+        except (IOError, OSError, ValueError):
+            logger.debug('Unable to load limit catalog from %s', path,
+                         exc_info=True)
+            return None
+        if data.get('version') != _VERSION:
+            logger.debug('Ignoring limit catalog for version %s (running %s)',
+                         data.get('version'), _VERSION)
+            return None
+        return cls(data)
+
+    def for_services(self, service_names):
+        """
+        Return a new catalog restricted to the named services, or None if
+        any of the names are unknown.
+
+        :param service_names: names of the services to keep
+        :type service_names: list
+        :rtype: :py:class:`~.LimitCatalog` or ``None``
+        """
+        services = self.data['services']
+        if any(sname not in services for sname in service_names):
+            return None
+        data = dict(self.data)
+        data['services'] = dict(
+            (sname, services[sname]) for sname in service_names
+        )
+        return LimitCatalog(data)
+
+    def get_service_names(self):
+        """
+        Return a list of all service names in the catalog.
+
+        :rtype: list
+        """
+        return sorted(self.data['services'].keys())
+
+    def supports_region(self, region_name):
+        """
+        Return whether the catalog's default limits are valid for
+        ``region_name`` in the current environment.
+
+        :param region_name: AWS region name, or None if unknown
+        :type region_name: str
+        :rtype: bool
+        """
+        if 'USE_VCPU_LIMITS' in os.environ:
+            return False
+        if region_name is None:
+            return True
+        for prefix in self.data['unsupported_region_prefixes']:
+            if region_name.startswith(prefix):
+                return False
+        return True
+
+    def get_default_limits(self, region_name):
+        """
+        Return the hard-coded default limit values for each service in
+        ``region_name``, in the same form as ``--list-defaults`` prints them.
+
+        :param region_name: AWS region name, or None if unknown
+        :type region_name: str
+        :returns: dict of service name to dict of limit name to default
+        :rtype: dict
+        """
+        regional = self.data['region_defaults'].get(region_name, {})
+        res = {}
+        for sname, svc in self.data['services'].items():
+            overrides = regional.get(sname, {})
+            res[sname] = dict(
+                (lname, overrides.get(lname, lim['default_limit']))
+                for lname, lim in svc['limits'].items()
+            )
+        return res
+
+    def get_required_iam_policy(self):
+        """
+        Return an IAM policy granting all of the permissions needed for the
+        catalog's services, identical to
+        :py:meth:`~.AwsLimitChecker.get_required_iam_policy`.
+
+        :returns: dict representation of IAM Policy
+        :rtype: dict
+        """
+        actions = set(self.data['base_iam_actions'])
+        for svc in self.data['services'].values():
+            actions.update(svc['iam_permissions'])
+        return {
+            'Version': '2012-10-17',
+            'Statement': [{
+                'Effect': 'Allow',
+                'Resource': '*',
+                'Action': sorted(actions),
+            }],
+        }
+
+
+if __name__ == "__main__":  # pragma: no cover
+    logging.basicConfig(level=logging.INFO)
+    write_catalog()
@@ -37,15 +37,23 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 ################################################################################
 """
 
-from .connectable import ConnectableCredentials
+from .connectable import (
+    ConnectableCredentials, RefreshableRoleCredentials, SESSION_KWARG,
+    ACCOUNT_KWARG, boto3_client
+)
 from .services import _services
+from .limit import _collection_run
 from .trustedadvisor import TrustedAdvisor
+from .limitindex import LimitIndex
 from .version import _get_version_info
-from .utils import _get_latest_version
+from .utils import _LatestVersionCheck, _DurationHistory
 from .quotas import ServiceQuotasClient
+from .thresholds import ColumnarThresholds
 import boto3
 import sys
 import logging
+import threading
+import time
 import warnings
 
 logger = logging.getLogger(__name__)
@@ -57,6 +65,22 @@ warnings.filterwarnings(
     action="always", category=PendingDeprecationWarning, module=__name__
 )
 
+#: IAM actions required by awslimitchecker itself, regardless of services
+_BASE_REQUIRED_IAM_ACTIONS = [
+    'cloudwatch:GetMetricData',
+    'ec2:DescribeRegions',
+    'servicequotas:GetServiceQuota',
+    'servicequotas:ListServiceQuotas',
+    'support:DescribeTrustedAdvisorCheckRefreshStatuses',
+    'support:DescribeTrustedAdvisorCheckResult',
+    'support:DescribeTrustedAdvisorCheckSummaries',
+    'support:DescribeTrustedAdvisorChecks',
+    'support:RefreshTrustedAdvisorCheck',
+    'sts:GetCallerIdentity',
+    'trustedadvisor:Describe*',
+    'trustedadvisor:RefreshCheck'
+]
+
 
 class AwsLimitChecker(object):
 
@@ -65,14 +89,19 @@ class AwsLimitChecker(object):
                  role_partition='aws', region=None, external_id=None,
                  mfa_serial_number=None, mfa_token=None, ta_refresh_mode=None,
                  ta_refresh_timeout=None, ta_api_region='us-east-1',
-                 check_version=True, skip_quotas=False):
+                 check_version=True, skip_quotas=False, services=None,
+                 version_check_interval=86400, ta_cache=True,
+                 columnar_thresholds=False, credentials=None,
+                 run_timeout=None, service_timeout=None,
+                 duration_history=False):
         """
         Main AwsLimitChecker class - this should be the only externally-used
         portion of awslimitchecker.
 
         Constructor builds ``self.services`` as a dict of service_name (str)
         to :py:class:`~._AwsService` instance, and sets limit
-        thresholds.
+        thresholds. Only the modules for the selected ``services`` are
+        imported.
 
         :param warning_threshold: the default warning threshold, as an
           integer percentage, for any limits without a specifically-set
@@ -135,11 +164,57 @@ class AwsLimitChecker(object):
           non GovCloud accounts.
         :type ta_api_region: str
         :param check_version: Whether or not to check for latest version of
-          awslimitchecker on PyPI during instantiation.
+          awslimitchecker on PyPI. The check runs in a background thread
+          started during instantiation; its result is logged at the end of
+          :py:meth:`~.find_usage` or :py:meth:`~.check_thresholds`.
         :type check_version: bool
         :param skip_quotas: If set to True, do not connect to Service Quotas
           service or use it to obtain current limits.
         :type skip_quotas: bool
+        :param services: the names of the services to check; if None, all
+          known services are loaded. Services not listed here are never
+          imported or instantiated.
+        :type services: :py:obj:`list` or :py:data:`None`
+        :param version_check_interval: number of seconds to cache the result
+          of the latest version check on disk for; 0 disables the cache.
+        :type version_check_interval: int
+        :param ta_cache: Whether to cache parsed Trusted Advisor results on
+          disk, per account and region, and reuse them while the check's
+          timestamp is unchanged.
+        :type ta_cache: bool
+        :param columnar_thresholds: Whether :py:meth:`~.check_thresholds`
+          should evaluate all limits in one pass with
+          :py:class:`~.ColumnarThresholds` (using NumPy if it is installed),
+          instead of limit by limit. Results are the same either way.
+        :type columnar_thresholds: bool
+        :param credentials: (optional) already-resolved credentials to connect
+          with, as the boto3 keyword arguments returned by
+          :py:meth:`~.get_credentials` of another checker. If given, neither
+          STS nor ``profile_name`` is used to obtain credentials.
+        :type credentials: :py:obj:`dict` or :py:data:`None`
+        :param run_timeout: (optional) number of seconds that each
+          :py:meth:`~.find_usage` or :py:meth:`~.check_thresholds` call may
+          spend collecting usage. Services still running at the deadline are
+          abandoned, and services not yet started are skipped; their limits
+          are marked unknown (see :py:meth:`~.get_unknown_services`). The
+          Trusted Advisor poll and refresh wait are bounded by the same
+          deadline; if they overrun, Trusted Advisor limits are not used.
+        :type run_timeout: :py:obj:`float` or :py:data:`None`
+        :param service_timeout: (optional) number of seconds each service may
+          spend collecting usage before it is abandoned, either one number
+          for every service or a dict of service name to seconds (services
+          not in the dict have no budget).
+        :type service_timeout: :py:obj:`float`, :py:obj:`dict` or
+          :py:data:`None`
+        :param duration_history: Whether to record how long each service
+          takes to collect usage in an on-disk history, per account and
+          region, used by :py:meth:`~.get_service_order` to check the
+          slowest services first. The history file is shared by every
+          process using the same cache directory; the ``awslimitchecker``
+          command line enables it.
+        :type duration_history: bool
+        :raises: :py:exc:`ValueError` if ``services`` contains an unknown
+          service name
         """
         # ###### IMPORTANT license notice ##########
         # Pursuant to Sections 5(b) and 13 of the GNU Affero General Public
@@ -164,14 +239,12 @@ class AwsLimitChecker(object):
                 self.vinfo.url
             )
         )
+        self._version_check = None
         if check_version:
-            latest_ver = _get_latest_version()
-            if latest_ver is not None:
-                logger.warning(
-                    'You are running awslimitchecker %s, but the latest version'
-                    ' is %s; please consider upgrading.', self.vinfo.release,
-                    latest_ver
-                )
+            self._version_check = _LatestVersionCheck(
+                cache_interval=version_check_interval
+            )
+            self._version_check.start()
         self._check_python_version()
         self.warning_threshold = warning_threshold
         self.critical_threshold = critical_threshold
@@ -183,24 +256,71 @@ class AwsLimitChecker(object):
         self.mfa_serial_number = mfa_serial_number
         self.mfa_token = mfa_token
         self.region = region
+        self.columnar_thresholds = columnar_thresholds
+        self.credentials = credentials
+        self.run_timeout = run_timeout
+        self.service_timeout = service_timeout
+        self._unknown_services = {}
+        self._service_durations = {}
+        self._abandoned = {}
+        self._run_token = 0
+        self._duration_history = None
+        if duration_history:
+            self._duration_history = _DurationHistory(
+                '%s/%s' % (account_id or 'default', region or 'default')
+            )
 
         self.services = {}
+        self.limit_index = LimitIndex()
 
         boto_conn_kwargs = self._boto_conn_kwargs
+        self._resolved_credentials = dict(
+            (k, v) for k, v in boto_conn_kwargs.items() if k != 'region_name'
+        )
         self._quotas_client = None
         if not skip_quotas:
             self._quotas_client = ServiceQuotasClient(boto_conn_kwargs)
-        for sname, cls in _services.items():
-            self.services[sname] = cls(warning_threshold,
-                                       critical_threshold,
-                                       boto_conn_kwargs,
-                                       self._quotas_client)
+        if services is None:
+            services = list(_services.keys())
+        unknown = [x for x in services if x not in _services]
+        if len(unknown) > 0:
+            raise ValueError(
+                'Unknown service name(s): %s' % ', '.join(sorted(unknown))
+            )
+        for sname in services:
+            self.services[sname] = _services[sname](warning_threshold,
+                                                    critical_threshold,
+                                                    boto_conn_kwargs,
+                                                    self._quotas_client)
+            self.limit_index.add_service(self.services[sname])
 
         self.ta = TrustedAdvisor(self.services,
                                  boto_conn_kwargs,
                                  ta_refresh_mode=ta_refresh_mode,
                                  ta_refresh_timeout=ta_refresh_timeout,
-                                 ta_api_region=ta_api_region)
+                                 ta_api_region=ta_api_region,
+                                 cache_results=ta_cache,
+                                 limit_index=self.limit_index)
+
+    def _log_latest_version(self):
+        """
+        If the background latest-version check has finished, warn if a newer
+        release of awslimitchecker is available. This never waits for the
+        check, and logs its result at most once.
+        """
+        if self._version_check is None:
+            return
+        finished, latest_ver = self._version_check.result()
+        if not finished:
+            logger.debug('Latest version check has not finished; skipping')
+            return
+        self._version_check = None
+        if latest_ver is not None:
+            logger.warning(
+                'You are running awslimitchecker %s, but the latest version'
+                ' is %s; please consider upgrading.', self.vinfo.release,
+                latest_ver
+            )
 
     def _check_python_version(self):
         """
@@ -251,21 +371,43 @@ class AwsLimitChecker(object):
         """
         Generate keyword arguments for boto3 connection functions.
 
-        If ``self.account_id`` is defined, this will call
+        If ``self.credentials`` is defined, those credentials are used as-is.
+        Otherwise, if ``self.account_id`` is defined, this will call
+        :py:meth:`~._get_refreshable_session` to assume the role via STS and
+        include the resulting session (under the
+        :py:data:`~.connectable.SESSION_KWARG` key) in the return value, so
+        that every client uses the same credentials and they are renewed
+        before they expire. If an MFA serial number or token is given, the
+        role can only be assumed once, so this instead calls
         :py:meth:`~._get_sts_token` to get STS token credentials using
         `boto3.STS.Client.assume_role <https://boto3.readthedocs.org/en/
-        latest/reference/services/sts.html#STS.Client.assume_role>`_ and include
-        those credentials in the return value.
+        latest/reference/services/sts.html#STS.Client.assume_role>`_ and
+        includes those credentials in the return value.
 
         If ``self.profile_name`` is defined, this will call `boto3.Session()
         <http://boto3.readthedocs.io/en/latest/reference/core/session.html>`
         with that profile and include those credentials in the return value.
 
+        If ``self.account_id`` is defined, it is included under the
+        :py:data:`~.connectable.ACCOUNT_KWARG` key, so that the clients share
+        API rate limits (see :py:mod:`~.ratelimit`) with other clients for
+        the same account.
+
         :return: keyword arguments for boto3 connection functions
         :rtype: dict
         """
         kwargs = {'region_name': self.region}
-        if self.account_id is not None:
+        if self.credentials is not None:
+            logger.debug("Using shared credentials (region: %s)", self.region)
+            kwargs.update(self.credentials)
+        elif self.account_id is not None and (
+            self.mfa_serial_number is None and self.mfa_token is None
+        ):
+            logger.debug("Connecting for account %s role '%s' with "
+                         "refreshable STS credentials (region: %s)",
+                         self.account_id, self.account_role, self.region)
+            kwargs[SESSION_KWARG] = self._get_refreshable_session()
+        elif self.account_id is not None:
             logger.debug("Connecting for account %s role '%s' with STS "
                          "(region: %s)", self.account_id, self.account_role,
                          self.region)
@@ -283,8 +425,53 @@ class AwsLimitChecker(object):
             kwargs['aws_session_token'] = credentials.token
         else:
             logger.debug("Connecting to region %s", self.region)
+        if self.account_id is not None:
+            kwargs[ACCOUNT_KWARG] = self.account_id
         return kwargs
 
+    def get_credentials(self):
+        """
+        Return the credentials this checker resolved when it was constructed
+        (from ``credentials``, STS or ``profile_name``), as boto3 connection
+        keyword arguments suitable for the ``credentials`` parameter of
+        another checker. This is empty if boto3's default credential chain is
+        used. For refreshable STS credentials, the other checker shares this
+        checker's session, and so the same credentials and their refreshes.
+
+        :rtype: dict
+        """
+        return dict(self._resolved_credentials)
+
+    def set_current_account_id(self, account_id):
+        """
+        Record the numeric ID of the account being checked, so that services
+        and Trusted Advisor do not each look it up with
+        ``sts:GetCallerIdentity``.
+
+        :param account_id: AWS Account ID
+        :type account_id: str
+        """
+        for cls in self.services.values():
+            cls._current_account_id = account_id
+        self.ta._account_id = account_id
+
+    def add_shared_service(self, service):
+        """
+        Use ``service``, an :py:class:`~._AwsService` instance belonging to
+        another checker for the same account, in place of this checker's own
+        instance of that service. This is intended for services whose
+        :py:attr:`~._AwsService.is_global` is True: the other checker collects
+        their usage, and this checker reports the same limits and usage.
+        Callers should exclude the service from this checker's
+        :py:meth:`~.find_usage`, :py:meth:`~.get_limits` and
+        :py:meth:`~.check_thresholds` calls, so it is only checked once.
+
+        :param service: the shared service instance
+        :type service: :py:class:`~._AwsService`
+        """
+        self.services[service.service_name] = service
+        self.limit_index.add_service(service)
+
     def get_version(self):
         """
         Return the version of awslimitchecker currently running.
@@ -323,8 +510,9 @@ class AwsLimitChecker(object):
         for sname in services_to_remove:
             logger.warning('Skipping service: %s', sname)
             self.services.pop(sname, None)
+            self.limit_index.remove_service(sname)
 
-    def get_limits(self, service=None, use_ta=True):
+    def get_limits(self, service=None, use_ta=True, use_api=True):
         """
         Return all :py:class:`~.AwsLimit` objects for the given
         service name, or for all services if ``service`` is None.
@@ -336,6 +524,10 @@ class AwsLimitChecker(object):
         :type service: list
         :param use_ta: check Trusted Advisor for information on limits
         :type use_ta: bool
+        :param use_api: update limits from each service's own API and from the
+          Service Quotas service. If False, no connections to AWS are made and
+          only default limits and overrides are populated.
+        :type use_api: bool
         :returns: dict of service name (string) to nested dict
           of limit name (string) to limit (:py:class:`~.AwsLimit`)
         :rtype: dict
@@ -347,12 +539,24 @@ class AwsLimitChecker(object):
         if use_ta:
             self.ta.update_limits()
         for sname, cls in to_get.items():
-            if hasattr(cls, '_update_limits_from_api'):
-                cls._update_limits_from_api()
-            cls._update_service_quotas()
+            if use_api:
+                cls._reset_api_cache()
+                if hasattr(cls, '_update_limits_from_api'):
+                    cls._update_limits_from_api()
+                cls._update_service_quotas()
             res[sname] = cls.get_limits()
         return res
 
+    def get_limit_index(self):
+        """
+        Return the :py:class:`~.LimitIndex` of all limits of all services
+        this instance checks. Unlike :py:meth:`~.get_limits`, this does not
+        update limits from Trusted Advisor or any API.
+
+        :rtype: :py:class:`~.LimitIndex`
+        """
+        return self.limit_index
+
     def get_service_names(self):
         """
         Return a list of all known service names
@@ -362,6 +566,35 @@ class AwsLimitChecker(object):
         """
         return sorted(self.services.keys())
 
+    def _role_arn(self):
+        """
+        Return the ARN of the role to assume in ``self.account_id``.
+
+        :rtype: str
+        """
+        return "arn:%s:iam::%s:role/%s" % (
+            self.role_partition,
+            self.account_id,
+            self.account_role
+        )
+
+    def _get_refreshable_session(self):
+        """
+        Assume a role via STS using ``self.account_id``, ``self.account_role``
+        and (optionally) ``self.external_id``, and return a boto3 session
+        whose credentials assume the role again before they expire (see
+        :py:class:`~.RefreshableRoleCredentials`).
+
+        :returns: boto3 session using the assumed role
+        :rtype: :py:class:`boto3.session.Session`
+        """
+        creds = RefreshableRoleCredentials(
+            self._role_arn(),
+            region_name=self.region,
+            external_id=self.external_id
+        )
+        return creds.session
+
     def _get_sts_token(self):
         """
         Assume a role via STS and return the credentials.
@@ -379,11 +612,7 @@ class AwsLimitChecker(object):
         """
         logger.debug("Connecting to STS in region %s", self.region)
         sts = boto3.client('sts', region_name=self.region)
-        arn = "arn:%s:iam::%s:role/%s" % (
-            self.role_partition,
-            self.account_id,
-            self.account_role
-        )
+        arn = self._role_arn()
         logger.debug("STS assume role for %s", arn)
         assume_kwargs = {
             'RoleArn': arn,
@@ -414,23 +643,328 @@ class AwsLimitChecker(object):
         :py:class:`~.AwsLimit` objects for each service, which can
         then be queried using :py:meth:`~.get_limits`.
 
+        Read-only API responses memoized via
+        :py:meth:`~.Connectable._memoized_call` are shared between the limit
+        and usage updates of each service, and discarded at the start of the
+        next call to this method.
+
+        When ``use_ta`` is True, the Trusted Advisor poll (and any refresh
+        wait) runs in a background thread while usage is collected; its
+        limits are applied once it completes, before this method returns.
+
+        Services that overrun ``run_timeout`` or ``service_timeout`` are
+        abandoned and their limits marked unknown; see
+        :py:meth:`~.get_unknown_services`.
+
         :param service: list of :py:class:`~._AwsService` name(s), or ``None``
           to check all services.
         :type service: :py:obj:`None`, or :py:obj:`list` service names to get
         :param use_ta: check Trusted Advisor for information on limits
         :type use_ta: bool
         """
+        deadline = self._run_deadline()
         to_get = self.services
         if service is not None:
             to_get = dict((each, self.services[each]) for each in service)
         if use_ta:
+            self._start_ta_update(deadline)
+        saved = sum(self._collect(
+            to_get, self._find_service_usage, refresh=True, deadline=deadline
+        ).values())
+        logger.debug('Memoized API responses saved %d API call(s)', saved)
+        if use_ta:
+            self._finish_ta_update(deadline)
+        self._log_latest_version()
+
+    def _run_deadline(self):
+        """
+        Return the time by which the current :py:meth:`~.find_usage` or
+        :py:meth:`~.check_thresholds` call must finish, per ``run_timeout``,
+        or None if it is unbounded.
+
+        :rtype: :py:obj:`float` or :py:data:`None`
+        """
+        if self.run_timeout is None:
+            return None
+        return time.time() + self.run_timeout
+
+    def _start_ta_update(self, deadline):
+        """
+        Start the background Trusted Advisor poll, giving up on any refresh
+        wait at ``deadline``.
+
+        :param deadline: time of the run deadline, or None
+        :type deadline: :py:obj:`float` or :py:data:`None`
+        """
+        if deadline is None:
+            self.ta.start_update_limits()
+            return
+        self.ta.start_update_limits(timeout=max(0, deadline - time.time()))
+
+    def _finish_ta_update(self, deadline):
+        """
+        Wait for the background Trusted Advisor poll, but not past
+        ``deadline``, and apply its limits.
+
+        :param deadline: time of the run deadline, or None
+        :type deadline: :py:obj:`float` or :py:data:`None`
+        """
+        if deadline is None:
             self.ta.update_limits()
-        for cls in to_get.values():
-            if hasattr(cls, '_update_limits_from_api'):
-                cls._update_limits_from_api()
-            cls._update_service_quotas()
-            logger.debug("Finding usage for service: %s", cls.service_name)
+            return
+        self.ta.update_limits(timeout=max(0, deadline - time.time()))
+
+    def _find_service_usage(self, cls):
+        """
+        Update the limits of one service and find its usage, for
+        :py:meth:`~.find_usage`.
+
+        :param cls: the service
+        :type cls: :py:class:`~._AwsService`
+        :returns: number of API calls saved by memoization
+        :rtype: int
+        """
+        cls._reset_api_cache()
+        if hasattr(cls, '_update_limits_from_api'):
+            cls._update_limits_from_api()
+        cls._update_service_quotas()
+        logger.debug("Finding usage for service: %s", cls.service_name)
+        cls.find_usage()
+        return cls._api_cache_hits
+
+    def _check_service(self, cls):
+        """
+        Update the limits of one service and make sure it has usage, for
+        :py:meth:`~.check_thresholds`. Thresholds are checked afterwards,
+        once the Trusted Advisor limits have been applied.
+
+        :param cls: the service
+        :type cls: :py:class:`~._AwsService`
+        :returns: number of API calls saved by memoization
+        :rtype: int
+        """
+        cls._reset_api_cache()
+        if hasattr(cls, '_update_limits_from_api'):
+            cls._update_limits_from_api()
+        cls._update_service_quotas()
+        if not cls._have_usage:
             cls.find_usage()
+        return cls._api_cache_hits
+
+    def _service_budget(self, service_name, deadline):
+        """
+        Return the number of seconds a service may spend collecting usage,
+        or None if it is unbounded, and the reason to record if it overruns.
+
+        :param service_name: the service name
+        :type service_name: str
+        :param deadline: time of the run deadline, or None
+        :type deadline: :py:obj:`float` or :py:data:`None`
+        :rtype: tuple
+        """
+        budget = self.service_timeout
+        if isinstance(budget, dict):
+            budget = budget.get(service_name)
+        reason = None
+        if budget is not None:
+            reason = 'did not finish within its %g second budget' % budget
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if budget is None or remaining < budget:
+                budget = remaining
+                reason = 'did not finish before the %g second run ' \
+                         'deadline' % self.run_timeout
+        return budget, reason
+
+    def _call_with_timeout(self, service_name, func, cls, timeout):
+        """
+        Call ``func(cls)`` in a daemon thread and wait up to ``timeout``
+        seconds for it. An exception raised by ``func`` is re-raised.
+
+        Python threads cannot be stopped, so if it has not finished the
+        thread is abandoned and leaks: it keeps running (and making API
+        calls) in the background until ``func`` returns, or the process
+        exits. The thread runs with a new run token that ``cls``'s limits are
+        given here and lose when it is abandoned, so any usage it adds after
+        that is ignored (see :py:meth:`.AwsLimit._is_stale`); and the service
+        is not collected again while it is still alive (see
+        :py:meth:`~._collect`).
+
+        :param service_name: service name, used to name the thread
+        :type service_name: str
+        :param func: the function to call
+        :type func: callable
+        :param cls: the service to call it with
+        :type cls: :py:class:`~._AwsService`
+        :param timeout: seconds to wait
+        :type timeout: float
+        :returns: 1-tuple of the return value, or None if it did not finish
+        :rtype: :py:obj:`tuple` or :py:data:`None`
+        """
+        outcome = {}
+        self._run_token += 1
+        token = self._run_token
+        for lim in cls.limits.values():
+            lim._run_token = token
+
+        def target():
+            _collection_run.token = token
+            try:
+                outcome['result'] = func(cls)
+            except Exception as ex:
+                outcome['exception'] = ex
+
+        t = threading.Thread(
+            target=target, name='awslimitchecker-%s' % service_name
+        )
+        t.daemon = True
+        t.start()
+        t.join(timeout)
+        if t.is_alive():
+            self._abandoned[service_name] = t
+            for lim in cls.limits.values():
+                lim._run_token = None
+            return None
+        if 'exception' in outcome:
+            raise outcome['exception']
+        return (outcome['result'],)
+
+    def _collect(self, to_get, func, refresh=False, deadline=None):
+        """
+        Call ``func`` with each service in ``to_get``, in the order given by
+        :py:meth:`~.get_service_order`. If ``run_timeout`` or
+        ``service_timeout`` is set, each call is bounded by its budget (see
+        :py:meth:`~._call_with_timeout`); services that overrun, or that have
+        not started by the run deadline, have their limits marked unknown and
+        are recorded for :py:meth:`~.get_unknown_services`. So are services
+        whose abandoned collection from an earlier call is still running.
+
+        The time each call takes is recorded for
+        :py:meth:`~.get_service_durations` (and the duration history), unless
+        the service already had usage and ``refresh`` is False, as then the
+        call does not collect usage.
+
+        :param to_get: dict of service name to :py:class:`~._AwsService`
+        :type to_get: dict
+        :param func: function to call with each service
+        :type func: callable
+        :param refresh: whether ``func`` always collects usage
+        :type refresh: bool
+        :param deadline: time of the run deadline (see
+          :py:meth:`~._run_deadline`), or None
+        :type deadline: :py:obj:`float` or :py:data:`None`
+        :returns: dict of service name to ``func``'s return value, for the
+          services that finished
+        :rtype: dict
+        """
+        res = {}
+        durations = {}
+        self._unknown_services = {}
+        limited = self.run_timeout is not None or \
+            self.service_timeout is not None
+        for sname in self.get_service_order(list(to_get.keys())):
+            cls = to_get[sname]
+            timed = refresh or not cls._have_usage
+            start = time.time()
+            prev = self._abandoned.pop(sname, None)
+            if prev is not None and prev.is_alive():
+                self._abandoned[sname] = prev
+                reason = 'abandoned usage collection from an earlier run ' \
+                         'is still running'
+                logger.warning('Skipping usage collection for %s: %s',
+                               sname, reason)
+                self._unknown_services[sname] = reason
+                for lim in cls.limits.values():
+                    lim._set_unknown(reason)
+                continue
+            if not limited:
+                res[sname] = func(cls)
+                if timed:
+                    durations[sname] = time.time() - start
+                continue
+            for lim in cls.limits.values():
+                lim.unknown_reason = None
+            budget, reason = self._service_budget(sname, deadline)
+            if budget is None:
+                res[sname] = func(cls)
+                if timed:
+                    durations[sname] = time.time() - start
+                continue
+            outcome = None
+            if budget > 0:
+                outcome = self._call_with_timeout(sname, func, cls, budget)
+                if timed:
+                    # an abandoned service took at least its budget
+                    durations[sname] = time.time() - start
+            else:
+                reason = 'not started before the %g second run ' \
+                         'deadline' % self.run_timeout
+            if outcome is not None:
+                res[sname] = outcome[0]
+                continue
+            logger.warning('Abandoning usage collection for %s: %s',
+                           sname, reason)
+            self._unknown_services[sname] = reason
+            for lim in cls.limits.values():
+                lim._set_unknown(reason)
+        self._service_durations = durations
+        if self._duration_history is not None:
+            self._duration_history.update(durations)
+        return res
+
+    def get_service_durations(self):
+        """
+        Return how long each service took to collect usage during the last
+        :py:meth:`~.find_usage` or :py:meth:`~.check_thresholds` call.
+        Services that were abandoned (see :py:meth:`~.get_unknown_services`)
+        are included with the time spent waiting for them.
+
+        :returns: dict of service name to seconds
+        :rtype: dict
+        """
+        return dict(self._service_durations)
+
+    def get_service_order(self, service=None):
+        """
+        Return service names ordered longest expected collection time first,
+        so that callers collecting several services at once finish soonest.
+        Expected times come from the on-disk duration history (see the
+        ``duration_history`` constructor argument), or from the last
+        :py:meth:`~.find_usage` or :py:meth:`~.check_thresholds` call if it
+        is disabled. Services with no recorded duration are expected to take
+        the mean of the recorded ones. Ties are ordered by name.
+
+        :param service: the name(s) of the service(s) to order, or ``None``
+          for all services.
+        :type service: :py:obj:`None`, or :py:obj:`list` service names
+        :returns: list of service names
+        :rtype: list
+        """
+        names = list(self.services.keys())
+        if service is not None:
+            names = list(service)
+        if self._duration_history is not None:
+            history = self._duration_history.get()
+        else:
+            history = self._service_durations
+        known = [history[x] for x in names if x in history]
+        default = 0
+        if len(known) > 0:
+            default = sum(known) / len(known)
+        return sorted(names, key=lambda x: (-history.get(x, default), x))
+
+    def get_unknown_services(self):
+        """
+        Return the services whose usage is unknown because the last
+        :py:meth:`~.find_usage` or :py:meth:`~.check_thresholds` call
+        abandoned or skipped them (see the ``run_timeout`` and
+        ``service_timeout`` constructor arguments). Their limits'
+        :py:attr:`~.AwsLimit.unknown_reason` is set to the same reason.
+
+        :returns: dict of service name to the reason its usage is unknown
+        :rtype: dict
+        """
+        return dict(self._unknown_services)
 
     def set_limit_overrides(self, override_dict, override_ta=True):
         """
@@ -593,6 +1127,27 @@ class AwsLimitChecker(object):
             crit_count=crit_count
         )
 
+    def set_usage_retention(self, service_name, limit_name, retain_top):
+        """
+        Only keep the ``retain_top`` usages with the highest utilization for
+        a specific per-resource limit, along with exact statistics for all of
+        its usage. This bounds memory use and sorting cost for limits that
+        are evaluated per-resource on accounts with many resources. Must be
+        called before usage is collected.
+
+        See :py:meth:`.AwsLimit.set_usage_retention`.
+
+        :param service_name: the name of the service the limit belongs to
+        :type service_name: str
+        :param limit_name: the name of the limit
+        :type limit_name: str
+        :param retain_top: number of usages to keep, or None for all
+        :type retain_top: int
+        """
+        self.services[service_name].set_usage_retention(
+            limit_name, retain_top
+        )
+
     def check_thresholds(self, service=None, use_ta=True):
         """
         Check all limits and current usage against their specified thresholds;
@@ -611,6 +1166,15 @@ class AwsLimitChecker(object):
 
         See :py:meth:`.AwsLimit.check_thresholds`.
 
+        As in :py:meth:`~.find_usage`, when ``use_ta`` is True the Trusted
+        Advisor poll runs in a background thread while usage is collected;
+        thresholds are checked once its limits have been applied.
+
+        Services that overrun ``run_timeout`` or ``service_timeout`` are
+        abandoned and not included in the result; their limits are marked
+        unknown (see :py:meth:`~.get_unknown_services`), and every service
+        that finished is still checked.
+
         :param service: the name(s) of one or more service(s) to return
           results for
         :type service: list
@@ -620,19 +1184,36 @@ class AwsLimitChecker(object):
           of limit name (string) to limit (:py:class:`~.AwsLimit`)
         :rtype: dict
         """
+        deadline = self._run_deadline()
         res = {}
         to_get = self.services
         if service is not None:
             to_get = dict((each, self.services[each]) for each in service)
         if use_ta:
-            self.ta.update_limits()
-        for sname, cls in to_get.items():
-            if hasattr(cls, '_update_limits_from_api'):
-                cls._update_limits_from_api()
-            cls._update_service_quotas()
-            tmp = cls.check_thresholds()
+            self._start_ta_update(deadline)
+        saved = 0
+        packed = []
+        results = self._collect(
+            to_get, self._check_service, deadline=deadline
+        )
+        if use_ta:
+            self._finish_ta_update(deadline)
+        for sname, hits in results.items():
+            saved += hits
+            if self.columnar_thresholds:
+                for lname, limit in to_get[sname].limits.items():
+                    packed.append((sname, lname, limit))
+                continue
+            tmp = to_get[sname].check_thresholds()
             if len(tmp) > 0:
                 res[sname] = tmp
+        if self.columnar_thresholds:
+            engine = ColumnarThresholds([x[2] for x in packed])
+            for (sname, lname, limit), ok in zip(packed, engine.evaluate()):
+                if not ok:
+                    res.setdefault(sname, {})[lname] = limit
+        logger.debug('Memoized API responses saved %d API call(s)', saved)
+        self._log_latest_version()
         return res
 
     def get_required_iam_policy(self):
@@ -647,18 +1228,7 @@ class AwsLimitChecker(object):
         :returns: dict representation of IAM Policy
         :rtype: dict
         """
-        required_actions = [
-            'cloudwatch:GetMetricData',
-            'servicequotas:ListServiceQuotas',
-            'support:DescribeTrustedAdvisorCheckRefreshStatuses',
-            'support:DescribeTrustedAdvisorCheckResult',
-            'support:DescribeTrustedAdvisorCheckSummaries',
-            'support:DescribeTrustedAdvisorChecks',
-            'support:RefreshTrustedAdvisorCheck',
-            'sts:GetCallerIdentity',
-            'trustedadvisor:Describe*',
-            'trustedadvisor:RefreshCheck'
-        ]
+        required_actions = list(_BASE_REQUIRED_IAM_ACTIONS)
         for cls in self.services.values():
             required_actions.extend(cls.required_iam_permissions())
         policy = {
@@ -671,6 +1241,16 @@ class AwsLimitChecker(object):
         }
         return policy
 
+    def get_ta_refresh_latency(self):
+        """
+        Return the number of seconds this run waited for a Trusted Advisor
+        check refresh to complete (or time out), or None if it did not wait
+        for a refresh.
+
+        :rtype: :py:obj:`float` or :py:data:`None`
+        """
+        return self.ta.refresh_latency
+
     @property
     def region_name(self):
         """
@@ -679,6 +1259,6 @@ class AwsLimitChecker(object):
         :return: AWS region name
         :rtype: str
         """
-        kwargs = self._boto_conn_kwargs
-        conn = boto3.client('ec2', **kwargs)
+        kwargs = dict(self._resolved_credentials, region_name=self.region)
+        conn = boto3_client('ec2', **kwargs)
         return conn._client_config.region_name
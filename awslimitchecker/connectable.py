@@ -38,12 +38,80 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 import os
+import json
 import logging
+import threading
 import boto3
+import botocore.session
 from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
+from .ratelimit import rate_limiter
 
 logger = logging.getLogger(__name__)
 
+#: Serializes boto3 client creation. Clients are thread-safe, but creating
+#: them from boto3's shared default session is not, and checkers for several
+#: regions (see :py:class:`~.MultiRegionChecker`) connect from worker threads.
+_client_lock = threading.Lock()
+
+#: Connection keyword argument holding a :py:class:`boto3.session.Session`
+#: that clients should be created from, instead of from boto3's default
+#: session. See :py:class:`~.RefreshableRoleCredentials`.
+SESSION_KWARG = 'boto3_session'
+
+#: Connection keyword argument holding the ID of the account that clients
+#: connect to, so that clients for the same account share API rate limits
+#: (see :py:mod:`~.ratelimit`). Absent for the default account.
+ACCOUNT_KWARG = 'account_id'
+
+
+def boto3_client(service_name, **kwargs):
+    """
+    Create a boto3 low-level client from connection keyword arguments. If
+    ``kwargs`` contain a :py:data:`~.SESSION_KWARG` session, the client is
+    created from that session (and shares its credentials); otherwise it is
+    created with :py:func:`boto3.client`. The client is registered with the
+    process-wide :py:data:`~.ratelimit.rate_limiter`, under the
+    :py:data:`~.ACCOUNT_KWARG` account if given.
+
+    :param service_name: AWS API name to connect to
+    :type service_name: str
+    :param kwargs: boto3 connection keyword arguments
+    :type kwargs: dict
+    :returns: boto3 client
+    """
+    session = kwargs.pop(SESSION_KWARG, None)
+    account_id = kwargs.pop(ACCOUNT_KWARG, None)
+    if session is None:
+        client = boto3.client(service_name, **kwargs)
+    else:
+        client = session.client(service_name, **kwargs)
+    rate_limiter.register(client, service_name, account_id=account_id)
+    return client
+
+
+def boto3_resource(service_name, **kwargs):
+    """
+    Create a boto3 high-level resource from connection keyword arguments, in
+    the same way as :py:func:`~.boto3_client`.
+
+    :param service_name: AWS API name to connect to
+    :type service_name: str
+    :param kwargs: boto3 connection keyword arguments
+    :type kwargs: dict
+    :returns: boto3 service resource
+    """
+    session = kwargs.pop(SESSION_KWARG, None)
+    account_id = kwargs.pop(ACCOUNT_KWARG, None)
+    if session is None:
+        resource = boto3.resource(service_name, **kwargs)
+    else:
+        resource = session.resource(service_name, **kwargs)
+    rate_limiter.register(
+        resource.meta.client, service_name, account_id=account_id
+    )
+    return resource
+
 
 class ConnectableCredentials(object):
     """
@@ -67,12 +135,102 @@ class ConnectableCredentials(object):
         self.account_id = None
 
 
+class RefreshableRoleCredentials(object):
+    """
+    Credentials for an IAM role assumed via STS, which assume the role again
+    shortly before they expire. This wraps botocore's
+    :py:class:`botocore.credentials.RefreshableCredentials`, so the refresh
+    happens transparently when a request is signed, and :py:attr:`session` is
+    a :py:class:`boto3.session.Session` using them. Every client created from
+    that session (see :py:func:`~.boto3_client`) shares the same credentials,
+    so long-running checks do not fail once the first set of STS credentials
+    expires.
+    """
+
+    def __init__(self, role_arn, region_name=None, external_id=None,
+                 session_name='awslimitchecker'):
+        """
+        Assume the role and set up the refreshable credentials.
+
+        :param role_arn: ARN of the IAM role to assume
+        :type role_arn: str
+        :param region_name: region to connect to STS in
+        :type region_name: str
+        :param external_id: External ID to pass to ``sts:AssumeRole``
+        :type external_id: str
+        :param session_name: ``RoleSessionName`` for ``sts:AssumeRole``
+        :type session_name: str
+        """
+        self.role_arn = role_arn
+        self.external_id = external_id
+        self.session_name = session_name
+        logger.debug("Connecting to STS in region %s", region_name)
+        with _client_lock:
+            self._sts = boto3.client('sts', region_name=region_name)
+        self.credentials = RefreshableCredentials.create_from_metadata(
+            metadata=self._assume_role(),
+            refresh_using=self._assume_role,
+            method='sts-assume-role'
+        )
+        bc_session = botocore.session.get_session()
+        bc_session._credentials = self.credentials
+        self.session = boto3.Session(botocore_session=bc_session)
+
+    def _assume_role(self):
+        """
+        Assume the role via STS and return the new credentials in the form
+        that :py:class:`botocore.credentials.RefreshableCredentials` expects
+        from its refresh function.
+
+        :rtype: dict
+        """
+        logger.debug("STS assume role for %s", self.role_arn)
+        assume_kwargs = {
+            'RoleArn': self.role_arn,
+            'RoleSessionName': self.session_name
+        }
+        if self.external_id is not None:
+            assume_kwargs['ExternalId'] = self.external_id
+        creds = ConnectableCredentials(self._sts.assume_role(**assume_kwargs))
+        logger.debug("Got STS credentials for role; access_key_id=%s "
+                     "expiration=%s", creds.access_key, creds.expiration)
+        return {
+            'access_key': creds.access_key,
+            'secret_key': creds.secret_key,
+            'token': creds.session_token,
+            'expiry_time': creds.expiration.isoformat()
+        }
+
+
 class Connectable(object):
     """
     Mix-in helper class for connecting to AWS APIs. Centralizes logic of
     connecting via regions and/or STS.
     """
 
+    #: per-run cache of memoized API responses; see :py:meth:`~._memoized_call`
+    _api_cache = None
+
+    #: number of API calls saved by :py:meth:`~._memoized_call` this run
+    _api_cache_hits = 0
+
+    @property
+    def _region_name(self):
+        """
+        Return the name of the region that :py:meth:`~.connect` will connect
+        to, *without* creating a client. This is the ``region_name`` connection
+        keyword argument if set, otherwise the default region that boto3
+        resolves from the environment and shared configuration files (or None
+        if no default region is configured).
+
+        :return: AWS region name
+        :rtype: :py:obj:`str` or :py:data:`None`
+        """
+        region_name = self._boto3_connection_kwargs.get('region_name')
+        if region_name is not None:
+            return region_name
+        return boto3.session.Session().region_name
+
     @property
     def _max_retries_config(self):
         """
@@ -119,7 +277,8 @@ class Connectable(object):
 
         if self._max_retries_config is not None:
             kwargs['config'] = default_config.merge(self._max_retries_config)
-        self.conn = boto3.client(self.api_name, **kwargs)
+        with _client_lock:
+            self.conn = boto3_client(self.api_name, **kwargs)
         logger.info("Connected to %s in region %s",
                     self.api_name, self.conn._client_config.region_name)
 
@@ -144,6 +303,62 @@ class Connectable(object):
         if self._max_retries_config is not None:
             kwargs['config'] = default_config.merge(self._max_retries_config)
 
-        self.resource_conn = boto3.resource(self.api_name, **kwargs)
+        with _client_lock:
+            self.resource_conn = boto3_resource(self.api_name, **kwargs)
         logger.info("Connected to %s (resource) in region %s", self.api_name,
                     self.resource_conn.meta.client._client_config.region_name)
+
+    def _memoized_call(self, operation_name, **kwargs):
+        """
+        Call the ``operation_name`` method of ``self.conn`` with ``kwargs``,
+        memoizing the response for the rest of the current run. A second call
+        with the same operation name and (normalized) parameters returns the
+        cached response instead of calling the API again. The cache is cleared
+        by :py:meth:`~._reset_api_cache`, which
+        :py:class:`~.AwsLimitChecker` calls at the start of every usage or
+        limit update cycle.
+
+        This must only be used for read-only API calls. The caller is
+        responsible for calling :py:meth:`~.connect` first.
+
+        :param operation_name: name of the boto3 client method to call
+        :type operation_name: str
+        :param kwargs: keyword arguments to pass to the client method
+        :type kwargs: dict
+        :returns: the API response
+        :rtype: dict
+        """
+        if self._api_cache is None:
+            self._api_cache = {}
+        key = (
+            operation_name,
+            json.dumps(kwargs, sort_keys=True, default=str)
+        )
+        if key in self._api_cache:
+            self._api_cache_hits += 1
+            logger.debug(
+                'Using memoized %s %s response (params: %s)',
+                self.api_name, operation_name, key[1]
+            )
+            return self._api_cache[key]
+        resp = getattr(self.conn, operation_name)(**kwargs)
+        self._api_cache[key] = resp
+        return resp
+
+    def _reset_api_cache(self):
+        """
+        Discard all responses memoized by :py:meth:`~._memoized_call`, logging
+        how many API calls the cache saved since it was last reset.
+
+        :returns: the number of API calls saved since the last reset
+        :rtype: int
+        """
+        hits = self._api_cache_hits
+        if hits > 0:
+            logger.debug(
+                'Memoized API responses saved %d call(s) to %s',
+                hits, self.api_name
+            )
+        self._api_cache = {}
+        self._api_cache_hits = 0
+        return hits
@@ -37,6 +37,14 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 ################################################################################
 """
 
+from array import array
+from collections import namedtuple
+import heapq
+import math
+import operator
+import sys
+import threading
+
 #: indicates a limit value that came from hard-coded defaults in awslimitchecker
 SOURCE_DEFAULT = 0
 
@@ -52,15 +60,32 @@ SOURCE_API = 3
 #: indicates a limit value that came from the Service Quotas service
 SOURCE_QUOTAS = 4
 
+#: thread-local holding the ``token`` of the bounded usage collection the
+#: current thread is running, if any; see :py:meth:`.AwsLimit._is_stale`
+_collection_run = threading.local()
+
 
 class AwsLimit(object):
 
+    __slots__ = (
+        'name', 'service', 'default_limit', 'limit_type', 'limit_subtype',
+        'limit_override', 'override_ta', 'ta_limit', 'ta_unlimited',
+        'api_limit', '_effective', 'compact_usage', 'retain_top',
+        '_current_usage',
+        'def_warning_threshold', 'def_critical_threshold', 'warn_percent',
+        'warn_count', 'crit_percent', 'crit_count', '_threshold_result',
+        '_ta_service_name', '_ta_limit_name', '_quotas_service_code',
+        '_quotas_name', '_quotas_unit', '_quotas_code', 'quotas_limit',
+        'quotas_unit_converter', 'unknown_reason', '_run_token'
+    )
+
     def __init__(self, name, service, default_limit,
                  def_warning_threshold, def_critical_threshold,
                  limit_type=None, limit_subtype=None,
                  ta_service_name=None, ta_limit_name=None,
                  quotas_service_code=None, quotas_name=None,
-                 quotas_unit='None', quotas_unit_converter=None):
+                 quotas_unit='None', quotas_unit_converter=None,
+                 quotas_code=None, compact_usage=False, retain_top=None):
         """
         Describes one specific AWS service limit, as well as its
         current utilization, default limit, thresholds, and any
@@ -115,11 +140,31 @@ class AwsLimit(object):
           the quota value from the quota Unit to this class's expected unit.
           If they cannot be converted, it should log an error and return None.
         :type quotas_unit_converter: ``callable``
+        :param quotas_code: The Service Quotas ``QuotaCode`` for this limit, if
+          known. Quotas are matched by code rather than by name when this is
+          set, and may be retrieved individually instead of listing all
+          quotas for the service code.
+        :type quotas_code: str
+        :param compact_usage: If True, store current usage in a
+          :py:class:`~.CompactUsageStore` instead of a list of
+          :py:class:`~.AwsLimitUsage` instances. This saves memory for
+          per-resource limits with many usage values, at the cost of creating
+          :py:class:`~.AwsLimitUsage` instances whenever they are accessed.
+        :type compact_usage: bool
+        :param retain_top: If set, only keep the usages with this many highest
+          utilizations, in a :py:class:`~.TopUsageStore`, along with exact
+          statistics for all usage (see :py:meth:`~.get_usage_stats`). This
+          bounds memory use for per-resource limits, where only the resources
+          closest to the limit matter; takes precedence over
+          ``compact_usage``. See :py:meth:`~.set_usage_retention`.
+        :type retain_top: int
         :raises: ValueError
         """
         if def_warning_threshold >= def_critical_threshold:
             raise ValueError("critical threshold must be greater than warning "
                              "threshold")
+        if retain_top is not None and retain_top < 1:
+            raise ValueError("retain_top must be at least 1")
         self.name = name
         self.service = service
         self.default_limit = default_limit
@@ -130,22 +175,54 @@ class AwsLimit(object):
         self.ta_limit = None
         self.ta_unlimited = False
         self.api_limit = None
-        self._current_usage = []
+        self.quotas_limit = None
+        self._effective = None
+        self.compact_usage = compact_usage
+        self.retain_top = retain_top
+        self._run_token = None
+        self._current_usage = self._new_usage_store()
         self.def_warning_threshold = def_warning_threshold
         self.def_critical_threshold = def_critical_threshold
         self.warn_percent = None
         self.warn_count = None
         self.crit_percent = None
         self.crit_count = None
-        self._warnings = []
-        self._criticals = []
+        self._threshold_result = None
         self._ta_service_name = ta_service_name
         self._ta_limit_name = ta_limit_name
         self._quotas_service_code = quotas_service_code
         self._quotas_name = quotas_name
         self._quotas_unit = quotas_unit
-        self.quotas_limit = None
         self.quotas_unit_converter = quotas_unit_converter
+        self._quotas_code = quotas_code
+        #: if usage for this limit could not be collected in the last run,
+        #: the reason why (see :py:meth:`~._set_unknown`); otherwise None
+        self.unknown_reason = None
+
+    def _set_unknown(self, reason):
+        """
+        Mark this limit's usage as unknown for the current run, such as when
+        its service did not finish collecting usage within its time budget.
+        The reason is cleared when usage collection for the limit starts
+        again.
+
+        :param reason: why the usage is unknown
+        :type reason: str
+        """
+        self.unknown_reason = reason
+        self._threshold_result = None
+
+    def _is_stale(self):
+        """
+        Return whether the calling thread is a bounded usage collection that
+        no longer owns this limit, i.e. one that was abandoned when its
+        service overran its time budget, and has since been superseded.
+        Usage changes from such threads are ignored.
+
+        :rtype: bool
+        """
+        token = getattr(_collection_run, 'token', None)
+        return token is not None and token != self._run_token
 
     def set_limit_override(self, limit_value, override_ta=True):
         """
@@ -162,6 +239,7 @@ class AwsLimit(object):
         """
         self.limit_override = limit_value
         self.override_ta = override_ta
+        self._effective = None
 
     def _set_ta_limit(self, limit_value):
         """
@@ -173,6 +251,7 @@ class AwsLimit(object):
         :type limit_value: int
         """
         self.ta_limit = limit_value
+        self._effective = None
 
     def _set_ta_unlimited(self):
         """
@@ -182,6 +261,7 @@ class AwsLimit(object):
         This method should only be called by :py:class:`~.TrustedAdvisor`.
         """
         self.ta_unlimited = True
+        self._effective = None
 
     def _set_api_limit(self, limit_value):
         """
@@ -193,6 +273,7 @@ class AwsLimit(object):
         :type limit_value: int
         """
         self.api_limit = limit_value
+        self._effective = None
 
     def _set_quotas_limit(self, limit_value):
         """
@@ -204,6 +285,7 @@ class AwsLimit(object):
         :type limit_value: float
         """
         self.quotas_limit = limit_value
+        self._effective = None
 
     def get_limit_source(self):
         """
@@ -224,18 +306,9 @@ class AwsLimit(object):
           :py:data:`~.awslimitchecker.limit.SOURCE_QUOTAS`
         :rtype: int
         """
-        if self.limit_override is not None and (
-                self.override_ta is True or
-                (self.ta_limit is None and self.ta_unlimited is False)
-        ):
-            return SOURCE_OVERRIDE
-        if self.api_limit is not None:
-            return SOURCE_API
-        if self.quotas_limit is not None:
-            return SOURCE_QUOTAS
-        if self.ta_limit is not None or self.ta_unlimited is True:
-            return SOURCE_TA
-        return SOURCE_DEFAULT
+        if self._effective is None:
+            self._effective = self._resolve_limit()
+        return self._effective[0]
 
     def get_limit(self):
         """
@@ -246,18 +319,34 @@ class AwsLimit(object):
 
         :returns: effective limit value, ``int`` or ``None``
         """
-        limit_type = self.get_limit_source()
-        if limit_type == SOURCE_OVERRIDE:
-            return self.limit_override
-        elif limit_type == SOURCE_API:
-            return self.api_limit
-        elif limit_type == SOURCE_QUOTAS:
-            return self.quotas_limit
-        elif limit_type == SOURCE_TA:
-            if self.ta_unlimited is True:
-                return None
-            return self.ta_limit
-        return self.default_limit
+        if self._effective is None:
+            self._effective = self._resolve_limit()
+        return self._effective[1]
+
+    def _resolve_limit(self):
+        """
+        Determine the effective limit and its source from the override,
+        API, Service Quotas, Trusted Advisor and default values. The result
+        is cached by :py:meth:`~.get_limit` and :py:meth:`~.get_limit_source`
+        until one of the setters for those values is called.
+
+        :returns: 2-tuple of limit source, effective limit value
+        :rtype: tuple
+        """
+        if self.limit_override is not None and (
+                self.override_ta is True or
+                (self.ta_limit is None and self.ta_unlimited is False)
+        ):
+            return SOURCE_OVERRIDE, self.limit_override
+        if self.api_limit is not None:
+            return SOURCE_API, self.api_limit
+        if self.quotas_limit is not None:
+            return SOURCE_QUOTAS, self.quotas_limit
+        if self.ta_unlimited is True:
+            return SOURCE_TA, None
+        if self.ta_limit is not None:
+            return SOURCE_TA, self.ta_limit
+        return SOURCE_DEFAULT, self.default_limit
 
     def has_resource_limits(self):
         """
@@ -267,17 +356,23 @@ class AwsLimit(object):
         :returns: whether of not some resources have a defined maximum
         :rtype: bool
         """
+        if self._uses_usage_store():
+            return any(self._current_usage.get_maxima())
         return any(usage for usage in self._current_usage if
                    usage.get_maximum())
 
     def get_current_usage(self):
         """
         Get the current usage for this limit, as a list of
-        :py:class:`~.AwsLimitUsage` instances.
+        :py:class:`~.AwsLimitUsage` instances. If ``compact_usage`` is set,
+        this is a new list of newly-created instances on every call. If
+        ``retain_top`` is set, this is a new list of only the retained usage.
 
         :returns: list of current usage values
         :rtype: :py:obj:`list` of :py:class:`~.AwsLimitUsage`
         """
+        if self._uses_usage_store():
+            return list(self._current_usage)
         return self._current_usage
 
     def get_current_usage_str(self):
@@ -295,16 +390,25 @@ class AwsLimit(object):
         the ``AwsLimitUsage.__str__`` value of the instance
         with the maximum value, and ``Y`` is a comma-separated list
         of the ``AwsLimitUsage.__str__`` values of all usage
-        instances in ascending order.
+        instances in ascending order. If ``retain_top`` is set and usage was
+        dropped, only the retained usage is listed, followed by
+        ``and N more``.
 
         :returns: representation of current usage
         :rtype: str
         """
         if len(self._current_usage) == 0:
             return '<unknown>'
-        if len(self._current_usage) == 1:
+        if len(self._current_usage) == 1 and self.retain_top is None:
             return str(self._current_usage[0])
         lim_str = ', '.join([str(x) for x in sorted(self._current_usage)])
+        if self.retain_top is not None:
+            dropped = self._current_usage.stats.count - len(
+                self._current_usage)
+            if dropped > 0:
+                lim_str += ' and {n} more'.format(n=dropped)
+            elif len(self._current_usage) == 1:
+                return str(self._current_usage[0])
         s = 'max: {m} ({l})'.format(
             m=str(max(self._current_usage)),
             l=lim_str
@@ -335,6 +439,14 @@ class AwsLimit(object):
           `CloudFormation <http://docs.aws.amazon.com/AWSCloudFormation/latest/UserGuide/aws-template-resource-type-ref.html>`_  # noqa
         :type aws_type: str
         """
+        if self._is_stale():
+            return
+        if self._uses_usage_store():
+            self._current_usage.append(
+                value, maximum=maximum, resource_id=resource_id,
+                aws_type=aws_type
+            )
+            return
         self._current_usage.append(
             AwsLimitUsage(
                 self,
@@ -345,9 +457,69 @@ class AwsLimit(object):
             )
         )
 
+    def _new_usage_store(self):
+        """
+        Return a new, empty container for current usage.
+
+        :rtype: :py:obj:`list`, :py:class:`~.CompactUsageStore` or
+          :py:class:`~.TopUsageStore`
+        """
+        if self.retain_top is not None:
+            return TopUsageStore(self, self.retain_top)
+        if self.compact_usage:
+            return CompactUsageStore(self)
+        return []
+
+    def _uses_usage_store(self):
+        """
+        Whether current usage is kept in a :py:class:`~.CompactUsageStore` or
+        :py:class:`~.TopUsageStore` rather than a list of
+        :py:class:`~.AwsLimitUsage`.
+
+        :rtype: bool
+        """
+        return self.compact_usage or self.retain_top is not None
+
+    def set_usage_retention(self, retain_top):
+        """
+        Set the number of highest-utilization usages to keep for this limit
+        (see the ``retain_top`` constructor argument), or None to keep all
+        usage. This discards any current usage, so it should be called before
+        usage is collected.
+
+        :param retain_top: number of usages to keep, or None for all
+        :type retain_top: int
+        :raises: ValueError
+        """
+        if retain_top is not None and retain_top < 1:
+            raise ValueError("retain_top must be at least 1")
+        self.retain_top = retain_top
+        self._reset_usage()
+
+    def get_usage_stats(self):
+        """
+        Return exact aggregate statistics over all current usage values for
+        this limit, including any not retained because of ``retain_top``.
+
+        :rtype: :py:class:`~.UsageStats`
+        """
+        if self.retain_top is not None:
+            return self._current_usage.stats
+        stats = UsageStats()
+        if self.compact_usage:
+            values = self._current_usage.get_values()
+        else:
+            values = [u.get_value() for u in self._current_usage]
+        for v in values:
+            stats.add(v)
+        return stats
+
     def _reset_usage(self):
-        """Discard all current usage data."""
-        self._current_usage = []
+        """Discard all current usage data, and the last threshold result."""
+        if self._is_stale():
+            return
+        self._current_usage = self._new_usage_store()
+        self._threshold_result = None
 
     def _get_thresholds(self):
         """
@@ -409,9 +581,13 @@ class AwsLimit(object):
         class instance. Return True if usage is within thresholds, or false if
         warning or critical thresholds have been surpassed.
 
-        This method sets internal variables in this instance which can be
-        queried via :py:meth:`~.get_warnings` and :py:meth:`~.get_criticals`
-        to obtain further details about the thresholds that were crossed.
+        Each call replaces the previous result with a new, immutable
+        :py:class:`~.ThresholdResult` (see :py:meth:`~.get_threshold_result`),
+        which can also be queried via :py:meth:`~.get_warnings` and
+        :py:meth:`~.get_criticals` to obtain further details about the
+        thresholds that were crossed. Calling this method repeatedly on the
+        same usage gives the same result, rather than accumulating warnings
+        and criticals.
 
         **Note** This function returns False if *any* thresholds were crossed.
         Please be aware of this when setting threshold overrides to suppress
@@ -426,25 +602,47 @@ class AwsLimit(object):
         """
         (warn_int, warn_pct, crit_int, crit_pct) = self._get_thresholds()
         all_ok = True
-        for u in self._current_usage:
-            usage = u.get_value()
-            limit = u.get_maximum() or self.get_limit()
+        warnings = []
+        criticals = []
+        usages = self._current_usage
+        if self._uses_usage_store():
+            rows = zip(usages.get_values(), usages.get_maxima())
+        else:
+            rows = ((u.get_value(), u.get_maximum()) for u in usages)
+        effective = self.get_limit()
+        for idx, (usage, maximum) in enumerate(rows):
+            limit = maximum or effective
             if limit is None or limit == 0:
                 continue
             pct = (usage / limit) * 100
             if crit_int is not None and usage >= crit_int:
                 all_ok = False
             elif pct >= crit_pct:
-                self._criticals.append(u)
+                criticals.append(idx)
                 all_ok = False
             elif warn_int is not None and usage >= warn_int:
-                self._warnings.append(u)
+                warnings.append(idx)
                 all_ok = False
             elif pct >= warn_pct:
-                self._warnings.append(u)
+                warnings.append(idx)
                 all_ok = False
+        self._threshold_result = ThresholdResult(
+            all_ok,
+            tuple([usages[i] for i in warnings]),
+            tuple([usages[i] for i in criticals])
+        )
         return all_ok
 
+    def get_threshold_result(self):
+        """
+        Return the :py:class:`~.ThresholdResult` of the last call to
+        :py:meth:`~.check_thresholds` on the current usage, or None if
+        thresholds have not been checked since usage was last reset.
+
+        :rtype: :py:class:`~.ThresholdResult` or :py:data:`None`
+        """
+        return self._threshold_result
+
     def get_warnings(self):
         """
         Return a list of :py:class:`~.AwsLimitUsage` instances that
@@ -453,7 +651,9 @@ class AwsLimit(object):
 
         :rtype: list
         """
-        return self._warnings
+        if self._threshold_result is None:
+            return []
+        return list(self._threshold_result.warnings)
 
     def get_criticals(self):
         """
@@ -463,7 +663,9 @@ class AwsLimit(object):
 
         :rtype: list
         """
-        return self._criticals
+        if self._threshold_result is None:
+            return []
+        return list(self._threshold_result.criticals)
 
     @property
     def ta_service_name(self):
@@ -527,9 +729,36 @@ class AwsLimit(object):
         """
         return self._quotas_unit
 
+    @property
+    def quotas_code(self):
+        """
+        Return the Service Quotas quota code for this limit, or None if it is
+        not known.
+
+        :return: Service Quotas quota code
+        :rtype: str
+        """
+        return self._quotas_code
+
+
+class ThresholdResult(
+    namedtuple('ThresholdResult', ['ok', 'warnings', 'criticals'])
+):
+    """
+    The immutable result of one :py:meth:`.AwsLimit.check_thresholds` call.
+
+    ``ok`` is the bool returned by that call; ``warnings`` and ``criticals``
+    are tuples of the :py:class:`~.AwsLimitUsage` instances that crossed the
+    warning or critical threshold, respectively.
+    """
+
+    __slots__ = ()
+
 
 class AwsLimitUsage(object):
 
+    __slots__ = ('limit', 'value', 'maximum', 'resource_id', 'aws_type')
+
     def __init__(self, limit, value, maximum=None, resource_id=None,
                  aws_type=None):
         """
@@ -567,6 +796,8 @@ class AwsLimitUsage(object):
         self.value = value
         self.maximum = maximum
         self.resource_id = resource_id
+        if aws_type is not None:
+            aws_type = sys.intern(aws_type)
         self.aws_type = aws_type
 
     def get_value(self):
@@ -615,3 +846,288 @@ class AwsLimitUsage(object):
 
     def __ge__(self, other):
         return self.value >= other.value
+
+
+class CompactUsageStore(object):
+
+    #: flag bit for a row whose value is an int
+    VALUE_INT = 1
+    #: flag bit for a row whose maximum is an int
+    MAXIMUM_INT = 2
+    #: flag bit for a row with no maximum
+    MAXIMUM_NONE = 4
+
+    __slots__ = (
+        'limit', '_values', '_maxima', '_flags', '_resource_ids', '_aws_types'
+    )
+
+    def __init__(self, limit):
+        """
+        Array-backed storage for the current usage of one
+        :py:class:`~.AwsLimit` created with ``compact_usage=True``. Values and
+        maximums are kept in :py:class:`array.array` columns, with one flag
+        byte per row recording which were ints (so they are returned as
+        given) and whether the maximum was None. AWS type strings are
+        interned. :py:class:`~.AwsLimitUsage` instances are only created when
+        rows are accessed by index or iteration, so this behaves like a
+        read-only list of them.
+
+        :param limit: the limit this usage is for
+        :type limit: :py:class:`~.AwsLimit`
+        """
+        self.limit = limit
+        self._values = array('d')
+        self._maxima = array('d')
+        self._flags = bytearray()
+        self._resource_ids = []
+        self._aws_types = []
+
+    def append(self, value, maximum=None, resource_id=None, aws_type=None):
+        """
+        Add a usage value; see :py:meth:`.AwsLimit._add_current_usage`.
+        """
+        flags = 0
+        if isinstance(value, int):
+            flags |= self.VALUE_INT
+        if maximum is None:
+            flags |= self.MAXIMUM_NONE
+            maximum = 0
+        elif isinstance(maximum, int):
+            flags |= self.MAXIMUM_INT
+        if aws_type is not None:
+            aws_type = sys.intern(aws_type)
+        self._values.append(value)
+        self._maxima.append(maximum)
+        self._flags.append(flags)
+        self._resource_ids.append(resource_id)
+        self._aws_types.append(aws_type)
+
+    def get_values(self):
+        """
+        Return the usage values of all rows.
+
+        :rtype: list
+        """
+        vint = self.VALUE_INT
+        return [
+            int(v) if f & vint else v
+            for v, f in zip(self._values, self._flags)
+        ]
+
+    def get_maxima(self):
+        """
+        Return the maximums of all rows (None where not set).
+
+        :rtype: list
+        """
+        mint = self.MAXIMUM_INT
+        mnone = self.MAXIMUM_NONE
+        return [
+            None if f & mnone else (int(m) if f & mint else m)
+            for m, f in zip(self._maxima, self._flags)
+        ]
+
+    def __len__(self):
+        return len(self._flags)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self[i] for i in range(*idx.indices(len(self)))]
+        flags = self._flags[idx]
+        value = self._values[idx]
+        if flags & self.VALUE_INT:
+            value = int(value)
+        maximum = None
+        if not flags & self.MAXIMUM_NONE:
+            maximum = self._maxima[idx]
+            if flags & self.MAXIMUM_INT:
+                maximum = int(maximum)
+        return AwsLimitUsage(
+            self.limit, value, maximum=maximum,
+            resource_id=self._resource_ids[idx],
+            aws_type=self._aws_types[idx]
+        )
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+class UsageStats(object):
+
+    __slots__ = ('count', 'total', 'maximum', 'buckets')
+
+    def __init__(self):
+        """
+        Exact aggregate statistics over every usage value added to a limit,
+        whether or not the usage itself is retained.
+
+        ``count``, ``total`` and ``maximum`` are the number, sum and largest
+        of the usage values (``maximum`` is None until a value is added).
+        ``buckets`` is a histogram dict of bucket upper bound to count, where
+        each value is counted in the bucket of the smallest power of two
+        greater than or equal to it (values of zero or less in bucket ``0``).
+        """
+        self.count = 0
+        self.total = 0
+        self.maximum = None
+        self.buckets = {}
+
+    @staticmethod
+    def bucket_for(value):
+        """
+        Return the histogram bucket (upper bound) for a usage value.
+
+        :param value: the usage value
+        :type value: :py:obj:`int` or :py:obj:`float`
+        :rtype: int
+        """
+        if value <= 0:
+            return 0
+        return 1 << (int(math.ceil(value)) - 1).bit_length()
+
+    def add(self, value):
+        """
+        Add one usage value to the statistics.
+
+        :param value: the usage value
+        :type value: :py:obj:`int` or :py:obj:`float`
+        """
+        self.count += 1
+        self.total += value
+        if self.maximum is None or value > self.maximum:
+            self.maximum = value
+        b = self.bucket_for(value)
+        self.buckets[b] = self.buckets.get(b, 0) + 1
+
+    @property
+    def mean(self):
+        """
+        The mean usage value, or None if no values have been added.
+
+        :rtype: :py:obj:`float` or :py:data:`None`
+        """
+        if self.count == 0:
+            return None
+        return self.total / float(self.count)
+
+    def __repr__(self):
+        return 'UsageStats(count=%d, total=%r, maximum=%r)' % (
+            self.count, self.total, self.maximum
+        )
+
+
+class TopUsageStore(object):
+
+    __slots__ = (
+        'limit', 'size', 'stats', '_shared', '_own', '_own_max', '_seq',
+        '_rows'
+    )
+
+    def __init__(self, limit, size):
+        """
+        Bounded storage for the current usage of one :py:class:`~.AwsLimit`
+        created with ``retain_top``. Every usage added is counted in
+        :py:attr:`~.stats`, but only the ``size`` usages with the highest
+        utilization are kept, in heaps, so memory and sorting cost do not
+        grow with the number of resources.
+
+        Usages without their own maximum are all compared against the same
+        effective limit, so the ``size`` largest values are kept. Usages with
+        their own maximum are kept in a second heap, of the same size,
+        ordered by ``value / maximum``, plus the one with the largest value.
+        Either way, if any usage that was dropped would cross a threshold, so
+        would a retained usage; the pass/fail result of
+        :py:meth:`.AwsLimit.check_thresholds` is therefore the same as if all
+        usage was kept, though at most ``size`` usages per heap are reported
+        as warnings or criticals.
+
+        Retained usage behaves like a read-only list of
+        :py:class:`~.AwsLimitUsage`, in the order it was added.
+
+        :param limit: the limit this usage is for
+        :type limit: :py:class:`~.AwsLimit`
+        :param size: the number of usages to keep, per heap
+        :type size: int
+        """
+        self.limit = limit
+        self.size = size
+        self.stats = UsageStats()
+        self._shared = []
+        self._own = []
+        self._own_max = None
+        self._seq = 0
+        self._rows = None
+
+    def append(self, value, maximum=None, resource_id=None, aws_type=None):
+        """
+        Add a usage value; see :py:meth:`.AwsLimit._add_current_usage`.
+        """
+        self.stats.add(value)
+        own_max = False
+        if maximum:
+            heap = self._own
+            key = value / float(maximum)
+            # keep the largest value too, for count thresholds
+            own_max = self._own_max is None or value > self._own_max[2].value
+        else:
+            heap = self._shared
+            key = value
+        self._seq += 1
+        if len(heap) >= self.size and key <= heap[0][0] and not own_max:
+            # would be dropped immediately; skip creating the usage object
+            return
+        item = (key, self._seq, AwsLimitUsage(
+            self.limit, value, maximum=maximum, resource_id=resource_id,
+            aws_type=aws_type
+        ))
+        self._rows = None
+        if own_max:
+            self._own_max = item
+            if len(heap) >= self.size and key <= heap[0][0]:
+                return
+        if len(heap) < self.size:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heapreplace(heap, item)
+
+    def _get_rows(self):
+        """
+        Return the retained :py:class:`~.AwsLimitUsage` instances, in the
+        order they were added.
+
+        :rtype: list
+        """
+        if self._rows is None:
+            items = self._shared + self._own
+            if self._own_max is not None and self._own_max not in self._own:
+                items.append(self._own_max)
+            self._rows = [
+                x[2] for x in sorted(items, key=operator.itemgetter(1))
+            ]
+        return self._rows
+
+    def get_values(self):
+        """
+        Return the usage values of all retained rows.
+
+        :rtype: list
+        """
+        return [u.value for u in self._get_rows()]
+
+    def get_maxima(self):
+        """
+        Return the maximums of all retained rows (None where not set).
+
+        :rtype: list
+        """
+        return [u.maximum for u in self._get_rows()]
+
+    def __len__(self):
+        return len(self._get_rows())
+
+    def __getitem__(self, idx):
+        return self._get_rows()[idx]
+
+    def __iter__(self):
+        return iter(self._get_rows())
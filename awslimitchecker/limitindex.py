@@ -0,0 +1,150 @@
+"""
+awslimitchecker/limitindex.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LimitIndex(object):
+
+    def __init__(self, services=None):
+        """
+        Registry of :py:class:`~.AwsLimit` instances, indexed for constant-time
+        lookup by service and limit name and by Trusted Advisor service name.
+        It is kept up to date as services are added to and removed from an
+        :py:class:`~.AwsLimitChecker`.
+
+        :param services: optional dict of service names to
+          :py:class:`~._AwsService` instances to add
+        :type services: dict
+        """
+        self._by_name = {}
+        self._by_ta = {}
+        if services is not None:
+            for sname in sorted(services.keys()):
+                self.add_service(services[sname])
+
+    def add_service(self, service):
+        """
+        Add (or replace) all limits of one service.
+
+        :param service: the service to add
+        :type service: :py:class:`~._AwsService`
+        """
+        self.remove_service(service.service_name)
+        limits = dict(service.get_limits())
+        self._by_name[service.service_name] = limits
+        for lname in sorted(limits.keys()):
+            lim = limits[lname]
+            self._by_ta.setdefault(
+                lim.ta_service_name, {}
+            )[lim.ta_limit_name] = lim
+        logger.debug('Indexed %d limits for service %s', len(limits),
+                     service.service_name)
+
+    def remove_service(self, service_name):
+        """
+        Remove all limits of one service, if present.
+
+        :param service_name: the name of the service to remove
+        :type service_name: str
+        """
+        limits = self._by_name.pop(service_name, None)
+        if limits is None:
+            return
+        for lim in limits.values():
+            ta_limits = self._by_ta.get(lim.ta_service_name, {})
+            if ta_limits.get(lim.ta_limit_name) is lim:
+                del ta_limits[lim.ta_limit_name]
+                if len(ta_limits) == 0:
+                    del self._by_ta[lim.ta_service_name]
+
+    def get_limit(self, service_name, limit_name):
+        """
+        Return the limit with the given service and limit name, or None.
+
+        :rtype: :py:class:`~.AwsLimit` or :py:data:`None`
+        """
+        return self._by_name.get(service_name, {}).get(limit_name)
+
+    def get_service_limits(self, service_name):
+        """
+        Return a dict of limit name to :py:class:`~.AwsLimit` for one service
+        (empty if the service is not indexed).
+
+        :rtype: dict
+        """
+        return dict(self._by_name.get(service_name, {}))
+
+    def get_service_names(self):
+        """
+        Return the sorted names of all indexed services.
+
+        :rtype: list
+        """
+        return sorted(self._by_name.keys())
+
+    def get_ta_service_limits(self, ta_service_name):
+        """
+        Return a dict of Trusted Advisor limit name to :py:class:`~.AwsLimit`
+        for one Trusted Advisor service name, or None if no limits have it.
+
+        :rtype: :py:obj:`dict` or :py:data:`None`
+        """
+        return self._by_ta.get(ta_service_name)
+
+    def iter_limits(self, service_names=None):
+        """
+        Yield ``(service name, limit name, AwsLimit)`` for every limit of the
+        given services (or of all services if None), sorted by service and
+        limit name.
+
+        :param service_names: names of services to include
+        :type service_names: list
+        """
+        for sname in sorted(self._by_name.keys()):
+            if service_names is not None and sname not in service_names:
+                continue
+            limits = self._by_name[sname]
+            for lname in sorted(limits.keys()):
+                yield sname, lname, limits[lname]
+
+    def __len__(self):
+        return sum(len(x) for x in self._by_name.values())
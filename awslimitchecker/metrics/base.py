@@ -60,6 +60,7 @@ class MetricsProvider(object):
         """
         self._region_name = region_name
         self._duration = 0.0
+        self._ta_refresh_latency = None
         self._limits = []
 
     def set_run_duration(self, duration):
@@ -72,6 +73,17 @@ class MetricsProvider(object):
         """
         self._duration = duration
 
+    def set_ta_refresh_latency(self, latency):
+        """
+        Set the time taken for a Trusted Advisor check refresh to complete
+        (or time out) during this run. This is only set for runs that waited
+        for a refresh; it is useful for tuning ``ta_refresh_timeout``.
+
+        :param latency: seconds waited for the Trusted Advisor refresh
+        :type latency: float
+        """
+        self._ta_refresh_latency = latency
+
     def add_limit(self, limit):
         """
         Cache a given limit for later sending to the metrics store.
@@ -87,7 +99,7 @@ class MetricsProvider(object):
         Flush all metrics to the provider. This is the method that actually
         sends data to your metrics provider/store. It should iterate over
         ``self._limits`` and send metrics for them, as well as for
-        ``self._duration``.
+        ``self._duration`` and (if not None) ``self._ta_refresh_latency``.
         """
         raise NotImplementedError()
 
@@ -131,6 +131,13 @@ class Datadog(MetricsProvider):
             'type': 'gauge',
             'tags': self._tags
         }]
+        if self._ta_refresh_latency is not None:
+            series.append({
+                'metric': '%sta_refresh_latency' % self._prefix,
+                'points': [[ts, self._ta_refresh_latency]],
+                'type': 'gauge',
+                'tags': self._tags
+            })
         for lim in self._limits:
             u = lim.get_current_usage()
             if len(u) == 0:
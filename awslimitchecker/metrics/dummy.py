@@ -52,6 +52,8 @@ class Dummy(MetricsProvider):
     def flush(self):
         print('DummyMetrics Provider flush for region=%s' % self._region_name)
         print('Duration: %s' % self._duration)
+        if self._ta_refresh_latency is not None:
+            print('TA refresh latency: %s' % self._ta_refresh_latency)
         lines = []
         for lim in self._limits:
             u = lim.get_current_usage()
@@ -0,0 +1,1618 @@
+"""
+awslimitchecker/multiaccount.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import argparse
+import inspect
+import json
+import logging
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+)
+from datetime import datetime, timedelta
+
+import boto3
+from pytz import utc
+
+from .alerts import AlertProvider
+from .checker import AwsLimitChecker
+from .connectable import ConnectableCredentials, _client_lock
+from .limit import AwsLimit, AwsLimitUsage
+from .metrics import MetricsProvider
+from .services import _services
+from .utils import StoreKeyValuePair, dict2cols, issue_string_tuple
+from .workqueue import WorkQueue
+
+logger = logging.getLogger(__name__)
+
+#: default name of the IAM role to assume in each account
+DEFAULT_ROLE_NAME = 'awslimitchecker'
+
+_account_id_re = re.compile(r'^[0-9]+$')
+
+#: version of the shard results file format written by
+#: :py:func:`~.write_shard_file`
+SHARD_FILE_VERSION = 1
+
+#: expected cost, in seconds, of a unit of work with no recorded duration
+DEFAULT_UNIT_COST = 1.0
+
+#: stand-in for :py:class:`~._AwsService`, giving metrics providers the
+#: ``service_name`` of a :py:class:`~.LimitSummary`
+_ServiceName = namedtuple('_ServiceName', ['service_name'])
+
+
+def load_accounts_config(path):
+    """
+    Load and validate a multi-account configuration file. This is a JSON
+    object with an ``accounts`` object, mapping numeric account IDs to
+    per-account settings, and an optional ``defaults`` object with settings
+    used for any account that does not set them. Settings are:
+
+    * ``name`` - display name for the account (default: the account ID)
+    * ``role_name`` - name of the IAM role to assume in the account, or
+      ``null`` to use the current credentials (default:
+      :py:data:`~.DEFAULT_ROLE_NAME`)
+    * ``regions`` - list of region names to check (required)
+    * ``limit_overrides`` - limit overrides, in the format of
+      :py:meth:`.AwsLimitChecker.set_limit_overrides`
+    * ``threshold_overrides`` - threshold overrides, in the format of
+      :py:meth:`.AwsLimitChecker.set_threshold_overrides`
+
+    :param path: path to the JSON configuration file
+    :type path: str
+    :returns: dict of account ID to fully-populated account settings
+    :rtype: dict
+    :raises: :py:exc:`ValueError` if the configuration is invalid
+    """
+    with open(path, 'r') as fh:
+        raw = json.loads(fh.read())
+    if not isinstance(raw, dict) or not isinstance(
+        raw.get('accounts'), dict
+    ):
+        raise ValueError(
+            'Accounts config %s must contain an "accounts" object' % path
+        )
+    defaults = {
+        'role_name': DEFAULT_ROLE_NAME,
+        'regions': [],
+        'limit_overrides': {},
+        'threshold_overrides': {}
+    }
+    defaults.update(raw.get('defaults', {}))
+    res = {}
+    for acct_id, acct in raw['accounts'].items():
+        if not _account_id_re.match(acct_id):
+            raise ValueError('Invalid account ID in accounts config: %s' % (
+                acct_id
+            ))
+        conf = dict(defaults)
+        conf['name'] = acct_id
+        conf.update(acct or {})
+        if not conf['regions']:
+            raise ValueError('No regions configured for account %s' % (
+                acct_id
+            ))
+        res[acct_id] = conf
+    return res
+
+
+class CredentialCache(object):
+
+    def __init__(self, region_name=None, role_partition='aws',
+                 external_id=None, refresh_margin=900):
+        """
+        Thread-safe cache of STS assumed-role credentials, keyed by account ID
+        and role name. Cached credentials are reused until ``refresh_margin``
+        seconds before their expiration, so a long run only assumes each role
+        again when it has to.
+
+        :param region_name: region to connect to STS in
+        :type region_name: str
+        :param role_partition: AWS partition of the roles' ARNs
+        :type role_partition: str
+        :param external_id: (optional) External ID to use when assuming roles
+        :type external_id: str
+        :param refresh_margin: number of seconds before expiration at which
+          credentials are refreshed
+        :type refresh_margin: int
+        """
+        self.region_name = region_name
+        self.role_partition = role_partition
+        self.external_id = external_id
+        self.refresh_margin = refresh_margin
+        self._cache = {}
+        self._lock = threading.Lock()
+        self._sts = None
+
+    def _connect(self):
+        """
+        Return the STS client, creating it if needed.
+
+        :rtype: ``botocore.client.STS``
+        """
+        with _client_lock:
+            if self._sts is None:
+                self._sts = boto3.client('sts', region_name=self.region_name)
+        return self._sts
+
+    def _is_fresh(self, creds):
+        """
+        Return whether ``creds`` are valid for at least another
+        ``refresh_margin`` seconds.
+
+        :param creds: cached credentials
+        :type creds: :py:class:`~.ConnectableCredentials`
+        :rtype: bool
+        """
+        return creds.expiration - timedelta(
+            seconds=self.refresh_margin
+        ) > datetime.now(utc)
+
+    def get(self, account_id, role_name):
+        """
+        Return credentials for ``role_name`` in ``account_id``, assuming the
+        role if there are no cached credentials or they expire soon.
+
+        :param account_id: AWS Account ID
+        :type account_id: str
+        :param role_name: name of the IAM role to assume
+        :type role_name: str
+        :rtype: :py:class:`~.ConnectableCredentials`
+        """
+        key = (account_id, role_name)
+        with self._lock:
+            creds = self._cache.get(key)
+        if creds is not None and self._is_fresh(creds):
+            return creds
+        arn = 'arn:%s:iam::%s:role/%s' % (
+            self.role_partition, account_id, role_name
+        )
+        logger.debug('STS assume role for %s', arn)
+        kwargs = {'RoleArn': arn, 'RoleSessionName': 'awslimitchecker'}
+        if self.external_id is not None:
+            kwargs['ExternalId'] = self.external_id
+        creds = ConnectableCredentials(self._connect().assume_role(**kwargs))
+        creds.account_id = account_id
+        with self._lock:
+            self._cache[key] = creds
+        return creds
+
+
+class LimitSummary(object):
+    """
+    Picklable snapshot of the results of one :py:class:`~.AwsLimit`, sent
+    back from a worker process. It provides the parts of the
+    :py:class:`~.AwsLimit` interface used by :py:func:`~.issue_string_tuple`
+    and by :py:class:`~.MetricsProvider` classes.
+    """
+
+    __slots__ = ('service', 'name', '_limit', '_usage', '_warnings',
+                 '_criticals')
+
+    def __init__(self, service_name, name, limit, max_usage, warnings,
+                 criticals):
+        """
+        :param service_name: name of the limit's service
+        :type service_name: str
+        :param name: name of the limit
+        :type name: str
+        :param limit: the effective limit value
+        :type limit: :py:obj:`int` or :py:data:`None`
+        :param max_usage: the largest usage value, or None if there is none
+        :type max_usage: :py:obj:`int` or :py:data:`None`
+        :param warnings: (value, resource ID) 2-tuples of the usages that
+          crossed the warning threshold
+        :type warnings: list
+        :param criticals: (value, resource ID) 2-tuples of the usages that
+          crossed the critical threshold
+        :type criticals: list
+        """
+        self.service = _ServiceName(service_name)
+        self.name = name
+        self._limit = limit
+        self._usage = []
+        if max_usage is not None:
+            self._usage.append(AwsLimitUsage(self, max_usage))
+        self._warnings = [
+            AwsLimitUsage(self, v, resource_id=r) for v, r in warnings
+        ]
+        self._criticals = [
+            AwsLimitUsage(self, v, resource_id=r) for v, r in criticals
+        ]
+
+    @staticmethod
+    def snapshot(service_name, name, limit):
+        """
+        Return the constructor arguments for a :py:class:`~.LimitSummary` of
+        ``limit``, as a tuple of plain values that can be pickled.
+
+        :param service_name: name of the limit's service
+        :type service_name: str
+        :param name: name of the limit
+        :type name: str
+        :param limit: the checked limit
+        :type limit: :py:class:`~.AwsLimit`
+        :rtype: tuple
+        """
+        usage = limit.get_current_usage()
+        return (
+            service_name, name, limit.get_limit(),
+            max(usage).get_value() if len(usage) > 0 else None,
+            [(u.get_value(), u.resource_id) for u in limit.get_warnings()],
+            [(u.get_value(), u.resource_id) for u in limit.get_criticals()]
+        )
+
+    def get_limit(self):
+        return self._limit
+
+    def get_current_usage(self):
+        return self._usage
+
+    def get_warnings(self):
+        return self._warnings
+
+    def get_criticals(self):
+        return self._criticals
+
+
+def _check_job(job):
+    """
+    Worker process entry point: check some services of one account in one
+    region and return the results as plain, picklable values. Exceptions are
+    caught and returned as the ``error`` string, so that one failing job
+    does not stop the run.
+
+    :param job: job description, as built by
+      :py:meth:`.MultiAccountChecker._job`
+    :type job: dict
+    :returns: dict with ``account_id``, ``region``, ``duration``, ``error``,
+      ``limits`` (a list of :py:meth:`.LimitSummary.snapshot` tuples) and
+      ``service_durations`` (dict of service name to seconds taken)
+    :rtype: dict
+    """
+    start = time.time()
+    res = {
+        'account_id': job['account_id'], 'region': job['region'],
+        'limits': [], 'error': None, 'service_durations': {}
+    }
+    try:
+        checker = AwsLimitChecker(
+            region=job['region'], account_id=job['account_id'],
+            credentials=job['credentials'], check_version=False,
+            services=job['services'], **job['checker_kwargs']
+        )
+        checker.set_current_account_id(job['account_id'])
+        if job['threshold_overrides']:
+            checker.set_threshold_overrides(job['threshold_overrides'])
+        if job['limit_overrides']:
+            checker.set_limit_overrides(job['limit_overrides'])
+        for svc in job['services']:
+            svc_start = time.time()
+            checker.check_thresholds(service=[svc], use_ta=job['use_ta'])
+            res['service_durations'][svc] = time.time() - svc_start
+        for sname, lname, lim in checker.get_limit_index().iter_limits():
+            res['limits'].append(LimitSummary.snapshot(sname, lname, lim))
+    except Exception as ex:
+        logger.error('Error checking account %s region %s',
+                     job['account_id'], job['region'], exc_info=True)
+        res['error'] = '%s: %s' % (type(ex).__name__, ex)
+    res['duration'] = time.time() - start
+    return res
+
+
+class JobResult(object):
+
+    def __init__(self, result, name=None):
+        """
+        Results of checking one account in one region.
+
+        :param result: return value of the worker process, or one result of
+          a shard results file
+        :type result: dict
+        :param name: display name of the account
+        :type name: str
+        """
+        #: the result as plain values, as written to shard results files
+        self.result = result
+        self.account_id = result['account_id']
+        self.name = name or result['account_id']
+        self.region = result['region']
+        self.duration = result['duration']
+        self.error = result['error']
+        #: dict of service name to the seconds taken to check it
+        self.service_durations = result.get('service_durations', {})
+        #: list of :py:class:`~.LimitSummary` for every checked limit
+        self.limits = [LimitSummary(*x) for x in result['limits']]
+
+    def get_problems(self):
+        """
+        Return the limits that crossed a threshold, in the same format as
+        :py:meth:`.AwsLimitChecker.check_thresholds`.
+
+        :returns: dict of service name to dict of limit name to
+          :py:class:`~.LimitSummary`
+        :rtype: dict
+        """
+        res = {}
+        for lim in self.limits:
+            if lim.get_warnings() or lim.get_criticals():
+                res.setdefault(
+                    lim.service.service_name, {}
+                )[lim.name] = lim
+        return res
+
+
+class MultiAccountChecker(object):
+
+    def __init__(self, accounts, max_workers=None, max_per_account=2,
+                 credential_cache=None, use_ta=True, checker_kwargs=None):
+        """
+        Check many accounts, each in one or more regions. The work is made up
+        of (account, region, service) units (see :py:meth:`~.get_work_units`);
+        the units of each (account, region) pair are a job run in a worker
+        process of a :py:class:`concurrent.futures.ProcessPoolExecutor`, with
+        at most ``max_per_account`` jobs for any one account running at once
+        to stay clear of per-account API rate limits. Roles are assumed
+        concurrently up front through a shared :py:class:`~.CredentialCache`,
+        and checked again for expiry as each job starts.
+
+        :param accounts: account configuration, as returned by
+          :py:func:`~.load_accounts_config`
+        :type accounts: dict
+        :param max_workers: number of worker processes; defaults to four per
+          CPU, as jobs spend most of their time waiting on AWS APIs
+        :type max_workers: :py:obj:`int` or :py:data:`None`
+        :param max_per_account: maximum number of concurrent jobs per account
+        :type max_per_account: int
+        :param credential_cache: cache to get assumed-role credentials from;
+          a new one is created if None
+        :type credential_cache: :py:class:`~.CredentialCache`
+        :param use_ta: whether to check Trusted Advisor
+        :type use_ta: bool
+        :param checker_kwargs: other keyword arguments for each
+          :py:class:`~.AwsLimitChecker`, such as ``warning_threshold``
+        :type checker_kwargs: dict
+        :raises: :py:exc:`ValueError` if ``max_per_account`` is less than 1
+        """
+        if max_per_account < 1:
+            raise ValueError('max_per_account must be at least 1')
+        self.accounts = accounts
+        self.max_workers = max_workers or (os.cpu_count() or 1) * 4
+        self.max_per_account = max_per_account
+        self.credential_cache = credential_cache or CredentialCache()
+        self.use_ta = use_ta
+        self.checker_kwargs = checker_kwargs or {}
+
+    def get_jobs(self, account_ids=None):
+        """
+        Return the (account ID, region) jobs to run, interleaving accounts so
+        that the per-account cap does not hold back the start of the run.
+
+        :param account_ids: IDs or names of the accounts to check, or None
+          for all of them
+        :type account_ids: :py:obj:`list` or :py:data:`None`
+        :rtype: list
+        :raises: :py:exc:`ValueError` for an unknown account ID or name
+        """
+        if not account_ids:
+            ids = sorted(self.accounts.keys())
+        else:
+            by_name = dict(
+                (c['name'], a) for a, c in self.accounts.items()
+            )
+            ids = []
+            for x in account_ids:
+                if x not in self.accounts and x not in by_name:
+                    raise ValueError('Unknown account ID or name: %s' % x)
+                ids.append(x if x in self.accounts else by_name[x])
+        jobs = []
+        for acct_id in ids:
+            for idx, region in enumerate(self.accounts[acct_id]['regions']):
+                jobs.append((idx, acct_id, region))
+        return [(a, r) for _, a, r in sorted(jobs)]
+
+    def get_work_units(self, account_ids=None):
+        """
+        Return the (account ID, region, service name) units of work to run,
+        in the order of :py:meth:`~.get_jobs`. Account-global services (see
+        :py:attr:`~._AwsService.is_global`) are only included in the first
+        configured region of each account.
+
+        :param account_ids: IDs or names of the accounts to check, or None
+          for all of them
+        :type account_ids: :py:obj:`list` or :py:data:`None`
+        :rtype: list
+        """
+        res = []
+        for acct_id, region in self.get_jobs(account_ids):
+            first = region == self.accounts[acct_id]['regions'][0]
+            for svc in sorted(_services.keys()):
+                if first or not _services[svc].is_global:
+                    res.append((acct_id, region, svc))
+        return res
+
+    def _credentials(self, account_id):
+        """
+        Return boto3 credential keyword arguments for ``account_id``; empty
+        if the account has no role to assume.
+
+        :param account_id: AWS Account ID
+        :type account_id: str
+        :rtype: dict
+        """
+        role_name = self.accounts[account_id]['role_name']
+        if role_name is None:
+            return {}
+        creds = self.credential_cache.get(account_id, role_name)
+        return {
+            'aws_access_key_id': creds.access_key,
+            'aws_secret_access_key': creds.secret_key,
+            'aws_session_token': creds.session_token
+        }
+
+    def _prefetch_credentials(self, account_ids):
+        """
+        Assume the roles for all of ``account_ids`` concurrently, so that
+        jobs do not wait on STS one account at a time. Failures are only
+        logged here; they are reported by the affected jobs.
+
+        :param account_ids: account IDs
+        :type account_ids: list
+        """
+        with ThreadPoolExecutor(max_workers=min(
+            32, max(1, len(account_ids))
+        )) as executor:
+            futures = dict(
+                (executor.submit(self._credentials, a), a)
+                for a in account_ids
+            )
+        for fut, acct_id in futures.items():
+            if fut.exception() is not None:
+                logger.warning('Unable to assume role in account %s: %s',
+                               acct_id, fut.exception())
+
+    def _job(self, account_id, region, services):
+        """
+        Build the description of one job, passed to :py:func:`~._check_job`.
+
+        :param account_id: AWS Account ID
+        :type account_id: str
+        :param region: region name
+        :type region: str
+        :param services: names of the services to check
+        :type services: list
+        :rtype: dict
+        """
+        conf = self.accounts[account_id]
+        return {
+            'account_id': account_id,
+            'region': region,
+            'services': services,
+            'credentials': self._credentials(account_id),
+            'use_ta': self.use_ta,
+            'limit_overrides': dict(
+                (k, v) for k, v in conf['limit_overrides'].items()
+                if k in services
+            ),
+            'threshold_overrides': dict(
+                (k, v) for k, v in conf['threshold_overrides'].items()
+                if k in services
+            ),
+            'checker_kwargs': self.checker_kwargs
+        }
+
+    def iter_results(self, account_ids=None, units=None):
+        """
+        Run all jobs and yield a :py:class:`~.JobResult` for each one as it
+        completes, so results can be reported while other jobs still run.
+
+        :param account_ids: IDs or names of the accounts to check, or None
+          for all of them
+        :type account_ids: :py:obj:`list` or :py:data:`None`
+        :param units: the (account ID, region, service name) units to run,
+          such as one shard from :py:func:`~.partition_units`; defaults to
+          all units of ``account_ids``
+        :type units: :py:obj:`list` or :py:data:`None`
+        :rtype: generator
+        """
+        if units is None:
+            units = self.get_work_units(account_ids)
+        services = {}
+        for acct_id, region, svc in units:
+            services.setdefault((acct_id, region), []).append(svc)
+        order = dict((j, i) for i, j in enumerate(self.get_jobs()))
+        pending = sorted(services.keys(), key=lambda j: order[j])
+        self._prefetch_credentials(sorted(set(a for a, _ in pending)))
+        running = {}
+        per_account = {}
+        with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                idx = 0
+                while len(running) < self.max_workers and idx < len(pending):
+                    acct_id, region = pending[idx]
+                    if per_account.get(acct_id, 0) >= self.max_per_account:
+                        idx += 1
+                        continue
+                    pending.pop(idx)
+                    try:
+                        job = self._job(
+                            acct_id, region,
+                            sorted(services[(acct_id, region)])
+                        )
+                    except Exception as ex:
+                        yield JobResult({
+                            'account_id': acct_id, 'region': region,
+                            'duration': 0.0, 'limits': [],
+                            'error': '%s: %s' % (type(ex).__name__, ex)
+                        }, name=self.accounts[acct_id]['name'])
+                        continue
+                    running[executor.submit(_check_job, job)] = acct_id
+                    per_account[acct_id] = per_account.get(acct_id, 0) + 1
+                if not running:
+                    continue
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for fut in [f for f in running if f in done]:
+                    acct_id = running.pop(fut)
+                    per_account[acct_id] -= 1
+                    yield JobResult(
+                        fut.result(), name=self.accounts[acct_id]['name']
+                    )
+
+    def run_queue(self, queue, account_ids=None, lease_seconds=900,
+                  max_attempts=3, poll_interval=5):
+        """
+        Coordinate a run through a :py:class:`~.WorkQueue`: enqueue every
+        work unit, wait for :py:class:`~.QueueWorker` processes (on any
+        number of hosts) to finish them, and then evaluate thresholds for
+        the collected usage. Workers pull items as they become free, so slow
+        units do not hold up the others; failed items and items whose lease
+        expires are retried.
+
+        :param queue: the work queue
+        :type queue: :py:class:`~.WorkQueue`
+        :param account_ids: IDs or names of the accounts to check, or None
+          for all of them
+        :type account_ids: :py:obj:`list` or :py:data:`None`
+        :param lease_seconds: how long a worker may work on an item before it
+          is given to another worker
+        :type lease_seconds: float
+        :param max_attempts: how many times an item is attempted before it is
+          reported as failed
+        :type max_attempts: int
+        :param poll_interval: seconds to wait between checks of the queue
+        :type poll_interval: float
+        :returns: list of :py:class:`~.JobResult`, sorted by account and
+          region
+        :rtype: list
+        """
+        cache = self.credential_cache
+        queue.start_run(self.get_work_units(account_ids), {
+            'accounts': self.accounts,
+            'use_ta': self.use_ta,
+            'checker_kwargs': self.checker_kwargs,
+            'sts': {
+                'region_name': cache.region_name,
+                'role_partition': cache.role_partition,
+                'external_id': cache.external_id,
+                'refresh_margin': cache.refresh_margin
+            }
+        }, lease_seconds=lease_seconds, max_attempts=max_attempts)
+        while True:
+            queue.reap()
+            if queue.is_finished():
+                break
+            logger.info('Work queue items: %s', queue.counts())
+            time.sleep(poll_interval)
+        return queue_results(queue.finished_items(), self.accounts)
+
+
+def _usage_data(limit):
+    """
+    Return the effective limit, thresholds and usage of ``limit`` as plain
+    values, for :py:func:`~.evaluate_limits`.
+
+    :param limit: the limit, after its usage has been found
+    :type limit: :py:class:`~.AwsLimit`
+    :returns: 4-item list of limit name, effective limit, the 4-item list
+      from :py:meth:`.AwsLimit._get_thresholds`, and a list of
+      ``[value, maximum, resource_id]`` usages
+    :rtype: list
+    """
+    return [
+        limit.name, limit.get_limit(), list(limit._get_thresholds()),
+        [
+            [u.get_value(), u.get_maximum(), u.resource_id]
+            for u in limit.get_current_usage()
+        ]
+    ]
+
+
+def evaluate_limits(service_name, limits):
+    """
+    Evaluate thresholds for the usage collected by a
+    :py:class:`~.QueueWorker`, by rebuilding each :py:class:`~.AwsLimit`
+    with its effective limit, thresholds and usage and calling
+    :py:meth:`.AwsLimit.check_thresholds`.
+
+    :param service_name: name of the service
+    :type service_name: str
+    :param limits: list of :py:func:`~._usage_data` lists
+    :type limits: list
+    :returns: list of :py:meth:`.LimitSummary.snapshot` tuples
+    :rtype: list
+    """
+    res = []
+    for name, value, thresholds, usage in limits:
+        warn_count, warn_pct, crit_count, crit_pct = thresholds
+        # the constructor requires default warning < critical thresholds, but
+        # overrides (as on _AwsService) need not be ordered
+        lim = AwsLimit(name, _ServiceName(service_name), value, 80, 99)
+        lim.set_threshold_override(
+            warn_percent=warn_pct, warn_count=warn_count,
+            crit_percent=crit_pct, crit_count=crit_count
+        )
+        for u_value, u_max, u_id in usage:
+            lim._add_current_usage(u_value, maximum=u_max, resource_id=u_id)
+        lim.check_thresholds()
+        res.append(LimitSummary.snapshot(service_name, name, lim))
+    return res
+
+
+def queue_results(items, accounts):
+    """
+    Turn the finished items of a :py:class:`~.WorkQueue` run into one
+    :py:class:`~.JobResult` per account and region, evaluating thresholds
+    with :py:func:`~.evaluate_limits`. Failed items are reported as errors
+    of their account and region.
+
+    :param items: items from :py:meth:`.WorkQueue.finished_items`
+    :type items: list
+    :param accounts: account configuration
+    :type accounts: dict
+    :returns: list of :py:class:`~.JobResult`, sorted by account and region
+    :rtype: list
+    """
+    grouped = {}
+    for item in items:
+        grouped.setdefault(
+            (item['account_id'], item['region']), []
+        ).append(item)
+    res = []
+    for acct_id, region in sorted(grouped.keys()):
+        limits = []
+        errors = []
+        durations = {}
+        for item in grouped[(acct_id, region)]:
+            if item['duration'] is not None:
+                durations[item['service']] = item['duration']
+            if item['state'] == 'failed':
+                errors.append('%s: %s' % (item['service'], item['error']))
+                continue
+            limits.extend(
+                evaluate_limits(item['service'], item['result']['limits'])
+            )
+        res.append(JobResult({
+            'account_id': acct_id,
+            'region': region,
+            'duration': sum(durations.values()),
+            'error': '; '.join(errors) or None,
+            'service_durations': durations,
+            'limits': limits
+        }, name=accounts[acct_id]['name']))
+    return res
+
+
+class QueueWorker(object):
+
+    def __init__(self, queue, owner=None):
+        """
+        Worker that takes (account, region, service) items from a
+        :py:class:`~.WorkQueue`, finds the service's usage and limits, and
+        records them in the queue for :py:meth:`.MultiAccountChecker.run_queue`
+        to evaluate. The accounts config and check settings are read from the
+        queue. The :py:class:`~.AwsLimitChecker` of the last account and
+        region is kept for following items of the same account and region.
+
+        :param queue: the work queue
+        :type queue: :py:class:`~.WorkQueue`
+        :param owner: unique name of this worker; defaults to the host name
+          and process ID
+        :type owner: str
+        """
+        self.queue = queue
+        self.owner = owner or '%s:%d' % (socket.gethostname(), os.getpid())
+        self._run_id = None
+        self._accounts = None
+        self._checker = None
+        self._checker_key = None
+
+    def _load_run(self, run_id):
+        """
+        Load the settings of run ``run_id`` from the queue.
+
+        :param run_id: ID of the run
+        :type run_id: str
+        """
+        self._run_id, data = self.queue.get_run_data()
+        if self._run_id != run_id:
+            raise RuntimeError('Work queue run changed while loading it')
+        self._accounts = MultiAccountChecker(
+            data['accounts'],
+            credential_cache=CredentialCache(**data['sts']),
+            use_ta=data['use_ta'],
+            checker_kwargs=data['checker_kwargs']
+        )
+        self._checker = None
+        self._checker_key = None
+
+    def _get_checker(self, account_id, region):
+        """
+        Return an :py:class:`~.AwsLimitChecker` for ``account_id`` in
+        ``region``, reusing the last one if it is for the same account and
+        region and its credentials are still current.
+
+        :param account_id: AWS Account ID
+        :type account_id: str
+        :param region: region name
+        :type region: str
+        :rtype: :py:class:`~.AwsLimitChecker`
+        """
+        creds = self._accounts._credentials(account_id)
+        key = (account_id, region, creds.get('aws_access_key_id'))
+        if key == self._checker_key:
+            return self._checker
+        conf = self._accounts.accounts[account_id]
+        checker = AwsLimitChecker(
+            region=region, account_id=account_id, credentials=creds,
+            check_version=False, **self._accounts.checker_kwargs
+        )
+        checker.set_current_account_id(account_id)
+        if conf['threshold_overrides']:
+            checker.set_threshold_overrides(conf['threshold_overrides'])
+        if conf['limit_overrides']:
+            checker.set_limit_overrides(conf['limit_overrides'])
+        self._checker = checker
+        self._checker_key = key
+        return checker
+
+    def work(self, item):
+        """
+        Work on one leased item and record its result or error in the queue.
+
+        :param item: the item, as returned by :py:meth:`.WorkQueue.lease`
+        :type item: dict
+        :returns: whether the item succeeded
+        :rtype: bool
+        """
+        if item['run_id'] != self._run_id:
+            self._load_run(item['run_id'])
+        start = time.time()
+        try:
+            checker = self._get_checker(item['account_id'], item['region'])
+            checker.find_usage(
+                service=[item['service']], use_ta=self._accounts.use_ta
+            )
+            limits = [
+                _usage_data(lim) for _, _, lim in
+                checker.get_limit_index().iter_limits([item['service']])
+            ]
+        except Exception as ex:
+            logger.error('Error checking account %s region %s service %s',
+                         item['account_id'], item['region'], item['service'],
+                         exc_info=True)
+            self.queue.fail(
+                item['id'], self.owner, '%s: %s' % (type(ex).__name__, ex)
+            )
+            return False
+        if not self.queue.complete(
+            item['id'], self.owner, {'limits': limits}, time.time() - start
+        ):
+            logger.warning('Lease on work item %d expired before it was '
+                           'completed; result discarded', item['id'])
+        return True
+
+    def run(self, poll_interval=5):
+        """
+        Work on items until the queue's run is finished.
+
+        :param poll_interval: seconds to wait for more items when none are
+          pending but the run is not finished
+        :type poll_interval: float
+        :returns: number of items worked on
+        :rtype: int
+        """
+        count = 0
+        while True:
+            item = self.queue.lease(self.owner)
+            if item is None:
+                if self.queue.is_finished():
+                    return count
+                time.sleep(poll_interval)
+                continue
+            self.work(item)
+            count += 1
+
+
+def _unit_key(unit):
+    """
+    Return the history key of an (account ID, region, service name) unit.
+
+    :param unit: the work unit
+    :type unit: tuple
+    :rtype: str
+    """
+    return '/'.join(unit)
+
+
+def _write_json(path, data):
+    """
+    Write ``data`` as JSON to ``path``, replacing the file atomically so that
+    concurrent readers never see a partial write.
+
+    :param path: path to write to
+    :type path: str
+    :param data: JSON-serializable data to write
+    :type data: object
+    """
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as fh:
+        fh.write(json.dumps(data, sort_keys=True, indent=2))
+    os.replace(tmp_path, path)
+
+
+def load_history(path):
+    """
+    Load a durations history file, as written by :py:func:`~.save_history`.
+    This is a JSON object mapping ``account/region/service`` keys to the
+    number of seconds that unit of work took to check.
+
+    :param path: path to the history file
+    :type path: str
+    :returns: dict of unit key to seconds; empty if the file does not exist
+    :rtype: dict
+    :raises: :py:exc:`ValueError` if the file is not a JSON object
+    """
+    if not os.path.exists(path):
+        logger.debug('Durations history file %s does not exist', path)
+        return {}
+    with open(path, 'r') as fh:
+        data = json.loads(fh.read())
+    if not isinstance(data, dict):
+        raise ValueError('Durations history %s must be a JSON object' % path)
+    return data
+
+
+def save_history(path, history):
+    """
+    Write a durations history file; see :py:func:`~.load_history`.
+
+    :param path: path to the history file
+    :type path: str
+    :param history: dict of unit key to seconds
+    :type history: dict
+    """
+    _write_json(path, history)
+
+
+def update_history(history, results, weight=0.5):
+    """
+    Return a new durations history with the per-service durations of
+    ``results`` blended into ``history`` as an exponentially weighted moving
+    average. Results with an error are left out, as their durations are not
+    representative.
+
+    :param history: current durations history
+    :type history: dict
+    :param results: job results
+    :type results: list
+    :param weight: weight of the new durations, from 0 to 1
+    :type weight: float
+    :rtype: dict
+    """
+    res = dict(history)
+    for result in results:
+        if result.error is not None:
+            continue
+        for svc, secs in result.service_durations.items():
+            key = _unit_key((result.account_id, result.region, svc))
+            if key in res:
+                secs = weight * secs + (1 - weight) * res[key]
+            res[key] = round(secs, 3)
+    return res
+
+
+def _unit_costs(units, history):
+    """
+    Return the expected cost, in seconds, of each of ``units``. Units
+    missing from ``history`` cost the mean of the service's recorded
+    durations in other accounts and regions, or :py:data:`~.DEFAULT_UNIT_COST`
+    if there are none.
+
+    :param units: (account ID, region, service name) work units
+    :type units: list
+    :param history: durations history
+    :type history: dict
+    :returns: dict of unit to cost
+    :rtype: dict
+    """
+    by_service = {}
+    for key, secs in history.items():
+        by_service.setdefault(key.rsplit('/', 1)[-1], []).append(secs)
+    means = dict(
+        (svc, sum(sorted(x)) / len(x)) for svc, x in by_service.items()
+    )
+    return dict(
+        (unit, history.get(
+            _unit_key(unit), means.get(unit[2], DEFAULT_UNIT_COST)
+        ))
+        for unit in units
+    )
+
+
+def partition_units(units, count, history=None):
+    """
+    Split ``units`` into ``count`` shards of about equal expected duration.
+    Units are assigned most expensive first, each to the shard with the
+    least total cost so far (the "longest processing time" heuristic), with
+    ties broken by unit and shard order. The result depends only on the
+    arguments, so every shard of a run computes the same partition as long
+    as they are given the same accounts config and history.
+
+    :param units: (account ID, region, service name) work units, as returned
+      by :py:meth:`.MultiAccountChecker.get_work_units`
+    :type units: list
+    :param count: number of shards
+    :type count: int
+    :param history: durations history, as returned by
+      :py:func:`~.load_history`
+    :type history: dict
+    :returns: list of ``count`` sorted lists of units
+    :rtype: list
+    :raises: :py:exc:`ValueError` if ``count`` is less than 1
+    """
+    if count < 1:
+        raise ValueError('Shard count must be at least 1')
+    costs = _unit_costs(units, history or {})
+    shards = [[] for _ in range(count)]
+    loads = [0.0] * count
+    for unit in sorted(units, key=lambda u: (-costs[u], u)):
+        idx = min(range(count), key=lambda i: (loads[i], i))
+        shards[idx].append(unit)
+        loads[idx] += costs[unit]
+    return [sorted(x) for x in shards]
+
+
+def write_shard_file(path, shard, results):
+    """
+    Write the results of one shard to ``path``. The file is a JSON object
+    with ``format`` (always ``awslimitchecker-shard``), ``version``
+    (:py:data:`~.SHARD_FILE_VERSION`), ``shard`` (a 2-item ``[index,
+    count]`` list, with ``index`` counted from 1) and ``results``, a list of
+    the :py:attr:`.JobResult.result` dicts with the account ``name`` added.
+
+    :param path: path to write to
+    :type path: str
+    :param shard: (index, count) of the shard
+    :type shard: tuple
+    :param results: the shard's job results
+    :type results: list
+    """
+    _write_json(path, {
+        'format': 'awslimitchecker-shard',
+        'version': SHARD_FILE_VERSION,
+        'shard': list(shard),
+        'results': [dict(r.result, name=r.name) for r in results]
+    })
+
+
+def load_shard_file(path):
+    """
+    Read a file written by :py:func:`~.write_shard_file`.
+
+    :param path: path to the shard results file
+    :type path: str
+    :returns: 2-tuple of (index, count) and list of :py:class:`~.JobResult`
+    :rtype: tuple
+    :raises: :py:exc:`ValueError` if the file is not a shard results file of
+      a supported version
+    """
+    with open(path, 'r') as fh:
+        data = json.loads(fh.read())
+    if not isinstance(data, dict) or data.get(
+        'format'
+    ) != 'awslimitchecker-shard':
+        raise ValueError('%s is not an awslimitchecker shard results file' % (
+            path
+        ))
+    if data.get('version') != SHARD_FILE_VERSION:
+        raise ValueError(
+            'Unsupported shard results file version %s in %s' % (
+                data.get('version'), path
+            )
+        )
+    return tuple(data['shard']), [
+        JobResult(r, name=r.get('name')) for r in data['results']
+    ]
+
+
+def merge_results(results):
+    """
+    Combine job results for the same account and region, such as those of
+    different shards, into one :py:class:`~.JobResult` each.
+
+    :param results: job results
+    :type results: list
+    :returns: list of :py:class:`~.JobResult`, sorted by account and region
+    :rtype: list
+    """
+    grouped = {}
+    for r in results:
+        grouped.setdefault((r.account_id, r.region), []).append(r)
+    res = []
+    for acct_id, region in sorted(grouped.keys()):
+        parts = grouped[(acct_id, region)]
+        errors = [p.error for p in parts if p.error is not None]
+        durations = {}
+        limits = []
+        for p in parts:
+            durations.update(p.service_durations)
+            limits.extend(p.result['limits'])
+        res.append(JobResult({
+            'account_id': acct_id,
+            'region': region,
+            'duration': sum(p.duration for p in parts),
+            'error': '; '.join(errors) or None,
+            'service_durations': durations,
+            'limits': limits
+        }, name=parts[0].name))
+    return res
+
+
+def merge_shard_files(paths):
+    """
+    Read and merge the shard results files of one run; see
+    :py:func:`~.merge_results`.
+
+    :param paths: paths to all of the run's shard results files
+    :type paths: list
+    :returns: list of :py:class:`~.JobResult`, sorted by account and region
+    :rtype: list
+    :raises: :py:exc:`ValueError` if the files are not exactly one of each
+      shard of the same run
+    """
+    if not paths:
+        raise ValueError('No shard results files to merge')
+    seen = {}
+    count = None
+    results = []
+    for path in paths:
+        (index, shard_count), shard_results = load_shard_file(path)
+        if count is None:
+            count = shard_count
+        elif shard_count != count:
+            raise ValueError(
+                '%s is shard %d/%d, but other files have %d shards' % (
+                    path, index, shard_count, count
+                )
+            )
+        if index in seen:
+            raise ValueError('Shard %d/%d is in both %s and %s' % (
+                index, count, seen[index], path
+            ))
+        seen[index] = path
+        results.extend(shard_results)
+    missing = sorted(set(range(1, count + 1)) - set(seen.keys()))
+    if missing:
+        raise ValueError('Missing shard(s) %s of %d' % (
+            ', '.join(str(x) for x in missing), count
+        ))
+    return merge_results(results)
+
+
+def format_result(result, colorize=True):
+    """
+    Format the report for one :py:class:`~.JobResult`, and return how severe
+    its problems are.
+
+    :param result: the job result
+    :type result: :py:class:`~.JobResult`
+    :param colorize: whether to colorize output
+    :type colorize: bool
+    :returns: 2-tuple of severity (2 for criticals or an error, 1 for
+      warnings, otherwise 0) and the report text
+    :rtype: tuple
+    """
+    lines = ['%s (%s) %s' % (result.account_id, result.name, result.region)]
+    if result.error is not None:
+        lines.append('\tERROR: %s' % result.error)
+        return 2, '\n'.join(lines)
+    res = 0
+    columns = {}
+    problems = result.get_problems()
+    for svc in sorted(problems.keys()):
+        for lim_name in sorted(problems[svc].keys()):
+            limit = problems[svc][lim_name]
+            crits = limit.get_criticals()
+            warns = limit.get_warnings()
+            res = max(res, 2 if crits else 1)
+            k, v = issue_string_tuple(
+                svc, limit, crits, warns, colorize=colorize
+            )
+            columns[k] = v
+    if not columns:
+        lines.append('\tNo problems found.')
+    for line in dict2cols(columns).splitlines():
+        lines.append('\t%s' % line)
+    return res, '\n'.join(lines)
+
+
+def _metrics_config(provider, config, account_id):
+    """
+    Return the constructor keyword arguments for a metrics provider instance
+    for ``account_id``. Providers tag their metrics with the region only; for
+    those that take ``extra_tags``, an ``account_id:<ID>`` tag is added so
+    that metrics from different accounts stay apart.
+
+    :param provider: metrics provider class
+    :type provider: class
+    :param config: metrics provider configuration from the command line
+    :type config: dict
+    :param account_id: AWS Account ID
+    :type account_id: str
+    :rtype: dict
+    """
+    res = dict(config)
+    if 'extra_tags' in inspect.signature(provider.__init__).parameters:
+        tags = [x for x in res.get('extra_tags', '').split(',') if x]
+        tags.append('account_id:%s' % account_id)
+        res['extra_tags'] = ','.join(tags)
+    return res
+
+
+class _Report(object):
+
+    def __init__(self, args, region_name):
+        """
+        Report job results for a whole run: print each result as it is
+        added, then send metrics and a single alert for the run in
+        :py:meth:`~.finish`.
+
+        :param args: parsed command line arguments
+        :type args: :py:class:`argparse.Namespace`
+        :param region_name: region name(s) to give the alert provider
+        :type region_name: str
+        """
+        self.colorize = not args.no_color
+        self.metrics_config = args.metrics_config
+        self.provider = None
+        if args.metrics_provider:
+            self.provider = MetricsProvider.get_provider_by_name(
+                args.metrics_provider
+            )
+        self.alerter = None
+        if args.alert_provider:
+            self.alerter = AlertProvider.get_provider_by_name(
+                args.alert_provider
+            )(region_name, **args.alert_config)
+        self.results = []
+        self.metrics = []
+        self.problems = {}
+        self.problem_texts = []
+        self.severity = 0
+
+    def add(self, result):
+        """
+        Print one job result and record it for metrics and alerts.
+
+        :param result: the job result
+        :type result: :py:class:`~.JobResult`
+        """
+        self.results.append(result)
+        severity, text = format_result(result, colorize=self.colorize)
+        print(text)
+        self.severity = max(self.severity, severity)
+        if self.alerter is not None and severity > 0:
+            self.problem_texts.append(format_result(result, colorize=False)[1])
+            for svc, limits in result.get_problems().items():
+                self.problems['%s/%s/%s' % (
+                    result.account_id, result.region, svc
+                )] = limits
+        if self.provider is not None and result.error is None:
+            m = self.provider(result.region, **_metrics_config(
+                self.provider, self.metrics_config, result.account_id
+            ))
+            m.set_run_duration(result.duration)
+            for lim in result.limits:
+                m.add_limit(lim)
+            self.metrics.append(m)
+
+    def finish(self, duration=None):
+        """
+        Flush all metrics and send the alert for the run.
+
+        :param duration: duration of the run, in seconds
+        :type duration: :py:obj:`float` or :py:data:`None`
+        :returns: the exit code for the run; see :py:func:`~.format_result`
+        :rtype: int
+        """
+        for m in self.metrics:
+            m.flush()
+        if self.alerter is None:
+            return self.severity
+        if self.severity == 2:
+            self.alerter.on_critical(
+                self.problems, '\n'.join(self.problem_texts),
+                duration=duration
+            )
+        elif self.severity == 1:
+            self.alerter.on_warning(
+                self.problems, '\n'.join(self.problem_texts),
+                duration=duration
+            )
+        else:
+            self.alerter.on_success(duration=duration)
+        return self.severity
+
+
+def _parse_shard(value):
+    """
+    Parse a ``--shard`` option value of the form ``INDEX/COUNT``.
+
+    :param value: option value
+    :type value: str
+    :returns: 2-tuple of (index, count)
+    :rtype: tuple
+    :raises: :py:exc:`argparse.ArgumentTypeError` if the value is invalid
+    """
+    m = re.match(r'^([0-9]+)/([0-9]+)$', value)
+    if m is None or not 1 <= int(m.group(1)) <= int(m.group(2)):
+        raise argparse.ArgumentTypeError(
+            'must be INDEX/COUNT, with INDEX from 1 to COUNT'
+        )
+    return int(m.group(1)), int(m.group(2))
+
+
+def _add_report_args(p):
+    """
+    Add the command line options shared by the check and merge commands.
+
+    :param p: argument parser
+    :type p: :py:class:`argparse.ArgumentParser`
+    """
+    p.add_argument('--metrics-provider', type=str, action='store',
+                   default=None,
+                   help='Metrics provider class name, to enable sending '
+                        'metrics; one provider instance is used per account'
+                        ' and region')
+    p.add_argument('--metrics-config', action=StoreKeyValuePair,
+                   default={},
+                   help='Specify key/value parameters for the metrics '
+                        'provider constructor.')
+    p.add_argument('--alert-provider', type=str, action='store',
+                   default=None,
+                   help='Alert provider class name, to enable sending a '
+                        'notification for the whole run')
+    p.add_argument('--alert-config', action=StoreKeyValuePair, default={},
+                   help='Specify key/value parameters for the alert '
+                        'provider constructor.')
+    p.add_argument('--no-color', action='store_true', default=False,
+                   help='do not colorize output')
+    p.add_argument('-v', '--verbose', dest='verbose', action='count',
+                   default=0,
+                   help='verbose output. specify twice for debug-level '
+                        'output.')
+
+
+_EPILOG = 'awslimitchecker is AGPLv3-licensed Free Software. Anyone using ' \
+          'this program, even remotely over a network, is entitled to a ' \
+          'copy of the source code.'
+
+
+def parse_args(argv):
+    """
+    Parse command line arguments for :py:func:`~.console_entry_point`.
+
+    :param argv: argument list to parse, usually ``sys.argv[1:]``
+    :type argv: list
+    :returns: parsed arguments
+    :rtype: :py:class:`argparse.Namespace`
+    """
+    p = argparse.ArgumentParser(
+        description='Check AWS service limits and usage in many accounts '
+                    'and regions at once. Run "%(prog)s merge --help" for '
+                    'merging the results of sharded runs, and "%(prog)s '
+                    'worker --help" for working on --queue runs.',
+        epilog=_EPILOG
+    )
+    p.add_argument('CONFIG', help='path to the JSON accounts config file')
+    p.add_argument('ACCOUNT', nargs='*',
+                   help='check only these account IDs or names')
+    p.add_argument('-j', '--workers', dest='workers', action='store',
+                   type=int, default=None,
+                   help='number of worker processes (default: 4 per CPU)')
+    p.add_argument('--max-per-account', dest='max_per_account',
+                   action='store', type=int, default=2,
+                   help='maximum number of regions to check at once in any'
+                        ' one account (default: 2)')
+    p.add_argument('-W', '--warning-threshold', action='store', type=int,
+                   default=80,
+                   help='default warning threshold (percentage of limit);'
+                        ' default: 80')
+    p.add_argument('-C', '--critical-threshold', action='store', type=int,
+                   default=99,
+                   help='default critical threshold (percentage of limit);'
+                        ' default: 99')
+    p.add_argument('--sts-region', dest='sts_region', action='store',
+                   type=str, default=None,
+                   help='region to assume roles via STS in')
+    p.add_argument('--role-partition', action='store', type=str,
+                   default='aws',
+                   help='AWS partition name of the roles to assume '
+                        '(default: "aws")')
+    p.add_argument('-E', '--external-id', action='store', type=str,
+                   default=None,
+                   help='External ID to use when assuming roles via STS')
+    p.add_argument('--skip-ta', action='store_true', default=False,
+                   help='do not attempt to pull *any* information on limits'
+                        ' from Trusted Advisor')
+    p.add_argument('--shard', action='store', type=_parse_shard,
+                   default=None, metavar='INDEX/COUNT',
+                   help='check only shard INDEX (counting from 1) of COUNT '
+                        'shards of the work, balanced using --history; '
+                        'requires --output')
+    p.add_argument('-o', '--output', action='store', type=str, default=None,
+                   help='write the results to this shard results file, for '
+                        'the merge command')
+    p.add_argument('--history', action='store', type=str, default=None,
+                   help='durations history file, used to balance shards; '
+                        'updated at the end of unsharded runs')
+    p.add_argument('--queue', action='store', type=str, default=None,
+                   help='instead of checking in local worker processes, '
+                        'enqueue the work in this SQLite work queue file and '
+                        'wait for "%(prog)s worker" processes to do it')
+    p.add_argument('--lease-seconds', action='store', type=float,
+                   default=900,
+                   help='with --queue, seconds a worker may take on one work '
+                        'item before it is retried (default: 900)')
+    p.add_argument('--max-attempts', action='store', type=int, default=3,
+                   help='with --queue, number of times a work item is '
+                        'attempted before it is reported as failed '
+                        '(default: 3)')
+    p.add_argument('--poll-interval', action='store', type=float, default=5,
+                   help='with --queue, seconds between checks of the work '
+                        'queue (default: 5)')
+    _add_report_args(p)
+    args = p.parse_args(argv)
+    if args.shard is not None and args.output is None:
+        p.error('--shard requires -o/--output')
+    if args.shard is not None and args.queue is not None:
+        p.error('--shard and --queue cannot be used together')
+    if args.shard is not None and (
+        args.metrics_provider or args.alert_provider
+    ):
+        # the merge command flushes metrics and alerts once for the run
+        p.error('--shard cannot be used with --metrics-provider or '
+                '--alert-provider; pass them to the merge command instead')
+    return args
+
+
+def parse_merge_args(argv):
+    """
+    Parse command line arguments for :py:func:`~.merge_entry_point`.
+
+    :param argv: argument list to parse, after the ``merge`` command
+    :type argv: list
+    :returns: parsed arguments
+    :rtype: :py:class:`argparse.Namespace`
+    """
+    p = argparse.ArgumentParser(
+        prog='awslimitchecker-accounts merge',
+        description='Merge the shard results files of a sharded run into '
+                    'one report, metrics flush and alert.',
+        epilog=_EPILOG
+    )
+    p.add_argument('FILE', nargs='+',
+                   help='shard results files, one for every shard of the run')
+    p.add_argument('--history', action='store', type=str, default=None,
+                   help='durations history file to update with the '
+                        'durations of the run')
+    _add_report_args(p)
+    return p.parse_args(argv)
+
+
+def parse_worker_args(argv):
+    """
+    Parse command line arguments for :py:func:`~.worker_entry_point`.
+
+    :param argv: argument list to parse, after the ``worker`` command
+    :type argv: list
+    :returns: parsed arguments
+    :rtype: :py:class:`argparse.Namespace`
+    """
+    p = argparse.ArgumentParser(
+        prog='awslimitchecker-accounts worker',
+        description='Work on the items of an awslimitchecker-accounts '
+                    '--queue run until it is finished.',
+        epilog=_EPILOG
+    )
+    p.add_argument('QUEUE', help='path to the SQLite work queue file')
+    p.add_argument('--poll-interval', action='store', type=float, default=5,
+                   help='seconds to wait for more work items when none are '
+                        'pending (default: 5)')
+    p.add_argument('-v', '--verbose', dest='verbose', action='count',
+                   default=0,
+                   help='verbose output. specify twice for debug-level '
+                        'output.')
+    return p.parse_args(argv)
+
+
+def _set_log_level(verbose):
+    """
+    Set the root logger level for the ``-v`` / ``--verbose`` option count.
+
+    :param verbose: number of times the option was given
+    :type verbose: int
+    """
+    if verbose == 1:
+        logging.getLogger().setLevel(logging.INFO)
+    elif verbose > 1:
+        logging.getLogger().setLevel(logging.DEBUG)
+
+
+def merge_entry_point(argv):
+    """
+    Entry point for ``awslimitchecker-accounts merge``: merge the shard
+    results files of a run, report them, flush all metrics and send one
+    alert. Exits as :py:func:`~.console_entry_point` does.
+
+    :param argv: argument list, after the ``merge`` command
+    :type argv: list
+    """
+    args = parse_merge_args(argv)
+    _set_log_level(args.verbose)
+    results = merge_shard_files(args.FILE)
+    report = _Report(args, ','.join(sorted(set(r.region for r in results))))
+    for result in results:
+        report.add(result)
+    print('Merged %d account/region(s) from %d shard file(s)' % (
+        len(results), len(args.FILE)
+    ))
+    res = report.finish()
+    if args.history:
+        save_history(args.history, update_history(
+            load_history(args.history), results
+        ))
+    raise SystemExit(res)
+
+
+def worker_entry_point(argv):
+    """
+    Entry point for ``awslimitchecker-accounts worker``: run a
+    :py:class:`~.QueueWorker` until the queue's run is finished.
+
+    :param argv: argument list, after the ``worker`` command
+    :type argv: list
+    """
+    args = parse_worker_args(argv)
+    _set_log_level(args.verbose)
+    worker = QueueWorker(WorkQueue(args.QUEUE))
+    count = worker.run(poll_interval=args.poll_interval)
+    print('Worked on %d item(s)' % count)
+    raise SystemExit(0)
+
+
+def console_entry_point():
+    """
+    Console entry point for ``awslimitchecker-accounts``. Check every
+    configured account and region (or one shard of them), printing each
+    job's results as soon as it completes, then flush all metrics and send
+    one alert. Exits 2 if any limit crossed its critical threshold or any
+    job failed, 1 if any crossed its warning threshold, and 0 otherwise.
+    If the first argument is ``merge`` or ``worker``, run
+    :py:func:`~.merge_entry_point` or :py:func:`~.worker_entry_point`
+    instead.
+    """
+    argv = sys.argv[1:]
+    if argv[:1] == ['merge']:
+        merge_entry_point(argv[1:])
+    if argv[:1] == ['worker']:
+        worker_entry_point(argv[1:])
+    args = parse_args(argv)
+    _set_log_level(args.verbose)
+    checker = MultiAccountChecker(
+        load_accounts_config(args.CONFIG),
+        max_workers=args.workers,
+        max_per_account=args.max_per_account,
+        credential_cache=CredentialCache(
+            region_name=args.sts_region,
+            role_partition=args.role_partition,
+            external_id=args.external_id
+        ),
+        use_ta=not args.skip_ta,
+        checker_kwargs={
+            'warning_threshold': args.warning_threshold,
+            'critical_threshold': args.critical_threshold,
+            'role_partition': args.role_partition
+        }
+    )
+    history = {}
+    if args.history:
+        history = load_history(args.history)
+    units = None
+    if args.shard is not None:
+        index, count = args.shard
+        units = partition_units(
+            checker.get_work_units(args.ACCOUNT), count, history
+        )[index - 1]
+    report = _Report(args, ','.join(sorted(set(
+        r for _, r in checker.get_jobs(args.ACCOUNT)
+    ))))
+    start = time.time()
+    if args.queue is not None:
+        results = checker.run_queue(
+            WorkQueue(args.queue), args.ACCOUNT,
+            lease_seconds=args.lease_seconds,
+            max_attempts=args.max_attempts,
+            poll_interval=args.poll_interval
+        )
+    else:
+        results = checker.iter_results(args.ACCOUNT, units=units)
+    for result in results:
+        report.add(result)
+    duration = time.time() - start
+    print('Checked %d account/region(s) in %.1f seconds' % (
+        len(report.results), duration
+    ))
+    res = report.finish(duration)
+    if args.output:
+        write_shard_file(args.output, args.shard or (1, 1), report.results)
+    if args.history and args.shard is None:
+        save_history(args.history, update_history(history, report.results))
+    raise SystemExit(res)
+
+
+if __name__ == "__main__":
+    console_entry_point()
@@ -0,0 +1,387 @@
+"""
+awslimitchecker/multiregion.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import boto3
+from .checker import AwsLimitChecker
+from .connectable import _client_lock, boto3_client
+
+logger = logging.getLogger(__name__)
+
+
+class MultiRegionChecker(object):
+
+    def __init__(self, regions, max_workers=None, **kwargs):
+        """
+        Check several regions of one account in a single run. One
+        :py:class:`~.AwsLimitChecker` is built per region; credentials are
+        resolved (including any STS role assumption) only once and shared by
+        all of them, as is the account ID. :py:meth:`~.find_usage`,
+        :py:meth:`~.get_limits` and :py:meth:`~.check_thresholds` run the
+        regions concurrently, so a run takes about as long as the slowest
+        region rather than the sum of all of them.
+
+        Services whose :py:attr:`~._AwsService.is_global` is True are only
+        checked by the first region's checker; the other regions share its
+        service instances (see :py:meth:`.AwsLimitChecker.add_shared_service`)
+        and so report the same limits and usage.
+
+        :param regions: list of region names, or the string "all" for every
+          region enabled for the account (per ``ec2:DescribeRegions`` in the
+          default region)
+        :type regions: :py:obj:`list` or :py:obj:`str`
+        :param max_workers: maximum number of regions to check at once;
+          defaults to all of them
+        :type max_workers: :py:obj:`int` or :py:data:`None`
+        :param kwargs: keyword arguments for :py:class:`~.AwsLimitChecker`,
+          other than ``region`` and ``credentials``
+        :type kwargs: dict
+        :raises: :py:exc:`ValueError` if no regions are given, if ``region``
+          or ``credentials`` is passed, or if ``regions`` is "all" and there
+          is no default region
+        """
+        for k in ['region', 'credentials']:
+            if k in kwargs:
+                raise ValueError(
+                    'MultiRegionChecker does not accept a "%s" argument' % k
+                )
+        kwargs = dict(kwargs)
+        if regions == 'all':
+            first_region = boto3.session.Session(
+                profile_name=kwargs.get('profile_name')
+            ).region_name
+            if first_region is None:
+                raise ValueError(
+                    'A default region must be configured to check all regions'
+                )
+        else:
+            regions = sorted(set(regions))
+            if len(regions) == 0:
+                raise ValueError('At least one region must be specified')
+            first_region = regions[0]
+        first = AwsLimitChecker(region=first_region, **kwargs)
+        self.credentials = first.get_credentials()
+        if regions == 'all':
+            regions = sorted(
+                set(self._enabled_regions(first_region)) | set([first_region])
+            )
+        self.regions = regions
+        self.max_workers = max_workers or len(regions)
+        self.account_id = kwargs.get('account_id')
+        #: dict of region name to :py:class:`~.AwsLimitChecker`
+        self.checkers = {first_region: first}
+        # the version check only needs to run once
+        kwargs['check_version'] = False
+        kwargs['credentials'] = self.credentials
+        for region in regions:
+            if region not in self.checkers:
+                self.checkers[region] = AwsLimitChecker(
+                    region=region, **kwargs
+                )
+        self._share_global_services()
+
+    def _share_global_services(self):
+        """
+        Replace every other region's instances of global services with the
+        first region's, so that their results are collected once and shared.
+        """
+        first = self._first
+        for region in self.regions[1:]:
+            for sname in self.global_services:
+                self.checkers[region].add_shared_service(
+                    first.services[sname]
+                )
+
+    @property
+    def global_services(self):
+        """
+        Return the names of the loaded services that are account-global.
+
+        :rtype: list
+        """
+        return sorted(
+            sname for sname, svc in self._first.services.items()
+            if svc.is_global
+        )
+
+    def _enabled_regions(self, region_name):
+        """
+        Return the names of all regions enabled for the account.
+
+        :param region_name: region to call ``ec2:DescribeRegions`` in
+        :type region_name: str
+        :rtype: list
+        """
+        with _client_lock:
+            conn = boto3_client(
+                'ec2', region_name=region_name, **self.credentials
+            )
+        regions = [
+            x['RegionName'] for x in conn.describe_regions()['Regions']
+        ]
+        logger.debug('Enabled regions: %s', regions)
+        return regions
+
+    def _resolve_account_id(self):
+        """
+        Look up the account ID once (unless it was given as ``account_id``)
+        and give it to every region's checker, so that none of their services
+        have to call ``sts:GetCallerIdentity`` themselves.
+        """
+        if self.account_id is None:
+            with _client_lock:
+                sts = boto3_client(
+                    'sts', region_name=self.regions[0], **self.credentials
+                )
+            self.account_id = sts.get_caller_identity()['Account']
+        for region in self.regions:
+            self.checkers[region].set_current_account_id(self.account_id)
+
+    def _run(self, method_name, service=None, **kwargs):
+        """
+        Call the ``method_name`` method of every region's checker with
+        ``service`` and ``kwargs``, running up to ``self.max_workers`` regions
+        concurrently. If any region raises an exception, the first one (in
+        region name order) is re-raised once all regions have finished.
+
+        Global services are only passed to the first region's checker; if the
+        method returns a dict keyed by service name, the first region's
+        results for them are copied into every other region's result.
+
+        :param method_name: name of the :py:class:`~.AwsLimitChecker` method
+        :type method_name: str
+        :param service: names of the services to check, or None for all
+        :type service: :py:obj:`list` or :py:data:`None`
+        :param kwargs: other keyword arguments for the method
+        :type kwargs: dict
+        :returns: dict of region name to the method's return value
+        :rtype: dict
+        """
+        self._resolve_account_id()
+        if service is None:
+            service = self._first.get_service_names()
+        shared = [x for x in self.global_services if x in service]
+        regional = [x for x in service if x not in shared]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {}
+            for region in self.regions:
+                futures[region] = executor.submit(
+                    getattr(self.checkers[region], method_name),
+                    service=(service if region == self.regions[0]
+                             else regional),
+                    **kwargs
+                )
+        res = {}
+        for region in self.regions:
+            try:
+                res[region] = futures[region].result()
+            except Exception:
+                logger.error('Error checking region %s', region)
+                raise
+        first = res[self.regions[0]]
+        if isinstance(first, dict):
+            for region in self.regions[1:]:
+                for sname in shared:
+                    if sname in first:
+                        res[region][sname] = first[sname]
+        return res
+
+    def _call_each(self, method_name, *args):
+        """
+        Call the ``method_name`` method of every region's checker with
+        ``args``, one region at a time.
+
+        :param method_name: name of the :py:class:`~.AwsLimitChecker` method
+        :type method_name: str
+        :param args: positional arguments for the method
+        :type args: tuple
+        """
+        for region in self.regions:
+            getattr(self.checkers[region], method_name)(*args)
+
+    @property
+    def _first(self):
+        """
+        Return the first region's checker, for region-independent methods.
+
+        :rtype: :py:class:`~.AwsLimitChecker`
+        """
+        return self.checkers[self.regions[0]]
+
+    @property
+    def region_name(self):
+        """
+        Return the names of all regions being checked, comma-separated.
+
+        :rtype: str
+        """
+        return ','.join(self.regions)
+
+    def get_version(self):
+        """
+        See :py:meth:`.AwsLimitChecker.get_version`.
+        """
+        return self._first.get_version()
+
+    def get_project_url(self):
+        """
+        See :py:meth:`.AwsLimitChecker.get_project_url`.
+        """
+        return self._first.get_project_url()
+
+    def get_service_names(self):
+        """
+        See :py:meth:`.AwsLimitChecker.get_service_names`.
+        """
+        return self._first.get_service_names()
+
+    def get_required_iam_policy(self):
+        """
+        See :py:meth:`.AwsLimitChecker.get_required_iam_policy`.
+        """
+        return self._first.get_required_iam_policy()
+
+    def remove_services(self, services_to_remove=[]):
+        """
+        Remove services from every region's checker; see
+        :py:meth:`.AwsLimitChecker.remove_services`.
+        """
+        self._call_each('remove_services', services_to_remove)
+
+    def set_limit_overrides(self, override_dict, override_ta=True):
+        """
+        Set limit overrides in every region; see
+        :py:meth:`.AwsLimitChecker.set_limit_overrides`.
+        """
+        self._call_each('set_limit_overrides', override_dict, override_ta)
+
+    def set_limit_override(self, service_name, limit_name,
+                           value, override_ta=True):
+        """
+        Set a limit override in every region; see
+        :py:meth:`.AwsLimitChecker.set_limit_override`.
+        """
+        self._call_each(
+            'set_limit_override', service_name, limit_name, value,
+            override_ta
+        )
+
+    def set_threshold_overrides(self, override_dict):
+        """
+        Set threshold overrides in every region; see
+        :py:meth:`.AwsLimitChecker.set_threshold_overrides`.
+        """
+        self._call_each('set_threshold_overrides', override_dict)
+
+    def find_usage(self, service=None, use_ta=True):
+        """
+        Find usage in all regions concurrently; see
+        :py:meth:`.AwsLimitChecker.find_usage`.
+        """
+        self._run('find_usage', service=service, use_ta=use_ta)
+
+    def get_limits(self, service=None, use_ta=True, use_api=True):
+        """
+        Return the limits of all regions, updated concurrently; see
+        :py:meth:`.AwsLimitChecker.get_limits`.
+
+        :returns: dict of region name to the return value of
+          :py:meth:`.AwsLimitChecker.get_limits` for that region
+        :rtype: dict
+        """
+        return self._run(
+            'get_limits', service=service, use_ta=use_ta, use_api=use_api
+        )
+
+    def check_thresholds(self, service=None, use_ta=True):
+        """
+        Check thresholds in all regions concurrently; see
+        :py:meth:`.AwsLimitChecker.check_thresholds`.
+
+        :returns: dict of region name to the return value of
+          :py:meth:`.AwsLimitChecker.check_thresholds` for that region
+        :rtype: dict
+        """
+        return self._run('check_thresholds', service=service, use_ta=use_ta)
+
+    def get_unknown_services(self):
+        """
+        Return the services whose usage is unknown in each region; see
+        :py:meth:`.AwsLimitChecker.get_unknown_services`. Global services
+        checked by the first region are reported for every region.
+
+        :returns: dict of region name to dict of service name to the reason
+          its usage is unknown
+        :rtype: dict
+        """
+        first = self._first.get_unknown_services()
+        res = {}
+        for region in self.regions:
+            res[region] = self.checkers[region].get_unknown_services()
+            for sname in self.global_services:
+                if sname in first:
+                    res[region][sname] = first[sname]
+        return res
+
+    def get_service_durations(self):
+        """
+        Return how long each service took to collect usage in each region;
+        see :py:meth:`.AwsLimitChecker.get_service_durations`. Global
+        services are only timed in the first region.
+
+        :returns: dict of region name to dict of service name to seconds
+        :rtype: dict
+        """
+        return dict(
+            (r, self.checkers[r].get_service_durations()) for r in self.regions
+        )
+
+    def get_ta_refresh_latency(self):
+        """
+        Return how long each region waited for a Trusted Advisor refresh; see
+        :py:meth:`.AwsLimitChecker.get_ta_refresh_latency`.
+
+        :returns: dict of region name to latency in seconds (or None)
+        :rtype: dict
+        """
+        return dict(
+            (region, self.checkers[region].get_ta_refresh_latency())
+            for region in self.regions
+        )
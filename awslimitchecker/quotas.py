@@ -38,6 +38,7 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 import logging
 
 from awslimitchecker.connectable import Connectable
@@ -48,6 +49,12 @@ logger = logging.getLogger(__name__)
 class ServiceQuotasClient(Connectable):
     api_name = 'service-quotas'
 
+    #: Maximum number of quotas for one service code to retrieve with
+    #: individual, concurrent ``GetServiceQuota`` calls; if more are needed,
+    #: or any limit using the service code has no quota code, all quotas for
+    #: the service code are listed instead.
+    max_targeted_quotas = 5
+
     def __init__(self, boto_connection_kwargs):
         """
         Client for the AWS Service Quotas service, that manages retrieving
@@ -60,6 +67,7 @@ class ServiceQuotasClient(Connectable):
         """
         self._boto3_connection_kwargs = boto_connection_kwargs
         self._cache = {}
+        self._by_code = {}
         self.conn = None
 
     def quotas_for_service(self, service_code):
@@ -80,20 +88,22 @@ class ServiceQuotasClient(Connectable):
             'Getting service quotas for service code: %s', service_code
         )
         self._cache[service_code] = {}
+        by_name = {}
+        by_code = {}
         try:
             paginator = self.conn.get_paginator('list_service_quotas')
             for page in paginator.paginate(ServiceCode=service_code):
                 for item in page['Quotas']:
-                    if item['QuotaName'] in self._cache[service_code]:
+                    if item['QuotaName'] in by_name:
                         logger.error(
                             'ERROR: Received duplicate service quota for '
                             'service code %s quota name "%s" - QuotaCodes %s'
                             ' and %s', service_code, item['QuotaName'],
-                            self._cache[service_code][
-                                item['QuotaName']
-                            ]['QuotaCode'], item['QuotaCode']
+                            by_name[item['QuotaName']]['QuotaCode'],
+                            item['QuotaCode']
                         )
-                    self._cache[service_code][item['QuotaName'].lower()] = item
+                    by_name[item['QuotaName'].lower()] = item
+                    by_code[item['QuotaCode']] = item
         except ClientError as ex:
             if ex.response.get(
                 'Error', {}
@@ -105,21 +115,129 @@ class ServiceQuotasClient(Connectable):
                 )
                 return {}
             raise
+        # both indexes come from the same listing; add to (rather than
+        # replace) any quotas already retrieved by code
+        self._by_code.setdefault(service_code, {}).update(by_code)
+        self._cache[service_code] = by_name
         logger.debug(
             'Retrieved %d quotas for service code %s: %s',
-            len(self._cache[service_code]), service_code,
-            sorted([x['QuotaName'] for x in self._cache[service_code].values()])
+            len(by_name), service_code,
+            sorted([x['QuotaName'] for x in by_name.values()])
+        )
+        return by_name
+
+    def load_quotas(self, service_code, quota_codes):
+        """
+        Retrieve the quotas that will be needed for one service code, given
+        the quota code of each limit that uses it. If all of the limits have
+        a quota code and there are no more than :py:attr:`~.max_targeted_quotas`
+        of them, get just those quotas with concurrent ``GetServiceQuota``
+        calls; otherwise, list all quotas for the service code (see
+        :py:meth:`~.quotas_for_service`).
+
+        :param service_code: the service code to get quotas for
+        :type service_code: str
+        :param quota_codes: the quota code of each limit using this service
+          code, or None for limits without one
+        :type quota_codes: list
+        """
+        if service_code in self._cache:
+            return
+        codes = set(quota_codes)
+        if None in codes or len(codes) > self.max_targeted_quotas:
+            self.quotas_for_service(service_code)
+            return
+        cached = self._by_code.get(service_code, {})
+        self._get_quotas_by_code(
+            service_code, sorted(x for x in codes if x not in cached)
+        )
+
+    def _get_quotas_by_code(self, service_code, quota_codes):
+        """
+        Get the specified quotas for one service code with concurrent
+        ``GetServiceQuota`` calls, and cache them (or None, for quotas that
+        do not exist) by quota code.
+
+        :param service_code: the service code to get quotas for
+        :type service_code: str
+        :param quota_codes: the quota codes to get
+        :type quota_codes: list
+        """
+        if len(quota_codes) == 0:
+            return
+        self.connect()
+        logger.debug(
+            'Getting service quotas for service code %s by quota code: %s',
+            service_code, quota_codes
         )
-        return self._cache[service_code]
+        with ThreadPoolExecutor(max_workers=len(quota_codes)) as executor:
+            results = list(executor.map(
+                lambda code: self._get_service_quota(service_code, code),
+                quota_codes
+            ))
+        cache = self._by_code.setdefault(service_code, {})
+        for code, item in zip(quota_codes, results):
+            cache[code] = item
+
+    def _get_service_quota(self, service_code, quota_code):
+        """
+        Return one quota from ``GetServiceQuota``, or None if it does not
+        exist.
+
+        :param service_code: the service code of the quota
+        :type service_code: str
+        :param quota_code: the quota code of the quota
+        :type quota_code: str
+        :return: dictionary of quota information returned by the service
+        :rtype: dict
+        """
+        try:
+            return self.conn.get_service_quota(
+                ServiceCode=service_code, QuotaCode=quota_code
+            )['Quota']
+        except ClientError as ex:
+            if ex.response.get(
+                'Error', {}
+            ).get('Code', '') == 'NoSuchResourceException':
+                logger.debug(
+                    'No service quota for service code %s quota code %s',
+                    service_code, quota_code
+                )
+                return None
+            raise
+
+    def _quota_by_code(self, service_code, quota_code):
+        """
+        Return the quota with the given quota code, or None if it does not
+        exist. If it has not already been retrieved (by
+        :py:meth:`~.load_quotas` or :py:meth:`~.quotas_for_service`), get it
+        with ``GetServiceQuota``.
+
+        :param service_code: the service code of the quota
+        :type service_code: str
+        :param quota_code: the quota code of the quota
+        :type quota_code: str
+        :return: dictionary of quota information returned by the service
+        :rtype: dict
+        """
+        cache = self._by_code.get(service_code, {})
+        if quota_code not in cache and service_code not in self._cache:
+            self._get_quotas_by_code(service_code, [quota_code])
+            cache = self._by_code[service_code]
+        return cache.get(quota_code)
 
     def get_quota_value(
-        self, service_code, quota_name, units='None', converter=None
+        self, service_code, quota_name, units='None', converter=None,
+        quota_code=None
     ):
         """
         Return a given quota value, or None if it cannot be found. If
         ``units`` is a value other than ``None``, attempt to convert the value
         to the specified units.
 
+        If ``quota_code`` is given, the quota is found by its code; the name
+        is only used if no quota has that code.
+
         :param service_code: the service code to get a quota from
         :type service_code: str
         :param quota_name: the quota name to get
@@ -133,23 +251,36 @@ class ServiceQuotasClient(Connectable):
           the quota value from the quota Unit to this class's expected unit.
           If they cannot be converted, it should log an error and return None.
         :type converter: ``callable``
+        :param quota_code: the quota code to get, if known
+        :type quota_code: str
         :return: the quota value
         :rtype: float or None
         """
-        svc = self.quotas_for_service(service_code)
-        if quota_name.lower() not in svc:
+        quota = None
+        if quota_code is not None:
+            quota = self._quota_by_code(service_code, quota_code)
+            if quota is None:
+                logger.debug(
+                    'No service quota for service code %s quota code %s; '
+                    'matching by name "%s"', service_code, quota_code,
+                    quota_name
+                )
+        if quota is None:
+            quota = self.quotas_for_service(service_code).get(
+                quota_name.lower()
+            )
+        if quota is None:
             return None
-        val = svc[quota_name.lower()].get('Value', None)
-        if svc[quota_name.lower()]['Unit'] != units:
+        val = quota.get('Value', None)
+        if quota['Unit'] != units:
             if converter is not None:
-                return converter(val, svc[quota_name.lower()]['Unit'], units)
+                return converter(val, quota['Unit'], units)
             logger.error(
                 'ERROR: Service Quota service_code=%s QuotaName="%s" has '
                 'Units set to "%s", but expected units to be "%s"; '
                 'awslimitchecker does not know how to '
                 'handle this. This quota will be ignored. Please open a bug '
-                'report.', service_code, quota_name,
-                svc[quota_name.lower()]['Unit'], units
+                'report.', service_code, quota_name, quota['Unit'], units
             )
             return None
         return val
@@ -0,0 +1,321 @@
+"""
+awslimitchecker/ratelimit.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import logging
+import threading
+import time
+from functools import partial
+
+logger = logging.getLogger(__name__)
+
+#: default maximum request rate, in requests per second, for each
+#: (account, region, API) that has no rate set with
+#: :py:meth:`~.RateLimiter.set_rate`
+DEFAULT_RATE = 50.0
+
+#: API error codes that mean a request was throttled (the same codes that
+#: botocore's retry handlers treat as throttling)
+THROTTLING_ERROR_CODES = (
+    'Throttling',
+    'ThrottlingException',
+    'ThrottledException',
+    'RequestThrottledException',
+    'TooManyRequestsException',
+    'ProvisionedThroughputExceededException',
+    'TransactionInProgressException',
+    'RequestLimitExceeded',
+    'BandwidthLimitExceeded',
+    'LimitExceededException',
+    'RequestThrottled',
+    'SlowDown',
+    'PriorRequestNotComplete',
+    'EC2ThrottledException'
+)
+
+
+class TokenBucket(object):
+
+    #: seconds after a rate decrease during which further throttling
+    #: responses are ignored, as those requests were sent at the old rate
+    cooldown = 1.0
+
+    def __init__(self, rate, min_rate=0.5, increase=1.0, decrease=0.5):
+        """
+        Thread-safe token bucket limiting requests to ``rate`` per second,
+        with bursts of up to one second's worth of requests. The rate is
+        adjusted from observed throttling with additive increase /
+        multiplicative decrease (AIMD): each throttled request multiplies it
+        by ``decrease`` (at most once per :py:attr:`~.cooldown`), and it
+        grows back by ``increase`` requests per second for every second
+        without throttling, up to the starting rate.
+
+        :param rate: maximum (and starting) rate, in requests per second
+        :type rate: float
+        :param min_rate: the rate is never decreased below this
+        :type min_rate: float
+        :param increase: requests per second added per second without
+          throttling
+        :type increase: float
+        :param decrease: factor the rate is multiplied by when throttled
+        :type decrease: float
+        """
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.rate = rate
+        self._tokens = self._capacity
+        self._lock = threading.Lock()
+        self._updated = time.monotonic()
+        self._adjusted = self._updated
+        self._decreased = None
+
+    @property
+    def _capacity(self):
+        """
+        Return the maximum number of tokens the bucket holds.
+
+        :rtype: float
+        """
+        return max(1.0, self.rate)
+
+    def _refill(self, now):
+        """
+        Add the tokens accrued at the current rate since the last refill.
+        Must be called with the lock held.
+
+        :param now: the current :py:func:`time.monotonic` time
+        :type now: float
+        """
+        self._tokens = min(
+            self._capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self):
+        """
+        Take one token, waiting until one is available.
+
+        :returns: number of seconds spent waiting
+        :rtype: float
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(time.monotonic())
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def on_success(self):
+        """
+        Record a request that was not throttled, increasing the rate if it
+        is below the maximum.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self.rate < self.max_rate:
+                self._refill(now)
+                self.rate = min(
+                    self.max_rate,
+                    self.rate + self.increase * (now - self._adjusted)
+                )
+            self._adjusted = now
+
+    def on_throttle(self):
+        """
+        Record a throttled request, decreasing the rate unless it was
+        already decreased within the last :py:attr:`~.cooldown` seconds.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._decreased is not None and \
+                    now - self._decreased < self.cooldown:
+                return
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = min(self._tokens, self._capacity)
+            self._decreased = now
+            self._adjusted = now
+            logger.debug('Request throttled; reduced rate to %.2f/s',
+                         self.rate)
+
+
+class RateLimiter(object):
+
+    def __init__(self, default_rate=DEFAULT_RATE):
+        """
+        Process-wide API rate limiter, with one :py:class:`~.TokenBucket`
+        per (account ID, region, API name). Clients are attached to it with
+        :py:meth:`~.register`, so that every client calling the same API in
+        the same account and region - from any service, thread or checker -
+        shares one rate, adjusted from the throttling any of them sees.
+
+        :param default_rate: maximum rate, in requests per second, for APIs
+          with no rate set with :py:meth:`~.set_rate`
+        :type default_rate: float
+        """
+        self.default_rate = default_rate
+        self._rates = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def set_rate(self, api_name, rate):
+        """
+        Set the maximum rate for an API, in every account and region. The
+        current rate of buckets already in use is reset to it.
+
+        :param api_name: boto3 API name, such as "ec2" or "elbv2"
+        :type api_name: str
+        :param rate: maximum rate, in requests per second
+        :type rate: float
+        :raises: :py:exc:`ValueError` if ``rate`` is not positive
+        """
+        if rate <= 0:
+            raise ValueError(
+                'Rate for %s API must be greater than 0' % api_name
+            )
+        with self._lock:
+            self._rates[api_name] = rate
+            for key in [k for k in self._buckets if k[2] == api_name]:
+                del self._buckets[key]
+
+    def get_rates(self):
+        """
+        Return the current rate of every bucket in use.
+
+        :returns: dict of (account ID, region, API name) to requests per
+          second
+        :rtype: dict
+        """
+        with self._lock:
+            return dict((k, b.rate) for k, b in self._buckets.items())
+
+    def reset(self):
+        """
+        Discard all buckets and configured rates.
+        """
+        with self._lock:
+            self._rates = {}
+            self._buckets = {}
+
+    def bucket(self, account_id, region_name, api_name):
+        """
+        Return the bucket for an account, region and API, creating it if
+        needed.
+
+        :param account_id: AWS account ID, or None for the default account
+        :type account_id: :py:obj:`str` or :py:data:`None`
+        :param region_name: region name
+        :type region_name: str
+        :param api_name: boto3 API name
+        :type api_name: str
+        :rtype: :py:class:`~.TokenBucket`
+        """
+        key = (account_id, region_name, api_name)
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(
+                    self._rates.get(api_name, self.default_rate)
+                )
+            return self._buckets[key]
+
+    def register(self, client, api_name, account_id=None):
+        """
+        Attach the limiter to a boto3 client through botocore's event
+        system: every request attempt (including retries) first takes a
+        token from the bucket for the client's account, region and API, and
+        every response adjusts that bucket's rate.
+
+        :param client: boto3 low-level client
+        :type client: ``botocore.client.BaseClient``
+        :param api_name: boto3 API name the client was created for
+        :type api_name: str
+        :param account_id: AWS account ID the client connects to, or None
+          for the default account
+        :type account_id: :py:obj:`str` or :py:data:`None`
+        """
+        key = (account_id, client.meta.region_name, api_name)
+        client.meta.events.register(
+            'before-send', partial(self._before_send, key)
+        )
+        client.meta.events.register(
+            'needs-retry', partial(self._needs_retry, key)
+        )
+
+    def _before_send(self, key, **kwargs):
+        """
+        ``before-send`` event handler; wait for a token.
+
+        :param key: (account ID, region, API name) of the client
+        :type key: tuple
+        """
+        waited = self.bucket(*key).acquire()
+        if waited > 0:
+            logger.debug('Waited %.3fs for %s API rate limit', waited, key)
+
+    def _needs_retry(self, key, response=None, **kwargs):
+        """
+        ``needs-retry`` event handler; adjust the rate from the response.
+        Requests that failed without a response (e.g. connection errors)
+        are ignored.
+
+        :param key: (account ID, region, API name) of the client
+        :type key: tuple
+        :param response: 2-tuple of the HTTP response and parsed response,
+          or None
+        :type response: :py:obj:`tuple` or :py:data:`None`
+        """
+        if response is None:
+            return
+        http_response, parsed = response
+        code = parsed.get('Error', {}).get('Code')
+        if code in THROTTLING_ERROR_CODES:
+            logger.debug('%s API throttled (%s)', key, code)
+            self.bucket(*key).on_throttle()
+        elif http_response.status_code < 400:
+            self.bucket(*key).on_success()
+
+
+#: the process-wide :py:class:`~.RateLimiter` that
+#: :py:func:`~.connectable.boto3_client` attaches every client to
+rate_limiter = RateLimiter()
@@ -38,20 +38,25 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 import argparse
+import configparser
 import json
 import logging
+import os
 import sys
 import time
 
-import boto3
 import tabulate
-from botocore.exceptions import ClientError
 
 from .alerts import AlertProvider
-from .checker import AwsLimitChecker
+from .catalog import LimitCatalog
 from .limit import SOURCE_API, SOURCE_QUOTAS, SOURCE_TA
 from .metrics import MetricsProvider
-from .utils import StoreKeyValuePair, dict2cols, issue_string_tuple
+from .services import _services
+from .utils import (
+    StoreKeyValuePair, color_output, dict2cols, issue_string_tuple
+)
+from .version import _get_version_info
+from .ratelimit import rate_limiter
 
 try:
     from urllib.parse import urlparse
@@ -77,9 +82,13 @@ class Runner(object):
     def __init__(self):
         self.colorize = True
         self.checker = None
+        self.catalog = None
+        self.region = None
+        self.multi_region = False
         self.skip_ta = False
         self.service_name = None
         self.skip_check = []
+        self.time_limited = False
 
     def parse_args(self, argv):
         """
@@ -187,7 +196,10 @@ class Runner(object):
                        'a role via STS')
         p.add_argument('-r', '--region', action='store',
                        type=str, default=None,
-                       help='AWS region name to connect to; required for STS')
+                       help='AWS region name to connect to; required for STS.'
+                            ' A comma-separated list of region names, or '
+                            '"all" for every enabled region, checks several '
+                            'regions concurrently')
         p.add_argument('--role-partition', action='store', type=str,
                        default='aws',
                        help='AWS partition name to use for account_role when '
@@ -227,11 +239,42 @@ class Runner(object):
                        help='If waiting for TA checks to refresh, wait up to '
                             'this number of seconds before continuing on '
                             'anyway.')
+        p.add_argument('--no-ta-cache', action='store_false', default=True,
+                       dest='ta_cache',
+                       help='do not cache Trusted Advisor results on disk')
+        p.add_argument('--columnar-thresholds', action='store_true',
+                       default=False, dest='columnar_thresholds',
+                       help='evaluate all thresholds in one vectorized pass '
+                            '(uses numpy if installed)')
+        p.add_argument('--run-timeout', dest='run_timeout', type=float,
+                       action='store', default=None, metavar='SECONDS',
+                       help='stop collecting usage after this many seconds; '
+                            'services that have not finished are reported as '
+                            'unknown, and thresholds are checked for the rest')
+        p.add_argument('--service-timeout', dest='service_timeout',
+                       action='append', default=[],
+                       metavar='[SERVICE=]SECONDS',
+                       help='abandon a service that takes longer than this '
+                            'many seconds to collect usage, reporting it as '
+                            'unknown. Without a service name, applies to all '
+                            'services. Can be specified multiple times.')
+        p.add_argument('--api-rate', action=StoreKeyValuePair,
+                       dest='api_rate', metavar='API=RATE',
+                       help='limit requests to an AWS API (e.g. "ec2") to '
+                            'at most this many per second, per account and '
+                            'region; the rate is lowered automatically when '
+                            'requests are throttled. Can be specified '
+                            'multiple times.')
         p.add_argument('--no-color', action='store_true', default=False,
                        help='do not colorize output')
         p.add_argument('--no-check-version', action='store_false', default=True,
                        dest='check_version',
                        help='do not check latest version at startup')
+        p.add_argument('--version-check-interval', dest='version_check_interval',
+                       type=int, action='store', default=86400,
+                       help='cache the latest version check result for this '
+                            'many seconds (default: 86400); 0 to disable the '
+                            'cache')
         p.add_argument('-v', '--verbose', dest='verbose', action='count',
                        default=0,
                        help='verbose output. specify twice for debug-level '
@@ -273,78 +316,337 @@ class Runner(object):
             args.ta_refresh_mode = 'trigger'
         elif args.ta_refresh_older is not None:
             args.ta_refresh_mode = args.ta_refresh_older
+        for name in args.service or []:
+            if name not in _services:
+                p.error('unknown service in --service: %s' % name)
+        if args.run_timeout is not None and args.run_timeout <= 0:
+            p.error('--run-timeout must be greater than zero')
+        args.service_timeout = self._service_timeouts(p, args.service_timeout)
+        for api, rate in args.api_rate.items():
+            try:
+                args.api_rate[api] = float(rate)
+            except ValueError:
+                args.api_rate[api] = 0
+            if args.api_rate[api] <= 0:
+                p.error('invalid --api-rate: %s=%s' % (api, rate))
         return args
 
+    def _service_timeouts(self, parser, values):
+        """
+        Convert the ``--service-timeout`` values into the ``service_timeout``
+        argument of :py:class:`~.AwsLimitChecker`: None, a number of seconds
+        for every service, or a dict of service name to seconds (with the
+        unnamed value, if any, applied to every other service).
+
+        :param parser: the argument parser, to report errors with
+        :type parser: :py:class:`argparse.ArgumentParser`
+        :param values: ``[SERVICE=]SECONDS`` strings
+        :type values: list
+        :rtype: :py:obj:`float`, :py:obj:`dict` or :py:data:`None`
+        """
+        default = None
+        per_service = {}
+        for value in values:
+            name, _, seconds = value.rpartition('=')
+            try:
+                seconds = float(seconds)
+            except ValueError:
+                seconds = 0
+            if seconds <= 0:
+                parser.error('invalid --service-timeout: %s' % value)
+            if name == '':
+                default = seconds
+            elif name not in _services:
+                parser.error('unknown service in --service-timeout: %s' % name)
+            else:
+                per_service[name] = seconds
+        if len(per_service) == 0:
+            return default
+        if default is not None:
+            for name in _services:
+                per_service.setdefault(name, default)
+        return per_service
+
+    def _selected_services(self, args):
+        """
+        Return the list of service names selected by the ``--service`` and
+        ``--skip-service`` options, or None if all services are selected.
+
+        :param args: parsed command line arguments
+        :type args: :py:class:`argparse.Namespace`
+        :rtype: :py:obj:`list` or :py:data:`None`
+        """
+        if not args.service and len(args.skip_service) == 0:
+            return None
+        names = args.service or sorted(_services.keys())
+        return [x for x in names if x not in args.skip_service]
+
+    def _metadata_catalog(self, args):
+        """
+        If the command line only asks for metadata that the precompiled
+        :py:class:`~.LimitCatalog` can answer (``--list-services``,
+        ``--list-defaults`` or ``--iam-policy``, without any overrides),
+        return the catalog restricted to the selected services and set
+        ``self.region``. Otherwise return None, and the full
+        :py:class:`~.AwsLimitChecker` should be used.
+
+        :param args: parsed command line arguments
+        :type args: :py:class:`argparse.Namespace`
+        :rtype: :py:class:`~.LimitCatalog` or ``None``
+        """
+        if args.version or len(args.limit) > 0:
+            return None
+        if args.limit_override_json or args.threshold_override_json:
+            return None
+        if not (args.list_services or args.list_defaults):
+            if args.list_limits or not args.iam_policy:
+                return None
+        catalog = LimitCatalog.load()
+        if catalog is None:
+            return None
+        names = self._selected_services(args)
+        if names is not None:
+            catalog = catalog.for_services(names)
+            if catalog is None:
+                return None
+        if args.list_services or not args.list_defaults:
+            return catalog
+        try:
+            self.region = args.region or self._configured_region(
+                args.profile_name
+            )
+        except Exception:
+            logger.debug('Unable to determine region', exc_info=True)
+            return None
+        if self.region is None or not catalog.supports_region(self.region):
+            return None
+        return catalog
+
+    def _configured_region(self, profile_name):
+        """
+        Return the default region that boto3 would use for ``profile_name``,
+        from the ``AWS_DEFAULT_REGION`` environment variable or the shared
+        config file, without importing boto3 (which the metadata-only
+        commands otherwise never need).
+
+        :param profile_name: the ``--profile`` name, or None
+        :type profile_name: :py:obj:`str` or :py:data:`None`
+        :returns: region name, or None if none is configured
+        :rtype: :py:obj:`str` or :py:data:`None`
+        """
+        if os.environ.get('AWS_DEFAULT_REGION'):
+            return os.environ['AWS_DEFAULT_REGION']
+        profile = profile_name or os.environ.get('AWS_PROFILE') or \
+            os.environ.get('AWS_DEFAULT_PROFILE') or 'default'
+        path = os.path.expanduser(
+            os.environ.get('AWS_CONFIG_FILE') or '~/.aws/config'
+        )
+        config = configparser.RawConfigParser()
+        config.read(path)
+        for section in ['profile %s' % profile, profile]:
+            if section == 'default' or section.startswith('profile '):
+                if config.has_option(section, 'region'):
+                    return config.get(section, 'region')
+        return None
+
+    def _regions(self, args):
+        """
+        If ``--region`` names more than one region (comma-separated) or is
+        "all", return the list of region names or "all". Otherwise, return
+        None and a single-region :py:class:`~.AwsLimitChecker` is used.
+
+        :param args: parsed command line arguments
+        :type args: :py:class:`argparse.Namespace`
+        :rtype: :py:obj:`list`, :py:obj:`str` or :py:data:`None`
+        """
+        if args.region is None:
+            return None
+        if args.region == 'all':
+            return 'all'
+        names = [x.strip() for x in args.region.split(',') if x.strip()]
+        if len(names) < 2:
+            return None
+        return names
+
+    def _per_region(self, result):
+        """
+        Return a list of (key prefix, result) 2-tuples for the result of a
+        checker method. When checking several regions, ``result`` is keyed by
+        region name and each region's output keys are prefixed with it.
+
+        :param result: return value of a checker method
+        :type result: dict
+        :rtype: list
+        """
+        if not self.multi_region:
+            return [('', result)]
+        return [('%s/' % r, result[r]) for r in sorted(result.keys())]
+
+    def _metrics_by_region(self, metrics):
+        """
+        Return a list of (region name, :py:class:`~.MetricsProvider`)
+        2-tuples. When checking several regions, ``metrics`` is a dict of
+        region name to that region's provider; otherwise it is a single
+        provider, returned with a region name of None.
+
+        :param metrics: metrics provider(s)
+        :type metrics: :py:class:`~.MetricsProvider` or dict
+        :rtype: list
+        """
+        if not self.multi_region:
+            return [(None, metrics)]
+        return sorted(metrics.items())
+
+    def _checker_for(self, region):
+        """
+        Return the :py:class:`~.AwsLimitChecker` for ``region``, as returned by
+        :py:meth:`~._metrics_by_region`.
+
+        :param region: region name, or None when checking a single region
+        :type region: :py:obj:`str` or :py:data:`None`
+        :rtype: :py:class:`~.AwsLimitChecker`
+        """
+        if region is None:
+            return self.checker
+        return self.checker.checkers[region]
+
+    def _log_service_durations(self):
+        """
+        Log a table of how long each service took to collect usage, longest
+        first, at info level (shown with ``-v`` / ``--verbose``).
+        """
+        rows = []
+        for prefix, durations in self._per_region(
+            self.checker.get_service_durations()
+        ):
+            for svc, secs in durations.items():
+                rows.append((prefix + svc, secs))
+        if len(rows) == 0:
+            return
+        table = [
+            [name, '%.3f' % secs]
+            for name, secs in sorted(rows, key=lambda x: (-x[1], x[0]))
+        ]
+        logger.info('Usage collection time per service:\n%s', tabulate.tabulate(
+            table, headers=['Service', 'Seconds'], tablefmt='simple_outline'
+        ))
+
+    def _print_license_notice(self):
+        """
+        Print the same AGPL notice that :py:class:`~.AwsLimitChecker` prints
+        on construction, for commands answered without a checker.
+        """
+        # ###### IMPORTANT license notice ##########
+        # Pursuant to Sections 5(b) and 13 of the GNU Affero General Public
+        # License, version 3, this notice MUST NOT be removed, and MUST be
+        # displayed to ALL USERS of this software, even if they interact with
+        # it remotely over a network. See AwsLimitChecker.__init__().
+        # ###### IMPORTANT license notice ##########
+        vinfo = _get_version_info()
+        sys.stderr.write(
+            "awslimitchecker %s is AGPL-licensed free software; "
+            "all users have a right to the full source code of "
+            "this version. See <%s>\n" % (vinfo.version_str, vinfo.url)
+        )
+
     def list_services(self):
-        for x in sorted(self.checker.get_service_names()):
+        if self.catalog is not None:
+            names = self.catalog.get_service_names()
+        else:
+            names = self.checker.get_service_names()
+        for x in sorted(names):
             print(x)
 
     def list_limits(self):
-        limits = self.checker.get_limits(
+        res = self.checker.get_limits(
             use_ta=(not self.skip_ta),
             service=self.service_name)
         data = {}
-        for svc in sorted(limits.keys()):
-            for lim in sorted(limits[svc].keys()):
-                src_str = ''
-                if limits[svc][lim].get_limit_source() == SOURCE_API:
-                    src_str = ' (API)'
-                if limits[svc][lim].get_limit_source() == SOURCE_TA:
-                    src_str = ' (TA)'
-                if limits[svc][lim].get_limit_source() == SOURCE_QUOTAS:
-                    src_str = ' (Quotas)'
-                if limits[svc][lim].has_resource_limits():
-                    for usage in limits[svc][lim].get_current_usage():
-                        id = "{s}/{l}/{r}".format(s=svc, l=lim,
-                                                  r=usage.resource_id)
-                        data[id] = '{v} (API)'.format(v=usage.get_maximum())
-                else:
-                    data["{s}/{l}".format(s=svc, l=lim)] = '{v}{t}'.format(
-                        v=limits[svc][lim].get_limit(),
-                        t=src_str)
+        for prefix, limits in self._per_region(res):
+            for svc in sorted(limits.keys()):
+                for lim in sorted(limits[svc].keys()):
+                    src_str = ''
+                    if limits[svc][lim].get_limit_source() == SOURCE_API:
+                        src_str = ' (API)'
+                    if limits[svc][lim].get_limit_source() == SOURCE_TA:
+                        src_str = ' (TA)'
+                    if limits[svc][lim].get_limit_source() == SOURCE_QUOTAS:
+                        src_str = ' (Quotas)'
+                    if limits[svc][lim].has_resource_limits():
+                        for usage in limits[svc][lim].get_current_usage():
+                            id = "{p}{s}/{l}/{r}".format(
+                                p=prefix, s=svc, l=lim, r=usage.resource_id
+                            )
+                            data[id] = '{v} (API)'.format(
+                                v=usage.get_maximum()
+                            )
+                    else:
+                        data["{p}{s}/{l}".format(p=prefix, s=svc, l=lim)] = \
+                            '{v}{t}'.format(v=limits[svc][lim].get_limit(),
+                                            t=src_str)
         print(dict2cols(data))
 
     def list_defaults(self):
-        limits = self.checker.get_limits(service=self.service_name)
+        if self.catalog is not None:
+            per_region = [('', self.catalog.get_default_limits(self.region))]
+        else:
+            per_region = []
+            for prefix, limits in self._per_region(self.checker.get_limits(
+                service=self.service_name, use_ta=False, use_api=False
+            )):
+                per_region.append((prefix, dict(
+                    (svc, dict(
+                        (lim, limits[svc][lim].default_limit)
+                        for lim in limits[svc]
+                    ))
+                    for svc in limits
+                )))
         data = {}
-        for svc in sorted(limits.keys()):
-            for lim in sorted(limits[svc].keys()):
-                data["{s}/{l}".format(s=svc, l=lim)] = '{v}'.format(
-                    v=limits[svc][lim].default_limit)
+        for prefix, defaults in per_region:
+            for svc in sorted(defaults.keys()):
+                for lim in sorted(defaults[svc].keys()):
+                    data["{p}{s}/{l}".format(p=prefix, s=svc, l=lim)] = \
+                        '{v}'.format(v=defaults[svc][lim])
         print(dict2cols(data))
 
     def iam_policy(self):
-        policy = self.checker.get_required_iam_policy()
+        if self.catalog is not None:
+            policy = self.catalog.get_required_iam_policy()
+        else:
+            policy = self.checker.get_required_iam_policy()
         print(json.dumps(policy, sort_keys=True, indent=2))
 
     def show_usage(self):
         self.checker.find_usage(
             service=self.service_name, use_ta=(not self.skip_ta))
-        limits = self.checker.get_limits(
+        res = self.checker.get_limits(
             service=self.service_name, use_ta=(not self.skip_ta))
         headers = ['Service Limit', 'Resource', 'Usage #', 'Usage %', 'Limit']
         table = []
-        for svc in sorted(limits.keys()):
-            for lim in sorted(limits[svc].keys()):
-                data = limits[svc][lim]
-                for usage in data.get_current_usage():
-                    service = svc
-                    limit_name = lim
-                    resource = usage.resource_id or '-'
-                    limit = "<unknown>"
-                    if data.quotas_limit:
-                        limit = int(data.quotas_limit)
-                    use = usage.value
-                    use_percent = "-"
-                    if isinstance(limit, (int, float)):
-                        use_percent = "{:.0f} %".format((use / limit) * 100)
-                    table.append([
-                        f"{service}/{limit_name}",
-                        resource,
-                        str(use),
-                        use_percent,
-                        str(limit),
-                    ])
+        for prefix, limits in self._per_region(res):
+            for svc in sorted(limits.keys()):
+                for lim in sorted(limits[svc].keys()):
+                    data = limits[svc][lim]
+                    for usage in data.get_current_usage():
+                        service = svc
+                        limit_name = lim
+                        resource = usage.resource_id or '-'
+                        limit = "<unknown>"
+                        if data.quotas_limit:
+                            limit = int(data.quotas_limit)
+                        use = usage.value
+                        use_percent = "-"
+                        if isinstance(limit, (int, float)):
+                            use_percent = "{:.0f} %".format(
+                                (use / limit) * 100
+                            )
+                        table.append([
+                            f"{prefix}{service}/{limit_name}",
+                            resource,
+                            str(use),
+                            use_percent,
+                            str(limit),
+                        ])
         print(tabulate.tabulate(
             table, headers=headers, tablefmt="simple_outline"))
 
@@ -355,32 +657,47 @@ class Runner(object):
             use_ta=(not self.skip_ta),
             service=self.service_name
         )
+        unknown = {}
+        if self.time_limited:
+            unknown = self.checker.get_unknown_services()
         if metrics:
-            for svc, svc_limits in sorted(self.checker.get_limits().items()):
-                if self.service_name and svc not in self.service_name:
-                    continue
-                for _, limit in sorted(svc_limits.items()):
-                    metrics.add_limit(limit)
+            for region, provider in self._metrics_by_region(metrics):
+                index = self._checker_for(region).get_limit_index()
+                for _, _, limit in index.iter_limits(
+                    self.service_name or None
+                ):
+                    if self.time_limited and limit.unknown_reason is not None:
+                        continue
+                    provider.add_limit(limit)
         columns = {}
-        for svc in sorted(problems.keys()):
-            for lim_name in sorted(problems[svc].keys()):
-                check_name = "{svc}/{limit}".format(
-                    svc=svc,
-                    limit=lim_name,
-                )
-                if check_name in self.skip_check:
-                    continue
-                limit = problems[svc][lim_name]
-                warns = limit.get_warnings()
-                crits = limit.get_criticals()
-                if len(crits) > 0:
-                    have_crit = True
-                if len(warns) > 0:
-                    have_warn = True
-                k, v = issue_string_tuple(
-                    svc, limit, crits, warns, colorize=self.colorize
+        for prefix, svc_unknown in self._per_region(unknown):
+            for svc in sorted(svc_unknown.keys()):
+                # usage we could not collect is treated as a warning
+                have_warn = True
+                columns[prefix + svc] = color_output(
+                    'UNKNOWN: %s' % svc_unknown[svc], 'yellow',
+                    colorize=self.colorize
                 )
-                columns[k] = v
+        for prefix, svc_problems in self._per_region(problems):
+            for svc in sorted(svc_problems.keys()):
+                for lim_name in sorted(svc_problems[svc].keys()):
+                    check_name = "{svc}/{limit}".format(
+                        svc=svc,
+                        limit=lim_name,
+                    )
+                    if check_name in self.skip_check:
+                        continue
+                    limit = svc_problems[svc][lim_name]
+                    warns = limit.get_warnings()
+                    crits = limit.get_criticals()
+                    if len(crits) > 0:
+                        have_crit = True
+                    if len(warns) > 0:
+                        have_warn = True
+                    k, v = issue_string_tuple(
+                        svc, limit, crits, warns, colorize=self.colorize
+                    )
+                    columns[prefix + k] = v
         d2c = dict2cols(columns)
         print(d2c)
         # might as well use the Nagios exit codes,
@@ -408,6 +725,7 @@ class Runner(object):
                 'Reading JSON from S3 bucket "%s" key "%s"',
                 parsed.netloc, s3key
             )
+            import boto3
             client = boto3.client('s3')
             resp = client.get_object(Bucket=parsed.netloc, Key=s3key)
             data = resp['Body'].read()
@@ -450,24 +768,61 @@ class Runner(object):
         if args.skip_ta:
             self.skip_ta = True
 
-        # the rest of these actually use the checker
-        self.checker = AwsLimitChecker(
+        if args.run_timeout is not None or args.service_timeout is not None:
+            self.time_limited = True
+
+        for api, rate in sorted(args.api_rate.items()):
+            rate_limiter.set_rate(api, rate)
+
+        # metadata-only commands can be answered from the catalog
+        self.catalog = self._metadata_catalog(args)
+        if self.catalog is not None:
+            self._print_license_notice()
+            if args.list_services:
+                self.list_services()
+            elif args.list_defaults:
+                self.list_defaults()
+            else:
+                self.iam_policy()
+            raise SystemExit(0)
+
+        # the rest of these actually use the checker; import it (and boto3)
+        # only now, so the metadata-only commands above stay fast
+        from botocore.exceptions import ClientError
+        from .checker import AwsLimitChecker
+        from .multiregion import MultiRegionChecker
+
+        checker_kwargs = dict(
             warning_threshold=args.warning_threshold,
             critical_threshold=args.critical_threshold,
             profile_name=args.profile_name,
             account_id=args.sts_account_id,
             account_role=args.sts_account_role,
-            region=args.region,
             external_id=args.external_id,
             mfa_serial_number=args.mfa_serial_number,
             mfa_token=args.mfa_token,
             ta_refresh_mode=args.ta_refresh_mode,
             ta_refresh_timeout=args.ta_refresh_timeout,
             check_version=args.check_version,
+            version_check_interval=args.version_check_interval,
+            ta_cache=args.ta_cache,
+            columnar_thresholds=args.columnar_thresholds,
+            run_timeout=args.run_timeout,
+            service_timeout=args.service_timeout,
             role_partition=args.role_partition,
             ta_api_region=args.ta_api_region,
-            skip_quotas=args.skip_quotas
+            skip_quotas=args.skip_quotas,
+            services=self._selected_services(args),
+            duration_history=True
         )
+        regions = self._regions(args)
+        if regions is None:
+            self.checker = AwsLimitChecker(
+                region=args.region, **checker_kwargs
+            )
+        else:
+            self.multi_region = True
+            self.checker = MultiRegionChecker(regions, **checker_kwargs)
 
         if args.version:
             print('awslimitchecker {v} (see <{s}> for source code)'.format(
@@ -512,6 +867,8 @@ class Runner(object):
 
         if args.show_usage:
             self.show_usage()
+            if args.verbose:
+                self._log_service_durations()
             raise SystemExit(0)
 
         if args.list_metrics_providers:
@@ -538,15 +895,32 @@ class Runner(object):
         try:
             metrics = None
             if args.metrics_provider:
-                metrics = MetricsProvider.get_provider_by_name(
+                provider = MetricsProvider.get_provider_by_name(
                     args.metrics_provider
-                )(self.checker.region_name, **args.metrics_config)
+                )
+                if self.multi_region:
+                    metrics = dict(
+                        (r, provider(r, **args.metrics_config))
+                        for r in self.checker.regions
+                    )
+                else:
+                    metrics = provider(
+                        self.checker.region_name, **args.metrics_config
+                    )
             res, problems, problem_str = self.check_thresholds(metrics)
             duration = time.time() - start_time
             logger.info('Finished checking limits in %s seconds', duration)
+            if args.verbose:
+                self._log_service_durations()
             if metrics:
-                metrics.set_run_duration(duration)
-                metrics.flush()
+                for region, provider in self._metrics_by_region(metrics):
+                    provider.set_run_duration(duration)
+                    latency = self._checker_for(
+                        region
+                    ).get_ta_refresh_latency()
+                    if latency is not None:
+                        provider.set_ta_refresh_latency(latency)
+                    provider.flush()
         except ClientError as ex:
             error_code = ex.response['Error']['Code']
             if error_code == 'NoSuchResourceException':
@@ -37,37 +37,102 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 ################################################################################
 """
 
-from awslimitchecker.services.base import _AwsService
-from awslimitchecker.services.apigateway import _ApigatewayService
-from awslimitchecker.services.autoscaling import _AutoscalingService
-from awslimitchecker.services.certificatemanager import \
-    _CertificatemanagerService
-from awslimitchecker.services.cloudformation import _CloudformationService
-from awslimitchecker.services.cloudfront import _CloudfrontService
-from awslimitchecker.services.cloudtrail import _CloudTrailService
-from awslimitchecker.services.directoryservice import _DirectoryserviceService
-from awslimitchecker.services.dynamodb import _DynamodbService
-from awslimitchecker.services.ebs import _EbsService
-from awslimitchecker.services.ec2 import _Ec2Service
-from awslimitchecker.services.ecr import _EcrService
-from awslimitchecker.services.ecs import _EcsService
-from awslimitchecker.services.efs import _EfsService
-from awslimitchecker.services.elasticache import _ElastiCacheService
-from awslimitchecker.services.elasticbeanstalk import _ElasticBeanstalkService
-from awslimitchecker.services.elb import _ElbService
-from awslimitchecker.services.eks import _EksService
-from awslimitchecker.services.firehose import _FirehoseService
-from awslimitchecker.services.iam import _IamService
-from awslimitchecker.services.kinesis import _KinesisService
-from awslimitchecker.services.lambdafunc import _LambdaService
-from awslimitchecker.services.rds import _RDSService
-from awslimitchecker.services.redshift import _RedshiftService
-from awslimitchecker.services.route53 import _Route53Service
-from awslimitchecker.services.s3 import _S3Service
-from awslimitchecker.services.ses import _SesService
-from awslimitchecker.services.vpc import _VpcService
-
-# dynamically generate the service name to class dict
-_services = {}
-for cls in _AwsService.__subclasses__():
-    _services[cls.service_name] = cls
+from importlib import import_module
+from collections.abc import MutableMapping
+
+
+#: Mapping of awslimitchecker service name to a 2-tuple of the module name
+#: (within this package) and class name implementing that service. Modules are
+#: only imported when their class is first requested from :py:data:`_services`.
+_SERVICE_MODULES = {
+    'ApiGateway': ('apigateway', '_ApigatewayService'),
+    'AutoScaling': ('autoscaling', '_AutoscalingService'),
+    'CertificateManager': ('certificatemanager', '_CertificatemanagerService'),
+    'CloudFormation': ('cloudformation', '_CloudformationService'),
+    'CloudFront': ('cloudfront', '_CloudfrontService'),
+    'CloudTrail': ('cloudtrail', '_CloudTrailService'),
+    'Directory Service': ('directoryservice', '_DirectoryserviceService'),
+    'DynamoDB': ('dynamodb', '_DynamodbService'),
+    'EBS': ('ebs', '_EbsService'),
+    'EC2': ('ec2', '_Ec2Service'),
+    'ECR': ('ecr', '_EcrService'),
+    'ECS': ('ecs', '_EcsService'),
+    'EFS': ('efs', '_EfsService'),
+    'EKS': ('eks', '_EksService'),
+    'ElastiCache': ('elasticache', '_ElastiCacheService'),
+    'ElasticBeanstalk': ('elasticbeanstalk', '_ElasticBeanstalkService'),
+    'ELB': ('elb', '_ElbService'),
+    'Firehose': ('firehose', '_FirehoseService'),
+    'IAM': ('iam', '_IamService'),
+    'Kinesis': ('kinesis', '_KinesisService'),
+    'Lambda': ('lambdafunc', '_LambdaService'),
+    'RDS': ('rds', '_RDSService'),
+    'Redshift': ('redshift', '_RedshiftService'),
+    'Route53': ('route53', '_Route53Service'),
+    'S3': ('s3', '_S3Service'),
+    'SES': ('ses', '_SesService'),
+    'VPC': ('vpc', '_VpcService'),
+}
+
+
+class _ServiceRegistry(MutableMapping):
+    """
+    Dict-like mapping of service name (str) to :py:class:`~._AwsService`
+    subclass, which imports each service's module only when its class is first
+    accessed. Listing service names or testing membership never imports
+    anything.
+    """
+
+    def __init__(self, modules):
+        """
+        :param modules: mapping of service name to (module name, class name)
+          2-tuples, like :py:data:`_SERVICE_MODULES`
+        :type modules: dict
+        """
+        self._modules = dict(modules)
+        self._classes = {}
+
+    def __getitem__(self, name):
+        if name not in self._classes:
+            modname, clsname = self._modules[name]
+            mod = import_module('awslimitchecker.services.%s' % modname)
+            self._classes[name] = getattr(mod, clsname)
+        return self._classes[name]
+
+    def __setitem__(self, name, cls):
+        self._modules[name] = None
+        self._classes[name] = cls
+
+    def __delitem__(self, name):
+        del self._modules[name]
+        self._classes.pop(name, None)
+
+    def __contains__(self, name):
+        return name in self._modules
+
+    def __iter__(self):
+        return iter(self._modules)
+
+    def __len__(self):
+        return len(self._modules)
+
+
+#: service name to class registry; see :py:class:`~._ServiceRegistry`
+_services = _ServiceRegistry(_SERVICE_MODULES)
+
+
+def __getattr__(name):
+    """
+    Lazily resolve service class names (e.g. ``_Ec2Service``) that used to be
+    imported eagerly into this package's namespace, and the
+    :py:class:`~._AwsService` base class (which imports boto3).
+    """
+    if name == '_AwsService':
+        from awslimitchecker.services.base import _AwsService
+        return _AwsService
+    for sname, (_, clsname) in _SERVICE_MODULES.items():
+        if clsname == name:
+            return _services[sname]
+    raise AttributeError(
+        'module %r has no attribute %r' % (__name__, name)
+    )
@@ -39,9 +39,10 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 
 import abc
 import logging
-import boto3
 from datetime import datetime, timedelta
-from awslimitchecker.connectable import Connectable
+from awslimitchecker.connectable import (
+    Connectable, _client_lock, boto3_client
+)
 
 logger = logging.getLogger(__name__)
 
@@ -58,6 +59,14 @@ class _AwsService(Connectable):
     #: the service code for Service Quotas, or None
     quotas_service_code = None
 
+    #: whether the service's limits and usage are account-wide rather than
+    #: per-region, so that checking several regions of the same account only
+    #: needs to check it once (see :py:class:`~.MultiRegionChecker`)
+    is_global = False
+
+    #: whether usage has been found since the service was created
+    _have_usage = False
+
     def __init__(self, warning_threshold, critical_threshold,
                  boto_connection_kwargs, quotas_client):
         """
@@ -107,7 +116,8 @@ class _AwsService(Connectable):
         if self._current_account_id is not None:
             return self._current_account_id
         kwargs = dict(self._boto3_connection_kwargs)
-        sts = boto3.client('sts', **kwargs)
+        with _client_lock:
+            sts = boto3_client('sts', **kwargs)
         logger.info(
             "Connected to STS in region %s", sts._client_config.region_name
         )
@@ -268,6 +278,23 @@ class _AwsService(Connectable):
                 s=self.service_name,
                 l=limit_name))
 
+    def set_usage_retention(self, limit_name, retain_top):
+        """
+        Only keep the ``retain_top`` highest-utilization usages of the
+        specified limit; see :py:meth:`.AwsLimit.set_usage_retention`.
+
+        :param limit_name: the name of the limit to set retention for
+        :type limit_name: str
+        :param retain_top: number of usages to keep, or None for all
+        :type retain_top: int
+        """
+        try:
+            self.limits[limit_name].set_usage_retention(retain_top)
+        except KeyError:
+            raise ValueError("{s} service has no '{l}' limit".format(
+                s=self.service_name,
+                l=limit_name))
+
     def check_thresholds(self):
         """
         Checks current usage against configured thresholds for all limits
@@ -294,11 +321,20 @@ class _AwsService(Connectable):
         if self._quotas_client is None:
             return
         logger.debug('Updating service quotas for %s', self.service_name)
+        codes = {}
+        for lname in sorted(self.limits.keys()):
+            lim = self.limits[lname]
+            codes.setdefault(lim.quotas_service_code, []).append(
+                lim.quotas_code
+            )
+        for service_code in sorted(codes.keys()):
+            self._quotas_client.load_quotas(service_code, codes[service_code])
         for lname in sorted(self.limits.keys()):
             lim = self.limits[lname]
             val = self._quotas_client.get_quota_value(
                 lim.quotas_service_code, lim.quota_name,
-                units=lim.quotas_unit, converter=lim.quotas_unit_converter
+                units=lim.quotas_unit, converter=lim.quotas_unit_converter,
+                quota_code=lim.quotas_code
             )
             if val is not None:
                 lim._set_quotas_limit(val)
@@ -313,7 +349,8 @@ class _AwsService(Connectable):
         kwargs = dict(self._boto3_connection_kwargs)
         if self._max_retries_config is not None:
             kwargs['config'] = self._max_retries_config
-        self._cloudwatch_client = boto3.client('cloudwatch', **kwargs)
+        with _client_lock:
+            self._cloudwatch_client = boto3_client('cloudwatch', **kwargs)
         logger.info(
             "Connected to cloudwatch in region %s",
             self._cloudwatch_client._client_config.region_name
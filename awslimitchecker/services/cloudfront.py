@@ -53,6 +53,7 @@ class _CloudfrontService(_AwsService):
     service_name = "CloudFront"
     api_name = "cloudfront"  # AWS API name to connect to (boto3.client)
     quotas_service_code = "cloudfront"
+    is_global = True
 
     def find_usage(self):
         """
@@ -567,6 +568,7 @@ class _CloudfrontService(_AwsService):
             self.critical_threshold,
             limit_type="AWS::CloudFront::Distribution",
             quotas_name="Alternate domain names (CNAMEs) per distribution",
+            compact_usage=True,
         )
 
         limits["Cache behaviors per distribution"] = AwsLimit(
@@ -577,6 +579,7 @@ class _CloudfrontService(_AwsService):
             self.critical_threshold,
             limit_type="AWS::CloudFront::Distribution",
             quotas_name="Cache behaviors per distribution",
+            compact_usage=True,
         )
 
         limits["Origins per distribution"] = AwsLimit(
@@ -587,6 +590,7 @@ class _CloudfrontService(_AwsService):
             self.critical_threshold,
             limit_type="AWS::CloudFront::Distribution",
             quotas_name="Origins per distribution",
+            compact_usage=True,
         )
 
         limits["Origin groups per distribution"] = AwsLimit(
@@ -597,6 +601,7 @@ class _CloudfrontService(_AwsService):
             self.critical_threshold,
             limit_type="AWS::CloudFront::Distribution",
             quotas_name="Origin groups per distribution",
+            compact_usage=True,
         )
 
         # This limit is listed by the "Service Quotas" service, but not in the
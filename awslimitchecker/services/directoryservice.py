@@ -62,7 +62,7 @@ class _DirectoryserviceService(_AwsService):
         self.connect()
         for lim in self.limits.values():
             lim._reset_usage()
-        resp = self.conn.get_directory_limits()
+        resp = self._memoized_call('get_directory_limits')
         directory_limits = resp['DirectoryLimits']
         self.limits['CloudOnlyDirectories']._add_current_usage(
             directory_limits['CloudOnlyDirectoriesCurrentCount'],
@@ -124,7 +124,7 @@ class _DirectoryserviceService(_AwsService):
         """
         logger.debug('Setting DirectoryService limits from API')
         self.connect()
-        resp = self.conn.get_directory_limits()
+        resp = self._memoized_call('get_directory_limits')
         directory_limits = resp['DirectoryLimits']
         self.limits['CloudOnlyDirectories']._set_api_limit(
             directory_limits['CloudOnlyDirectoriesLimit']
@@ -142,10 +142,9 @@ class _DynamodbService(_AwsService):
         :returns: dict of limit names to :py:class:`~.AwsLimit` objects
         :rtype: dict
         """
-        self.connect()
-        region_name = self.conn._client_config.region_name
         if self.limits != {}:
             return self.limits
+        region_name = self._region_name
         limits = {}
 
         limits['Tables Per Region'] = AwsLimit(
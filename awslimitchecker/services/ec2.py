@@ -77,6 +77,15 @@ class _Ec2Service(_AwsService):
         'x': 'Running On-Demand X instances'
     }
 
+    #: Mapping of lower-case instance family character to Service Quotas
+    #: quota code for that family.
+    instance_family_to_quota_code = {
+        'f': 'L-74FC7D96',
+        'g': 'L-DB2E81BA',
+        'p': 'L-417A185B',
+        'x': 'L-7295265B'
+    }
+
     #: Name of default limit for all other (standard) instance families.
     default_limit_name = 'Running On-Demand All Standard ' \
                          '(A, C, D, H, I, M, R, T, Z) instances'
@@ -85,6 +94,9 @@ class _Ec2Service(_AwsService):
     default_quota_name = 'Running On-Demand Standard ' \
                          '(A, C, D, H, I, M, R, T, Z) instances'
 
+    #: Service Quotas quota code for all other (standard) families.
+    default_quota_code = 'L-1216C47A'
+
     #: List of instance types that aren't exposed via Service Quotas
     no_quotas_types = [
         'c5d.12xlarge',
@@ -404,10 +416,7 @@ class _Ec2Service(_AwsService):
                 'environment and set to something other than "true".'
             )
             return False
-        oldconn = self.conn
-        self.connect()
-        region_name = self.conn._client_config.region_name
-        self.conn = oldconn
+        region_name = self._region_name or ''
         if region_name.startswith('cn-') or region_name.startswith('us-gov-'):
             logger.debug(
                 'Using non-vCPU EC2 limits due to region name: %s', region_name
@@ -577,7 +586,8 @@ class _Ec2Service(_AwsService):
                 self.critical_threshold,
                 limit_type='On-Demand instances',
                 limit_subtype=key.upper(),
-                quotas_name=self.instance_family_to_quota_name[key]
+                quotas_name=self.instance_family_to_quota_name[key],
+                quotas_code=self.instance_family_to_quota_code[key]
             )
         limits[self.default_limit_name] = AwsLimit(
             self.default_limit_name,
@@ -587,7 +597,8 @@ class _Ec2Service(_AwsService):
             self.critical_threshold,
             limit_type='On-Demand instances',
             limit_subtype='Standard',
-            quotas_name=self.default_quota_name
+            quotas_name=self.default_quota_name,
+            quotas_code=self.default_quota_code
         )
         return limits
 
@@ -784,7 +795,8 @@ class _Ec2Service(_AwsService):
             limit_type='AWS::EC2::SecurityGroup',
             limit_subtype='AWS::EC2::VPC',
             quotas_name='VPC security groups per Region',
-            quotas_service_code='vpc'
+            quotas_service_code='vpc',
+            quotas_code='L-E79EC296'
         )
         limits['Rules per VPC security group'] = AwsLimit(
             'Rules per VPC security group',
@@ -795,7 +807,9 @@ class _Ec2Service(_AwsService):
             limit_type='AWS::EC2::SecurityGroup',
             limit_subtype='AWS::EC2::VPC',
             quotas_name='Inbound or outbound rules per security group',
-            quotas_service_code='vpc'
+            quotas_service_code='vpc',
+            quotas_code='L-0EA8095F',
+            compact_usage=True
         )
         limits['VPC Elastic IP addresses (EIPs)'] = AwsLimit(
             'VPC Elastic IP addresses (EIPs)',
@@ -806,7 +820,8 @@ class _Ec2Service(_AwsService):
             limit_type='AWS::EC2::EIP',
             limit_subtype='AWS::EC2::VPC',
             ta_service_name='VPC',  # TA shows this as VPC not EC2
-            quotas_name='EC2-VPC Elastic IPs'
+            quotas_name='EC2-VPC Elastic IPs',
+            quotas_code='L-0263D0A3'
         )
         # the EC2 limits screen calls this 'EC2-Classic Elastic IPs'
         # but Trusted Advisor just calls it 'Elastic IP addresses (EIPs)'
@@ -120,6 +120,7 @@ class _EcrService(_AwsService):
             def_warning_threshold=self.warning_threshold,
             def_critical_threshold=self.critical_threshold,
             limit_type="AWS::ECR::Repository",
+            compact_usage=True,
         )
 
         self.limits = limits
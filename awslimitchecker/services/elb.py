@@ -39,10 +39,10 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 
 import abc  # noqa
 import logging
-from boto3 import client
 from botocore.config import Config
 
 from .base import _AwsService
+from ..connectable import boto3_client
 from ..limit import AwsLimit
 from ..utils import paginate_dict
 
@@ -146,7 +146,7 @@ class _ElbService(_AwsService):
         :rtype: int
         """
         logger.debug('Checking usage for ELBv2')
-        conn2 = client(
+        conn2 = boto3_client(
             'elbv2',
             config=Config(retries={'max_attempts': ELBV2_MAX_RETRY_ATTEMPTS}),
             **self._boto3_connection_kwargs
@@ -361,7 +361,8 @@ class _ElbService(_AwsService):
             self.warning_threshold,
             self.critical_threshold,
             limit_type='AWS::ElasticLoadBalancingV2::LoadBalancer',
-            limit_subtype='LoadBalancerRule'
+            limit_subtype='LoadBalancerRule',
+            compact_usage=True
         )
         limits['Network load balancers'] = AwsLimit(
             'Network load balancers',
@@ -405,7 +406,7 @@ class _ElbService(_AwsService):
                 continue
             self.limits[name_to_limits[name]]._set_api_limit(int(attrib['Max']))
         # connect to ELBv2 API as well
-        self.conn2 = client('elbv2', **self._boto3_connection_kwargs)
+        self.conn2 = boto3_client('elbv2', **self._boto3_connection_kwargs)
         logger.debug("Connected to %s in region %s",
                      'elbv2', self.conn2._client_config.region_name)
         logger.debug("Querying ELBv2 (ALB) DescribeAccountLimits for limits")
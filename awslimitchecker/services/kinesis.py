@@ -67,7 +67,7 @@ class _KinesisService(_AwsService):
         logger.debug("Done checking usage.")
 
     def _find_shards(self):
-        describe_limits_response = self.conn.describe_limits()
+        describe_limits_response = self._memoized_call('describe_limits')
         self.limits['Shards per Region']._add_current_usage(
             describe_limits_response['OpenShardCount'],
             resource_id=self._boto3_connection_kwargs['region_name'],
@@ -85,8 +85,7 @@ class _KinesisService(_AwsService):
         if self.limits != {}:
             return self.limits
 
-        self.connect()
-        region_name = self.conn._client_config.region_name
+        region_name = self._region_name
         regions_500_shards = ['us-east-1', 'us-west-2', 'eu-west-1']
 
         limits = {}
@@ -109,7 +108,7 @@ class _KinesisService(_AwsService):
         """
         logger.debug("Updating limits for Kinesis from the AWS API")
         self.connect()
-        describe_limits_response = self.conn.describe_limits()
+        describe_limits_response = self._memoized_call('describe_limits')
         self.limits['Shards per Region']._set_api_limit(
             describe_limits_response['ShardLimit']
         )
@@ -61,7 +61,7 @@ class _LambdaService(_AwsService):
         logger.debug("Getting usage for Lambda metrics")
         try:
             self.connect()
-            resp = self.conn.get_account_settings()
+            resp = self._memoized_call('get_account_settings')
         except EndpointConnectionError as ex:
             logger.warn('Skipping Lambda: %s', str(ex))
             return
@@ -98,7 +98,7 @@ class _LambdaService(_AwsService):
         if len(self.limits) == 2:
             return
         self.connect()
-        lims = self.conn.get_account_settings()['AccountLimit']
+        lims = self._memoized_call('get_account_settings')['AccountLimit']
         self.limits['Total Code Size (MiB)']._set_api_limit(
             (lims['TotalCodeSize'] / 1048576)
         )
@@ -336,7 +336,9 @@ class _RDSService(_AwsService):
         """
         self.connect()
         logger.info("Querying RDS DescribeAccountAttributes for limits")
-        lims = self.conn.describe_account_attributes()['AccountQuotas']
+        lims = self._memoized_call(
+            'describe_account_attributes'
+        )['AccountQuotas']
         for lim in lims:
             if lim['AccountQuotaName'] not in self.API_NAME_TO_LIMIT:
                 logger.info('RDS DescribeAccountAttributes returned unknown'
@@ -65,7 +65,7 @@ class _SesService(_AwsService):
             lim._reset_usage()
         try:
             self.connect()
-            resp = self.conn.get_send_quota()
+            resp = self._memoized_call('get_send_quota')
         except EndpointConnectionError as ex:
             logger.warning('Skipping SES: %s', str(ex))
             return
@@ -112,7 +112,7 @@ class _SesService(_AwsService):
         """
         try:
             self.connect()
-            resp = self.conn.get_send_quota()
+            resp = self._memoized_call('get_send_quota')
         except EndpointConnectionError as ex:
             logger.warning('Skipping SES: %s', str(ex))
             return
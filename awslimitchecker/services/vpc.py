@@ -269,7 +269,8 @@ class _VpcService(_AwsService):
             self.warning_threshold,
             self.critical_threshold,
             limit_type='AWS::EC2::VPC',
-            quotas_name='VPCs per Region'
+            quotas_name='VPCs per Region',
+            quotas_code='L-F678F1CE'
         )
 
         limits['Subnets per VPC'] = AwsLimit(
@@ -280,6 +281,7 @@ class _VpcService(_AwsService):
             self.critical_threshold,
             limit_type='AWS::EC2::Subnet',
             limit_subtype='AWS::EC2::VPC',
+            quotas_code='L-407747CB'
         )
 
         limits['Network ACLs per VPC'] = AwsLimit(
@@ -300,6 +302,7 @@ class _VpcService(_AwsService):
             self.critical_threshold,
             limit_type='AWS::EC2::NetworkAclEntry',
             limit_subtype='AWS::EC2::NetworkAcl',
+            compact_usage=True
         )
 
         limits['Route tables per VPC'] = AwsLimit(
@@ -320,7 +323,9 @@ class _VpcService(_AwsService):
             self.critical_threshold,
             limit_type='AWS::EC2::Route',
             limit_subtype='AWS::EC2::RouteTable',
-            quotas_name='Routes per route table'
+            quotas_name='Routes per route table',
+            quotas_code='L-93826ACB',
+            compact_usage=True
         )
 
         limits['Internet gateways'] = AwsLimit(
@@ -330,7 +335,8 @@ class _VpcService(_AwsService):
             self.warning_threshold,
             self.critical_threshold,
             limit_type='AWS::EC2::InternetGateway',
-            quotas_name='Internet gateways per Region'
+            quotas_name='Internet gateways per Region',
+            quotas_code='L-A4707A72'
         )
 
         limits['NAT Gateways per AZ'] = AwsLimit(
@@ -340,7 +346,8 @@ class _VpcService(_AwsService):
             self.warning_threshold,
             self.critical_threshold,
             limit_type='AWS::EC2::NatGateway',
-            quotas_name='NAT gateways per Availability Zone'
+            quotas_name='NAT gateways per Availability Zone',
+            quotas_code='L-FE5A380F'
         )
 
         limits['Virtual private gateways'] = AwsLimit(
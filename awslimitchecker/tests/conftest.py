@@ -48,6 +48,8 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 import os
 import re
 
+import pytest
+
 from awslimitchecker.services import _services
 from awslimitchecker.tests.test_integration import REGION
 
@@ -105,6 +107,27 @@ class OutputSanitizer(object):
         return self._tw.fullwidth
 
 
+@pytest.fixture(autouse=True)
+def hermetic_cache(request, monkeypatch, tmp_path):
+    """
+    Keep unit tests from touching the real user cache directory (the latest
+    version check and service duration history) or reaching PyPI when they
+    construct a real :py:class:`~awslimitchecker.checker.AwsLimitChecker`.
+    Tests that exercise the version check patch ``urllib3.PoolManager``
+    themselves, which overrides the patch here.
+    """
+    monkeypatch.setenv('AWSLIMITCHECKER_CACHE_DIR', str(tmp_path / 'cache'))
+    if request.node.get_closest_marker('integration') is None:
+        monkeypatch.setattr(
+            'awslimitchecker.utils.urllib3.PoolManager',
+            _offline_pool_manager
+        )
+
+
+def _offline_pool_manager(*args, **kwargs):
+    raise RuntimeError('unit tests must not make HTTP requests')
+
+
 def pytest_generate_tests(metafunc):
     if (
         metafunc.cls.__name__ == 'Test_AwsServiceSubclasses' and
@@ -55,6 +55,7 @@ class TestMetricsProvider(object):
         cls = MPTester('foo')
         assert cls._region_name == 'foo'
         assert cls._duration == 0.0
+        assert cls._ta_refresh_latency is None
         assert cls._limits == []
 
     def test_set_run_duration(self):
@@ -63,6 +64,11 @@ class TestMetricsProvider(object):
         cls.set_run_duration(123.45)
         assert cls._duration == 123.45
 
+    def test_set_ta_refresh_latency(self):
+        cls = MPTester('foo')
+        cls.set_ta_refresh_latency(12.5)
+        assert cls._ta_refresh_latency == 12.5
+
     def test_add_limit(self):
         cls = MPTester('foo')
         assert cls._limits == []
@@ -171,6 +171,7 @@ class DatadogTester(object):
             m_init.return_value = None
             self.cls = Datadog()
             self.cls._host = 'https://api.datadoghq.com'
+            self.cls._ta_refresh_latency = None
 
 
 class TestValidateAuth(DatadogTester):
@@ -297,6 +298,37 @@ class TestFlush(DatadogTester):
         assert c[2]['headers'] == {'Content-type': 'application/json'}
         assert json.loads(c[2]['body'].decode()) == expected
 
+    @freeze_time("2016-12-16 10:40:42", tz_offset=0, auto_tick_seconds=6)
+    def test_ta_refresh_latency(self):
+        self.cls._prefix = 'prefix.'
+        self.cls._tags = ['tag1']
+        self.cls._limits = []
+        self.cls._api_key = 'myKey'
+        self.cls.set_run_duration(123.45)
+        self.cls.set_ta_refresh_latency(42.5)
+        mock_http = Mock()
+        mock_http.request.return_value = Mock(status=200, data='{}')
+        self.cls._http = mock_http
+        self.cls.flush()
+        ts = 1481884842
+        c = mock_http.mock_calls[0]
+        assert json.loads(c[2]['body'].decode()) == {
+            'series': [
+                {
+                    'metric': 'prefix.runtime',
+                    'points': [[ts, 123.45]],
+                    'type': 'gauge',
+                    'tags': ['tag1']
+                },
+                {
+                    'metric': 'prefix.ta_refresh_latency',
+                    'points': [[ts, 42.5]],
+                    'type': 'gauge',
+                    'tags': ['tag1']
+                }
+            ]
+        }
+
     @freeze_time("2016-12-16 10:40:42", tz_offset=0, auto_tick_seconds=6)
     def test_api_error_non_default_host(self):
         self.cls._prefix = 'prefix.'
@@ -83,3 +83,13 @@ class TestDummyInit(object):
                       'Duration: 123.45\n' \
                       'SVC1 / limitA: limit=unknown max_usage=0\n' \
                       'SVC1 / limitB: limit=10 max_usage=6\n'
+
+    def test_flush_ta_refresh_latency(self, capsys):
+        cls = Dummy('foo')
+        cls.set_run_duration(123.45)
+        cls.set_ta_refresh_latency(42.5)
+        cls.flush()
+        out, err = capsys.readouterr()
+        assert out == 'DummyMetrics Provider flush for region=foo\n' \
+                      'Duration: 123.45\n' \
+                      'TA refresh latency: 42.5\n'
@@ -136,7 +136,7 @@ class Test_AwsService(object):
         }
         cls = AwsServiceTester(1, 2, {'foo': 'bar'}, None)
         cls._current_account_id = '987654321'
-        with patch('awslimitchecker.services.base.boto3.client') as m_boto:
+        with patch('awslimitchecker.services.base.boto3_client') as m_boto:
             m_boto.return_value = mock_sts
             res = cls.current_account_id
         assert res == '987654321'
@@ -151,7 +151,7 @@ class Test_AwsService(object):
             'Arn': 'something'
         }
         cls = AwsServiceTester(1, 2, {'foo': 'bar'}, None)
-        with patch('awslimitchecker.services.base.boto3.client') as m_boto:
+        with patch('awslimitchecker.services.base.boto3_client') as m_boto:
             m_boto.return_value = mock_sts
             res = cls.current_account_id
         assert res == '123456789'
@@ -253,6 +253,23 @@ class Test_AwsService(object):
             "'bar' limit"
         assert mock_limit.mock_calls == []
 
+    def test_set_usage_retention(self):
+        mock_limit = Mock(spec_set=AwsLimit)
+        cls = AwsServiceTester(1, 2, {}, None)
+        cls.limits['foo'] = mock_limit
+        cls.set_usage_retention('foo', 10)
+        assert mock_limit.mock_calls == [call.set_usage_retention(10)]
+
+    def test_set_usage_retention_keyerror(self):
+        mock_limit = Mock(spec_set=AwsLimit)
+        cls = AwsServiceTester(1, 2, {}, None)
+        cls.limits['foo'] = mock_limit
+        with pytest.raises(ValueError) as excinfo:
+            cls.set_usage_retention('bar', 10)
+        assert excinfo.value.args[0] == "AwsServiceTester service has no " \
+            "'bar' limit"
+        assert mock_limit.mock_calls == []
+
     def test_check_thresholds(self):
         cls = AwsServiceTester(1, 2, {}, None)
         cls.find_usage()
@@ -316,6 +333,7 @@ class Test_AwsService(object):
             return_value='qsc'
         )
         type(mock_limit1).quota_name = PropertyMock(return_value='qn1')
+        type(mock_limit1).quotas_code = PropertyMock(return_value='L-1')
         type(mock_limit1).quotas_unit = PropertyMock(return_value='None')
         type(mock_limit1).quotas_unit_converter = PropertyMock(
             return_value=None
@@ -325,15 +343,17 @@ class Test_AwsService(object):
             return_value='qsc'
         )
         type(mock_limit2).quota_name = PropertyMock(return_value='qn2')
+        type(mock_limit2).quotas_code = PropertyMock(return_value=None)
         type(mock_limit2).quotas_unit = PropertyMock(return_value='None')
         type(mock_limit2).quotas_unit_converter = PropertyMock(
             return_value=None
         )
         mock_limit3 = Mock(spec_set=AwsLimit)
         type(mock_limit3).quotas_service_code = PropertyMock(
-            return_value='qsc'
+            return_value='other'
         )
         type(mock_limit3).quota_name = PropertyMock(return_value='qn3')
+        type(mock_limit3).quotas_code = PropertyMock(return_value='L-3')
         type(mock_limit3).quotas_unit = PropertyMock(return_value='Foo')
         mock_conv = Mock()
         type(mock_limit3).quotas_unit_converter = PropertyMock(
@@ -348,10 +368,17 @@ class Test_AwsService(object):
         }
         cls._update_service_quotas()
         assert mock_client.mock_calls == [
-            call.get_quota_value('qsc', 'qn1', units='None', converter=None),
-            call.get_quota_value('qsc', 'qn2', units='None', converter=None),
+            call.load_quotas('other', ['L-3']),
+            call.load_quotas('qsc', ['L-1', None]),
             call.get_quota_value(
-                'qsc', 'qn3', units='Foo', converter=mock_conv
+                'qsc', 'qn1', units='None', converter=None, quota_code='L-1'
+            ),
+            call.get_quota_value(
+                'qsc', 'qn2', units='None', converter=None, quota_code=None
+            ),
+            call.get_quota_value(
+                'other', 'qn3', units='Foo', converter=mock_conv,
+                quota_code='L-3'
             )
         ]
         assert mock_limit1.mock_calls == [
@@ -422,7 +449,7 @@ class Test_AwsService(object):
         mock_cw = Mock(_client_config=mock_conf)
         cls = AwsServiceTester(1, 2, {'foo': 'bar'}, None)
         assert cls._cloudwatch_client is None
-        with patch('awslimitchecker.services.base.boto3.client') as m_boto:
+        with patch('awslimitchecker.services.base.boto3_client') as m_boto:
             m_boto.return_value = mock_cw
             res = cls._cloudwatch_connection()
         assert res == mock_cw
@@ -436,7 +463,7 @@ class Test_AwsService(object):
         mock_cw = Mock(_client_config=mock_conf)
         cls = AwsServiceTester(1, 2, {'foo': 'bar'}, None)
         assert cls._cloudwatch_client is None
-        with patch('awslimitchecker.services.base.boto3.client') as m_boto:
+        with patch('awslimitchecker.services.base.boto3_client') as m_boto:
             with patch(
                 'awslimitchecker.connectable.Connectable._max_retries_config',
                 new_callable=PropertyMock
@@ -455,7 +482,7 @@ class Test_AwsService(object):
         mock_cw = Mock(_client_config=mock_conf)
         cls = AwsServiceTester(1, 2, {'foo': 'bar'}, None)
         cls._cloudwatch_client = mock_cw
-        with patch('awslimitchecker.services.base.boto3.client') as m_boto:
+        with patch('awslimitchecker.services.base.boto3_client') as m_boto:
             m_boto.return_value = mock_cw
             res = cls._cloudwatch_connection()
         assert res == mock_cw
@@ -810,6 +837,10 @@ class Test_AwsServiceSubclasses(object):
         assert not inst._boto3_connection_kwargs
         assert inst._current_account_id is None
         assert inst._cloudwatch_client is None
+        # only account-wide services are global
+        assert inst.is_global is (
+            inst.service_name in ['CloudFront', 'IAM', 'Route53', 'S3']
+        )
 
         boto_args = dict(region_name='myregion',
                          aws_access_key_id='myaccesskey',
@@ -71,17 +71,9 @@ class Test_DynamodbService(object):
         assert cls.critical_threshold == 43
 
     def test_get_limits_other_region(self):
-        mock_conn = Mock()
-        m_client = Mock()
-        type(m_client).region_name = 'foo'
-        type(mock_conn)._client_config = m_client
-
-        def se_conn(cls):
-            cls.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as mock_connect:
-            mock_connect.side_effect = se_conn
-            cls = _DynamodbService(21, 43, {}, None)
+            cls = _DynamodbService(21, 43, {'region_name': 'foo'}, None)
+        assert mock_connect.mock_calls == []
 
         limits = cls.limits
         for x in limits:
@@ -113,17 +105,9 @@ class Test_DynamodbService(object):
         assert read_capacity_table.default_limit == 10000
 
     def test_get_limits_us_east_1(self):
-        mock_conn = Mock()
-        m_client = Mock()
-        type(m_client).region_name = 'us-east-1'
-        type(mock_conn)._client_config = m_client
-
-        def se_conn(cls):
-            cls.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as mock_connect:
-            mock_connect.side_effect = se_conn
-            cls = _DynamodbService(21, 43, {}, None)
+            cls = _DynamodbService(21, 43, {'region_name': 'us-east-1'}, None)
+        assert mock_connect.mock_calls == []
 
         limits = cls.limits
         for x in limits:
@@ -182,9 +166,7 @@ class Test_DynamodbService(object):
         assert cls.limits['Account Max Write Capacity Units'].api_limit == 222
         assert cls.limits['Table Max Read Capacity Units'].api_limit == 333
         assert cls.limits['Table Max Write Capacity Units'].api_limit == 444
-        assert mock_connect.mock_calls == [
-            call(cls), call(cls)
-        ]
+        assert mock_connect.mock_calls == [call(cls)]
         assert mock_conn.mock_calls == [call.describe_limits()]
 
     def test_find_usage(self):
@@ -206,7 +188,7 @@ class Test_DynamodbService(object):
                     cls.conn = mock_conn
                     assert cls._have_usage is False
                     cls.find_usage()
-        assert mock_connect.mock_calls == [call(cls)]
+        assert mock_connect.mock_calls == []
         assert mock_conn_res.mock_calls == [call(cls)]
         assert mock_conn.mock_calls == []
         assert m_client.mock_calls == []
@@ -1225,20 +1225,13 @@ class TestUseVcpuLimits(object):
         mock_orig_conn = Mock()
         cls.conn = mock_orig_conn
 
-        def se_conn(klass):
-            mock_conn = Mock()
-            mock_conf = Mock()
-            type(mock_conf).region_name = PropertyMock(
-                return_value='us-east-1'
-            )
-            type(mock_conn)._client_config = PropertyMock(
-                return_value=mock_conf
-            )
-            klass.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as m_connect:
-            m_connect.side_effect = se_conn
-            res = cls._use_vcpu_limits
+            with patch(
+                '%s._region_name' % pb, new_callable=PropertyMock
+            ) as m_region:
+                m_region.return_value = 'us-east-1'
+                res = cls._use_vcpu_limits
+        assert m_connect.mock_calls == []
         assert res is True
         assert cls.conn == mock_orig_conn
 
@@ -1253,20 +1246,13 @@ class TestUseVcpuLimits(object):
         mock_orig_conn = Mock()
         cls.conn = mock_orig_conn
 
-        def se_conn(klass):
-            mock_conn = Mock()
-            mock_conf = Mock()
-            type(mock_conf).region_name = PropertyMock(
-                return_value='cn-north-1'
-            )
-            type(mock_conn)._client_config = PropertyMock(
-                return_value=mock_conf
-            )
-            klass.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as m_connect:
-            m_connect.side_effect = se_conn
-            res = cls._use_vcpu_limits
+            with patch(
+                '%s._region_name' % pb, new_callable=PropertyMock
+            ) as m_region:
+                m_region.return_value = 'cn-north-1'
+                res = cls._use_vcpu_limits
+        assert m_connect.mock_calls == []
         assert res is False
         assert cls.conn == mock_orig_conn
 
@@ -1281,20 +1267,13 @@ class TestUseVcpuLimits(object):
         mock_orig_conn = Mock()
         cls.conn = mock_orig_conn
 
-        def se_conn(klass):
-            mock_conn = Mock()
-            mock_conf = Mock()
-            type(mock_conf).region_name = PropertyMock(
-                return_value='cn-northwest-1'
-            )
-            type(mock_conn)._client_config = PropertyMock(
-                return_value=mock_conf
-            )
-            klass.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as m_connect:
-            m_connect.side_effect = se_conn
-            res = cls._use_vcpu_limits
+            with patch(
+                '%s._region_name' % pb, new_callable=PropertyMock
+            ) as m_region:
+                m_region.return_value = 'cn-northwest-1'
+                res = cls._use_vcpu_limits
+        assert m_connect.mock_calls == []
         assert res is False
         assert cls.conn == mock_orig_conn
 
@@ -1309,20 +1288,13 @@ class TestUseVcpuLimits(object):
         mock_orig_conn = Mock()
         cls.conn = mock_orig_conn
 
-        def se_conn(klass):
-            mock_conn = Mock()
-            mock_conf = Mock()
-            type(mock_conf).region_name = PropertyMock(
-                return_value='us-gov-west-1'
-            )
-            type(mock_conn)._client_config = PropertyMock(
-                return_value=mock_conf
-            )
-            klass.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as m_connect:
-            m_connect.side_effect = se_conn
-            res = cls._use_vcpu_limits
+            with patch(
+                '%s._region_name' % pb, new_callable=PropertyMock
+            ) as m_region:
+                m_region.return_value = 'us-gov-west-1'
+                res = cls._use_vcpu_limits
+        assert m_connect.mock_calls == []
         assert res is False
         assert cls.conn == mock_orig_conn
 
@@ -1336,20 +1308,13 @@ class TestUseVcpuLimits(object):
         mock_orig_conn = Mock()
         cls.conn = mock_orig_conn
 
-        def se_conn(klass):
-            mock_conn = Mock()
-            mock_conf = Mock()
-            type(mock_conf).region_name = PropertyMock(
-                return_value='us-east-1'
-            )
-            type(mock_conn)._client_config = PropertyMock(
-                return_value=mock_conf
-            )
-            klass.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as m_connect:
-            m_connect.side_effect = se_conn
-            res = cls._use_vcpu_limits
+            with patch(
+                '%s._region_name' % pb, new_callable=PropertyMock
+            ) as m_region:
+                m_region.return_value = 'us-east-1'
+                res = cls._use_vcpu_limits
+        assert m_connect.mock_calls == []
         assert res is True
         assert cls.conn == mock_orig_conn
 
@@ -1363,20 +1328,13 @@ class TestUseVcpuLimits(object):
         mock_orig_conn = Mock()
         cls.conn = mock_orig_conn
 
-        def se_conn(klass):
-            mock_conn = Mock()
-            mock_conf = Mock()
-            type(mock_conf).region_name = PropertyMock(
-                return_value='cn-north-1'
-            )
-            type(mock_conn)._client_config = PropertyMock(
-                return_value=mock_conf
-            )
-            klass.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as m_connect:
-            m_connect.side_effect = se_conn
-            res = cls._use_vcpu_limits
+            with patch(
+                '%s._region_name' % pb, new_callable=PropertyMock
+            ) as m_region:
+                m_region.return_value = 'cn-north-1'
+                res = cls._use_vcpu_limits
+        assert m_connect.mock_calls == []
         assert res is True
         assert cls.conn == mock_orig_conn
 
@@ -1390,20 +1348,13 @@ class TestUseVcpuLimits(object):
         mock_orig_conn = Mock()
         cls.conn = mock_orig_conn
 
-        def se_conn(klass):
-            mock_conn = Mock()
-            mock_conf = Mock()
-            type(mock_conf).region_name = PropertyMock(
-                return_value='cn-northwest-1'
-            )
-            type(mock_conn)._client_config = PropertyMock(
-                return_value=mock_conf
-            )
-            klass.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as m_connect:
-            m_connect.side_effect = se_conn
-            res = cls._use_vcpu_limits
+            with patch(
+                '%s._region_name' % pb, new_callable=PropertyMock
+            ) as m_region:
+                m_region.return_value = 'cn-northwest-1'
+                res = cls._use_vcpu_limits
+        assert m_connect.mock_calls == []
         assert res is True
         assert cls.conn == mock_orig_conn
 
@@ -1417,20 +1368,13 @@ class TestUseVcpuLimits(object):
         mock_orig_conn = Mock()
         cls.conn = mock_orig_conn
 
-        def se_conn(klass):
-            mock_conn = Mock()
-            mock_conf = Mock()
-            type(mock_conf).region_name = PropertyMock(
-                return_value='us-gov-west-1'
-            )
-            type(mock_conn)._client_config = PropertyMock(
-                return_value=mock_conf
-            )
-            klass.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as m_connect:
-            m_connect.side_effect = se_conn
-            res = cls._use_vcpu_limits
+            with patch(
+                '%s._region_name' % pb, new_callable=PropertyMock
+            ) as m_region:
+                m_region.return_value = 'us-gov-west-1'
+                res = cls._use_vcpu_limits
+        assert m_connect.mock_calls == []
         assert res is True
         assert cls.conn == mock_orig_conn
 
@@ -1444,20 +1388,13 @@ class TestUseVcpuLimits(object):
         mock_orig_conn = Mock()
         cls.conn = mock_orig_conn
 
-        def se_conn(klass):
-            mock_conn = Mock()
-            mock_conf = Mock()
-            type(mock_conf).region_name = PropertyMock(
-                return_value='us-east-1'
-            )
-            type(mock_conn)._client_config = PropertyMock(
-                return_value=mock_conf
-            )
-            klass.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as m_connect:
-            m_connect.side_effect = se_conn
-            res = cls._use_vcpu_limits
+            with patch(
+                '%s._region_name' % pb, new_callable=PropertyMock
+            ) as m_region:
+                m_region.return_value = 'us-east-1'
+                res = cls._use_vcpu_limits
+        assert m_connect.mock_calls == []
         assert res is False
         assert cls.conn == mock_orig_conn
 
@@ -1471,20 +1408,13 @@ class TestUseVcpuLimits(object):
         mock_orig_conn = Mock()
         cls.conn = mock_orig_conn
 
-        def se_conn(klass):
-            mock_conn = Mock()
-            mock_conf = Mock()
-            type(mock_conf).region_name = PropertyMock(
-                return_value='cn-north-1'
-            )
-            type(mock_conn)._client_config = PropertyMock(
-                return_value=mock_conf
-            )
-            klass.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as m_connect:
-            m_connect.side_effect = se_conn
-            res = cls._use_vcpu_limits
+            with patch(
+                '%s._region_name' % pb, new_callable=PropertyMock
+            ) as m_region:
+                m_region.return_value = 'cn-north-1'
+                res = cls._use_vcpu_limits
+        assert m_connect.mock_calls == []
         assert res is False
         assert cls.conn == mock_orig_conn
 
@@ -1498,20 +1428,13 @@ class TestUseVcpuLimits(object):
         mock_orig_conn = Mock()
         cls.conn = mock_orig_conn
 
-        def se_conn(klass):
-            mock_conn = Mock()
-            mock_conf = Mock()
-            type(mock_conf).region_name = PropertyMock(
-                return_value='cn-northwest-1'
-            )
-            type(mock_conn)._client_config = PropertyMock(
-                return_value=mock_conf
-            )
-            klass.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as m_connect:
-            m_connect.side_effect = se_conn
-            res = cls._use_vcpu_limits
+            with patch(
+                '%s._region_name' % pb, new_callable=PropertyMock
+            ) as m_region:
+                m_region.return_value = 'cn-northwest-1'
+                res = cls._use_vcpu_limits
+        assert m_connect.mock_calls == []
         assert res is False
         assert cls.conn == mock_orig_conn
 
@@ -1525,19 +1448,12 @@ class TestUseVcpuLimits(object):
         mock_orig_conn = Mock()
         cls.conn = mock_orig_conn
 
-        def se_conn(klass):
-            mock_conn = Mock()
-            mock_conf = Mock()
-            type(mock_conf).region_name = PropertyMock(
-                return_value='us-gov-west-1'
-            )
-            type(mock_conn)._client_config = PropertyMock(
-                return_value=mock_conf
-            )
-            klass.conn = mock_conn
-
         with patch('%s.connect' % pb, autospec=True) as m_connect:
-            m_connect.side_effect = se_conn
-            res = cls._use_vcpu_limits
+            with patch(
+                '%s._region_name' % pb, new_callable=PropertyMock
+            ) as m_region:
+                m_region.return_value = 'us-gov-west-1'
+                res = cls._use_vcpu_limits
+        assert m_connect.mock_calls == []
         assert res is False
         assert cls.conn == mock_orig_conn
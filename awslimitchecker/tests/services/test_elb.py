@@ -122,7 +122,7 @@ class Test_ElbService(object):
         mock_conn.describe_account_limits.return_value = r1
 
         with patch('%s.connect' % pb) as mock_connect:
-            with patch('%s.client' % pbm) as mock_client:
+            with patch('%s.boto3_client' % pbm) as mock_client:
                 m_cli = mock_client.return_value
                 m_cli._client_config.region_name = PropertyMock(
                     return_value='rname'
@@ -222,7 +222,7 @@ class Test_ElbService(object):
         tgs_res = result_fixtures.ELB.test_find_usage_elbv2_target_groups
 
         with patch('%s.connect' % pb) as mock_connect:
-            with patch('%s.client' % pbm) as mock_client:
+            with patch('%s.boto3_client' % pbm) as mock_client:
                 mock_client.return_value._client_config.region_name = \
                     PropertyMock(return_value='rname')
                 with patch('%s.paginate_dict' % pbm) as mock_paginate:
@@ -0,0 +1,91 @@
+"""
+awslimitchecker/tests/services/test_init.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+################################################################################
+Copyright 2015-2018 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+################################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+################################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+################################################################################
+"""
+
+import pytest
+
+import awslimitchecker.services as services
+from awslimitchecker.services import (
+    _services, _SERVICE_MODULES, _ServiceRegistry, _AwsService
+)
+
+
+class TestServiceRegistry(object):
+
+    def test_registry_matches_classes(self):
+        for sname in _SERVICE_MODULES:
+            assert _services[sname].service_name == sname
+            assert issubclass(_services[sname], _AwsService)
+        # every _AwsService subclass must be registered
+        names = sorted([
+            x.service_name for x in _AwsService.__subclasses__()
+            if x.__module__.startswith('awslimitchecker.services.')
+        ])
+        assert names == sorted(_SERVICE_MODULES.keys())
+
+    def test_lazy_import(self):
+        reg = _ServiceRegistry({'Foo': ('nonexistent_module', '_FooService')})
+        assert list(reg.keys()) == ['Foo']
+        assert 'Foo' in reg
+        assert 'Bar' not in reg
+        assert len(reg) == 1
+        with pytest.raises(ImportError):
+            reg['Foo']
+        with pytest.raises(KeyError):
+            reg['Bar']
+
+    def test_import_on_access(self):
+        reg = _ServiceRegistry({'Lambda': ('lambdafunc', '_LambdaService')})
+        cls = reg['Lambda']
+        assert cls.__name__ == '_LambdaService'
+        assert reg['Lambda'] is cls
+
+    def test_set_delete(self):
+        reg = _ServiceRegistry({'Lambda': ('lambdafunc', '_LambdaService')})
+        reg['Foo'] = 'bar'
+        assert sorted(reg.keys()) == ['Foo', 'Lambda']
+        assert reg['Foo'] == 'bar'
+        del reg['Foo']
+        assert list(reg.keys()) == ['Lambda']
+        with pytest.raises(KeyError):
+            del reg['Foo']
+
+    def test_module_getattr(self):
+        assert services._LambdaService is _services['Lambda']
+        with pytest.raises(AttributeError):
+            services._NoSuchService
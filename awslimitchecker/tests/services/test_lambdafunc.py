@@ -177,6 +177,23 @@ class Test_LambdaService(object):
         assert len(u) == 1
         assert u[0].get_value() == 2
 
+    def test_find_usage_memoized(self):
+        response = result_fixtures.Lambda.test_lambda_response
+        mock_conn = Mock()
+        mock_conn.get_account_settings.return_value = response
+
+        with patch('%s.connect' % pb):
+            cls = _LambdaService(21, 43, {}, None)
+            cls.conn = mock_conn
+            cls._reset_api_cache()
+            cls._update_limits_from_api()
+            cls.find_usage()
+
+        assert mock_conn.mock_calls == [call.get_account_settings()]
+        assert cls._api_cache_hits == 1
+        u = cls.limits['Function Count'].get_current_usage()
+        assert u[0].get_value() == 12
+
     def test_required_iam_permissions(self):
         cls = _LambdaService(21, 43, {}, None)
         assert cls.required_iam_permissions() == [
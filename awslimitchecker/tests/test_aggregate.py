@@ -0,0 +1,359 @@
+"""
+awslimitchecker/tests/test_aggregate.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import json
+import random
+
+import pytest
+
+from awslimitchecker.aggregate import Aggregator, QuantileSketch, Rollup
+from awslimitchecker.limit import AwsLimit
+from awslimitchecker.multiaccount import JobResult, LimitSummary
+
+
+class FakeService(object):
+
+    def __init__(self, service_name):
+        self.service_name = service_name
+
+
+def make_limit(svc, name, default, usages, **kwargs):
+    lim = AwsLimit(name, FakeService(svc), default, 80, 99, **kwargs)
+    for u in usages:
+        lim._add_current_usage(*u)
+    return lim
+
+
+class TestQuantileSketch(object):
+
+    def test_invalid_accuracy(self):
+        for x in [0, 1, -0.5]:
+            with pytest.raises(ValueError):
+                QuantileSketch(x)
+
+    def test_empty(self):
+        assert QuantileSketch().quantile(0.5) is None
+
+    def test_invalid_quantile(self):
+        s = QuantileSketch()
+        s.add(1)
+        with pytest.raises(ValueError):
+            s.quantile(1.5)
+
+    def test_quantiles_within_accuracy(self):
+        rng = random.Random(42)
+        values = [rng.uniform(1, 10000) for _ in range(5000)]
+        s = QuantileSketch(0.01)
+        for v in values:
+            s.add(v)
+        values.sort()
+        for q in [0, 0.5, 0.95, 0.99, 1]:
+            exact = values[int(q * (len(values) - 1))]
+            assert abs(s.quantile(q) - exact) <= exact * 0.01 + 1e-9
+        assert s.count == 5000
+        # memory is bounded by the range, not the number of values
+        assert len(s.buckets) < 500
+
+    def test_zero(self):
+        s = QuantileSketch()
+        for v in [0, 0, 0, 10]:
+            s.add(v)
+        assert s.zero_count == 3
+        assert s.quantile(0.5) == 0.0
+        assert s.quantile(1) == pytest.approx(10, rel=0.01)
+
+    def test_merge_equals_single_stream(self):
+        a = QuantileSketch()
+        b = QuantileSketch()
+        both = QuantileSketch()
+        for v in range(1, 100):
+            (a if v % 2 else b).add(v)
+            both.add(v)
+        a.merge(b)
+        assert a.count == both.count
+        assert a.buckets == both.buckets
+        assert a.quantile(0.95) == both.quantile(0.95)
+
+    def test_merge_mismatch(self):
+        with pytest.raises(ValueError):
+            QuantileSketch(0.01).merge(QuantileSketch(0.02))
+
+    def test_dict_round_trip(self):
+        s = QuantileSketch()
+        for v in [0, 1, 5, 500]:
+            s.add(v)
+        res = QuantileSketch.from_dict(json.loads(json.dumps(s.to_dict())))
+        assert res.buckets == s.buckets
+        assert res.zero_count == 1
+        assert res.count == 4
+
+
+class TestRollup(object):
+
+    def test_add(self):
+        r = Rollup(top_k=2)
+        r.add(5, utilization=50.0, key=('a', 'r', 'S', 'L', 'x'))
+        r.add(9, utilization=None, key=('a', 'r', 'S', 'L', 'y'))
+        r.add(3, utilization=75.0, key=('a', 'r', 'S', 'L', 'z'))
+        assert r.count == 3
+        assert r.total == 17
+        assert r.maximum == 9
+        assert r.max_utilization == 75.0
+        assert r.mean == pytest.approx(17 / 3.0)
+        assert r.utilization.count == 2
+        assert r.get_top() == [
+            (75.0, 3, ('a', 'r', 'S', 'L', 'z')),
+            (50.0, 5, ('a', 'r', 'S', 'L', 'x'))
+        ]
+
+    def test_add_no_key(self):
+        r = Rollup(top_k=2)
+        r.add(5, utilization=50.0)
+        r.add(3, utilization=75.0, key=['a', 'r', 'S', 'L', 'z'])
+        assert r.count == 2
+        assert r.get_top() == [
+            (75.0, 3, ('a', 'r', 'S', 'L', 'z')),
+            (50.0, 5, ())
+        ]
+
+    def test_empty(self):
+        r = Rollup()
+        assert r.mean is None
+        assert r.p95 is None
+        assert r.get_top() == []
+
+    def test_unknown_limit_ranked_last(self):
+        r = Rollup(top_k=5)
+        r.add(100, key=('a', 'r', 'S', 'L', 'x'))
+        r.add(1, utilization=1.0, key=('a', 'r', 'S', 'L', 'y'))
+        assert r.get_top() == [
+            (1.0, 1, ('a', 'r', 'S', 'L', 'y')),
+            (None, 100, ('a', 'r', 'S', 'L', 'x'))
+        ]
+
+    def test_merge(self):
+        a = Rollup(top_k=2)
+        b = Rollup(top_k=2)
+        a.add(5, utilization=50.0, key=('1', 'r', 'S', 'L', ''))
+        b.add(8, utilization=80.0, key=('2', 'r', 'S', 'L', ''))
+        b.add(1, utilization=10.0, key=('3', 'r', 'S', 'L', ''))
+        a.merge(b)
+        assert a.count == 3
+        assert a.total == 14
+        assert a.maximum == 8
+        assert a.max_utilization == 80.0
+        assert [x[2][0] for x in a.get_top()] == ['2', '1']
+
+    def test_merge_empty(self):
+        a = Rollup()
+        a.add(5, utilization=50.0, key=('1', 'r', 'S', 'L', ''))
+        a.merge(Rollup())
+        assert a.maximum == 5
+        assert a.max_utilization == 50.0
+
+    def test_dict_round_trip(self):
+        r = Rollup(top_k=3)
+        r.add(5, utilization=50.0, key=('a', 'r', 'S', 'L', 'x'))
+        r.add(9, key=('a', 'r', 'S', 'L', 'y'))
+        res = Rollup.from_dict(json.loads(json.dumps(r.to_dict())))
+        assert res.top_k == 3
+        assert res.count == 2
+        assert res.total == 14
+        assert res.maximum == 9
+        assert res.max_utilization == 50.0
+        assert res.get_top() == r.get_top()
+        assert res.p95 == r.p95
+
+
+class TestAggregator(object):
+
+    def limits(self, vcpus, eips):
+        return {
+            'EC2': {
+                'vCPUs': make_limit('EC2', 'vCPUs', 100, [(vcpus,)]),
+                'EIPs': make_limit('EC2', 'EIPs', 5, [(eips,)])
+            },
+            'VPC': {
+                'Subnets per VPC': make_limit(
+                    'VPC', 'Subnets per VPC', 200,
+                    [(10, None, 'vpc-1'), (150, None, 'vpc-2')]
+                )
+            }
+        }
+
+    def aggregate(self, **kwargs):
+        agg = Aggregator(**kwargs)
+        agg.add_limits(self.limits(40, 1), account_id='1', region='r1')
+        agg.add_limits(self.limits(20, 4), account_id='1', region='r2')
+        agg.add_limits(self.limits(60, 2), account_id='2', region='r1')
+        return agg
+
+    def test_invalid_args(self):
+        with pytest.raises(ValueError) as excinfo:
+            Aggregator(group_by=('service', 'foo'))
+        assert str(excinfo.value) == 'Unknown group_by dimension(s): foo'
+        with pytest.raises(ValueError):
+            Aggregator(group_by=('region', 'region'))
+        with pytest.raises(ValueError):
+            Aggregator(top_k=0)
+        with pytest.raises(ValueError):
+            Aggregator(relative_accuracy=2)
+
+    def test_totals_by_limit(self):
+        res = self.aggregate().get_rollups()
+        assert sorted(res.keys()) == [
+            ('EC2', 'EIPs'), ('EC2', 'vCPUs'), ('VPC', 'Subnets per VPC')
+        ]
+        vcpus = res[('EC2', 'vCPUs')]
+        assert vcpus.total == 120
+        assert vcpus.count == 3
+        assert vcpus.maximum == 60
+        assert vcpus.max_utilization == 60.0
+        assert vcpus.get_top()[0] == (60.0, 60, ('2', 'r1', 'EC2', 'vCPUs', ''))
+        subnets = res[('VPC', 'Subnets per VPC')]
+        assert subnets.count == 6
+        assert subnets.total == 480
+        # ties are broken by the highest row key
+        assert subnets.get_top()[0] == (
+            75.0, 150, ('2', 'r1', 'VPC', 'Subnets per VPC', 'vpc-2')
+        )
+
+    def test_ranked_regions(self):
+        agg = Aggregator(group_by=('region',))
+        for acct, region, eips in [('1', 'r1', 1), ('1', 'r2', 4),
+                                   ('2', 'r1', 2)]:
+            agg.add_limit(
+                make_limit('EC2', 'EIPs', 5, [(eips,)]),
+                account_id=acct, region=region
+            )
+        res = agg.ranked('max_utilization', count=1)
+        assert len(res) == 1
+        assert res[0][0] == ('r2',)
+        assert res[0][1].max_utilization == 80.0
+        assert [x[0] for x in agg.ranked('total')] == [('r2',), ('r1',)]
+
+    def test_ranked_omits_none(self):
+        agg = Aggregator(group_by=('service',))
+        agg.add_usage('1', 'r1', 'S1', 'L', 5, limit=10)
+        agg.add_usage('1', 'r1', 'S2', 'L', 5)
+        assert [x[0] for x in agg.ranked()] == [('S1',)]
+
+    def test_group_everything(self):
+        agg = self.aggregate(group_by=())
+        res = agg.get_rollups()
+        assert list(res.keys()) == [()]
+        assert res[()].count == 12
+
+    def test_max_and_own_maximum(self):
+        agg = Aggregator(group_by=('limit',))
+        agg.add_limit(make_limit(
+            'S', 'L', None, [(5, 10, 'a'), (2, None, 'b')]
+        ), account_id='1', region='r1')
+        res = agg.get_rollups()[('L',)]
+        assert res.max_utilization == 50.0
+        assert res.utilization.count == 1
+        assert res.get_top()[1] == (None, 2, ('1', 'r1', 'S', 'L', 'b'))
+
+    def test_retain_top(self):
+        lim = make_limit(
+            'S', 'L', 100, [(x, None, 'r%d' % x) for x in range(1, 11)],
+            retain_top=2
+        )
+        agg = Aggregator(group_by=('limit',))
+        agg.add_limit(lim, account_id='1', region='r1')
+        res = agg.get_rollups()[('L',)]
+        assert res.count == 10
+        assert res.total == 55
+        assert res.maximum == 10
+        assert res.usage.count == 2
+
+    def test_add_result(self):
+        result = JobResult({
+            'account_id': '1', 'region': 'r1', 'duration': 1.0,
+            'error': None,
+            'limits': [['EC2', 'vCPUs', 100, 40, [], []]]
+        })
+        agg = Aggregator(group_by=('account', 'service'))
+        agg.add_result(result)
+        res = agg.get_rollups()
+        assert list(res.keys()) == [('1', 'EC2')]
+        assert res[('1', 'EC2')].max_utilization == 40.0
+
+    def test_limit_summary(self):
+        agg = Aggregator()
+        agg.add_limit(LimitSummary('S', 'L', None, None, [], []))
+        assert agg.get_rollups() == {}
+
+    def test_merge_matches_single_run(self):
+        single = self.aggregate(group_by=('service', 'region'))
+        a = Aggregator(group_by=('service', 'region'))
+        a.add_limits(self.limits(40, 1), account_id='1', region='r1')
+        a.add_limits(self.limits(20, 4), account_id='1', region='r2')
+        b = Aggregator(group_by=('service', 'region'))
+        b.add_limits(self.limits(60, 2), account_id='2', region='r1')
+        a.merge(b)
+        assert a.to_dict() == single.to_dict()
+
+    def test_merge_mismatch(self):
+        with pytest.raises(ValueError):
+            Aggregator().merge(Aggregator(group_by=('service',)))
+        with pytest.raises(ValueError):
+            Aggregator().merge(Aggregator(top_k=3))
+
+    def test_dict_round_trip(self):
+        agg = self.aggregate(group_by=('account',), top_k=3)
+        data = json.loads(json.dumps(agg.to_dict()))
+        assert data['format'] == 'awslimitchecker-aggregate'
+        res = Aggregator.from_dict(data)
+        assert res.group_by == ('account',)
+        assert res.top_k == 3
+        assert res.to_dict() == agg.to_dict()
+        # partial aggregates loaded from files merge like live ones
+        res.merge(Aggregator.from_dict(data))
+        assert res.get_rollups()[('1',)].count == 2 * 8
+
+    def test_from_dict_invalid(self):
+        with pytest.raises(ValueError) as excinfo:
+            Aggregator.from_dict({'format': 'foo'})
+        assert str(excinfo.value) == 'Not an awslimitchecker aggregate'
+        with pytest.raises(ValueError) as excinfo:
+            Aggregator.from_dict(
+                {'format': 'awslimitchecker-aggregate', 'version': 99}
+            )
+        assert str(excinfo.value) == 'Unsupported aggregate version: 99'
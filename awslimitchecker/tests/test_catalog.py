@@ -0,0 +1,219 @@
+"""
+awslimitchecker/tests/test_catalog.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import json
+import os
+import sys
+
+from awslimitchecker.catalog import (
+    CATALOG_PATH, LimitCatalog, generate_catalog, write_catalog,
+    _service_instances
+)
+from awslimitchecker.checker import AwsLimitChecker
+from awslimitchecker.version import _VERSION
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch
+else:
+    from unittest.mock import patch
+
+pbm = 'awslimitchecker.catalog'
+
+
+def sample_data():
+    return {
+        'version': _VERSION,
+        'base_iam_actions': ['sts:GetCallerIdentity'],
+        'unsupported_region_prefixes': ['cn-', 'us-gov-'],
+        'services': {
+            'SvcFoo': {
+                'api_name': 'foo',
+                'quotas_service_code': None,
+                'iam_permissions': ['foo:List', 'foo:Describe'],
+                'limits': {
+                    'lim1': {'default_limit': 10},
+                    'lim2': {'default_limit': None}
+                }
+            },
+            'SvcBar': {
+                'api_name': 'bar',
+                'quotas_service_code': 'bar',
+                'iam_permissions': ['bar:Get', 'foo:List'],
+                'limits': {
+                    'lim3': {'default_limit': 3}
+                }
+            }
+        },
+        'region_defaults': {
+            'us-east-1': {'SvcFoo': {'lim1': 20}}
+        }
+    }
+
+
+class TestShippedCatalog(object):
+
+    def test_up_to_date(self):
+        """
+        The shipped catalog must match the service classes; regenerate it
+        with ``python -m awslimitchecker.catalog`` when limits change.
+        """
+        with open(CATALOG_PATH, 'r') as fh:
+            shipped = json.loads(fh.read())
+        assert shipped == json.loads(json.dumps(generate_catalog()))
+
+    def test_defaults_match_services(self):
+        cat = LimitCatalog.load()
+        assert cat is not None
+        for region in ['us-east-1', 'us-west-2', 'eu-west-1', 'ap-south-1']:
+            expected = dict(
+                (sname, dict(
+                    (lname, lim.default_limit)
+                    for lname, lim in svc.get_limits().items()
+                ))
+                for sname, svc in _service_instances(region).items()
+            )
+            assert cat.get_default_limits(region) == expected
+
+    def test_iam_policy_matches_checker(self):
+        mock_checker = AwsLimitChecker.__new__(AwsLimitChecker)
+        mock_checker.services = _service_instances('us-east-1')
+        assert LimitCatalog.load().get_required_iam_policy() == \
+            mock_checker.get_required_iam_policy()
+
+    def test_generate_ignores_vcpu_env(self):
+        with patch.dict(os.environ, {'USE_VCPU_LIMITS': 'false'}):
+            res = generate_catalog()
+            assert os.environ['USE_VCPU_LIMITS'] == 'false'
+        assert res == generate_catalog()
+
+
+class TestWriteCatalog(object):
+
+    def test_write(self, tmpdir):
+        path = str(tmpdir.join('catalog.json'))
+        with patch('%s.generate_catalog' % pbm) as mock_gen:
+            mock_gen.return_value = sample_data()
+            write_catalog(path)
+        with open(path, 'r') as fh:
+            assert json.loads(fh.read()) == sample_data()
+
+
+class TestLoad(object):
+
+    def test_load(self, tmpdir):
+        path = tmpdir.join('catalog.json')
+        path.write(json.dumps(sample_data()))
+        res = LimitCatalog.load(str(path))
+        assert isinstance(res, LimitCatalog)
+        assert res.data == sample_data()
+
+    def test_missing(self, tmpdir):
+        assert LimitCatalog.load(str(tmpdir.join('nope.json'))) is None
+
+    def test_invalid(self, tmpdir):
+        path = tmpdir.join('catalog.json')
+        path.write('{not json')
+        assert LimitCatalog.load(str(path)) is None
+
+    def test_other_version(self, tmpdir):
+        data = sample_data()
+        data['version'] = '0.0.1'
+        path = tmpdir.join('catalog.json')
+        path.write(json.dumps(data))
+        assert LimitCatalog.load(str(path)) is None
+
+
+class TestLimitCatalog(object):
+
+    def setup(self):
+        self.cls = LimitCatalog(sample_data())
+
+    def test_get_service_names(self):
+        assert self.cls.get_service_names() == ['SvcBar', 'SvcFoo']
+
+    def test_for_services(self):
+        res = self.cls.for_services(['SvcFoo'])
+        assert res.get_service_names() == ['SvcFoo']
+        assert self.cls.get_service_names() == ['SvcBar', 'SvcFoo']
+
+    def test_for_services_unknown(self):
+        assert self.cls.for_services(['SvcFoo', 'SvcBaz']) is None
+
+    def test_supports_region(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert self.cls.supports_region('us-east-1') is True
+            assert self.cls.supports_region(None) is True
+            assert self.cls.supports_region('cn-north-1') is False
+            assert self.cls.supports_region('us-gov-west-1') is False
+
+    def test_supports_region_vcpu_env(self):
+        with patch.dict(os.environ, {'USE_VCPU_LIMITS': 'true'}):
+            assert self.cls.supports_region('us-east-1') is False
+
+    def test_get_default_limits(self):
+        assert self.cls.get_default_limits('us-west-2') == {
+            'SvcFoo': {'lim1': 10, 'lim2': None},
+            'SvcBar': {'lim3': 3}
+        }
+
+    def test_get_default_limits_regional(self):
+        assert self.cls.get_default_limits('us-east-1') == {
+            'SvcFoo': {'lim1': 20, 'lim2': None},
+            'SvcBar': {'lim3': 3}
+        }
+
+    def test_get_required_iam_policy(self):
+        assert self.cls.get_required_iam_policy() == {
+            'Version': '2012-10-17',
+            'Statement': [{
+                'Effect': 'Allow',
+                'Resource': '*',
+                'Action': [
+                    'bar:Get',
+                    'foo:Describe',
+                    'foo:List',
+                    'sts:GetCallerIdentity'
+                ],
+            }],
+        }
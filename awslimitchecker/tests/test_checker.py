@@ -38,12 +38,16 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 import sys
+import threading
+import time
+import pytest
 
 from awslimitchecker.services.base import _AwsService
 from awslimitchecker.checker import AwsLimitChecker
 from awslimitchecker.version import _get_version_info
 from awslimitchecker.limit import AwsLimit
 from awslimitchecker.trustedadvisor import TrustedAdvisor
+from awslimitchecker.utils import _LatestVersionCheck
 from .support import sample_limits
 
 
@@ -86,6 +90,8 @@ class TestAwsLimitChecker(object):
         self.mock_foo = Mock(spec_set=_AwsService)
         self.mock_bar = Mock(spec_set=_AwsService)
         self.mock_ta = Mock(spec_set=TrustedAdvisor)
+        self.mock_svc1._api_cache_hits = 0
+        self.mock_svc2._api_cache_hits = 0
         self.mock_foo.return_value = self.mock_svc1
         self.mock_bar.return_value = self.mock_svc2
         self.svcs = {'SvcFoo': self.mock_foo, 'SvcBar': self.mock_bar}
@@ -95,19 +101,26 @@ class TestAwsLimitChecker(object):
                     logger=DEFAULT,
                     _get_version_info=DEFAULT,
                     TrustedAdvisor=DEFAULT,
-                    _get_latest_version=DEFAULT,
+                    LimitIndex=DEFAULT,
+                    _LatestVersionCheck=DEFAULT,
                     ServiceQuotasClient=DEFAULT,
+                    _DurationHistory=DEFAULT,
                     autospec=True,
             ) as mocks:
                 self.mock_logger = mocks['logger']
                 self.mock_version = mocks['_get_version_info']
                 self.mock_ta_constr = mocks['TrustedAdvisor']
-                self.mock_glv = mocks['_get_latest_version']
+                self.mock_lvc = mocks['_LatestVersionCheck']
                 self.mock_quotas = mocks['ServiceQuotasClient']
+                self.mock_index = mocks['LimitIndex']
+                self.mock_hist_constr = mocks['_DurationHistory']
+                self.mock_hist = mocks['_DurationHistory'].return_value
+                self.mock_hist.get.return_value = {}
                 mocks['TrustedAdvisor'].return_value = self.mock_ta
-                mocks['_get_latest_version'].return_value = None
                 self.mock_version.return_value = self.mock_ver_info
-                self.cls = AwsLimitChecker(check_version=False)
+                self.cls = AwsLimitChecker(
+                    check_version=False, duration_history=True
+                )
 
     def test_init(self):
         # dict should be of _AwsService instances
@@ -125,18 +138,28 @@ class TestAwsLimitChecker(object):
         ]
         assert self.mock_ta_constr.mock_calls == [
             call(services, {'region_name': None}, ta_api_region='us-east-1',
-                 ta_refresh_mode=None, ta_refresh_timeout=None)
+                 ta_refresh_mode=None, ta_refresh_timeout=None,
+                 cache_results=True,
+                 limit_index=self.mock_index.return_value)
+        ]
+        assert self.cls.limit_index is self.mock_index.return_value
+        assert self.mock_index.mock_calls == [
+            call(),
+            call().add_service(self.mock_svc1),
+            call().add_service(self.mock_svc2)
         ]
         assert self.mock_svc1.mock_calls == []
         assert self.mock_svc2.mock_calls == []
         assert self.cls.ta == self.mock_ta
         assert self.mock_version.mock_calls == [call()]
         assert self.cls.vinfo == self.mock_ver_info
-        assert self.mock_glv.mock_calls == []
+        assert self.mock_lvc.mock_calls == []
+        assert self.cls._version_check is None
         assert self.mock_logger.mock_calls == [
             call.debug('Connecting to region %s', None)
         ]
         assert self.cls.role_partition == 'aws'
+        assert self.cls.columnar_thresholds is False
         assert self.mock_quotas.mock_calls == [
             call({'region_name': None})
         ]
@@ -156,43 +179,67 @@ class TestAwsLimitChecker(object):
             "all users have a right to the full source code of "
             "this version. See <http://myurl>\n")
 
-    def test_check_version_old(self):
+    def test_check_version(self):
         with patch.multiple(
             'awslimitchecker.checker',
             logger=DEFAULT,
             _get_version_info=DEFAULT,
             TrustedAdvisor=DEFAULT,
-            _get_latest_version=DEFAULT,
+            LimitIndex=DEFAULT,
+            _LatestVersionCheck=DEFAULT,
             autospec=True,
         ) as mocks:
             mocks['_get_version_info'].return_value = self.mock_ver_info
-            mocks['_get_latest_version'].return_value = '3.4.5'
-            AwsLimitChecker()
-        assert mocks['_get_latest_version'].mock_calls == [call()]
+            cls = AwsLimitChecker(version_check_interval=60)
+        assert mocks['_LatestVersionCheck'].mock_calls == [
+            call(cache_interval=60),
+            call().start()
+        ]
+        assert cls._version_check == mocks['_LatestVersionCheck'].return_value
         assert mocks['logger'].mock_calls == [
+            call.debug('Connecting to region %s', None)
+        ]
+
+    def test_log_latest_version_old(self):
+        mock_check = Mock(spec_set=_LatestVersionCheck)
+        mock_check.result.return_value = (True, '3.4.5')
+        self.cls._version_check = mock_check
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            self.cls._log_latest_version()
+            self.cls._log_latest_version()
+        assert mock_check.mock_calls == [call.result()]
+        assert mock_logger.mock_calls == [
             call.warning(
                 'You are running awslimitchecker %s, but the latest version'
                 ' is %s; please consider upgrading.', '1.2.3', '3.4.5'
-            ),
-            call.debug('Connecting to region %s', None)
+            )
         ]
+        assert self.cls._version_check is None
 
-    def test_check_version_not_old(self):
-        with patch.multiple(
-            'awslimitchecker.checker',
-            logger=DEFAULT,
-            _get_version_info=DEFAULT,
-            TrustedAdvisor=DEFAULT,
-            _get_latest_version=DEFAULT,
-            autospec=True,
-        ) as mocks:
-            mocks['_get_version_info'].return_value = self.mock_ver_info
-            mocks['_get_latest_version'].return_value = None
-            AwsLimitChecker()
-        assert mocks['_get_latest_version'].mock_calls == [call()]
-        assert mocks['logger'].mock_calls == [
-            call.debug('Connecting to region %s', None)
+    def test_log_latest_version_not_old(self):
+        mock_check = Mock(spec_set=_LatestVersionCheck)
+        mock_check.result.return_value = (True, None)
+        self.cls._version_check = mock_check
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            self.cls._log_latest_version()
+        assert mock_logger.mock_calls == []
+        assert self.cls._version_check is None
+
+    def test_log_latest_version_not_finished(self):
+        mock_check = Mock(spec_set=_LatestVersionCheck)
+        mock_check.result.return_value = (False, None)
+        self.cls._version_check = mock_check
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            self.cls._log_latest_version()
+        assert mock_logger.mock_calls == [
+            call.debug('Latest version check has not finished; skipping')
         ]
+        assert self.cls._version_check == mock_check
+
+    def test_log_latest_version_disabled(self):
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            self.cls._log_latest_version()
+        assert mock_logger.mock_calls == []
 
     def test_init_thresholds(self):
         mock_svc1 = Mock(spec_set=_AwsService)
@@ -209,7 +256,8 @@ class TestAwsLimitChecker(object):
                     logger=DEFAULT,
                     _get_version_info=DEFAULT,
                     TrustedAdvisor=DEFAULT,
-                    _get_latest_version=DEFAULT,
+                    LimitIndex=DEFAULT,
+                    _LatestVersionCheck=DEFAULT,
                     ServiceQuotasClient=DEFAULT,
                     autospec=True,
             ) as mocks:
@@ -217,7 +265,6 @@ class TestAwsLimitChecker(object):
                 mock_version.return_value = self.mock_ver_info
                 mock_ta_constr = mocks['TrustedAdvisor']
                 mocks['TrustedAdvisor'].return_value = mock_ta
-                mocks['_get_latest_version'].return_value = None
                 cls = AwsLimitChecker(
                     warning_threshold=5,
                     critical_threshold=22,
@@ -243,13 +290,71 @@ class TestAwsLimitChecker(object):
         ]
         assert mock_ta_constr.mock_calls == [
             call(services, {'region_name': None}, ta_api_region='us-east-1',
-                 ta_refresh_mode=None, ta_refresh_timeout=None)
+                 ta_refresh_mode=None, ta_refresh_timeout=None,
+                 cache_results=True,
+                 limit_index=mocks['LimitIndex'].return_value)
         ]
         assert mock_svc1.mock_calls == []
         assert mock_svc2.mock_calls == []
         assert self.mock_version.mock_calls == [call()]
         assert self.cls.vinfo == self.mock_ver_info
 
+    def test_init_services(self):
+        mock_svc2 = Mock(spec_set=_AwsService)
+        mock_foo = Mock(spec_set=_AwsService)
+        mock_bar = Mock(spec_set=_AwsService)
+        mock_bar.return_value = mock_svc2
+        svcs = {'SvcFoo': mock_foo, 'SvcBar': mock_bar}
+        with patch.dict('%s._services' % pbm, values=svcs, clear=True):
+            with patch.multiple(
+                    'awslimitchecker.checker',
+                    logger=DEFAULT,
+                    _get_version_info=DEFAULT,
+                    TrustedAdvisor=DEFAULT,
+                    LimitIndex=DEFAULT,
+                    _LatestVersionCheck=DEFAULT,
+                    ServiceQuotasClient=DEFAULT,
+                    autospec=True,
+            ) as mocks:
+                mocks['_get_version_info'].return_value = self.mock_ver_info
+                cls = AwsLimitChecker(services=['SvcBar'])
+        assert cls.services == {'SvcBar': mock_svc2}
+        assert mock_foo.mock_calls == []
+        assert mock_bar.mock_calls == [
+            call(
+                80, 99, {'region_name': None},
+                mocks['ServiceQuotasClient'].return_value
+            )
+        ]
+        assert mocks['TrustedAdvisor'].mock_calls == [
+            call({'SvcBar': mock_svc2}, {'region_name': None},
+                 ta_api_region='us-east-1', ta_refresh_mode=None,
+                 ta_refresh_timeout=None, cache_results=True,
+                 limit_index=mocks['LimitIndex'].return_value)
+        ]
+        assert mocks['LimitIndex'].mock_calls == [
+            call(), call().add_service(mock_svc2)
+        ]
+
+    def test_init_services_unknown(self):
+        svcs = {'SvcFoo': Mock(spec_set=_AwsService)}
+        with patch.dict('%s._services' % pbm, values=svcs, clear=True):
+            with patch.multiple(
+                    'awslimitchecker.checker',
+                    logger=DEFAULT,
+                    _get_version_info=DEFAULT,
+                    TrustedAdvisor=DEFAULT,
+                    LimitIndex=DEFAULT,
+                    _LatestVersionCheck=DEFAULT,
+                    ServiceQuotasClient=DEFAULT,
+                    autospec=True,
+            ) as mocks:
+                mocks['_get_version_info'].return_value = self.mock_ver_info
+                with pytest.raises(ValueError) as excinfo:
+                    AwsLimitChecker(services=['SvcFoo', 'Zzz', 'Aaa'])
+        assert str(excinfo.value) == 'Unknown service name(s): Aaa, Zzz'
+        assert svcs['SvcFoo'].mock_calls == []
+
     def test_init_region_profile_role_partition_ta_region(self):
         mock_svc1 = Mock(spec_set=_AwsService)
         mock_svc2 = Mock(spec_set=_AwsService)
@@ -266,14 +371,14 @@ class TestAwsLimitChecker(object):
                         logger=DEFAULT,
                         _get_version_info=DEFAULT,
                         TrustedAdvisor=DEFAULT,
-                        _get_latest_version=DEFAULT,
+                        LimitIndex=DEFAULT,
+                        _LatestVersionCheck=DEFAULT,
                         autospec=True,
                 ) as mocks:
                     mock_boto3.Session.return_value._session = Mock()
                     mock_version = mocks['_get_version_info']
                     mock_version.return_value = self.mock_ver_info
                     mocks['TrustedAdvisor'].return_value = mock_ta
-                    mocks['_get_latest_version'].return_value = None
                     with patch(
                         '%s._boto_conn_kwargs' % pb, new_callable=PropertyMock
                     ) as m_bck:
@@ -302,10 +407,41 @@ class TestAwsLimitChecker(object):
                 {'region_name': 'rName'},
                 ta_api_region='taRegion',
                 ta_refresh_mode=None,
-                ta_refresh_timeout=None
+                ta_refresh_timeout=None,
+                cache_results=True,
+                limit_index=mocks['LimitIndex'].return_value
             )
         ]
 
+    def test_init_duration_history(self):
+        assert self.mock_hist_constr.mock_calls == [call('default/default')]
+        with patch.dict('%s._services' % pbm, values={}, clear=True):
+            with patch.multiple(
+                    'awslimitchecker.checker',
+                    logger=DEFAULT,
+                    _get_version_info=DEFAULT,
+                    TrustedAdvisor=DEFAULT,
+                    LimitIndex=DEFAULT,
+                    _LatestVersionCheck=DEFAULT,
+                    ServiceQuotasClient=DEFAULT,
+                    _DurationHistory=DEFAULT,
+                    autospec=True,
+            ) as mocks:
+                mocks['_get_version_info'].return_value = self.mock_ver_info
+                with patch(
+                    '%s._boto_conn_kwargs' % pb, new_callable=PropertyMock
+                ) as m_bck:
+                    m_bck.return_value = {'region_name': 'rName'}
+                    cls = AwsLimitChecker(
+                        account_id='123', account_role='myrole',
+                        region='rName', duration_history=True
+                    )
+                    cls2 = AwsLimitChecker()
+        assert mocks['_DurationHistory'].mock_calls == [call('123/rName')]
+        assert cls._duration_history is \
+            mocks['_DurationHistory'].return_value
+        assert cls2._duration_history is None
+
     def test_init_sts(self):
         mock_svc1 = Mock(spec_set=_AwsService)
         mock_svc2 = Mock(spec_set=_AwsService)
@@ -315,32 +451,20 @@ class TestAwsLimitChecker(object):
         mock_foo.return_value = mock_svc1
         mock_bar.return_value = mock_svc2
         svcs = {'SvcFoo': mock_foo, 'SvcBar': mock_bar}
-        with patch('%s.boto3' % pbm) as mock_boto:
-            mock_boto.client.return_value.assume_role.return_value = {
-                'Credentials': {
-                    'AccessKeyId': 'akid',
-                    'SecretAccessKey': 'sk',
-                    'SessionToken': 'stoken',
-                    'Expiration': '0'
-                },
-                'AssumedRoleUser': {
-                    'AssumedRoleId': 'arid',
-                    'Arn': 'arn'
-                }
-            }
+        with patch('%s.RefreshableRoleCredentials' % pbm) as mock_rrc:
             with patch.dict('%s._services' % pbm, values=svcs, clear=True):
                 with patch.multiple(
                     'awslimitchecker.checker',
                     logger=DEFAULT,
                     _get_version_info=DEFAULT,
                     TrustedAdvisor=DEFAULT,
-                    _get_latest_version=DEFAULT,
+                    LimitIndex=DEFAULT,
+                    _LatestVersionCheck=DEFAULT,
                     autospec=True,
                 ) as mocks:
                     mock_version = mocks['_get_version_info']
                     mock_version.return_value = self.mock_ver_info
                     mocks['TrustedAdvisor'].return_value = mock_ta
-                    mocks['_get_latest_version'].return_value = None
                     cls = AwsLimitChecker(
                         account_id='123456789012',
                         account_role='myrole',
@@ -356,13 +480,22 @@ class TestAwsLimitChecker(object):
         assert mock_svc2.mock_calls == []
         assert self.mock_version.mock_calls == [call()]
         assert self.cls.vinfo == self.mock_ver_info
-        assert mock_boto.mock_calls == [
-            call.client('sts', region_name='myregion'),
-            call.client().assume_role(
-                RoleArn='arn:aws:iam::123456789012:role/myrole',
-                RoleSessionName='awslimitchecker'
+        assert mock_rrc.mock_calls == [
+            call(
+                'arn:aws:iam::123456789012:role/myrole',
+                region_name='myregion',
+                external_id=None
             )
         ]
+        session = mock_rrc.return_value.session
+        assert cls.get_credentials() == {
+            'boto3_session': session, 'account_id': '123456789012'
+        }
+        assert mocks['TrustedAdvisor'].mock_calls[0][1][1] == {
+            'region_name': 'myregion',
+            'boto3_session': session,
+            'account_id': '123456789012'
+        }
 
     def test_init_sts_external_id_ta_refresh(self):
         mock_svc1 = Mock(spec_set=_AwsService)
@@ -392,13 +525,13 @@ class TestAwsLimitChecker(object):
                         logger=DEFAULT,
                         _get_version_info=DEFAULT,
                         TrustedAdvisor=DEFAULT,
-                        _get_latest_version=DEFAULT,
+                        LimitIndex=DEFAULT,
+                        _LatestVersionCheck=DEFAULT,
                         autospec=True,
                 ) as mocks:
                     mock_version = mocks['_get_version_info']
                     mock_version.return_value = self.mock_ver_info
                     mocks['TrustedAdvisor'].return_value = mock_ta
-                    mocks['_get_latest_version'].return_value = None
                     cls = AwsLimitChecker(
                         account_id='123456789012',
                         account_role='myrole',
@@ -497,6 +630,30 @@ class TestAwsLimitChecker(object):
         }
 
     def test_boto3_connection_kwargs_sts(self):
+        with patch('%s._get_sts_token' % pb) as mock_get_sts:
+            with patch('%s._get_refreshable_session' % pb) as mock_grs:
+                with patch('%s.logger' % pbm) as mock_logger:
+                    with patch.dict('%s._services' % pbm, {}, clear=True):
+                        cls = AwsLimitChecker(account_id='123',
+                                              account_role='myrole',
+                                              region='myregion')
+                        mock_grs.reset_mock()
+                        mock_logger.reset_mock()
+                        res = cls._boto_conn_kwargs
+        assert mock_get_sts.mock_calls == []
+        assert mock_grs.mock_calls == [call()]
+        assert mock_logger.mock_calls == [
+            call.debug("Connecting for account %s role '%s' with "
+                       "refreshable STS credentials (region: %s)",
+                       '123', 'myrole', 'myregion')
+        ]
+        assert res == {
+            'region_name': 'myregion',
+            'boto3_session': mock_grs.return_value,
+            'account_id': '123'
+        }
+
+    def test_boto3_connection_kwargs_sts_mfa(self):
         mock_creds = Mock()
         type(mock_creds).access_key = 'sts_ak'
         type(mock_creds).secret_key = 'sts_sk'
@@ -508,7 +665,9 @@ class TestAwsLimitChecker(object):
                     with patch.dict('%s._services' % pbm, {}, clear=True):
                         cls = AwsLimitChecker(account_id='123',
                                               account_role='myrole',
-                                              region='myregion')
+                                              region='myregion',
+                                              mfa_serial_number='sn',
+                                              mfa_token='123456')
                         mock_get_sts.return_value = mock_creds
                         mock_get_sts.reset_mock()
                         mock_logger.reset_mock()
@@ -524,9 +683,118 @@ class TestAwsLimitChecker(object):
             'region_name': 'myregion',
             'aws_access_key_id': 'sts_ak',
             'aws_secret_access_key': 'sts_sk',
-            'aws_session_token': 'sts_token'
+            'aws_session_token': 'sts_token',
+            'account_id': '123'
         }
 
+    def test_boto3_connection_kwargs_credentials(self):
+        creds = {
+            'aws_access_key_id': 'ak',
+            'aws_secret_access_key': 'sk',
+            'aws_session_token': 'tkn'
+        }
+        with patch('%s._get_sts_token' % pb) as mock_get_sts:
+            with patch('%s.logger' % pbm) as mock_logger:
+                with patch('%s.boto3.Session' % pbm) as mock_sess:
+                    with patch.dict('%s._services' % pbm, {}, clear=True):
+                        cls = AwsLimitChecker(account_id='123',
+                                              account_role='myrole',
+                                              profile_name='myprof',
+                                              region='myregion',
+                                              credentials=creds)
+                        res = cls._boto_conn_kwargs
+        assert mock_get_sts.mock_calls == []
+        assert mock_sess.mock_calls == []
+        assert mock_logger.mock_calls == [
+            call.debug("Using shared credentials (region: %s)", 'myregion'),
+            call.debug("Using shared credentials (region: %s)", 'myregion')
+        ]
+        assert res == {
+            'region_name': 'myregion',
+            'aws_access_key_id': 'ak',
+            'aws_secret_access_key': 'sk',
+            'aws_session_token': 'tkn',
+            'account_id': '123'
+        }
+        assert cls.get_credentials() == dict(creds, account_id='123')
+
+    def test_get_credentials(self):
+        mock_creds = Mock()
+        type(mock_creds).access_key = 'sts_ak'
+        type(mock_creds).secret_key = 'sts_sk'
+        type(mock_creds).session_token = 'sts_token'
+
+        with patch('%s._get_sts_token' % pb) as mock_get_sts:
+            mock_get_sts.return_value = mock_creds
+            with patch.dict('%s._services' % pbm, {}, clear=True):
+                cls = AwsLimitChecker(account_id='123',
+                                      account_role='myrole',
+                                      region='myregion',
+                                      mfa_token='123456')
+                res = cls.get_credentials()
+        assert mock_get_sts.mock_calls == [call()]
+        assert res == {
+            'aws_access_key_id': 'sts_ak',
+            'aws_secret_access_key': 'sts_sk',
+            'aws_session_token': 'sts_token',
+            'account_id': '123'
+        }
+        # returns a copy
+        res['foo'] = 'bar'
+        assert 'foo' not in cls.get_credentials()
+
+    def test_get_credentials_refreshable(self):
+        with patch('%s._get_refreshable_session' % pb) as mock_grs:
+            with patch.dict('%s._services' % pbm, {}, clear=True):
+                cls = AwsLimitChecker(account_id='123',
+                                      account_role='myrole',
+                                      region='myregion')
+                res = cls.get_credentials()
+        assert mock_grs.mock_calls == [call()]
+        assert res == {
+            'boto3_session': mock_grs.return_value, 'account_id': '123'
+        }
+
+    def test_get_refreshable_session(self):
+        with patch('%s.RefreshableRoleCredentials' % pbm) as mock_rrc:
+            self.cls.account_id = '123456789012'
+            self.cls.account_role = 'myrole'
+            self.cls.role_partition = 'mypart'
+            self.cls.external_id = 'myextid'
+            self.cls.region = 'myregion'
+            res = self.cls._get_refreshable_session()
+        assert mock_rrc.mock_calls == [
+            call(
+                'arn:mypart:iam::123456789012:role/myrole',
+                region_name='myregion',
+                external_id='myextid'
+            )
+        ]
+        assert res is mock_rrc.return_value.session
+
+    def test_get_credentials_default_chain(self):
+        assert self.cls.get_credentials() == {}
+
+    def test_set_current_account_id(self):
+        svc1 = Mock(_current_account_id=None)
+        svc2 = Mock(_current_account_id=None)
+        self.cls.services = {'SvcFoo': svc1, 'SvcBar': svc2}
+        self.cls.ta = Mock()
+        self.cls.set_current_account_id('123456789012')
+        assert svc1._current_account_id == '123456789012'
+        assert svc2._current_account_id == '123456789012'
+        assert self.cls.ta._account_id == '123456789012'
+
+    def test_add_shared_service(self):
+        mock_svc = Mock(spec_set=_AwsService)
+        type(mock_svc).service_name = 'SvcFoo'
+        self.cls.add_shared_service(mock_svc)
+        assert self.cls.services['SvcFoo'] is mock_svc
+        assert self.cls.services['SvcBar'] is self.mock_svc2
+        assert self.mock_index.return_value.mock_calls[-1] == \
+            call.add_service(mock_svc)
+        assert mock_svc.mock_calls == []
+
     def test_get_version(self):
         with patch('%s._get_version_info' % pbm,
                    spec_set=_get_version_info) as mock_version:
@@ -551,15 +819,22 @@ class TestAwsLimitChecker(object):
         }
 
     def test_remove_services_one(self):
+        self.mock_index.reset_mock()
         self.cls.remove_services(['SvcFoo'])
         assert self.cls.services == {
             'SvcBar': self.mock_svc2
         }
+        assert self.mock_index.mock_calls == [
+            call().remove_service('SvcFoo')
+        ]
 
     def test_remove_services_all(self):
         self.cls.remove_services(['SvcFoo', 'SvcBar'])
         assert self.cls.services == {}
 
+    def test_get_limit_index(self):
+        assert self.cls.get_limit_index() is self.mock_index.return_value
+
     def test_get_service_names(self):
         res = self.cls.get_service_names()
         assert res == ['SvcBar', 'SvcFoo']
@@ -574,10 +849,12 @@ class TestAwsLimitChecker(object):
             call.update_limits()
         ]
         assert self.mock_svc1.mock_calls == [
+            call._reset_api_cache(),
             call._update_service_quotas(),
             call.get_limits()
         ]
         assert self.mock_svc2.mock_calls == [
+            call._reset_api_cache(),
             call._update_limits_from_api(),
             call._update_service_quotas(),
             call.get_limits()
@@ -591,15 +868,27 @@ class TestAwsLimitChecker(object):
         assert res == limits
         assert self.mock_ta.mock_calls == []
         assert self.mock_svc1.mock_calls == [
+            call._reset_api_cache(),
             call._update_service_quotas(),
             call.get_limits()
         ]
         assert self.mock_svc2.mock_calls == [
+            call._reset_api_cache(),
             call._update_limits_from_api(),
             call._update_service_quotas(),
             call.get_limits()
         ]
 
+    def test_get_limits_no_api(self):
+        limits = sample_limits()
+        self.mock_svc1.get_limits.return_value = limits['SvcFoo']
+        self.mock_svc2.get_limits.return_value = limits['SvcBar']
+        res = self.cls.get_limits(use_ta=False, use_api=False)
+        assert res == limits
+        assert self.mock_ta.mock_calls == []
+        assert self.mock_svc1.mock_calls == [call.get_limits()]
+        assert self.mock_svc2.mock_calls == [call.get_limits()]
+
     def test_get_limits_service(self):
         limits = sample_limits()
         self.mock_svc1.get_limits.return_value = limits['SvcFoo']
@@ -610,6 +899,7 @@ class TestAwsLimitChecker(object):
             call.update_limits()
         ]
         assert self.mock_svc1.mock_calls == [
+            call._reset_api_cache(),
             call._update_service_quotas(),
             call.get_limits()
         ]
@@ -626,6 +916,7 @@ class TestAwsLimitChecker(object):
         ]
         assert self.mock_svc1.mock_calls == []
         assert self.mock_svc2.mock_calls == [
+            call._reset_api_cache(),
             call._update_limits_from_api(),
             call._update_service_quotas(),
             call.get_limits()
@@ -634,25 +925,52 @@ class TestAwsLimitChecker(object):
     def test_find_usage(self):
         self.cls.find_usage()
         assert self.mock_svc1.mock_calls == [
+            call._reset_api_cache(),
             call._update_service_quotas(),
             call.find_usage()
         ]
         assert self.mock_svc2.mock_calls == [
+            call._reset_api_cache(),
             call._update_limits_from_api(),
             call._update_service_quotas(),
             call.find_usage()
         ]
         assert self.mock_ta.mock_calls == [
+            call.start_update_limits(),
             call.update_limits()
         ]
 
+    def test_find_usage_ta_overlaps(self):
+        mgr = Mock()
+        mgr.attach_mock(self.mock_ta, 'ta')
+        mgr.attach_mock(self.mock_svc1, 'svc1')
+        mgr.attach_mock(self.mock_svc2, 'svc2')
+        self.cls.find_usage(service=['SvcFoo'])
+        assert mgr.mock_calls == [
+            call.ta.start_update_limits(),
+            call.svc1._reset_api_cache(),
+            call.svc1._update_service_quotas(),
+            call.svc1.find_usage(),
+            call.ta.update_limits()
+        ]
+
+    def test_find_usage_logs_latest_version(self):
+        mock_check = Mock(spec_set=_LatestVersionCheck)
+        mock_check.result.return_value = (True, None)
+        self.cls._version_check = mock_check
+        self.cls.find_usage()
+        assert mock_check.mock_calls == [call.result()]
+        assert self.cls._version_check is None
+
     def test_find_usage_no_ta(self):
         self.cls.find_usage(use_ta=False)
         assert self.mock_svc1.mock_calls == [
+            call._reset_api_cache(),
             call._update_service_quotas(),
             call.find_usage()
         ]
         assert self.mock_svc2.mock_calls == [
+            call._reset_api_cache(),
             call._update_limits_from_api(),
             call._update_service_quotas(),
             call.find_usage()
@@ -662,11 +980,13 @@ class TestAwsLimitChecker(object):
     def test_find_usage_service(self):
         self.cls.find_usage(service=['SvcFoo'])
         assert self.mock_svc1.mock_calls == [
+            call._reset_api_cache(),
             call._update_service_quotas(),
             call.find_usage()
         ]
         assert self.mock_svc2.mock_calls == []
         assert self.mock_ta.mock_calls == [
+            call.start_update_limits(),
             call.update_limits()
         ]
 
@@ -674,11 +994,13 @@ class TestAwsLimitChecker(object):
         self.cls.find_usage(service=['SvcBar'])
         assert self.mock_svc1.mock_calls == []
         assert self.mock_svc2.mock_calls == [
+            call._reset_api_cache(),
             call._update_limits_from_api(),
             call._update_service_quotas(),
             call.find_usage()
         ]
         assert self.mock_ta.mock_calls == [
+            call.start_update_limits(),
             call.update_limits()
         ]
 
@@ -839,6 +1161,16 @@ class TestAwsLimitChecker(object):
             )
         ]
 
+    def test_set_usage_retention(self):
+        self.cls.set_usage_retention('SvcFoo', 'foo limit3', 25)
+        assert self.mock_svc1.mock_calls == [
+            call.set_usage_retention('foo limit3', 25)
+        ]
+
+    def test_get_ta_refresh_latency(self):
+        self.cls.ta = Mock(refresh_latency=12.5)
+        assert self.cls.get_ta_refresh_latency() == 12.5
+
     def test_get_required_iam_policy(self):
         expected = {
             'Version': '2012-10-17',
@@ -847,10 +1179,12 @@ class TestAwsLimitChecker(object):
                 'Resource': '*',
                 'Action': [
                     'cloudwatch:GetMetricData',
+                    'ec2:DescribeRegions',
                     'ec2:bar',
                     'ec2:foo',
                     'foo:perm1',
                     'foo:perm2',
+                    'servicequotas:GetServiceQuota',
                     'servicequotas:ListServiceQuotas',
                     'sts:GetCallerIdentity',
                     'support:DescribeTrustedAdvisorCheckRefreshStatuses',
@@ -877,6 +1211,15 @@ class TestAwsLimitChecker(object):
         assert self.mock_svc1.mock_calls == [call.required_iam_permissions()]
         assert self.mock_svc2.mock_calls == [call.required_iam_permissions()]
 
+    def test_check_thresholds_logs_latest_version(self):
+        self.mock_svc1.check_thresholds.return_value = {}
+        self.mock_svc2.check_thresholds.return_value = {}
+        mock_check = Mock(spec_set=_LatestVersionCheck)
+        mock_check.result.return_value = (False, None)
+        self.cls._version_check = mock_check
+        self.cls.check_thresholds()
+        assert mock_check.mock_calls == [call.result()]
+
     def test_check_thresholds(self):
         self.mock_svc1.check_thresholds.return_value = {
             'foo': 'bar',
@@ -891,18 +1234,75 @@ class TestAwsLimitChecker(object):
             }
         }
         assert self.mock_ta.mock_calls == [
-            call.update_limits(),
+            call.start_update_limits(),
+            call.update_limits()
         ]
         assert self.mock_svc1.mock_calls == [
+            call._reset_api_cache(),
             call._update_service_quotas(),
             call.check_thresholds()
         ]
         assert self.mock_svc2.mock_calls == [
+            call._reset_api_cache(),
             call._update_limits_from_api(),
             call._update_service_quotas(),
             call.check_thresholds()
         ]
 
+    def test_check_thresholds_ta_overlaps(self):
+        self.mock_svc1._have_usage = False
+        self.mock_svc1.check_thresholds.return_value = {}
+        mgr = Mock()
+        mgr.attach_mock(self.mock_ta, 'ta')
+        mgr.attach_mock(self.mock_svc1, 'svc1')
+        self.cls.check_thresholds(service=['SvcFoo'])
+        # usage is collected while the poll runs, and thresholds are checked
+        # only after its limits are applied
+        assert mgr.mock_calls == [
+            call.ta.start_update_limits(),
+            call.svc1._reset_api_cache(),
+            call.svc1._update_service_quotas(),
+            call.svc1.find_usage(),
+            call.ta.update_limits(),
+            call.svc1.check_thresholds()
+        ]
+
+    def test_check_thresholds_ta_run_deadline(self):
+        self.cls.run_timeout = 100
+        with patch.object(self.cls, '_collect') as mock_collect:
+            mock_collect.return_value = {}
+            self.cls.check_thresholds()
+        assert 99 < mock_collect.mock_calls[0][2]['deadline'] - time.time() \
+            <= 100
+        # the TA refresh wait and join are both bounded by the run deadline
+        assert [x[0] for x in self.mock_ta.mock_calls] == [
+            'start_update_limits', 'update_limits'
+        ]
+        for c in self.mock_ta.mock_calls:
+            assert 99 < c[2]['timeout'] <= 100
+
+    def test_find_usage_ta_deadline_passed(self):
+        self.cls.run_timeout = 100
+        with patch('%s.time' % pbm, autospec=True) as mock_time:
+            # the run deadline has passed by the time TA is waited for
+            mock_time.time.return_value = 1000
+            with patch.object(self.cls, '_collect') as mock_collect:
+
+                def se_collect(*args, **kwargs):
+                    mock_time.time.return_value = 1200
+                    return {}
+
+                mock_collect.side_effect = se_collect
+                self.cls.find_usage(service=['SvcFoo'])
+        assert mock_collect.mock_calls == [
+            call({'SvcFoo': self.mock_svc1}, self.cls._find_service_usage,
+                 refresh=True, deadline=1100)
+        ]
+        assert self.mock_ta.mock_calls == [
+            call.start_update_limits(timeout=100),
+            call.update_limits(timeout=0)
+        ]
+
     def test_check_thresholds_service(self):
         self.mock_svc1.check_thresholds.return_value = {'foo': 'bar'}
         self.mock_svc2.check_thresholds.return_value = {'baz': 'blam'}
@@ -913,9 +1313,11 @@ class TestAwsLimitChecker(object):
             }
         }
         assert self.mock_ta.mock_calls == [
+            call.start_update_limits(),
             call.update_limits()
         ]
         assert self.mock_svc1.mock_calls == [
+            call._reset_api_cache(),
             call._update_service_quotas(),
             call.check_thresholds()
         ]
@@ -931,10 +1333,12 @@ class TestAwsLimitChecker(object):
             }
         }
         assert self.mock_ta.mock_calls == [
+            call.start_update_limits(),
             call.update_limits()
         ]
         assert self.mock_svc1.mock_calls == []
         assert self.mock_svc2.mock_calls == [
+            call._reset_api_cache(),
             call._update_limits_from_api(),
             call._update_service_quotas(),
             call.check_thresholds()
@@ -956,24 +1360,302 @@ class TestAwsLimitChecker(object):
         }
         assert self.mock_ta.mock_calls == []
         assert self.mock_svc1.mock_calls == [
+            call._reset_api_cache(),
             call._update_service_quotas(),
             call.check_thresholds()
         ]
         assert self.mock_svc2.mock_calls == [
+            call._reset_api_cache(),
             call._update_limits_from_api(),
             call._update_service_quotas(),
             call.check_thresholds()
         ]
 
+    def test_find_usage_records_durations(self):
+        with patch('%s.time' % pbm, autospec=True) as mock_time:
+            mock_time.time.side_effect = [0, 2, 2, 7]
+            self.cls.find_usage(use_ta=False)
+        assert self.cls.get_service_durations() == {
+            'SvcBar': 2, 'SvcFoo': 5
+        }
+        assert self.mock_hist.mock_calls == [
+            call.get(),
+            call.update({'SvcBar': 2, 'SvcFoo': 5})
+        ]
+
+    def test_check_thresholds_records_collecting_durations(self):
+        svc1 = Mock(_have_usage=True, _api_cache_hits=0)
+        svc1.check_thresholds.return_value = {}
+        svc2 = Mock(_have_usage=False, _api_cache_hits=0)
+        svc2.check_thresholds.return_value = {}
+        self.cls.services = {'SvcFoo': svc1, 'SvcBar': svc2}
+        with patch('%s.time' % pbm, autospec=True) as mock_time:
+            mock_time.time.side_effect = [0, 4, 4]
+            self.cls.check_thresholds(use_ta=False)
+        # SvcFoo already had usage, so its time is not recorded
+        assert self.cls.get_service_durations() == {'SvcBar': 4}
+        assert self.mock_hist.update.mock_calls == [call({'SvcBar': 4})]
+
+    def test_get_service_order(self):
+        self.mock_hist.get.return_value = {'SvcFoo': 3.0, 'SvcBar': 1.0}
+        assert self.cls.get_service_order() == ['SvcFoo', 'SvcBar']
+        assert self.cls.get_service_order(service=['SvcBar']) == ['SvcBar']
+
+    def test_get_service_order_unknown_and_ties(self):
+        self.mock_hist.get.return_value = {'A': 1.0, 'C': 5.0, 'D': 1.0}
+        # B is expected to take the mean (7 / 3) of the recorded durations
+        assert self.cls.get_service_order(
+            service=['A', 'B', 'C', 'D']
+        ) == ['C', 'B', 'A', 'D']
+
+    def test_get_service_order_no_history(self):
+        assert self.cls.get_service_order() == ['SvcBar', 'SvcFoo']
+        self.cls._duration_history = None
+        self.cls._service_durations = {'SvcFoo': 2.0, 'SvcBar': 1.0}
+        assert self.cls.get_service_order() == ['SvcFoo', 'SvcBar']
+
+    def test_check_thresholds_columnar(self):
+        lim1 = Mock()
+        lim2 = Mock()
+        lim3 = Mock()
+        svc1 = Mock(_have_usage=True, _api_cache_hits=2)
+        svc1.limits = {'lim1': lim1, 'lim2': lim2}
+        svc2 = Mock(_have_usage=False, _api_cache_hits=0)
+        svc2.limits = {'lim3': lim3}
+        self.cls.services = {'SvcFoo': svc1, 'SvcBar': svc2}
+        self.cls.columnar_thresholds = True
+        self.mock_hist.get.return_value = {'SvcFoo': 2.0, 'SvcBar': 1.0}
+        with patch('%s.ColumnarThresholds' % pbm, autospec=True) as m_ct:
+            with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+                m_ct.return_value.evaluate.return_value = [True, False, False]
+                res = self.cls.check_thresholds()
+        assert res == {
+            'SvcFoo': {'lim2': lim2},
+            'SvcBar': {'lim3': lim3}
+        }
+        assert m_ct.mock_calls == [
+            call([lim1, lim2, lim3]),
+            call().evaluate()
+        ]
+        assert self.mock_ta.mock_calls == [
+            call.start_update_limits(),
+            call.update_limits()
+        ]
+        assert svc1.mock_calls == [
+            call._reset_api_cache(),
+            call._update_limits_from_api(),
+            call._update_service_quotas()
+        ]
+        assert svc2.mock_calls == [
+            call._reset_api_cache(),
+            call._update_limits_from_api(),
+            call._update_service_quotas(),
+            call.find_usage()
+        ]
+        assert mock_logger.mock_calls == [
+            call.debug('Memoized API responses saved %d API call(s)', 2)
+        ]
+
     def test_region_name(self):
         mock_client = Mock(
             _client_config=Mock(region_name='rname')
         )
+        self.cls._resolved_credentials = {'foo': 'bar'}
+        self.cls.region = 'myregion'
         with patch(
             '%s._boto_conn_kwargs' % pb, new_callable=PropertyMock
         ) as mock_bck:
-            mock_bck.return_value = {'foo': 'bar'}
-            with patch('%s.boto3.client' % pbm) as m_client:
+            with patch('%s.boto3_client' % pbm) as m_client:
                 m_client.return_value = mock_client
                 res = self.cls.region_name
         assert res == 'rname'
+        assert mock_bck.mock_calls == []
+        assert m_client.mock_calls == [
+            call('ec2', foo='bar', region_name='myregion')
+        ]
+
+
+class BlockingService(object):
+    """
+    Minimal service whose usage collection can be made to hang until
+    ``release`` is set, for testing run and service time limits.
+    """
+
+    def __init__(self, name, block=False, exc=None):
+        self.service_name = name
+        self.release = threading.Event()
+        self.block = block
+        self.exc = exc
+        self.limits = {'L1': AwsLimit('L1', self, 10, 80, 99)}
+        self._api_cache_hits = 0
+        self._have_usage = False
+        self.calls = 0
+
+    def _reset_api_cache(self):
+        pass
+
+    def _update_service_quotas(self):
+        pass
+
+    def find_usage(self):
+        self.calls += 1
+        if self.block:
+            self.release.wait(5)
+        if self.exc is not None:
+            raise self.exc
+        self.limits['L1']._add_current_usage(9)
+        self._have_usage = True
+
+    def check_thresholds(self):
+        if not self._have_usage:
+            self.find_usage()
+        return dict(
+            (k, v) for k, v in self.limits.items()
+            if v.check_thresholds() is False
+        )
+
+
+class TestTimeLimits(object):
+
+    def setup(self):
+        self.fast = BlockingService('Fast')
+        self.slow = BlockingService('Slow', block=True)
+        self.later = BlockingService('Later')
+        with patch.multiple(
+                'awslimitchecker.checker',
+                logger=DEFAULT,
+                _get_version_info=DEFAULT,
+                TrustedAdvisor=DEFAULT,
+                LimitIndex=DEFAULT,
+                _LatestVersionCheck=DEFAULT,
+                ServiceQuotasClient=DEFAULT,
+                _DurationHistory=DEFAULT,
+                autospec=True,
+        ) as mocks:
+            with patch.dict('%s._services' % pbm, {}, clear=True):
+                self.cls = AwsLimitChecker(
+                    check_version=False, duration_history=True
+                )
+        # services are collected longest expected duration first
+        mocks['_DurationHistory'].return_value.get.return_value = {
+            'Fast': 3.0, 'Slow': 2.0, 'Later': 1.0
+        }
+        self.cls.services = {
+            'Fast': self.fast, 'Slow': self.slow, 'Later': self.later
+        }
+
+    def teardown(self):
+        self.slow.release.set()
+
+    def test_no_limits(self):
+        self.cls.services = {'Fast': self.fast}
+        with patch('%s._call_with_timeout' % pb) as mock_cwt:
+            self.cls.find_usage(use_ta=False)
+        assert mock_cwt.mock_calls == []
+        assert self.cls.get_unknown_services() == {}
+        assert self.fast.limits['L1'].get_current_usage()[0].get_value() == 9
+
+    def test_service_timeout(self):
+        self.cls.service_timeout = 0.2
+        with patch('%s.logger' % pbm) as mock_logger:
+            res = self.cls.check_thresholds(use_ta=False)
+        reason = 'did not finish within its 0.2 second budget'
+        assert self.cls.get_unknown_services() == {'Slow': reason}
+        assert self.slow.limits['L1'].unknown_reason == reason
+        assert self.fast.limits['L1'].unknown_reason is None
+        # services after the one that overran are still checked
+        assert sorted(res.keys()) == ['Fast', 'Later']
+        assert call.warning(
+            'Abandoning usage collection for %s: %s', 'Slow', reason
+        ) in mock_logger.mock_calls
+
+    def test_service_timeout_dict(self):
+        self.cls.service_timeout = {'Slow': 0.1}
+        with patch(
+            '%s._call_with_timeout' % pb, wraps=self.cls._call_with_timeout
+        ) as mock_cwt:
+            self.cls.find_usage(use_ta=False)
+        assert [x[1][0] for x in mock_cwt.mock_calls] == ['Slow']
+        assert self.cls.get_unknown_services() == {
+            'Slow': 'did not finish within its 0.1 second budget'
+        }
+
+    def test_run_timeout(self):
+        self.cls.run_timeout = 0.2
+        self.cls.find_usage(use_ta=False)
+        assert self.cls.get_unknown_services() == {
+            'Slow': 'did not finish before the 0.2 second run deadline',
+            'Later': 'not started before the 0.2 second run deadline'
+        }
+        assert self.later.limits['L1'].get_current_usage() == []
+        assert self.fast.limits['L1'].unknown_reason is None
+
+    def test_run_timeout_and_service_timeout(self):
+        self.cls.run_timeout = 100
+        self.cls.service_timeout = 0.1
+        self.cls.find_usage(use_ta=False)
+        assert self.cls.get_unknown_services() == {
+            'Slow': 'did not finish within its 0.1 second budget'
+        }
+
+    def test_durations_include_abandoned(self):
+        self.cls.service_timeout = {'Slow': 0.2}
+        self.cls.find_usage(use_ta=False)
+        durations = self.cls.get_service_durations()
+        assert sorted(durations.keys()) == ['Fast', 'Later', 'Slow']
+        assert durations['Slow'] >= 0.2
+
+    def test_unknown_cleared(self):
+        self.cls.service_timeout = 0.1
+        self.cls.find_usage(use_ta=False)
+        assert self.slow.limits['L1'].unknown_reason is not None
+        self.slow.release.set()
+        self.cls._abandoned['Slow'].join(5)
+        self.cls.find_usage(use_ta=False)
+        assert self.cls.get_unknown_services() == {}
+        assert self.slow.limits['L1'].unknown_reason is None
+        # only the second run's usage; the abandoned run's was ignored
+        assert len(self.slow.limits['L1'].get_current_usage()) == 1
+        assert 'Slow' not in self.cls._abandoned
+
+    def test_abandoned_usage_ignored(self):
+        self.cls.service_timeout = 0.1
+        self.cls.find_usage(use_ta=False)
+        thread = self.cls._abandoned['Slow']
+        self.slow.release.set()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert self.slow._have_usage is True
+        assert self.slow.limits['L1'].get_current_usage() == []
+        assert self.fast.limits['L1'].get_current_usage()[0].get_value() == 9
+
+    def test_abandoned_still_running(self):
+        self.cls.service_timeout = 0.1
+        self.cls.find_usage(use_ta=False)
+        with patch('%s.logger' % pbm) as mock_logger:
+            self.cls.find_usage(use_ta=False)
+        reason = 'abandoned usage collection from an earlier run is still ' \
+                 'running'
+        assert self.cls.get_unknown_services() == {'Slow': reason}
+        assert self.slow.limits['L1'].unknown_reason == reason
+        assert self.slow.calls == 1
+        assert self.fast.calls == 2
+        assert call.warning(
+            'Skipping usage collection for %s: %s', 'Slow', reason
+        ) in mock_logger.mock_calls
+
+    def test_exception_reraised(self):
+        self.cls.services = {'Bad': BlockingService(
+            'Bad', exc=RuntimeError('foo')
+        )}
+        self.cls.service_timeout = 5
+        with pytest.raises(RuntimeError) as excinfo:
+            self.cls.find_usage(use_ta=False)
+        assert str(excinfo.value) == 'foo'
+
+    def test_columnar(self):
+        self.cls.columnar_thresholds = True
+        self.cls.service_timeout = 0.1
+        res = self.cls.check_thresholds(use_ta=False)
+        assert sorted(res.keys()) == ['Fast', 'Later']
+        assert list(self.cls.get_unknown_services().keys()) == ['Slow']
@@ -37,8 +37,12 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 ################################################################################
 """
 
-from awslimitchecker.connectable import Connectable, ConnectableCredentials
-from datetime import datetime
+from awslimitchecker.connectable import (
+    Connectable, ConnectableCredentials, RefreshableRoleCredentials,
+    boto3_client, boto3_resource
+)
+from datetime import datetime, timedelta
+from pytz import utc
 import sys
 import os
 
@@ -142,7 +146,8 @@ class Test_Connectable(object):
                    new_callable=PropertyMock, create=True) as mock_kwargs:
             mock_kwargs.return_value = kwargs
             with patch('%s.logger' % pbm) as mock_logger:
-                with patch('%s.boto3.client' % pbm) as mock_client:
+                with patch('%s.boto3.client' % pbm) as mock_client, \
+                        patch('%s.rate_limiter' % pbm) as mock_rl:
                     with patch('%s.Config' % pbm) as m_conf:
                         with patch(
                             '%s._max_retries_config' % pb, new_callable=PropertyMock    # noqa - ignore line length
@@ -166,6 +171,9 @@ class Test_Connectable(object):
         ]
         assert m_mrc.mock_calls == [call(), call()]
         assert cls.conn == mock_client.return_value
+        assert mock_rl.mock_calls == [
+            call.register(mock_conn, 'myapi', account_id=None)
+        ]
 
     def test_connect_with_retries(self):
         mock_conn = Mock()
@@ -185,7 +193,8 @@ class Test_Connectable(object):
                    new_callable=PropertyMock, create=True) as mock_kwargs:
             mock_kwargs.return_value = kwargs
             with patch('%s.logger' % pbm) as mock_logger:
-                with patch('%s.boto3.client' % pbm) as mock_client:
+                with patch('%s.boto3.client' % pbm) as mock_client, \
+                        patch('%s.rate_limiter' % pbm) as mock_rl:
                     with patch('%s.Config' % pbm) as m_conf:
                         with patch(
                             '%s._max_retries_config' % pb, new_callable=PropertyMock    # noqa - ignore line length
@@ -210,6 +219,9 @@ class Test_Connectable(object):
         ]
         assert m_mrc.mock_calls == [call(), call()]
         assert cls.conn == mock_client.return_value
+        assert mock_rl.mock_calls == [
+            call.register(mock_conn, 'myapi', account_id=None)
+        ]
 
     def test_connect_again(self):
         mock_conn = Mock()
@@ -370,6 +382,63 @@ class Test_Connectable(object):
         assert cls.resource_conn == mock_conn
 
 
+class TestRegionName(object):
+
+    def test_from_kwargs(self):
+        cls = ConnectableTester()
+        cls._boto3_connection_kwargs = {'region_name': 'us-west-2'}
+        with patch('%s.boto3.session.Session' % pbm) as m_sess:
+            assert cls._region_name == 'us-west-2'
+        assert m_sess.mock_calls == []
+
+    def test_default(self):
+        cls = ConnectableTester()
+        cls._boto3_connection_kwargs = {'region_name': None}
+        with patch('%s.boto3' % pbm) as m_boto3:
+            m_boto3.session.Session.return_value.region_name = 'eu-west-1'
+            assert cls._region_name == 'eu-west-1'
+        assert m_boto3.mock_calls == [call.session.Session()]
+
+
+class TestMemoizedCall(object):
+
+    def test_memoizes_by_operation_and_params(self):
+        cls = ConnectableTester()
+        cls.api_name = 'myapi'
+        cls.conn = Mock()
+        cls.conn.get_foo.side_effect = [{'a': 1}, {'a': 2}, {'a': 3}]
+        assert cls._memoized_call('get_foo', X=1, Y='b') == {'a': 1}
+        assert cls._memoized_call('get_foo', Y='b', X=1) == {'a': 1}
+        assert cls._memoized_call('get_foo', X=2) == {'a': 2}
+        assert cls._memoized_call('get_foo') == {'a': 3}
+        assert cls._memoized_call('get_foo') == {'a': 3}
+        assert cls.conn.mock_calls == [
+            call.get_foo(X=1, Y='b'),
+            call.get_foo(X=2),
+            call.get_foo()
+        ]
+        assert cls._api_cache_hits == 2
+
+    def test_reset(self):
+        cls = ConnectableTester()
+        cls.api_name = 'myapi'
+        cls.conn = Mock()
+        cls.conn.get_foo.side_effect = [{'a': 1}, {'a': 2}]
+        assert cls._reset_api_cache() == 0
+        assert cls._memoized_call('get_foo') == {'a': 1}
+        assert cls._memoized_call('get_foo') == {'a': 1}
+        with patch('%s.logger' % pbm) as mock_logger:
+            assert cls._reset_api_cache() == 1
+        assert mock_logger.mock_calls == [
+            call.debug(
+                'Memoized API responses saved %d call(s) to %s', 1, 'myapi'
+            )
+        ]
+        assert cls._api_cache_hits == 0
+        assert cls._memoized_call('get_foo') == {'a': 2}
+        assert len(cls.conn.mock_calls) == 2
+
+
 class TestConnectableCredentials(object):
 
     def test_connectable_credentials(self):
@@ -393,3 +462,137 @@ class TestConnectableCredentials(object):
         assert c.expiration == datetime(2015, 1, 1)
         assert c.assumed_role_id == 'roleid'
         assert c.assumed_role_arn == 'arn'
+
+
+def _assume_role_result(akid, expiration):
+    return {
+        'Credentials': {
+            'AccessKeyId': akid,
+            'SecretAccessKey': 'secret-%s' % akid,
+            'SessionToken': 'token-%s' % akid,
+            'Expiration': expiration
+        },
+        'AssumedRoleUser': {
+            'AssumedRoleId': 'roleid',
+            'Arn': 'arn'
+        }
+    }
+
+
+class TestBoto3Client(object):
+
+    def test_default_session(self):
+        with patch('%s.boto3' % pbm) as mock_boto3:
+            with patch('%s.rate_limiter' % pbm) as mock_rl:
+                res = boto3_client('ec2', region_name='r1', foo='bar')
+        assert res is mock_boto3.client.return_value
+        assert mock_boto3.mock_calls == [
+            call.client('ec2', region_name='r1', foo='bar')
+        ]
+        assert mock_rl.mock_calls == [
+            call.register(res, 'ec2', account_id=None)
+        ]
+
+    def test_session(self):
+        mock_sess = Mock()
+        kwargs = {
+            'region_name': 'r1', 'boto3_session': mock_sess,
+            'account_id': '123'
+        }
+        with patch('%s.boto3' % pbm) as mock_boto3:
+            with patch('%s.rate_limiter' % pbm) as mock_rl:
+                res = boto3_client('ec2', **kwargs)
+        assert res is mock_sess.client.return_value
+        assert mock_boto3.mock_calls == []
+        assert mock_sess.mock_calls == [call.client('ec2', region_name='r1')]
+        assert mock_rl.mock_calls == [
+            call.register(res, 'ec2', account_id='123')
+        ]
+        # the caller's kwargs are not modified
+        assert kwargs == {
+            'region_name': 'r1', 'boto3_session': mock_sess,
+            'account_id': '123'
+        }
+
+    def test_resource_default_session(self):
+        with patch('%s.boto3' % pbm) as mock_boto3:
+            with patch('%s.rate_limiter' % pbm) as mock_rl:
+                res = boto3_resource('ec2', region_name='r1', account_id='1')
+        assert res is mock_boto3.resource.return_value
+        assert mock_boto3.mock_calls == [
+            call.resource('ec2', region_name='r1')
+        ]
+        assert mock_rl.mock_calls == [
+            call.register(res.meta.client, 'ec2', account_id='1')
+        ]
+
+    def test_resource_session(self):
+        mock_sess = Mock()
+        with patch('%s.boto3' % pbm) as mock_boto3:
+            with patch('%s.rate_limiter' % pbm) as mock_rl:
+                res = boto3_resource(
+                    'ec2', region_name='r1', boto3_session=mock_sess
+                )
+        assert res is mock_sess.resource.return_value
+        assert mock_boto3.mock_calls == []
+        assert mock_sess.mock_calls == [
+            call.resource('ec2', region_name='r1')
+        ]
+        assert mock_rl.mock_calls == [
+            call.register(res.meta.client, 'ec2', account_id=None)
+        ]
+
+
+class TestRefreshableRoleCredentials(object):
+
+    def test_init(self):
+        expiration = datetime.now(utc) + timedelta(hours=1)
+        with patch('%s.boto3.client' % pbm) as mock_client:
+            mock_client.return_value.assume_role.return_value = \
+                _assume_role_result('ak1', expiration)
+            cls = RefreshableRoleCredentials(
+                'arn:aws:iam::123:role/foo', region_name='r1',
+                external_id='myextid'
+            )
+            frozen = cls.credentials.get_frozen_credentials()
+        assert mock_client.mock_calls == [
+            call('sts', region_name='r1'),
+            call().assume_role(
+                RoleArn='arn:aws:iam::123:role/foo',
+                RoleSessionName='awslimitchecker',
+                ExternalId='myextid'
+            )
+        ]
+        assert frozen.access_key == 'ak1'
+        assert frozen.secret_key == 'secret-ak1'
+        assert frozen.token == 'token-ak1'
+        assert cls.session.get_credentials() is cls.credentials
+
+    def test_refresh_before_expiration(self):
+        with patch('%s.boto3.client' % pbm) as mock_client:
+            mock_client.return_value.assume_role.side_effect = [
+                # inside botocore's mandatory refresh window
+                _assume_role_result(
+                    'ak1', datetime.now(utc) + timedelta(minutes=5)
+                ),
+                _assume_role_result(
+                    'ak2', datetime.now(utc) + timedelta(hours=1)
+                )
+            ]
+            cls = RefreshableRoleCredentials('arn:aws:iam::123:role/foo')
+            frozen = cls.credentials.get_frozen_credentials()
+            again = cls.credentials.get_frozen_credentials()
+        assert mock_client.mock_calls == [
+            call('sts', region_name=None),
+            call().assume_role(
+                RoleArn='arn:aws:iam::123:role/foo',
+                RoleSessionName='awslimitchecker'
+            ),
+            call().assume_role(
+                RoleArn='arn:aws:iam::123:role/foo',
+                RoleSessionName='awslimitchecker'
+            )
+        ]
+        assert frozen.access_key == 'ak2'
+        assert frozen.token == 'token-ak2'
+        assert again.access_key == 'ak2'
@@ -41,7 +41,8 @@ import pytest
 import sys
 from awslimitchecker.limit import (
     AwsLimit, AwsLimitUsage, SOURCE_DEFAULT, SOURCE_OVERRIDE,
-    SOURCE_TA, SOURCE_API, SOURCE_QUOTAS
+    SOURCE_TA, SOURCE_API, SOURCE_QUOTAS, ThresholdResult, CompactUsageStore,
+    TopUsageStore, UsageStats, _collection_run
 )
 from awslimitchecker.services.base import _AwsService
 
@@ -271,6 +272,24 @@ class TestAddCurrentUsage(AwsLimitTester):
         assert len(limit.get_current_usage()) == 2
         assert limit._current_usage[1].get_value() == 4
 
+    def test_stale_run(self):
+        limit = AwsLimit('limitname', self.mock_svc, 3, 1, 2)
+        limit._add_current_usage(1)
+        limit._run_token = 2
+        try:
+            _collection_run.token = 1
+            assert limit._is_stale() is True
+            limit._add_current_usage(2)
+            limit._reset_usage()
+            assert [u.get_value() for u in limit.get_current_usage()] == [1]
+            _collection_run.token = 2
+            assert limit._is_stale() is False
+            limit._add_current_usage(3)
+        finally:
+            del _collection_run.token
+        assert limit._is_stale() is False
+        assert [u.get_value() for u in limit.get_current_usage()] == [1, 3]
+
 
 class TestGetCurrentUsage(AwsLimitTester):
 
@@ -502,6 +521,43 @@ class TestGetLimitSource(AwsLimitTester):
         assert limit.get_limit_source() == SOURCE_OVERRIDE
 
 
+class TestEffectiveLimitCache(AwsLimitTester):
+
+    def test_cached(self):
+        limit = AwsLimit('limitname', self.mock_svc, 3, 1, 2)
+        with patch.object(
+            AwsLimit, '_resolve_limit', autospec=True
+        ) as mock_resolve:
+            mock_resolve.return_value = (SOURCE_API, 7)
+            assert limit.get_limit() == 7
+            assert limit.get_limit_source() == SOURCE_API
+            assert limit.get_limit() == 7
+        assert mock_resolve.mock_calls == [call(limit)]
+
+    def test_invalidated_by_setters(self):
+        limit = AwsLimit('limitname', self.mock_svc, 3, 1, 2)
+        assert limit.get_limit() == 3
+        assert limit.get_limit_source() == SOURCE_DEFAULT
+        limit._set_ta_limit(40)
+        assert limit.get_limit() == 40
+        assert limit.get_limit_source() == SOURCE_TA
+        limit._set_ta_unlimited()
+        assert limit.get_limit() is None
+        assert limit.get_limit_source() == SOURCE_TA
+        limit._set_quotas_limit(50)
+        assert limit.get_limit() == 50
+        assert limit.get_limit_source() == SOURCE_QUOTAS
+        limit._set_api_limit(60)
+        assert limit.get_limit() == 60
+        assert limit.get_limit_source() == SOURCE_API
+        limit.set_limit_override(70, override_ta=False)
+        assert limit.get_limit() == 60
+        assert limit.get_limit_source() == SOURCE_API
+        limit.set_limit_override(70)
+        assert limit.get_limit() == 70
+        assert limit.get_limit_source() == SOURCE_OVERRIDE
+
+
 class TestCheckThresholds(AwsLimitTester):
 
     def test_pct(self):
@@ -518,10 +574,10 @@ class TestCheckThresholds(AwsLimitTester):
                 mock_get_limit.return_value = 100
                 res = limit.check_thresholds()
         assert res is True
-        assert limit._warnings == []
-        assert limit._criticals == []
+        assert limit.get_warnings() == []
+        assert limit.get_criticals() == []
         assert mock_get_thresh.mock_calls == [call()]
-        assert mock_get_limit.mock_calls == [call(), call(), call()]
+        assert mock_get_limit.mock_calls == [call()]
 
     def test_ta_unlimited(self):
         limit = AwsLimit('limitname', self.mock_svc, 3, 1, 2)
@@ -538,10 +594,10 @@ class TestCheckThresholds(AwsLimitTester):
                 mock_get_limit.return_value = None
                 res = limit.check_thresholds()
         assert res is True
-        assert limit._warnings == []
-        assert limit._criticals == []
+        assert limit.get_warnings() == []
+        assert limit.get_criticals() == []
         assert mock_get_thresh.mock_calls == [call()]
-        assert mock_get_limit.mock_calls == [call(), call(), call()]
+        assert mock_get_limit.mock_calls == [call()]
 
     def test_ta_zero(self):
         limit = AwsLimit('limitname', self.mock_svc, 3, 1, 2)
@@ -558,10 +614,10 @@ class TestCheckThresholds(AwsLimitTester):
                 mock_get_limit.return_value = 0
                 res = limit.check_thresholds()
         assert res is True
-        assert limit._warnings == []
-        assert limit._criticals == []
+        assert limit.get_warnings() == []
+        assert limit.get_criticals() == []
         assert mock_get_thresh.mock_calls == [call()]
-        assert mock_get_limit.mock_calls == [call(), call(), call()]
+        assert mock_get_limit.mock_calls == [call()]
 
     def test_pct_warn(self):
         limit = AwsLimit('limitname', self.mock_svc, 100, 1, 2)
@@ -577,10 +633,10 @@ class TestCheckThresholds(AwsLimitTester):
                 mock_get_limit.return_value = 100
                 res = limit.check_thresholds()
         assert res is False
-        assert limit._warnings == [u2]
-        assert limit._criticals == []
+        assert limit.get_warnings() == [u2]
+        assert limit.get_criticals() == []
         assert mock_get_thresh.mock_calls == [call()]
-        assert mock_get_limit.mock_calls == [call(), call(), call()]
+        assert mock_get_limit.mock_calls == [call()]
 
     def test_int_warn(self):
         limit = AwsLimit('limitname', self.mock_svc, 100, 1, 2)
@@ -596,10 +652,10 @@ class TestCheckThresholds(AwsLimitTester):
                 mock_get_limit.return_value = 100
                 res = limit.check_thresholds()
         assert res is False
-        assert limit._warnings == [u1]
-        assert limit._criticals == []
+        assert limit.get_warnings() == [u1]
+        assert limit.get_criticals() == []
         assert mock_get_thresh.mock_calls == [call()]
-        assert mock_get_limit.mock_calls == [call(), call(), call()]
+        assert mock_get_limit.mock_calls == [call()]
 
     def test_int_warn_crit(self):
         limit = AwsLimit(
@@ -627,8 +683,8 @@ class TestCheckThresholds(AwsLimitTester):
         limit._current_usage = [u1, u2, u3]
         res = limit.check_thresholds()
         assert res is False
-        assert limit._warnings == [u1]
-        assert limit._criticals == [u3]
+        assert limit.get_warnings() == [u1]
+        assert limit.get_criticals() == [u3]
 
     def test_pct_crit(self):
         limit = AwsLimit('limitname', self.mock_svc, 100, 1, 2)
@@ -644,10 +700,10 @@ class TestCheckThresholds(AwsLimitTester):
                 mock_get_limit.return_value = 100
                 res = limit.check_thresholds()
         assert res is False
-        assert limit._warnings == []
-        assert limit._criticals == [u3]
+        assert limit.get_warnings() == []
+        assert limit.get_criticals() == [u3]
         assert mock_get_thresh.mock_calls == [call()]
-        assert mock_get_limit.mock_calls == [call(), call(), call()]
+        assert mock_get_limit.mock_calls == [call()]
 
     def test_int_crit(self):
         limit = AwsLimit(
@@ -675,8 +731,8 @@ class TestCheckThresholds(AwsLimitTester):
         limit._current_usage = [u1, u2, u3]
         res = limit.check_thresholds()
         assert res is False
-        assert limit._warnings == []
-        assert limit._criticals == [u1, u3]
+        assert limit.get_warnings() == []
+        assert limit.get_criticals() == [u1, u3]
 
     def test_pct_warn_crit(self):
         limit = AwsLimit('limitname', self.mock_svc, 100, 1, 2)
@@ -692,28 +748,81 @@ class TestCheckThresholds(AwsLimitTester):
                 mock_get_limit.return_value = 100
                 res = limit.check_thresholds()
         assert res is False
-        assert limit._warnings == [u1]
-        assert limit._criticals == [u3]
+        assert limit.get_warnings() == [u1]
+        assert limit.get_criticals() == [u3]
         assert mock_get_thresh.mock_calls == [call()]
-        assert mock_get_limit.mock_calls == [call(), call(), call()]
+        assert mock_get_limit.mock_calls == [call()]
+
+
+class TestThresholdResults(AwsLimitTester):
+
+    def test_repeated(self):
+        limit = AwsLimit('limitname', self.mock_svc, 10, 40, 60)
+        limit._add_current_usage(4, resource_id='foo4bar')
+        limit._add_current_usage(1, resource_id='foo1bar')
+        limit._add_current_usage(7, resource_id='foo7bar')
+        u1, u2, u3 = limit.get_current_usage()
+        assert limit.get_threshold_result() is None
+        assert limit.check_thresholds() is False
+        first = limit.get_threshold_result()
+        assert first == ThresholdResult(False, (u1,), (u3,))
+        assert limit.check_thresholds() is False
+        second = limit.get_threshold_result()
+        assert second == first
+        assert second is not first
+        assert limit.get_warnings() == [u1]
+        assert limit.get_criticals() == [u3]
+
+    def test_ok(self):
+        limit = AwsLimit('limitname', self.mock_svc, 10, 40, 60)
+        limit._add_current_usage(1)
+        assert limit.check_thresholds() is True
+        assert limit.get_threshold_result() == ThresholdResult(True, (), ())
+
+    def test_reset_usage(self):
+        limit = AwsLimit('limitname', self.mock_svc, 10, 40, 60)
+        limit._add_current_usage(9)
+        limit.check_thresholds()
+        assert len(limit.get_criticals()) == 1
+        limit._reset_usage()
+        assert limit.get_current_usage() == []
+        assert limit.get_threshold_result() is None
+        assert limit.get_warnings() == []
+        assert limit.get_criticals() == []
+
+    def test_result_immutable(self):
+        res = ThresholdResult(True, (), ())
+        with pytest.raises(AttributeError):
+            res.ok = False
+        with pytest.raises(AttributeError):
+            res.foo = 'bar'
 
 
 class TestGetWarnings(AwsLimitTester):
 
     def test_simple(self):
         limit = AwsLimit('limitname', self.mock_svc, 100, 1, 2)
-        m = Mock()
-        limit._warnings = m
-        assert limit.get_warnings() == m
+        m1 = Mock()
+        m2 = Mock()
+        limit._threshold_result = ThresholdResult(False, (m1, m2), ())
+        assert limit.get_warnings() == [m1, m2]
+
+    def test_none(self):
+        limit = AwsLimit('limitname', self.mock_svc, 100, 1, 2)
+        assert limit.get_warnings() == []
 
 
 class TestGetCriticals(AwsLimitTester):
 
     def test_simple(self):
         limit = AwsLimit('limitname', self.mock_svc, 100, 1, 2)
-        m = Mock()
-        limit._criticals = m
-        assert limit.get_criticals() == m
+        m1 = Mock()
+        limit._threshold_result = ThresholdResult(False, (), (m1,))
+        assert limit.get_criticals() == [m1]
+
+    def test_none(self):
+        limit = AwsLimit('limitname', self.mock_svc, 100, 1, 2)
+        assert limit.get_criticals() == []
 
 
 class TestGetThresholds(AwsLimitTester):
@@ -757,6 +866,18 @@ class TestSetThresholdOverride(AwsLimitTester):
         assert limit.crit_count == 4
 
 
+class TestSetUnknown(AwsLimitTester):
+
+    def test_set_unknown(self):
+        limit = AwsLimit('limitname', self.mock_svc, 100, 1, 2)
+        assert limit.unknown_reason is None
+        limit._add_current_usage(5)
+        limit.check_thresholds()
+        limit._set_unknown('timed out')
+        assert limit.unknown_reason == 'timed out'
+        assert limit.get_threshold_result() is None
+
+
 class TestTaServiceName(AwsLimitTester):
 
     def test_default(self):
@@ -809,6 +930,19 @@ class TestQuotaName(AwsLimitTester):
         assert limit.quota_name == 'qn'
 
 
+class TestQuotasCode(AwsLimitTester):
+
+    def test_default(self):
+        limit = AwsLimit('limitname', self.mock_svc, 3, 1, 2)
+        assert limit.quotas_code is None
+
+    def test_set(self):
+        limit = AwsLimit(
+            'limitname', self.mock_svc, 3, 1, 2, quotas_code='L-1234ABCD'
+        )
+        assert limit.quotas_code == 'L-1234ABCD'
+
+
 class TestQuotasUnit(AwsLimitTester):
 
     def test_default(self):
@@ -886,3 +1020,296 @@ class TestAwsLimitUsage(object):
         assert u1 < u3
         assert u1 > u2
         assert u1 >= u2
+
+    def test_slots(self):
+        mock_limit = Mock(spec_set=AwsLimit)
+        u = AwsLimitUsage(mock_limit, 3)
+        assert not hasattr(u, '__dict__')
+        with pytest.raises(AttributeError):
+            u.foo = 'bar'
+
+    def test_aws_type_interned(self):
+        mock_limit = Mock(spec_set=AwsLimit)
+        type_name = ''.join(['AWS::EC2::', 'SecurityGroup'])
+        u = AwsLimitUsage(mock_limit, 3, aws_type=type_name)
+        assert u.aws_type is sys.intern('AWS::EC2::SecurityGroup')
+
+
+class TestSlots(AwsLimitTester):
+
+    def test_limit(self):
+        limit = AwsLimit('limitname', self.mock_svc, 3, 1, 2)
+        assert not hasattr(limit, '__dict__')
+        with pytest.raises(AttributeError):
+            limit.foo = 'bar'
+
+
+class TestCompactUsage(AwsLimitTester):
+
+    def setup(self):
+        super(TestCompactUsage, self).setup()
+        self.limit = AwsLimit(
+            'limitname', self.mock_svc, 10, 40, 60, compact_usage=True
+        )
+
+    def test_init(self):
+        assert self.limit.compact_usage is True
+        assert isinstance(self.limit._current_usage, CompactUsageStore)
+        assert len(self.limit._current_usage) == 0
+        plain = AwsLimit('limitname', self.mock_svc, 10, 40, 60)
+        assert plain.compact_usage is False
+        assert plain._current_usage == []
+
+    def test_add_and_get(self):
+        self.limit._add_current_usage(
+            4, resource_id='foo4bar', aws_type='AWS::EC2::VPC'
+        )
+        self.limit._add_current_usage(2.5, maximum=5)
+        self.limit._add_current_usage(7, maximum=9.5, resource_id='foo7bar')
+        res = self.limit.get_current_usage()
+        assert isinstance(res, list)
+        assert [type(u.value) for u in res] == [int, float, int]
+        assert [u.value for u in res] == [4, 2.5, 7]
+        assert [type(u.maximum) for u in res] == [type(None), int, float]
+        assert [u.maximum for u in res] == [None, 5, 9.5]
+        assert [u.resource_id for u in res] == ['foo4bar', None, 'foo7bar']
+        assert [u.aws_type for u in res] == ['AWS::EC2::VPC', None, None]
+        assert all(u.limit is self.limit for u in res)
+        assert self.limit.has_resource_limits() is True
+        assert self.limit.get_current_usage_str() == \
+            'max: foo7bar=7 (2.5, foo4bar=4, foo7bar=7)'
+
+    def test_no_resource_limits(self):
+        self.limit._add_current_usage(4)
+        assert self.limit.has_resource_limits() is False
+
+    def test_reset(self):
+        self.limit._add_current_usage(9)
+        self.limit.check_thresholds()
+        self.limit._reset_usage()
+        assert isinstance(self.limit._current_usage, CompactUsageStore)
+        assert self.limit.get_current_usage() == []
+        assert self.limit.get_threshold_result() is None
+
+    def test_check_thresholds(self):
+        self.limit._add_current_usage(4, resource_id='foo4bar')
+        self.limit._add_current_usage(1, resource_id='foo1bar')
+        self.limit._add_current_usage(7, resource_id='foo7bar')
+        self.limit._add_current_usage(7, maximum=100, resource_id='bar')
+        assert self.limit.check_thresholds() is False
+        warns = self.limit.get_warnings()
+        crits = self.limit.get_criticals()
+        assert [str(u) for u in warns] == ['foo4bar=4']
+        assert [str(u) for u in crits] == ['foo7bar=7']
+
+
+class TestCompactUsageStore(AwsLimitTester):
+
+    def setup(self):
+        super(TestCompactUsageStore, self).setup()
+        self.limit = Mock(spec_set=AwsLimit)
+        self.cls = CompactUsageStore(self.limit)
+        self.cls.append(1, resource_id='a', aws_type='AWS::EC2::Instance')
+        self.cls.append(2.5, maximum=10, resource_id='b')
+        self.cls.append(3, maximum=0.5, resource_id='c')
+
+    def test_values(self):
+        assert len(self.cls) == 3
+        assert self.cls.get_values() == [1, 2.5, 3]
+        assert [type(x) for x in self.cls.get_values()] == [int, float, int]
+        assert self.cls.get_maxima() == [None, 10, 0.5]
+        assert [type(x) for x in self.cls.get_maxima()] == [
+            type(None), int, float
+        ]
+
+    def test_getitem(self):
+        u = self.cls[1]
+        assert isinstance(u, AwsLimitUsage)
+        assert u.limit == self.limit
+        assert u.value == 2.5
+        assert u.maximum == 10
+        assert u.resource_id == 'b'
+        assert u.aws_type is None
+        assert self.cls[-1].resource_id == 'c'
+        assert self.cls[0].aws_type == 'AWS::EC2::Instance'
+        assert [x.resource_id for x in self.cls[1:]] == ['b', 'c']
+        with pytest.raises(IndexError):
+            self.cls[3]
+
+    def test_iter(self):
+        assert [str(x) for x in self.cls] == ['a=1', 'b=2.5', 'c=3']
+
+    def test_aws_type_interned(self):
+        type_name = ''.join(['AWS::EC2::', 'Instance'])
+        self.cls.append(4, aws_type=type_name)
+        assert self.cls._aws_types[-1] is sys.intern('AWS::EC2::Instance')
+
+
+class TestRetainTop(AwsLimitTester):
+
+    def setup(self):
+        super(TestRetainTop, self).setup()
+        self.limit = AwsLimit(
+            'limitname', self.mock_svc, 10, 40, 60, retain_top=3
+        )
+
+    def test_init(self):
+        assert self.limit.retain_top == 3
+        assert isinstance(self.limit._current_usage, TopUsageStore)
+        assert self.limit._current_usage.size == 3
+        plain = AwsLimit('limitname', self.mock_svc, 10, 40, 60)
+        assert plain.retain_top is None
+        both = AwsLimit(
+            'limitname', self.mock_svc, 10, 40, 60, compact_usage=True,
+            retain_top=2
+        )
+        assert isinstance(both._current_usage, TopUsageStore)
+
+    def test_init_invalid(self):
+        with pytest.raises(ValueError) as excinfo:
+            AwsLimit('limitname', self.mock_svc, 10, 40, 60, retain_top=0)
+        assert excinfo.value.args[0] == 'retain_top must be at least 1'
+
+    def test_add_and_get(self):
+        for i in [2, 9, 1, 5, 3, 7]:
+            self.limit._add_current_usage(i, resource_id='r%d' % i)
+        res = self.limit.get_current_usage()
+        assert isinstance(res, list)
+        assert [str(u) for u in res] == ['r9=9', 'r5=5', 'r7=7']
+        assert self.limit.get_current_usage_str() == \
+            'max: r9=9 (r5=5, r7=7, r9=9 and 3 more)'
+        assert self.limit.has_resource_limits() is False
+        stats = self.limit.get_usage_stats()
+        assert stats.count == 6
+        assert stats.total == 27
+        assert stats.maximum == 9
+
+    def test_usage_str_not_dropped(self):
+        self.limit._add_current_usage(4, resource_id='foo')
+        assert self.limit.get_current_usage_str() == 'foo=4'
+        self.limit._add_current_usage(2, resource_id='bar')
+        assert self.limit.get_current_usage_str() == \
+            'max: foo=4 (bar=2, foo=4)'
+
+    def test_check_thresholds(self):
+        full = AwsLimit('limitname', self.mock_svc, 10, 40, 60)
+        for i in [5, 4, 1, 3, 7, 2, 8]:
+            self.limit._add_current_usage(i, resource_id='r%d' % i)
+            full._add_current_usage(i, resource_id='r%d' % i)
+        assert self.limit.check_thresholds() is False
+        assert full.check_thresholds() is False
+        assert [str(u) for u in self.limit.get_warnings()] == ['r5=5']
+        assert [str(u) for u in self.limit.get_criticals()] == [
+            'r7=7', 'r8=8'
+        ]
+        # the full list also reports r4, which was dropped
+        assert [str(u) for u in full.get_warnings()] == ['r5=5', 'r4=4']
+
+    def test_check_thresholds_ok(self):
+        for i in range(10):
+            self.limit._add_current_usage(
+                i, maximum=100, resource_id='r%d' % i
+            )
+        assert self.limit.has_resource_limits() is True
+        assert self.limit.check_thresholds() is True
+
+    def test_set_usage_retention(self):
+        self.limit._add_current_usage(4)
+        self.limit.set_usage_retention(None)
+        assert self.limit.retain_top is None
+        assert self.limit._current_usage == []
+        self.limit.set_usage_retention(5)
+        assert self.limit._current_usage.size == 5
+        with pytest.raises(ValueError):
+            self.limit.set_usage_retention(-1)
+        assert self.limit.retain_top == 5
+
+    def test_get_usage_stats_plain(self):
+        limit = AwsLimit('limitname', self.mock_svc, 10, 40, 60)
+        limit._add_current_usage(3)
+        limit._add_current_usage(5)
+        stats = limit.get_usage_stats()
+        assert stats.count == 2
+        assert stats.total == 8
+        assert stats.maximum == 5
+        assert stats.buckets == {4: 1, 8: 1}
+
+    def test_get_usage_stats_compact(self):
+        limit = AwsLimit(
+            'limitname', self.mock_svc, 10, 40, 60, compact_usage=True
+        )
+        limit._add_current_usage(3)
+        limit._add_current_usage(0.5)
+        stats = limit.get_usage_stats()
+        assert stats.count == 2
+        assert stats.total == 3.5
+        assert stats.buckets == {1: 1, 4: 1}
+
+
+class TestTopUsageStore(AwsLimitTester):
+
+    def setup(self):
+        super(TestTopUsageStore, self).setup()
+        self.limit = Mock(spec_set=AwsLimit)
+        self.cls = TopUsageStore(self.limit, 2)
+
+    def test_shared_heap(self):
+        for i, v in enumerate([3, 1, 5, 2, 4, 4]):
+            self.cls.append(v, resource_id='r%d' % i)
+        assert len(self.cls) == 2
+        # ties keep the earlier usage
+        assert [str(u) for u in self.cls] == ['r2=5', 'r4=4']
+        assert self.cls.get_values() == [5, 4]
+        assert self.cls.get_maxima() == [None, None]
+        assert self.cls[0].limit == self.limit
+        assert self.cls.stats.count == 6
+        assert self.cls.stats.maximum == 5
+
+    def test_own_heap(self):
+        self.cls.append(5, maximum=100, resource_id='a')
+        self.cls.append(3, maximum=4, resource_id='b')
+        self.cls.append(1, resource_id='c')
+        self.cls.append(9, maximum=10, resource_id='d')
+        self.cls.append(0, resource_id='e')
+        self.cls.append(2, maximum=0, resource_id='f')
+        assert len(self.cls) == 4
+        assert [str(u) for u in self.cls] == ['b=3', 'c=1', 'd=9', 'f=2']
+        assert self.cls.get_maxima() == [4, None, 10, 0]
+
+    def test_aws_type_interned(self):
+        type_name = ''.join(['AWS::EC2::', 'Instance'])
+        self.cls.append(4, aws_type=type_name)
+        assert self.cls[0].aws_type is sys.intern('AWS::EC2::Instance')
+
+    def test_own_heap_keeps_max_value(self):
+        self.cls.append(10, maximum=1000, resource_id='big')
+        self.cls.append(3, maximum=4, resource_id='b')
+        self.cls.append(9, maximum=10, resource_id='d')
+        assert [str(u) for u in self.cls] == ['big=10', 'b=3', 'd=9']
+        self.cls.append(20, maximum=10000, resource_id='bigger')
+        assert [str(u) for u in self.cls] == ['b=3', 'd=9', 'bigger=20']
+        self.cls.append(1, maximum=1, resource_id='full')
+        assert [str(u) for u in self.cls] == ['d=9', 'bigger=20', 'full=1']
+        assert len(self.cls) == 3
+
+
+class TestUsageStats(object):
+
+    def test_empty(self):
+        cls = UsageStats()
+        assert cls.count == 0
+        assert cls.total == 0
+        assert cls.maximum is None
+        assert cls.buckets == {}
+        assert cls.mean is None
+        assert repr(cls) == 'UsageStats(count=0, total=0, maximum=None)'
+
+    def test_add(self):
+        cls = UsageStats()
+        for v in [0, 1, 2, 3, 4, 4.5, 1000, -1]:
+            cls.add(v)
+        assert cls.count == 8
+        assert cls.total == 1013.5
+        assert cls.maximum == 1000
+        assert cls.mean == 1013.5 / 8
+        assert cls.buckets == {0: 2, 1: 1, 2: 1, 4: 2, 8: 1, 1024: 1}
@@ -0,0 +1,137 @@
+"""
+awslimitchecker/tests/test_limitindex.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import sys
+from awslimitchecker.limit import AwsLimit
+from awslimitchecker.limitindex import LimitIndex
+from awslimitchecker.services.base import _AwsService
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import Mock
+else:
+    from unittest.mock import Mock
+
+
+class TestLimitIndex(object):
+
+    def setup(self):
+        self.svc_a = Mock(spec_set=_AwsService)
+        type(self.svc_a).service_name = 'SvcA'
+        type(self.svc_a).quotas_service_code = 'qa'
+        self.a1 = AwsLimit(
+            'Limit One', self.svc_a, 5, 80, 99,
+            limit_type='AWS::A::Thing', quotas_name='Things Per Region'
+        )
+        self.a2 = AwsLimit(
+            'Limit Two', self.svc_a, 5, 80, 99, limit_type='AWS::A::Other',
+            ta_service_name='OtherTA', ta_limit_name='Two'
+        )
+        self.svc_a.get_limits.return_value = {
+            'Limit One': self.a1, 'Limit Two': self.a2
+        }
+        self.svc_b = Mock(spec_set=_AwsService)
+        type(self.svc_b).service_name = 'SvcB'
+        type(self.svc_b).quotas_service_code = 'qb'
+        self.b1 = AwsLimit(
+            'Limit One', self.svc_b, 5, 80, 99, limit_type='AWS::A::Thing'
+        )
+        self.svc_b.get_limits.return_value = {'Limit One': self.b1}
+        self.cls = LimitIndex({'SvcB': self.svc_b, 'SvcA': self.svc_a})
+
+    def test_init_empty(self):
+        cls = LimitIndex()
+        assert len(cls) == 0
+        assert cls.get_service_names() == []
+        assert list(cls.iter_limits()) == []
+
+    def test_get_limit(self):
+        assert len(self.cls) == 3
+        assert self.cls.get_service_names() == ['SvcA', 'SvcB']
+        assert self.cls.get_limit('SvcA', 'Limit One') is self.a1
+        assert self.cls.get_limit('SvcB', 'Limit One') is self.b1
+        assert self.cls.get_limit('SvcB', 'Limit Two') is None
+        assert self.cls.get_limit('SvcC', 'Limit One') is None
+        assert self.cls.get_service_limits('SvcA') == {
+            'Limit One': self.a1, 'Limit Two': self.a2
+        }
+        assert self.cls.get_service_limits('SvcC') == {}
+
+    def test_by_ta(self):
+        assert self.cls.get_ta_service_limits('SvcA') == {
+            'Limit One': self.a1
+        }
+        assert self.cls.get_ta_service_limits('OtherTA') == {'Two': self.a2}
+        assert self.cls.get_ta_service_limits('SvcB') == {
+            'Limit One': self.b1
+        }
+        assert self.cls.get_ta_service_limits('Foo') is None
+
+    def test_iter_limits(self):
+        assert list(self.cls.iter_limits()) == [
+            ('SvcA', 'Limit One', self.a1),
+            ('SvcA', 'Limit Two', self.a2),
+            ('SvcB', 'Limit One', self.b1),
+        ]
+        assert list(self.cls.iter_limits(['SvcB'])) == [
+            ('SvcB', 'Limit One', self.b1),
+        ]
+
+    def test_remove_service(self):
+        self.cls.remove_service('SvcA')
+        self.cls.remove_service('SvcC')
+        assert len(self.cls) == 1
+        assert self.cls.get_limit('SvcA', 'Limit One') is None
+        assert self.cls.get_ta_service_limits('OtherTA') is None
+        assert self.cls.get_ta_service_limits('SvcA') is None
+
+    def test_add_service_replaces(self):
+        new = AwsLimit('Limit Three', self.svc_a, 5, 80, 99)
+        self.svc_a.get_limits.return_value = {'Limit Three': new}
+        self.cls.add_service(self.svc_a)
+        assert self.cls.get_service_limits('SvcA') == {'Limit Three': new}
+        assert self.cls.get_ta_service_limits('SvcA') == {
+            'Limit Three': new
+        }
+        assert self.cls.get_ta_service_limits('OtherTA') is None
+        assert len(self.cls) == 2
@@ -0,0 +1,1483 @@
+"""
+awslimitchecker/tests/test_multiaccount.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import argparse
+import json
+import sys
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import pytest
+from pytz import utc
+
+from awslimitchecker.checker import AwsLimitChecker
+from awslimitchecker.limit import AwsLimit, AwsLimitUsage
+from awslimitchecker.multiaccount import (
+    DEFAULT_UNIT_COST, SHARD_FILE_VERSION, CredentialCache, JobResult,
+    LimitSummary, MultiAccountChecker, QueueWorker, _check_job,
+    _metrics_config, _parse_shard, _Report, _unit_costs, _usage_data,
+    console_entry_point, evaluate_limits, format_result,
+    load_accounts_config, load_history, load_shard_file, merge_results,
+    merge_shard_files, parse_args, parse_merge_args, parse_worker_args,
+    partition_units, queue_results, save_history, update_history,
+    write_shard_file
+)
+from awslimitchecker.workqueue import WorkQueue
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT
+
+pbm = 'awslimitchecker.multiaccount'
+pb = '%s.MultiAccountChecker' % pbm
+pqw = '%s.QueueWorker' % pbm
+
+
+def conf(**kwargs):
+    res = {
+        'name': 'acct', 'role_name': 'myrole', 'regions': ['r1'],
+        'limit_overrides': {}, 'threshold_overrides': {}
+    }
+    res.update(kwargs)
+    return res
+
+
+def job_result(**kwargs):
+    res = {
+        'account_id': '123', 'region': 'r1', 'duration': 1.5,
+        'error': None, 'limits': []
+    }
+    res.update(kwargs)
+    return res
+
+
+class TestLoadAccountsConfig(object):
+
+    def write(self, tmpdir, data):
+        p = tmpdir.join('accounts.json')
+        p.write(json.dumps(data))
+        return str(p)
+
+    def test_defaults(self, tmpdir):
+        path = self.write(tmpdir, {
+            'defaults': {'regions': ['r1', 'r2']},
+            'accounts': {
+                '123': {'name': 'prod', 'role_name': None},
+                '456': {'regions': ['r3'], 'limit_overrides': {'S': {}}},
+                '789': None
+            }
+        })
+        assert load_accounts_config(path) == {
+            '123': {
+                'name': 'prod', 'role_name': None, 'regions': ['r1', 'r2'],
+                'limit_overrides': {}, 'threshold_overrides': {}
+            },
+            '456': {
+                'name': '456', 'role_name': 'awslimitchecker',
+                'regions': ['r3'], 'limit_overrides': {'S': {}},
+                'threshold_overrides': {}
+            },
+            '789': {
+                'name': '789', 'role_name': 'awslimitchecker',
+                'regions': ['r1', 'r2'], 'limit_overrides': {},
+                'threshold_overrides': {}
+            }
+        }
+
+    def test_no_accounts(self, tmpdir):
+        path = self.write(tmpdir, {'defaults': {}})
+        with pytest.raises(ValueError) as excinfo:
+            load_accounts_config(path)
+        assert 'must contain an "accounts" object' in str(excinfo.value)
+
+    def test_bad_account_id(self, tmpdir):
+        path = self.write(tmpdir, {'accounts': {'prod': {'regions': ['r1']}}})
+        with pytest.raises(ValueError) as excinfo:
+            load_accounts_config(path)
+        assert str(excinfo.value) == 'Invalid account ID in accounts ' \
+                                     'config: prod'
+
+    def test_no_regions(self, tmpdir):
+        path = self.write(tmpdir, {'accounts': {'123': {}}})
+        with pytest.raises(ValueError) as excinfo:
+            load_accounts_config(path)
+        assert str(excinfo.value) == 'No regions configured for account 123'
+
+
+class TestCredentialCache(object):
+
+    def setup(self):
+        self.now = datetime(2019, 1, 1, 12, 0, 0, tzinfo=utc)
+        self.sts = Mock()
+        self.sts.assume_role.side_effect = self.se_assume
+        self.cls = CredentialCache(region_name='rx', external_id='eid')
+        self.cls._sts = self.sts
+        self.expiration = self.now + timedelta(hours=1)
+        self.count = 0
+
+    def se_assume(self, **kwargs):
+        self.count += 1
+        return {
+            'Credentials': {
+                'AccessKeyId': 'ak%d' % self.count,
+                'SecretAccessKey': 'sk',
+                'SessionToken': 'st',
+                'Expiration': self.expiration
+            },
+            'AssumedRoleUser': {'AssumedRoleId': 'rid', 'Arn': 'arn'}
+        }
+
+    def get(self, now, *args):
+        with patch('%s.datetime' % pbm) as mock_dt:
+            mock_dt.now.return_value = now
+            return self.cls.get(*args)
+
+    def test_connect(self):
+        cls = CredentialCache(region_name='rx')
+        with patch('%s.boto3.client' % pbm) as mock_client:
+            assert cls._connect() is mock_client.return_value
+            assert cls._connect() is mock_client.return_value
+        assert mock_client.mock_calls == [call('sts', region_name='rx')]
+
+    def test_get_cached(self):
+        c1 = self.get(self.now, '123', 'role1')
+        c2 = self.get(self.now + timedelta(minutes=40), '123', 'role1')
+        assert c1 is c2
+        assert c1.access_key == 'ak1'
+        assert c1.account_id == '123'
+        assert self.sts.mock_calls == [
+            call.assume_role(
+                RoleArn='arn:aws:iam::123:role/role1',
+                RoleSessionName='awslimitchecker', ExternalId='eid'
+            )
+        ]
+
+    def test_get_refresh(self):
+        c1 = self.get(self.now, '123', 'role1')
+        self.expiration = self.now + timedelta(hours=2)
+        c2 = self.get(self.now + timedelta(minutes=46), '123', 'role1')
+        assert c1.access_key == 'ak1'
+        assert c2.access_key == 'ak2'
+        assert self.get(self.now + timedelta(minutes=47), '123', 'role1') is c2
+
+    def test_get_separate_keys(self):
+        self.cls.external_id = None
+        self.cls.role_partition = 'aws-cn'
+        c1 = self.get(self.now, '123', 'role1')
+        c2 = self.get(self.now, '123', 'role2')
+        c3 = self.get(self.now, '456', 'role1')
+        assert [c1.access_key, c2.access_key, c3.access_key] == [
+            'ak1', 'ak2', 'ak3'
+        ]
+        assert self.sts.mock_calls[2] == call.assume_role(
+            RoleArn='arn:aws-cn:iam::456:role/role1',
+            RoleSessionName='awslimitchecker'
+        )
+
+
+class TestLimitSummary(object):
+
+    def test_snapshot_and_interface(self):
+        lim = Mock(spec_set=AwsLimit)
+        lim.get_limit.return_value = 10
+        u1 = AwsLimitUsage(lim, 3, resource_id='a')
+        u2 = AwsLimitUsage(lim, 9, resource_id='b')
+        lim.get_current_usage.return_value = [u1, u2]
+        lim.get_warnings.return_value = [u2]
+        lim.get_criticals.return_value = []
+        snap = LimitSummary.snapshot('S1', 'L1', lim)
+        assert snap == ('S1', 'L1', 10, 9, [(9, 'b')], [])
+        cls = LimitSummary(*snap)
+        assert cls.service.service_name == 'S1'
+        assert cls.name == 'L1'
+        assert cls.get_limit() == 10
+        assert [
+            (u.limit, u.get_value()) for u in cls.get_current_usage()
+        ] == [(cls, 9)]
+        assert [
+            (u.get_value(), u.resource_id) for u in cls.get_warnings()
+        ] == [(9, 'b')]
+        assert cls.get_criticals() == []
+
+    def test_no_usage(self):
+        lim = Mock(spec_set=AwsLimit)
+        lim.get_limit.return_value = None
+        lim.get_current_usage.return_value = []
+        lim.get_warnings.return_value = []
+        lim.get_criticals.return_value = []
+        snap = LimitSummary.snapshot('S1', 'L1', lim)
+        assert snap == ('S1', 'L1', None, None, [], [])
+        assert LimitSummary(*snap).get_current_usage() == []
+
+
+class TestCheckJob(object):
+
+    def setup(self):
+        self.job = {
+            'account_id': '123', 'region': 'r2', 'services': ['S1', 'S2'],
+            'credentials': {'aws_access_key_id': 'ak'},
+            'use_ta': False,
+            'limit_overrides': {'S1': {'L1': 5}},
+            'threshold_overrides': {},
+            'checker_kwargs': {'warning_threshold': 70}
+        }
+        self.checker = Mock(spec=AwsLimitChecker)
+        self.lim = Mock()
+        self.checker.get_limit_index.return_value.iter_limits.return_value = [
+            ('S1', 'L1', self.lim)
+        ]
+
+    def test_check_job(self):
+        with patch.multiple(
+            pbm, autospec=True, AwsLimitChecker=DEFAULT, LimitSummary=DEFAULT
+        ) as mocks:
+            mocks['AwsLimitChecker'].return_value = self.checker
+            mocks['LimitSummary'].snapshot.return_value = ('snap',)
+            with patch('%s.time.time' % pbm) as mock_time:
+                mock_time.side_effect = [10.0, 10.5, 11.5, 12.0, 14.0, 14.5]
+                res = _check_job(self.job)
+        assert res == {
+            'account_id': '123', 'region': 'r2', 'duration': 4.5,
+            'error': None, 'limits': [('snap',)],
+            'service_durations': {'S1': 1.0, 'S2': 2.0}
+        }
+        assert mocks['AwsLimitChecker'].mock_calls[:1] == [
+            call(
+                region='r2', account_id='123',
+                credentials={'aws_access_key_id': 'ak'}, check_version=False,
+                services=['S1', 'S2'], warning_threshold=70
+            )
+        ]
+        assert self.checker.mock_calls == [
+            call.set_current_account_id('123'),
+            call.set_limit_overrides({'S1': {'L1': 5}}),
+            call.check_thresholds(service=['S1'], use_ta=False),
+            call.check_thresholds(service=['S2'], use_ta=False),
+            call.get_limit_index(),
+            call.get_limit_index().iter_limits()
+        ]
+        assert mocks['LimitSummary'].mock_calls == [
+            call.snapshot('S1', 'L1', self.lim)
+        ]
+
+    def test_check_job_threshold_overrides(self):
+        self.job['services'] = ['S1']
+        self.job['limit_overrides'] = {}
+        self.job['threshold_overrides'] = {'S1': {'L1': {'warning': {}}}}
+        self.job['use_ta'] = True
+        with patch.multiple(
+            pbm, autospec=True, AwsLimitChecker=DEFAULT, LimitSummary=DEFAULT
+        ) as mocks:
+            mocks['AwsLimitChecker'].return_value = self.checker
+            mocks['LimitSummary'].snapshot.return_value = ('snap',)
+            _check_job(self.job)
+        assert self.checker.mock_calls[:3] == [
+            call.set_current_account_id('123'),
+            call.set_threshold_overrides({'S1': {'L1': {'warning': {}}}}),
+            call.check_thresholds(service=['S1'], use_ta=True)
+        ]
+
+    def test_check_job_error(self):
+        self.checker.check_thresholds.side_effect = [None, RuntimeError('foo')]
+        with patch('%s.AwsLimitChecker' % pbm, autospec=True) as mock_alc:
+            mock_alc.return_value = self.checker
+            with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+                res = _check_job(self.job)
+        assert res['error'] == 'RuntimeError: foo'
+        assert res['limits'] == []
+        assert list(res['service_durations'].keys()) == ['S1']
+        assert res['account_id'] == '123'
+        assert res['region'] == 'r2'
+        assert mock_logger.mock_calls == [
+            call.error('Error checking account %s region %s', '123', 'r2',
+                       exc_info=True)
+        ]
+
+
+class TestJobResult(object):
+
+    def test_init_and_problems(self):
+        res = JobResult(job_result(limits=[
+            ('S2', 'L1', 10, 9, [], [(9, 'x')]),
+            ('S1', 'L1', 10, 1, [], []),
+            ('S1', 'L2', 10, 8, [(8, None)], [])
+        ]), name='prod')
+        assert res.account_id == '123'
+        assert res.name == 'prod'
+        assert res.region == 'r1'
+        assert res.duration == 1.5
+        assert res.error is None
+        assert res.service_durations == {}
+        assert res.result['limits'][1] == ('S1', 'L1', 10, 1, [], [])
+        assert len(res.limits) == 3
+        problems = res.get_problems()
+        assert sorted(problems.keys()) == ['S1', 'S2']
+        assert list(problems['S1'].keys()) == ['L2']
+        assert problems['S1']['L2'] is res.limits[2]
+        assert problems['S2']['L1'] is res.limits[0]
+
+    def test_default_name(self):
+        assert JobResult(job_result()).name == '123'
+
+
+class FakeExecutor(object):
+    """run submitted functions synchronously, recording each batch"""
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self.submitted = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def submit(self, fn, *args):
+        f = Future()
+        f.set_result(fn(*args))
+        self.submitted.append(args)
+        return f
+
+
+class TestMultiAccountChecker(object):
+
+    def setup(self):
+        self.accounts = {
+            '222': conf(name='dev', regions=['r1', 'r2', 'r3']),
+            '111': conf(name='prod', regions=['r2', 'r1'], role_name=None)
+        }
+        self.cache = Mock(spec_set=CredentialCache)
+        self.cls = MultiAccountChecker(
+            self.accounts, max_workers=4, credential_cache=self.cache,
+            use_ta=False, checker_kwargs={'warning_threshold': 70}
+        )
+
+    def test_init_defaults(self):
+        with patch('%s.os.cpu_count' % pbm) as mock_count:
+            mock_count.return_value = 3
+            cls = MultiAccountChecker(self.accounts)
+        assert cls.max_workers == 12
+        assert cls.max_per_account == 2
+        assert isinstance(cls.credential_cache, CredentialCache)
+        assert cls.use_ta is True
+        assert cls.checker_kwargs == {}
+
+    def test_init_bad_max_per_account(self):
+        with pytest.raises(ValueError) as excinfo:
+            MultiAccountChecker(self.accounts, max_per_account=0)
+        assert str(excinfo.value) == 'max_per_account must be at least 1'
+
+    def test_get_jobs(self):
+        assert self.cls.get_jobs() == [
+            ('111', 'r2'), ('222', 'r1'), ('111', 'r1'), ('222', 'r2'),
+            ('222', 'r3')
+        ]
+
+    def test_get_jobs_filtered(self):
+        assert self.cls.get_jobs(['dev']) == [
+            ('222', 'r1'), ('222', 'r2'), ('222', 'r3')
+        ]
+        assert self.cls.get_jobs(['111']) == [('111', 'r2'), ('111', 'r1')]
+
+    def test_get_jobs_unknown(self):
+        with pytest.raises(ValueError) as excinfo:
+            self.cls.get_jobs(['foo'])
+        assert str(excinfo.value) == 'Unknown account ID or name: foo'
+
+    def test_credentials(self):
+        creds = Mock(access_key='ak', secret_key='sk', session_token='st')
+        self.cache.get.return_value = creds
+        assert self.cls._credentials('222') == {
+            'aws_access_key_id': 'ak',
+            'aws_secret_access_key': 'sk',
+            'aws_session_token': 'st'
+        }
+        assert self.cls._credentials('111') == {}
+        assert self.cache.mock_calls == [call.get('222', 'myrole')]
+
+    def test_prefetch_credentials(self):
+
+        def se_get(acct_id, role_name):
+            if acct_id == '333':
+                raise RuntimeError('denied')
+            return Mock(access_key='ak', secret_key='sk', session_token='st')
+
+        self.accounts['333'] = conf()
+        self.cache.get.side_effect = se_get
+        with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+            self.cls._prefetch_credentials(['111', '222', '333'])
+        assert sorted(self.cache.mock_calls) == [
+            call.get('222', 'myrole'), call.get('333', 'myrole')
+        ]
+        assert len(mock_logger.mock_calls) == 1
+        assert mock_logger.mock_calls[0][1][:2] == (
+            'Unable to assume role in account %s: %s', '333'
+        )
+
+    def test_get_work_units(self):
+        svcs = {
+            'S1': Mock(is_global=False),
+            'G1': Mock(is_global=True),
+            'S2': Mock(is_global=False)
+        }
+        with patch.dict('%s._services' % pbm, svcs, clear=True):
+            assert self.cls.get_work_units(['prod']) == [
+                ('111', 'r2', 'G1'), ('111', 'r2', 'S1'), ('111', 'r2', 'S2'),
+                ('111', 'r1', 'S1'), ('111', 'r1', 'S2')
+            ]
+            assert len(self.cls.get_work_units()) == 12
+
+    def test_job(self):
+        self.accounts['222']['limit_overrides'] = {
+            'S1': {'L1': 5}, 'S3': {'L1': 2}
+        }
+        self.accounts['222']['threshold_overrides'] = {'S3': {'L1': {}}}
+        with patch('%s._credentials' % pb, autospec=True) as mock_creds:
+            mock_creds.return_value = {'aws_access_key_id': 'ak'}
+            res = self.cls._job('222', 'r2', ['S1', 'S2'])
+        assert res == {
+            'account_id': '222', 'region': 'r2', 'services': ['S1', 'S2'],
+            'credentials': {'aws_access_key_id': 'ak'},
+            'use_ta': False,
+            'limit_overrides': {'S1': {'L1': 5}},
+            'threshold_overrides': {},
+            'checker_kwargs': {'warning_threshold': 70}
+        }
+
+    def run_iter(self, **kwargs):
+        self.executors = []
+        self.batches = []
+
+        def se_executor(max_workers=None):
+            self.executors.append(FakeExecutor(max_workers=max_workers))
+            return self.executors[-1]
+
+        def se_wait(futures, return_when=None):
+            self.batches.append(len(futures))
+            return set(futures), set()
+
+        def se_job(_, acct_id, region, services):
+            if acct_id == '222' and region == 'r3':
+                raise RuntimeError('denied')
+            return {
+                'account_id': acct_id, 'region': region, 'services': services
+            }
+
+        def se_check(job):
+            return job_result(account_id=job['account_id'],
+                              region=job['region'])
+
+        def se_units(_, account_ids=None):
+            return [
+                (a, r, s) for a, r in self.cls.get_jobs(account_ids)
+                for s in ['S2', 'S1']
+            ]
+
+        with patch.multiple(
+            pbm, ProcessPoolExecutor=DEFAULT, wait=DEFAULT,
+            _check_job=DEFAULT
+        ) as mocks:
+            mocks['ProcessPoolExecutor'].side_effect = se_executor
+            mocks['wait'].side_effect = se_wait
+            mocks['_check_job'].side_effect = se_check
+            with patch.multiple(
+                pb, autospec=True, _job=DEFAULT, get_work_units=DEFAULT,
+                _prefetch_credentials=DEFAULT
+            ) as cls_mocks:
+                cls_mocks['_job'].side_effect = se_job
+                cls_mocks['get_work_units'].side_effect = se_units
+                res = list(self.cls.iter_results(**kwargs))
+        return res, mocks, cls_mocks
+
+    def test_iter_results(self):
+        self.cls.max_per_account = 1
+        res, mocks, cls_mocks = self.run_iter()
+        assert [(r.account_id, r.name, r.region, r.error) for r in res] == [
+            ('111', 'prod', 'r2', None),
+            ('222', 'dev', 'r1', None),
+            ('111', 'prod', 'r1', None),
+            ('222', 'dev', 'r2', None),
+            ('222', 'dev', 'r3', 'RuntimeError: denied')
+        ]
+        assert cls_mocks['_prefetch_credentials'].mock_calls == [
+            call(self.cls, ['111', '222'])
+        ]
+        assert self.executors[0].max_workers == 4
+        assert [x[0] for x in self.executors[0].submitted] == [
+            {'account_id': '111', 'region': 'r2', 'services': ['S1', 'S2']},
+            {'account_id': '222', 'region': 'r1', 'services': ['S1', 'S2']},
+            {'account_id': '111', 'region': 'r1', 'services': ['S1', 'S2']},
+            {'account_id': '222', 'region': 'r2', 'services': ['S1', 'S2']}
+        ]
+        # one job per account at a time
+        assert self.batches == [2, 2]
+        assert mocks['wait'].mock_calls[0][2] == {
+            'return_when': 'FIRST_COMPLETED'
+        }
+
+    def test_iter_results_units(self):
+        res, mocks, cls_mocks = self.run_iter(units=[
+            ('222', 'r2', 'S3'), ('111', 'r1', 'S1'), ('222', 'r2', 'S1')
+        ])
+        assert [(r.account_id, r.region) for r in res] == [
+            ('111', 'r1'), ('222', 'r2')
+        ]
+        assert [x[0] for x in self.executors[0].submitted] == [
+            {'account_id': '111', 'region': 'r1', 'services': ['S1']},
+            {'account_id': '222', 'region': 'r2', 'services': ['S1', 'S3']}
+        ]
+        assert cls_mocks['get_work_units'].mock_calls == []
+        assert cls_mocks['_prefetch_credentials'].mock_calls == [
+            call(self.cls, ['111', '222'])
+        ]
+        assert self.batches == [2]
+
+
+class TestHistory(object):
+
+    def test_load_missing(self, tmpdir):
+        assert load_history(str(tmpdir.join('nope.json'))) == {}
+
+    def test_save_and_load(self, tmpdir):
+        path = str(tmpdir.join('history.json'))
+        save_history(path, {'1/r1/S1': 2.5})
+        assert load_history(path) == {'1/r1/S1': 2.5}
+        assert tmpdir.listdir() == [tmpdir.join('history.json')]
+
+    def test_load_invalid(self, tmpdir):
+        path = tmpdir.join('history.json')
+        path.write('[1, 2]')
+        with pytest.raises(ValueError) as excinfo:
+            load_history(str(path))
+        assert 'must be a JSON object' in str(excinfo.value)
+
+    def test_update_history(self):
+        history = {'1/r1/S1': 4.0, '1/r1/S3': 7.0}
+        results = [
+            JobResult(job_result(
+                account_id='1', service_durations={'S1': 2.0, 'S2': 1.23456}
+            )),
+            JobResult(job_result(
+                account_id='2', error='E: x', service_durations={'S1': 9.0}
+            ))
+        ]
+        assert update_history(history, results) == {
+            '1/r1/S1': 3.0, '1/r1/S2': 1.235, '1/r1/S3': 7.0
+        }
+        assert history == {'1/r1/S1': 4.0, '1/r1/S3': 7.0}
+
+
+class TestPartitionUnits(object):
+
+    def test_unit_costs(self):
+        units = [('1', 'r1', 'S1'), ('2', 'r1', 'S1'), ('2', 'r1', 'S2')]
+        history = {'1/r1/S1': 4.0, '3/r2/S1': 2.0}
+        assert _unit_costs(units, history) == {
+            ('1', 'r1', 'S1'): 4.0,
+            ('2', 'r1', 'S1'): 3.0,
+            ('2', 'r1', 'S2'): DEFAULT_UNIT_COST
+        }
+
+    def test_partition_balanced(self):
+        units = [('1', 'r1', 'S%d' % i) for i in range(6)]
+        history = dict(
+            ('1/r1/S%d' % i, c) for i, c in enumerate([8, 7, 6, 5, 4, 3])
+        )
+        res = partition_units(units, 2, history)
+        assert res == [
+            [('1', 'r1', 'S0'), ('1', 'r1', 'S3'), ('1', 'r1', 'S4')],
+            [('1', 'r1', 'S1'), ('1', 'r1', 'S2'), ('1', 'r1', 'S5')]
+        ]
+
+    def test_partition_deterministic(self):
+        units = [
+            (a, r, s) for a in ['1', '2', '3'] for r in ['r1', 'r2']
+            for s in ['S1', 'S2', 'S3']
+        ]
+        res = partition_units(units, 4)
+        assert res == partition_units(list(reversed(units)), 4)
+        assert sorted(sum(res, [])) == sorted(units)
+        assert [len(x) for x in res] == [5, 5, 4, 4]
+
+    def test_partition_more_shards_than_units(self):
+        assert partition_units([('1', 'r1', 'S1')], 3) == [
+            [('1', 'r1', 'S1')], [], []
+        ]
+
+    def test_partition_bad_count(self):
+        with pytest.raises(ValueError) as excinfo:
+            partition_units([], 0)
+        assert str(excinfo.value) == 'Shard count must be at least 1'
+
+
+class TestParseShard(object):
+
+    def test_valid(self):
+        assert _parse_shard('1/4') == (1, 4)
+        assert _parse_shard('4/4') == (4, 4)
+
+    @pytest.mark.parametrize('value', ['0/4', '5/4', '1', 'a/b', '1/4/2'])
+    def test_invalid(self, value):
+        with pytest.raises(argparse.ArgumentTypeError):
+            _parse_shard(value)
+
+
+class TestShardFiles(object):
+
+    def write(self, tmpdir, name, shard, results):
+        path = str(tmpdir.join(name))
+        write_shard_file(path, shard, results)
+        return path
+
+    def test_write_and_load(self, tmpdir):
+        path = self.write(tmpdir, 's1.json', (1, 2), [JobResult(job_result(
+            limits=[('S1', 'L1', 10, 9, [(9, 'x')], [])],
+            service_durations={'S1': 1.0}
+        ), name='prod')])
+        with open(path, 'r') as fh:
+            data = json.loads(fh.read())
+        assert data['format'] == 'awslimitchecker-shard'
+        assert data['version'] == SHARD_FILE_VERSION
+        assert data['shard'] == [1, 2]
+        assert data['results'][0]['name'] == 'prod'
+        shard, results = load_shard_file(path)
+        assert shard == (1, 2)
+        assert len(results) == 1
+        assert results[0].name == 'prod'
+        assert results[0].service_durations == {'S1': 1.0}
+        lim = results[0].limits[0]
+        assert lim.get_limit() == 10
+        assert [
+            (u.get_value(), u.resource_id) for u in lim.get_warnings()
+        ] == [(9, 'x')]
+
+    def test_load_not_shard_file(self, tmpdir):
+        path = tmpdir.join('x.json')
+        path.write('{"foo": 1}')
+        with pytest.raises(ValueError) as excinfo:
+            load_shard_file(str(path))
+        assert 'is not an awslimitchecker shard results file' in str(
+            excinfo.value
+        )
+
+    def test_load_bad_version(self, tmpdir):
+        path = tmpdir.join('x.json')
+        path.write(json.dumps({
+            'format': 'awslimitchecker-shard', 'version': 99,
+            'shard': [1, 1], 'results': []
+        }))
+        with pytest.raises(ValueError) as excinfo:
+            load_shard_file(str(path))
+        assert 'Unsupported shard results file version 99' in str(
+            excinfo.value
+        )
+
+    def test_merge_results(self):
+        res = merge_results([
+            JobResult(job_result(
+                region='r2', limits=[('S1', 'L1', 10, 1, [], [])],
+                service_durations={'S1': 1.0}
+            ), name='prod'),
+            JobResult(job_result(account_id='1')),
+            JobResult(job_result(
+                region='r2', error='E: x', duration=2.0,
+                limits=[('S2', 'L1', 10, 1, [], [])],
+                service_durations={'S2': 2.0}
+            ), name='prod')
+        ])
+        assert [(r.account_id, r.region) for r in res] == [
+            ('1', 'r1'), ('123', 'r2')
+        ]
+        assert res[1].name == 'prod'
+        assert res[1].duration == 3.5
+        assert res[1].error == 'E: x'
+        assert res[1].service_durations == {'S1': 1.0, 'S2': 2.0}
+        assert [x.service.service_name for x in res[1].limits] == ['S1', 'S2']
+        assert res[0].error is None
+
+    def test_merge_shard_files(self, tmpdir):
+        p1 = self.write(tmpdir, 's1.json', (1, 2), [
+            JobResult(job_result(limits=[('S1', 'L1', 10, 1, [], [])]))
+        ])
+        p2 = self.write(tmpdir, 's2.json', (2, 2), [
+            JobResult(job_result(limits=[('S2', 'L1', 10, 1, [], [])]))
+        ])
+        res = merge_shard_files([p2, p1])
+        assert len(res) == 1
+        assert sorted(x.service.service_name for x in res[0].limits) == [
+            'S1', 'S2'
+        ]
+
+    def test_merge_shard_files_missing(self, tmpdir):
+        p1 = self.write(tmpdir, 's1.json', (1, 3), [])
+        with pytest.raises(ValueError) as excinfo:
+            merge_shard_files([p1])
+        assert str(excinfo.value) == 'Missing shard(s) 2, 3 of 3'
+
+    def test_merge_shard_files_duplicate(self, tmpdir):
+        p1 = self.write(tmpdir, 's1.json', (1, 2), [])
+        p2 = self.write(tmpdir, 's2.json', (1, 2), [])
+        with pytest.raises(ValueError) as excinfo:
+            merge_shard_files([p1, p2])
+        assert str(excinfo.value) == 'Shard 1/2 is in both %s and %s' % (
+            p1, p2
+        )
+
+    def test_merge_shard_files_mismatch(self, tmpdir):
+        p1 = self.write(tmpdir, 's1.json', (1, 2), [])
+        p2 = self.write(tmpdir, 's2.json', (2, 3), [])
+        with pytest.raises(ValueError) as excinfo:
+            merge_shard_files([p1, p2])
+        assert str(excinfo.value) == '%s is shard 2/3, but other files ' \
+                                     'have 2 shards' % p2
+
+    def test_merge_shard_files_none(self):
+        with pytest.raises(ValueError) as excinfo:
+            merge_shard_files([])
+        assert str(excinfo.value) == 'No shard results files to merge'
+
+
+class TestFormatResult(object):
+
+    def test_error(self):
+        assert format_result(JobResult(job_result(error='Foo: bar'))) == (
+            2, '123 (123) r1\n\tERROR: Foo: bar'
+        )
+
+    def test_no_problems(self):
+        assert format_result(JobResult(
+            job_result(limits=[('S1', 'L1', 10, 1, [], [])]), name='prod'
+        )) == (0, '123 (prod) r1\n\tNo problems found.')
+
+    def test_problems(self):
+        res = format_result(JobResult(job_result(limits=[
+            ('S2', 'L1', 10, 10, [], [(10, 'x')]),
+            ('S1', 'L2', 10, 8, [(8, None)], [])
+        ])), colorize=False)
+        assert res == (
+            2, '123 (123) r1\n'
+               '\tS1/L2  (limit 10) WARNING: 8\n'
+               '\tS2/L1  (limit 10) CRITICAL: x=10'
+        )
+
+    def test_warnings_only(self):
+        res = format_result(JobResult(job_result(limits=[
+            ('S1', 'L2', 10, 8, [(8, None)], [])
+        ])), colorize=False)
+        assert res[0] == 1
+
+
+class TestMetricsConfig(object):
+
+    def test_no_extra_tags(self):
+
+        class Prov(object):
+            def __init__(self, region_name, foo=None):
+                pass
+
+        assert _metrics_config(Prov, {'foo': 'bar'}, '123') == {'foo': 'bar'}
+
+    def test_extra_tags(self):
+
+        class Prov(object):
+            def __init__(self, region_name, extra_tags=None):
+                pass
+
+        config = {'extra_tags': 'a:b,c:d'}
+        assert _metrics_config(Prov, config, '123') == {
+            'extra_tags': 'a:b,c:d,account_id:123'
+        }
+        assert config == {'extra_tags': 'a:b,c:d'}
+        assert _metrics_config(Prov, {}, '123') == {
+            'extra_tags': 'account_id:123'
+        }
+
+
+def report_args(**kwargs):
+    res = dict(
+        no_color=True, metrics_provider=None, metrics_config={},
+        alert_provider=None, alert_config={}
+    )
+    res.update(kwargs)
+    return argparse.Namespace(**res)
+
+
+class TestReport(object):
+
+    def results(self):
+        return [
+            JobResult(job_result(
+                account_id='1', limits=[('S1', 'L1', 10, 1, [], [])]
+            )),
+            JobResult(job_result(
+                account_id='2', region='r2',
+                limits=[('S1', 'L1', 10, 8, [(8, None)], [])]
+            )),
+            JobResult(job_result(account_id='3', error='E: x'))
+        ]
+
+    def test_plain(self, capsys):
+        cls = _Report(report_args(), 'r1,r2')
+        for r in self.results()[:2]:
+            cls.add(r)
+        assert cls.finish(3.0) == 1
+        assert capsys.readouterr().out == '1 (1) r1\n' \
+                                          '\tNo problems found.\n' \
+                                          '2 (2) r2\n' \
+                                          '\tS1/L1  (limit 10) WARNING: 8\n'
+        assert len(cls.results) == 2
+
+    def test_metrics_and_alerts(self):
+        results = self.results()
+        with patch.multiple(
+            pbm, autospec=True, MetricsProvider=DEFAULT, AlertProvider=DEFAULT
+        ) as mocks:
+            prov = Mock()
+            alerter = Mock()
+            mocks['MetricsProvider'].get_provider_by_name.return_value = prov
+            mocks['AlertProvider'].get_provider_by_name.return_value = alerter
+            cls = _Report(report_args(
+                metrics_provider='Dummy', metrics_config={'a': 'b'},
+                alert_provider='Dummy', alert_config={'c': 'd'}
+            ), 'r1,r2')
+            for r in results:
+                cls.add(r)
+            assert cls.finish(3.0) == 2
+        assert mocks['MetricsProvider'].mock_calls[:1] == [
+            call.get_provider_by_name('Dummy')
+        ]
+        assert mocks['AlertProvider'].mock_calls[:1] == [
+            call.get_provider_by_name('Dummy')
+        ]
+        assert prov.mock_calls == [
+            call('r1', a='b'),
+            call().set_run_duration(1.5),
+            call().add_limit(results[0].limits[0]),
+            call('r2', a='b'),
+            call().set_run_duration(1.5),
+            call().add_limit(results[1].limits[0]),
+            call().flush(),
+            call().flush()
+        ]
+        assert alerter.mock_calls == [
+            call('r1,r2', c='d'),
+            call().on_critical(
+                {'2/r2/S1': {'L1': results[1].limits[0]}},
+                '2 (2) r2\n\tS1/L1  (limit 10) WARNING: 8\n'
+                '3 (3) r1\n\tERROR: E: x',
+                duration=3.0
+            )
+        ]
+
+    def test_alert_warning(self):
+        alerter = Mock()
+        results = self.results()
+        with patch('%s.AlertProvider' % pbm, autospec=True) as mock_ap:
+            mock_ap.get_provider_by_name.return_value = alerter
+            cls = _Report(report_args(alert_provider='Dummy'), 'r1')
+            for r in results[:2]:
+                cls.add(r)
+            assert cls.finish() == 1
+        assert alerter.mock_calls[1:] == [
+            call().on_warning(
+                {'2/r2/S1': {'L1': results[1].limits[0]}},
+                '2 (2) r2\n\tS1/L1  (limit 10) WARNING: 8',
+                duration=None
+            )
+        ]
+
+    def test_alert_success(self):
+        alerter = Mock()
+        with patch('%s.AlertProvider' % pbm, autospec=True) as mock_ap:
+            mock_ap.get_provider_by_name.return_value = alerter
+            cls = _Report(report_args(alert_provider='Dummy'), 'r1')
+            cls.add(self.results()[0])
+            assert cls.finish(2.0) == 0
+        assert alerter.mock_calls[1:] == [call().on_success(duration=2.0)]
+
+
+class TestParseArgs(object):
+
+    def test_defaults(self):
+        args = parse_args(['a.json'])
+        assert args.CONFIG == 'a.json'
+        assert args.ACCOUNT == []
+        assert args.shard is None
+        assert args.output is None
+        assert args.history is None
+        assert args.alert_provider is None
+        assert args.alert_config == {}
+
+    def test_shard(self):
+        args = parse_args(['--shard=2/3', '-o', 'out.json', 'a.json'])
+        assert args.shard == (2, 3)
+        assert args.output == 'out.json'
+
+    def test_shard_requires_output(self, capsys):
+        with pytest.raises(SystemExit):
+            parse_args(['--shard=2/3', 'a.json'])
+        assert '--shard requires -o/--output' in capsys.readouterr().err
+
+    def test_shard_rejects_metrics_and_alerts(self, capsys):
+        for opt in ['--metrics-provider=Dummy', '--alert-provider=Dummy']:
+            with pytest.raises(SystemExit):
+                parse_args(['--shard=2/3', '-o', 'out.json', opt, 'a.json'])
+            assert '--shard cannot be used with --metrics-provider or ' \
+                '--alert-provider' in capsys.readouterr().err
+
+    def test_merge(self):
+        args = parse_merge_args([
+            '--history=h.json', '--alert-provider=Dummy', 's1.json', 's2.json'
+        ])
+        assert args.FILE == ['s1.json', 's2.json']
+        assert args.history == 'h.json'
+        assert args.alert_provider == 'Dummy'
+
+
+class TestConsoleEntryPoint(object):
+
+    def run(self, argv, results, units=None, history=None):
+        with patch.object(sys, 'argv', ['awslimitchecker-accounts'] + argv):
+            with patch.multiple(
+                pbm, autospec=True, load_accounts_config=DEFAULT,
+                MultiAccountChecker=DEFAULT, CredentialCache=DEFAULT,
+                _Report=DEFAULT, load_history=DEFAULT, save_history=DEFAULT,
+                update_history=DEFAULT, write_shard_file=DEFAULT,
+                partition_units=DEFAULT
+            ) as mocks:
+                checker = mocks['MultiAccountChecker'].return_value
+                checker.iter_results.return_value = iter(results)
+                checker.get_jobs.return_value = [
+                    ('1', 'r2'), ('1', 'r1'), ('2', 'r2')
+                ]
+                checker.get_work_units.return_value = ['u1', 'u2', 'u3']
+                mocks['partition_units'].return_value = [['u1'], ['u2', 'u3']]
+                mocks['load_history'].return_value = history or {}
+                mocks['_Report'].return_value.results = results
+                mocks['_Report'].return_value.finish.return_value = 1
+                with pytest.raises(SystemExit) as excinfo:
+                    console_entry_point()
+        return excinfo.value.code, mocks
+
+    def test_defaults(self, capsys):
+        results = [JobResult(job_result()), JobResult(job_result())]
+        code, mocks = self.run(['accounts.json'], results)
+        assert code == 1
+        assert mocks['load_accounts_config'].mock_calls == [
+            call('accounts.json')
+        ]
+        assert mocks['CredentialCache'].mock_calls == [
+            call(region_name=None, role_partition='aws', external_id=None)
+        ]
+        assert mocks['MultiAccountChecker'].mock_calls == [
+            call(
+                mocks['load_accounts_config'].return_value,
+                max_workers=None, max_per_account=2,
+                credential_cache=mocks['CredentialCache'].return_value,
+                use_ta=True,
+                checker_kwargs={
+                    'warning_threshold': 80, 'critical_threshold': 99,
+                    'role_partition': 'aws'
+                }
+            ),
+            call().get_jobs([]),
+            call().iter_results([], units=None)
+        ]
+        report = mocks['_Report']
+        assert report.mock_calls[0][1][1] == 'r1,r2'
+        assert report.mock_calls[1:3] == [
+            call().add(results[0]), call().add(results[1])
+        ]
+        assert report.return_value.finish.call_count == 1
+        for x in ['load_history', 'save_history', 'write_shard_file',
+                  'partition_units']:
+            assert mocks[x].mock_calls == []
+        assert 'Checked 2 account/region(s) in ' in capsys.readouterr().out
+
+    def test_options(self):
+        code, mocks = self.run([
+            '-j', '8', '--max-per-account=3', '-W', '50', '-C', '90',
+            '--sts-region=rx', '--role-partition=aws-cn', '-E', 'eid',
+            '--skip-ta', 'accounts.json', '123', 'dev'
+        ], [])
+        assert mocks['CredentialCache'].mock_calls == [
+            call(region_name='rx', role_partition='aws-cn',
+                 external_id='eid')
+        ]
+        assert mocks['MultiAccountChecker'].mock_calls == [
+            call(
+                mocks['load_accounts_config'].return_value,
+                max_workers=8, max_per_account=3,
+                credential_cache=mocks['CredentialCache'].return_value,
+                use_ta=False,
+                checker_kwargs={
+                    'warning_threshold': 50, 'critical_threshold': 90,
+                    'role_partition': 'aws-cn'
+                }
+            ),
+            call().get_jobs(['123', 'dev']),
+            call().iter_results(['123', 'dev'], units=None)
+        ]
+
+    def test_shard(self):
+        results = [JobResult(job_result())]
+        code, mocks = self.run([
+            '--shard=2/2', '-o', 'out.json', '--history=h.json', 'a.json'
+        ], results, history={'k': 1.0})
+        checker = mocks['MultiAccountChecker'].return_value
+        assert mocks['load_history'].mock_calls == [call('h.json')]
+        assert mocks['partition_units'].mock_calls == [
+            call(['u1', 'u2', 'u3'], 2, {'k': 1.0})
+        ]
+        assert checker.iter_results.mock_calls == [
+            call([], units=['u2', 'u3'])
+        ]
+        assert mocks['write_shard_file'].mock_calls == [
+            call('out.json', (2, 2), results)
+        ]
+        assert mocks['save_history'].mock_calls == []
+
+    def test_output_and_history(self):
+        results = [JobResult(job_result())]
+        code, mocks = self.run([
+            '-o', 'out.json', '--history=h.json', 'a.json'
+        ], results, history={'k': 1.0})
+        assert mocks['partition_units'].mock_calls == []
+        assert mocks['write_shard_file'].mock_calls == [
+            call('out.json', (1, 1), results)
+        ]
+        assert mocks['update_history'].mock_calls == [
+            call({'k': 1.0}, results)
+        ]
+        assert mocks['save_history'].mock_calls == [
+            call('h.json', mocks['update_history'].return_value)
+        ]
+
+    def test_verbose(self):
+        with patch('%s.logging.getLogger' % pbm) as mock_get:
+            self.run(['-v', 'a.json'], [])
+            assert mock_get.return_value.mock_calls == [
+                call.setLevel(20)
+            ]
+            mock_get.reset_mock()
+            self.run(['-vv', 'a.json'], [])
+            assert mock_get.return_value.mock_calls == [
+                call.setLevel(10)
+            ]
+
+    def test_merge(self, capsys):
+        results = [
+            JobResult(job_result(region='r2')), JobResult(job_result())
+        ]
+        argv = ['merge', '--history=h.json', 's1.json', 's2.json']
+        with patch.object(sys, 'argv', ['awslimitchecker-accounts'] + argv):
+            with patch.multiple(
+                pbm, autospec=True, merge_shard_files=DEFAULT,
+                _Report=DEFAULT, load_history=DEFAULT, save_history=DEFAULT,
+                update_history=DEFAULT, MultiAccountChecker=DEFAULT
+            ) as mocks:
+                mocks['merge_shard_files'].return_value = results
+                mocks['_Report'].return_value.finish.return_value = 2
+                with pytest.raises(SystemExit) as excinfo:
+                    console_entry_point()
+        assert excinfo.value.code == 2
+        assert mocks['merge_shard_files'].mock_calls == [
+            call(['s1.json', 's2.json'])
+        ]
+        report = mocks['_Report']
+        assert report.mock_calls[0][1][1] == 'r1,r2'
+        assert report.mock_calls[1:] == [
+            call().add(results[0]), call().add(results[1]), call().finish()
+        ]
+        assert mocks['update_history'].mock_calls == [
+            call(mocks['load_history'].return_value, results)
+        ]
+        assert mocks['save_history'].mock_calls == [
+            call('h.json', mocks['update_history'].return_value)
+        ]
+        assert mocks['MultiAccountChecker'].mock_calls == []
+        assert 'Merged 2 account/region(s) from 2 shard file(s)' in \
+            capsys.readouterr().out
+
+
+class TestQueueCoordination(object):
+
+    def setup(self):
+        self.accounts = {
+            '111': conf(name='prod', regions=['r1', 'r2'], role_name=None)
+        }
+        self.cache = CredentialCache(region_name='rx', external_id='eid')
+
+    def test_usage_data(self):
+        lim = AwsLimit('L1', Mock(), 10, 80, 99)
+        lim.set_threshold_override(warn_count=5)
+        lim._add_current_usage(3, maximum=20, resource_id='a')
+        lim._add_current_usage(4)
+        assert _usage_data(lim) == [
+            'L1', 10, [5, 80, None, 99], [[3, 20, 'a'], [4, None, None]]
+        ]
+
+    def test_evaluate_limits(self):
+        res = evaluate_limits('S1', [
+            ['L1', 10, [None, 80, None, 99], [[9, None, 'a'], [1, None, 'b']]],
+            ['L2', 10, [None, 50, None, 60], [[7, 20, 'c'], [7, None, 'd']]],
+            ['L3', None, [None, 80, None, 99], [[100, None, None]]],
+            ['L4', 100, [2, 80, None, 99], [[3, None, None]]]
+        ])
+        assert res == [
+            ('S1', 'L1', 10, 9, [(9, 'a')], []),
+            ('S1', 'L2', 10, 7, [], [(7, 'd')]),
+            ('S1', 'L3', None, 100, [], []),
+            ('S1', 'L4', 100, 3, [(3, None)], [])
+        ]
+
+    def test_evaluate_limits_unordered_override(self):
+        # crit_percent=70 overriding the default 80% warning threshold
+        res = evaluate_limits('S1', [
+            ['L1', 100, [None, 80, None, 70], [[75, None, 'a']]]
+        ])
+        assert res == [('S1', 'L1', 100, 75, [], [(75, 'a')])]
+
+    def test_queue_results(self):
+        items = [
+            {
+                'account_id': '111', 'region': 'r2', 'service': 'S1',
+                'state': 'done', 'duration': 1.0, 'error': None,
+                'result': {'limits': [['L1', 10, [None, 80, None, 99],
+                                       [[9, None, None]]]]}
+            },
+            {
+                'account_id': '111', 'region': 'r1', 'service': 'S1',
+                'state': 'done', 'duration': 2.0, 'error': None,
+                'result': {'limits': []}
+            },
+            {
+                'account_id': '111', 'region': 'r2', 'service': 'S2',
+                'state': 'failed', 'duration': None, 'result': None,
+                'error': 'Lease expired after 3 attempt(s)'
+            }
+        ]
+        res = queue_results(items, self.accounts)
+        assert [(r.account_id, r.name, r.region) for r in res] == [
+            ('111', 'prod', 'r1'), ('111', 'prod', 'r2')
+        ]
+        assert res[0].error is None
+        assert res[0].duration == 2.0
+        assert res[1].error == 'S2: Lease expired after 3 attempt(s)'
+        assert res[1].service_durations == {'S1': 1.0}
+        assert res[1].result['limits'] == [
+            ('S1', 'L1', 10, 9, [(9, None)], [])
+        ]
+
+    def test_run_queue(self):
+        cls = MultiAccountChecker(
+            self.accounts, credential_cache=self.cache, use_ta=False,
+            checker_kwargs={'warning_threshold': 70}
+        )
+        queue = Mock(spec_set=WorkQueue)
+        queue.is_finished.side_effect = [False, False, True]
+        with patch.multiple(
+            pbm, autospec=True, queue_results=DEFAULT, time=DEFAULT
+        ) as mocks:
+            with patch('%s.get_work_units' % pb, autospec=True) as mock_gwu:
+                mock_gwu.return_value = [('111', 'r1', 'S1')]
+                res = cls.run_queue(
+                    queue, ['prod'], lease_seconds=60, max_attempts=2,
+                    poll_interval=3
+                )
+        assert res is mocks['queue_results'].return_value
+        assert mock_gwu.mock_calls == [call(cls, ['prod'])]
+        assert queue.mock_calls == [
+            call.start_run([('111', 'r1', 'S1')], {
+                'accounts': self.accounts,
+                'use_ta': False,
+                'checker_kwargs': {'warning_threshold': 70},
+                'sts': {
+                    'region_name': 'rx', 'role_partition': 'aws',
+                    'external_id': 'eid', 'refresh_margin': 900
+                }
+            }, lease_seconds=60, max_attempts=2),
+            call.reap(),
+            call.is_finished(),
+            call.counts(),
+            call.reap(),
+            call.is_finished(),
+            call.counts(),
+            call.reap(),
+            call.is_finished(),
+            call.finished_items()
+        ]
+        assert mocks['time'].mock_calls == [call.sleep(3), call.sleep(3)]
+        assert mocks['queue_results'].mock_calls == [
+            call(queue.finished_items.return_value, self.accounts)
+        ]
+
+
+class TestQueueWorker(object):
+
+    def setup(self):
+        self.accounts = {
+            '111': conf(
+                name='prod', regions=['r1', 'r2'], role_name=None,
+                limit_overrides={'S1': {'L1': 5}},
+                threshold_overrides={'S1': {'L1': {'warning': {}}}}
+            ),
+            '222': conf(name='dev')
+        }
+        self.data = {
+            'accounts': self.accounts, 'use_ta': False,
+            'checker_kwargs': {'warning_threshold': 70},
+            'sts': {
+                'region_name': 'rx', 'role_partition': 'aws',
+                'external_id': None, 'refresh_margin': 900
+            }
+        }
+        self.queue = Mock(spec_set=WorkQueue)
+        self.queue.get_run_data.return_value = ('run1', self.data)
+        self.cls = QueueWorker(self.queue, owner='w1')
+
+    def item(self, **kwargs):
+        res = {
+            'id': 5, 'run_id': 'run1', 'account_id': '111', 'region': 'r1',
+            'service': 'S1', 'attempts': 1
+        }
+        res.update(kwargs)
+        return res
+
+    def test_init_default_owner(self):
+        with patch('%s.socket.gethostname' % pbm) as mock_host:
+            mock_host.return_value = 'host1'
+            with patch('%s.os.getpid' % pbm) as mock_pid:
+                mock_pid.return_value = 123
+                cls = QueueWorker(self.queue)
+        assert cls.owner == 'host1:123'
+
+    def test_load_run(self):
+        self.cls._checker_key = ('x',)
+        self.cls._load_run('run1')
+        assert self.cls._run_id == 'run1'
+        assert self.cls._accounts.accounts == self.accounts
+        assert self.cls._accounts.use_ta is False
+        assert self.cls._accounts.checker_kwargs == {'warning_threshold': 70}
+        assert self.cls._accounts.credential_cache.region_name == 'rx'
+        assert self.cls._checker_key is None
+
+    def test_load_run_changed(self):
+        with pytest.raises(RuntimeError):
+            self.cls._load_run('run0')
+
+    def test_get_checker(self):
+        self.cls._load_run('run1')
+        with patch('%s.AwsLimitChecker' % pbm, autospec=True) as mock_alc:
+            c1 = self.cls._get_checker('111', 'r1')
+            assert self.cls._get_checker('111', 'r1') is c1
+            self.cls._get_checker('111', 'r2')
+        assert mock_alc.mock_calls == [
+            call(region='r1', account_id='111', credentials={},
+                 check_version=False, warning_threshold=70),
+            call().set_current_account_id('111'),
+            call().set_threshold_overrides({'S1': {'L1': {'warning': {}}}}),
+            call().set_limit_overrides({'S1': {'L1': 5}}),
+            call(region='r2', account_id='111', credentials={},
+                 check_version=False, warning_threshold=70),
+            call().set_current_account_id('111'),
+            call().set_threshold_overrides({'S1': {'L1': {'warning': {}}}}),
+            call().set_limit_overrides({'S1': {'L1': 5}})
+        ]
+
+    def test_get_checker_new_credentials(self):
+        self.cls._load_run('run1')
+        keys = ['ak1', 'ak1', 'ak2']
+        with patch('%s._credentials' % pb, autospec=True) as mock_creds:
+            mock_creds.side_effect = lambda *_: {
+                'aws_access_key_id': keys.pop(0)
+            }
+            with patch('%s.AwsLimitChecker' % pbm, autospec=True) as mock_alc:
+                mock_alc.side_effect = lambda **_: Mock()
+                c1 = self.cls._get_checker('222', 'r1')
+                assert self.cls._get_checker('222', 'r1') is c1
+                assert self.cls._get_checker('222', 'r1') is not c1
+        assert mock_alc.call_count == 2
+
+    def test_work(self):
+        checker = Mock(spec=AwsLimitChecker)
+        lim = Mock()
+        checker.get_limit_index.return_value.iter_limits.return_value = [
+            ('S1', 'L1', lim)
+        ]
+        self.queue.complete.return_value = True
+        with patch.multiple(
+            pbm, autospec=True, _usage_data=DEFAULT
+        ) as mocks:
+            mocks['_usage_data'].return_value = ['data']
+            with patch('%s._get_checker' % pqw, autospec=True) as mock_gc:
+                mock_gc.return_value = checker
+                with patch('%s.time.time' % pbm) as mock_time:
+                    mock_time.side_effect = [10.0, 12.5]
+                    assert self.cls.work(self.item()) is True
+        assert self.cls._run_id == 'run1'
+        assert mock_gc.mock_calls == [call(self.cls, '111', 'r1')]
+        assert checker.mock_calls == [
+            call.find_usage(service=['S1'], use_ta=False),
+            call.get_limit_index(),
+            call.get_limit_index().iter_limits(['S1'])
+        ]
+        assert mocks['_usage_data'].mock_calls == [call(lim)]
+        assert self.queue.mock_calls == [
+            call.get_run_data(),
+            call.complete(5, 'w1', {'limits': [['data']]}, 2.5)
+        ]
+
+    def test_work_expired(self):
+        self.cls._load_run('run1')
+        checker = Mock(spec=AwsLimitChecker)
+        checker.get_limit_index.return_value.iter_limits.return_value = []
+        self.queue.complete.return_value = False
+        with patch('%s._get_checker' % pqw, autospec=True) as mock_gc:
+            mock_gc.return_value = checker
+            with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+                assert self.cls.work(self.item()) is True
+        assert mock_logger.mock_calls == [
+            call.warning('Lease on work item %d expired before it was '
+                         'completed; result discarded', 5)
+        ]
+
+    def test_work_error(self):
+        self.cls._load_run('run1')
+        with patch('%s._get_checker' % pqw, autospec=True) as mock_gc:
+            mock_gc.return_value.find_usage.side_effect = RuntimeError('foo')
+            with patch('%s.logger' % pbm, autospec=True):
+                assert self.cls.work(self.item()) is False
+        assert self.queue.mock_calls[-1:] == [
+            call.fail(5, 'w1', 'RuntimeError: foo')
+        ]
+
+    def test_run(self):
+        self.queue.lease.side_effect = [
+            self.item(id=1), None, self.item(id=2), None
+        ]
+        self.queue.is_finished.side_effect = [False, True]
+        with patch('%s.work' % pqw, autospec=True) as mock_work:
+            with patch('%s.time.sleep' % pbm) as mock_sleep:
+                assert self.cls.run(poll_interval=2) == 2
+        assert mock_work.mock_calls == [
+            call(self.cls, self.item(id=1)), call(self.cls, self.item(id=2))
+        ]
+        assert mock_sleep.mock_calls == [call(2)]
+        assert self.queue.mock_calls == [
+            call.lease('w1'), call.lease('w1'), call.is_finished(),
+            call.lease('w1'), call.lease('w1'), call.is_finished()
+        ]
+
+
+class TestQueueCommands(object):
+
+    def test_parse_queue_args(self):
+        args = parse_args(['--queue=q.db', 'a.json'])
+        assert args.queue == 'q.db'
+        assert args.lease_seconds == 900
+        assert args.max_attempts == 3
+        assert args.poll_interval == 5
+
+    def test_parse_queue_and_shard(self, capsys):
+        with pytest.raises(SystemExit):
+            parse_args(['--queue=q.db', '--shard=1/2', '-o', 'x', 'a.json'])
+        assert '--shard and --queue cannot be used together' in \
+            capsys.readouterr().err
+
+    def test_parse_worker_args(self):
+        args = parse_worker_args(['--poll-interval=1', '-v', 'q.db'])
+        assert args.QUEUE == 'q.db'
+        assert args.poll_interval == 1
+        assert args.verbose == 1
+
+    def test_worker_entry_point(self, capsys):
+        argv = ['awslimitchecker-accounts', 'worker', 'q.db']
+        with patch.object(sys, 'argv', argv):
+            with patch.multiple(
+                pbm, autospec=True, WorkQueue=DEFAULT, QueueWorker=DEFAULT,
+                MultiAccountChecker=DEFAULT
+            ) as mocks:
+                mocks['QueueWorker'].return_value.run.return_value = 4
+                with pytest.raises(SystemExit) as excinfo:
+                    console_entry_point()
+        assert excinfo.value.code == 0
+        assert mocks['WorkQueue'].mock_calls == [call('q.db')]
+        assert mocks['QueueWorker'].mock_calls == [
+            call(mocks['WorkQueue'].return_value),
+            call().run(poll_interval=5)
+        ]
+        assert mocks['MultiAccountChecker'].mock_calls == []
+        assert 'Worked on 4 item(s)' in capsys.readouterr().out
+
+    def test_console_queue(self):
+        results = [JobResult(job_result())]
+        argv = [
+            'awslimitchecker-accounts', '--queue=q.db', '--lease-seconds=60',
+            '--max-attempts=5', '--poll-interval=2', 'a.json', 'prod'
+        ]
+        with patch.object(sys, 'argv', argv):
+            with patch.multiple(
+                pbm, autospec=True, load_accounts_config=DEFAULT,
+                MultiAccountChecker=DEFAULT, CredentialCache=DEFAULT,
+                _Report=DEFAULT, WorkQueue=DEFAULT
+            ) as mocks:
+                checker = mocks['MultiAccountChecker'].return_value
+                checker.get_jobs.return_value = [('1', 'r1')]
+                checker.run_queue.return_value = results
+                mocks['_Report'].return_value.results = results
+                mocks['_Report'].return_value.finish.return_value = 0
+                with pytest.raises(SystemExit) as excinfo:
+                    console_entry_point()
+        assert excinfo.value.code == 0
+        assert checker.mock_calls[1:] == [
+            call.run_queue(
+                mocks['WorkQueue'].return_value, ['prod'], lease_seconds=60,
+                max_attempts=5, poll_interval=2
+            )
+        ]
+        assert mocks['WorkQueue'].mock_calls == [call('q.db')]
+        assert mocks['_Report'].mock_calls[1] == call().add(results[0])
@@ -0,0 +1,355 @@
+"""
+awslimitchecker/tests/test_multiregion.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import sys
+import pytest
+from awslimitchecker.checker import AwsLimitChecker
+from awslimitchecker.multiregion import MultiRegionChecker
+from awslimitchecker.services.base import _AwsService
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock, DEFAULT
+else:
+    from unittest.mock import patch, call, Mock, DEFAULT
+
+pbm = 'awslimitchecker.multiregion'
+pb = '%s.MultiRegionChecker' % pbm
+
+
+class MultiRegionTester(object):
+
+    def setup(self):
+        self.checkers = {}
+
+        def se_checker(region=None, **kwargs):
+            m = Mock(spec=AwsLimitChecker)
+            m.get_credentials.return_value = {'aws_access_key_id': 'ak'}
+            m.get_service_names.return_value = ['G1', 'S1']
+            m.services = {
+                'G1': Mock(spec_set=_AwsService, is_global=True),
+                'S1': Mock(spec_set=_AwsService, is_global=False)
+            }
+            self.checkers[region] = m
+            return m
+
+        with patch('%s.AwsLimitChecker' % pbm, autospec=True) as mock_alc:
+            mock_alc.side_effect = se_checker
+            self.cls = MultiRegionChecker(
+                ['r2', 'r1', 'r2'], warning_threshold=70
+            )
+        self.mock_alc = mock_alc
+
+
+class TestInit(MultiRegionTester):
+
+    def test_init(self):
+        assert self.cls.regions == ['r1', 'r2']
+        assert self.cls.max_workers == 2
+        assert self.cls.account_id is None
+        assert self.cls.credentials == {'aws_access_key_id': 'ak'}
+        assert self.cls.checkers == self.checkers
+        assert self.mock_alc.mock_calls == [
+            call(region='r1', warning_threshold=70),
+            call(
+                region='r2', warning_threshold=70, check_version=False,
+                credentials={'aws_access_key_id': 'ak'}
+            )
+        ]
+        assert self.checkers['r1'].mock_calls == [call.get_credentials()]
+        assert self.checkers['r2'].mock_calls == [
+            call.add_shared_service(self.checkers['r1'].services['G1'])
+        ]
+
+    def test_global_services(self):
+        assert self.cls.global_services == ['G1']
+
+    def test_init_account_id(self):
+        with patch('%s.AwsLimitChecker' % pbm, autospec=True) as mock_alc:
+            mock_alc.return_value.get_credentials.return_value = {}
+            mock_alc.return_value.services = {}
+            cls = MultiRegionChecker(
+                ['r1'], max_workers=4, account_id='123', account_role='foo'
+            )
+        assert cls.account_id == '123'
+        assert cls.max_workers == 4
+        assert mock_alc.mock_calls == [
+            call(region='r1', account_id='123', account_role='foo'),
+            call().get_credentials()
+        ]
+
+    @pytest.mark.parametrize('kwarg', ['region', 'credentials'])
+    def test_init_bad_kwarg(self, kwarg):
+        with patch('%s.AwsLimitChecker' % pbm, autospec=True) as mock_alc:
+            with pytest.raises(ValueError) as excinfo:
+                MultiRegionChecker(['r1'], **{kwarg: 'foo'})
+        assert str(excinfo.value) == 'MultiRegionChecker does not ' \
+            'accept a "%s" argument' % kwarg
+        assert mock_alc.mock_calls == []
+
+    def test_init_no_regions(self):
+        with patch('%s.AwsLimitChecker' % pbm, autospec=True) as mock_alc:
+            with pytest.raises(ValueError) as excinfo:
+                MultiRegionChecker([])
+        assert str(excinfo.value) == 'At least one region must be specified'
+        assert mock_alc.mock_calls == []
+
+    def test_init_all(self):
+        with patch.multiple(
+            pbm, autospec=True, AwsLimitChecker=DEFAULT, boto3=DEFAULT,
+            boto3_client=DEFAULT
+        ) as mocks:
+            mocks['boto3'].session.Session.return_value.region_name = 'r2'
+            mocks['AwsLimitChecker'].return_value.get_credentials\
+                .return_value = {'aws_access_key_id': 'ak'}
+            mocks['AwsLimitChecker'].return_value.services = {
+                'G1': Mock(spec_set=_AwsService, is_global=True)
+            }
+            mock_conn = mocks['boto3_client'].return_value
+            mock_conn.describe_regions.return_value = {
+                'Regions': [
+                    {'RegionName': 'r3'},
+                    {'RegionName': 'r1'},
+                    {'RegionName': 'r2'}
+                ]
+            }
+            cls = MultiRegionChecker('all', profile_name='prof')
+        assert cls.regions == ['r1', 'r2', 'r3']
+        assert mocks['boto3'].mock_calls == [
+            call.session.Session(profile_name='prof')
+        ]
+        assert mocks['boto3_client'].mock_calls == [
+            call('ec2', region_name='r2', aws_access_key_id='ak'),
+            call().describe_regions()
+        ]
+        assert mocks['AwsLimitChecker'].mock_calls == [
+            call(region='r2', profile_name='prof'),
+            call().get_credentials(),
+            call(region='r1', profile_name='prof', check_version=False,
+                 credentials={'aws_access_key_id': 'ak'}),
+            call(region='r3', profile_name='prof', check_version=False,
+                 credentials={'aws_access_key_id': 'ak'}),
+            call().add_shared_service(
+                mocks['AwsLimitChecker'].return_value.services['G1']
+            ),
+            call().add_shared_service(
+                mocks['AwsLimitChecker'].return_value.services['G1']
+            )
+        ]
+        assert sorted(cls.checkers.keys()) == ['r1', 'r2', 'r3']
+
+    def test_init_all_no_default_region(self):
+        with patch.multiple(
+            pbm, autospec=True, AwsLimitChecker=DEFAULT, boto3=DEFAULT
+        ) as mocks:
+            mocks['boto3'].session.Session.return_value.region_name = None
+            with pytest.raises(ValueError) as excinfo:
+                MultiRegionChecker('all')
+        assert str(excinfo.value) == 'A default region must be ' \
+            'configured to check all regions'
+        assert mocks['AwsLimitChecker'].mock_calls == []
+
+
+class TestResolveAccountId(MultiRegionTester):
+
+    def test_lookup(self):
+        with patch('%s.boto3_client' % pbm, autospec=True) as mock_client:
+            mock_client.return_value.get_caller_identity\
+                .return_value = {'Account': '123456789012'}
+            self.cls._resolve_account_id()
+            self.cls._resolve_account_id()
+        assert self.cls.account_id == '123456789012'
+        assert mock_client.mock_calls == [
+            call('sts', region_name='r1', aws_access_key_id='ak'),
+            call().get_caller_identity()
+        ]
+        for region in ['r1', 'r2']:
+            assert self.checkers[region].mock_calls[-2:] == [
+                call.set_current_account_id('123456789012'),
+                call.set_current_account_id('123456789012')
+            ]
+
+    def test_given(self):
+        self.cls.account_id = '123'
+        with patch('%s.boto3_client' % pbm, autospec=True) as mock_client:
+            self.cls._resolve_account_id()
+        assert mock_client.mock_calls == []
+        assert self.checkers['r2'].mock_calls[-1:] == [
+            call.set_current_account_id('123')
+        ]
+
+
+class TestRun(MultiRegionTester):
+
+    def test_run(self):
+        self.checkers['r1'].check_thresholds.return_value = {
+            'G1': {'g': 1}, 'S1': {'a': 1}
+        }
+        self.checkers['r2'].check_thresholds.return_value = {'S1': {'b': 2}}
+        with patch('%s._resolve_account_id' % pb, autospec=True) as m_rai:
+            res = self.cls._run('check_thresholds', use_ta=False)
+        assert res == {
+            'r1': {'G1': {'g': 1}, 'S1': {'a': 1}},
+            'r2': {'G1': {'g': 1}, 'S1': {'b': 2}}
+        }
+        assert m_rai.mock_calls == [call(self.cls)]
+        assert self.checkers['r1'].check_thresholds.mock_calls == [
+            call(service=['G1', 'S1'], use_ta=False)
+        ]
+        assert self.checkers['r2'].check_thresholds.mock_calls == [
+            call(service=['S1'], use_ta=False)
+        ]
+
+    def test_run_regional_only(self):
+        self.checkers['r1'].check_thresholds.return_value = {}
+        self.checkers['r2'].check_thresholds.return_value = {'S1': {'b': 2}}
+        with patch('%s._resolve_account_id' % pb, autospec=True):
+            res = self.cls._run('check_thresholds', service=['S1'])
+        assert res == {'r1': {}, 'r2': {'S1': {'b': 2}}}
+        assert self.checkers['r1'].check_thresholds.mock_calls == [
+            call(service=['S1'])
+        ]
+        assert self.checkers['r2'].check_thresholds.mock_calls == [
+            call(service=['S1'])
+        ]
+
+    def test_run_no_result(self):
+        with patch('%s._resolve_account_id' % pb, autospec=True):
+            res = self.cls._run('find_usage', service=['G1'])
+        assert res == {
+            'r1': self.checkers['r1'].find_usage.return_value,
+            'r2': self.checkers['r2'].find_usage.return_value
+        }
+        assert self.checkers['r1'].find_usage.mock_calls == [
+            call(service=['G1'])
+        ]
+        assert self.checkers['r2'].find_usage.mock_calls == [
+            call(service=[])
+        ]
+
+    def test_run_exception(self):
+        self.checkers['r1'].find_usage.return_value = None
+        self.checkers['r2'].find_usage.side_effect = RuntimeError('foo')
+        with patch('%s._resolve_account_id' % pb, autospec=True):
+            with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+                with pytest.raises(RuntimeError):
+                    self.cls._run('find_usage')
+        assert mock_logger.mock_calls == [
+            call.error('Error checking region %s', 'r2')
+        ]
+        # every region still ran
+        assert self.checkers['r1'].find_usage.mock_calls == [
+            call(service=['G1', 'S1'])
+        ]
+
+
+class TestDelegation(MultiRegionTester):
+
+    def test_region_name(self):
+        assert self.cls.region_name == 'r1,r2'
+
+    def test_first_region_methods(self):
+        self.checkers['r2'].reset_mock()
+        c = self.checkers['r1']
+        c.get_version.return_value = 'ver'
+        c.get_project_url.return_value = 'url'
+        c.get_service_names.return_value = ['S']
+        c.get_required_iam_policy.return_value = {'p': 1}
+        assert self.cls.get_version() == 'ver'
+        assert self.cls.get_project_url() == 'url'
+        assert self.cls.get_service_names() == ['S']
+        assert self.cls.get_required_iam_policy() == {'p': 1}
+        assert self.checkers['r2'].mock_calls == []
+
+    def test_call_each(self):
+        self.cls.remove_services(['S1'])
+        self.cls.set_limit_overrides({'S': {'l': 1}}, override_ta=False)
+        self.cls.set_limit_override('S', 'l', 2)
+        self.cls.set_threshold_overrides({'S': {}})
+        for region in ['r1', 'r2']:
+            assert self.checkers[region].mock_calls[-4:] == [
+                call.remove_services(['S1']),
+                call.set_limit_overrides({'S': {'l': 1}}, False),
+                call.set_limit_override('S', 'l', 2, True),
+                call.set_threshold_overrides({'S': {}})
+            ]
+
+    def test_concurrent_methods(self):
+        with patch('%s._run' % pb, autospec=True) as mock_run:
+            mock_run.return_value = {'r1': {}, 'r2': {}}
+            assert self.cls.find_usage(service=['S']) is None
+            assert self.cls.get_limits(use_api=False) == {'r1': {}, 'r2': {}}
+            assert self.cls.check_thresholds(use_ta=False) == {
+                'r1': {}, 'r2': {}
+            }
+        assert mock_run.mock_calls == [
+            call(self.cls, 'find_usage', service=['S'], use_ta=True),
+            call(self.cls, 'get_limits', service=None, use_ta=True,
+                 use_api=False),
+            call(self.cls, 'check_thresholds', service=None, use_ta=False)
+        ]
+
+    def test_get_unknown_services(self):
+        self.checkers['r1'].get_unknown_services.return_value = {
+            'G1': 'timed out', 'S1': 'slow'
+        }
+        self.checkers['r2'].get_unknown_services.return_value = {}
+        assert self.cls.get_unknown_services() == {
+            'r1': {'G1': 'timed out', 'S1': 'slow'},
+            'r2': {'G1': 'timed out'}
+        }
+
+    def test_get_service_durations(self):
+        self.checkers['r1'].get_service_durations.return_value = {
+            'G1': 2.0, 'S1': 1.0
+        }
+        self.checkers['r2'].get_service_durations.return_value = {'S1': 3.0}
+        assert self.cls.get_service_durations() == {
+            'r1': {'G1': 2.0, 'S1': 1.0},
+            'r2': {'S1': 3.0}
+        }
+
+    def test_get_ta_refresh_latency(self):
+        self.checkers['r1'].get_ta_refresh_latency.return_value = None
+        self.checkers['r2'].get_ta_refresh_latency.return_value = 1.5
+        assert self.cls.get_ta_refresh_latency() == {'r1': None, 'r2': 1.5}
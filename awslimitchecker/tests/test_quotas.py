@@ -50,9 +50,9 @@ if (
         sys.version_info[0] < 3 or
         sys.version_info[0] == 3 and sys.version_info[1] < 4
 ):
-    from mock import patch, call, Mock
+    from mock import patch, call, Mock, DEFAULT
 else:
-    from unittest.mock import patch, call, Mock
+    from unittest.mock import patch, call, Mock, DEFAULT
 
 pbm = 'awslimitchecker.quotas'
 pb = '%s.ServiceQuotasClient' % pbm
@@ -64,6 +64,7 @@ class TestConstructor(object):
         cls = ServiceQuotasClient({'foo': 'bar'})
         assert cls._boto3_connection_kwargs == {'foo': 'bar'}
         assert cls._cache == {}
+        assert cls._by_code == {}
         assert cls.conn is None
 
 
@@ -87,6 +88,9 @@ class TestQuotasForService(object):
             res = self.cls.quotas_for_service('scode')
         assert res == expected
         assert self.cls._cache == {'scode': expected}
+        assert self.cls._by_code == {
+            'scode': dict((x['QuotaCode'], x) for x in expected.values())
+        }
         assert m_connect.mock_calls == [call(self.cls)]
         assert mock_conn.mock_calls == [
             call.get_paginator('list_service_quotas'),
@@ -238,3 +242,188 @@ class TestGetQuotaValue(object):
         assert m_conv.mock_calls == [
             call(12.3, 'Foo', 'None')
         ]
+
+
+def quota(code, name, value=12.3, unit='None'):
+    return {'QuotaCode': code, 'QuotaName': name, 'Value': value, 'Unit': unit}
+
+
+class TestLoadQuotas(object):
+
+    def setup(self):
+        self.cls = ServiceQuotasClient({'foo': 'bar'})
+
+    def test_listed(self):
+        self.cls._cache = {'scode': {}}
+        with patch.multiple(
+            pb, autospec=True, quotas_for_service=DEFAULT,
+            _get_quotas_by_code=DEFAULT
+        ) as mocks:
+            self.cls.load_quotas('scode', ['L-1'])
+        assert mocks['quotas_for_service'].mock_calls == []
+        assert mocks['_get_quotas_by_code'].mock_calls == []
+
+    def test_no_code(self):
+        with patch.multiple(
+            pb, autospec=True, quotas_for_service=DEFAULT,
+            _get_quotas_by_code=DEFAULT
+        ) as mocks:
+            self.cls.load_quotas('scode', ['L-1', None])
+        assert mocks['quotas_for_service'].mock_calls == [
+            call(self.cls, 'scode')
+        ]
+        assert mocks['_get_quotas_by_code'].mock_calls == []
+
+    def test_too_many(self):
+        codes = ['L-%d' % x for x in range(6)]
+        with patch.multiple(
+            pb, autospec=True, quotas_for_service=DEFAULT,
+            _get_quotas_by_code=DEFAULT
+        ) as mocks:
+            self.cls.load_quotas('scode', codes)
+            self.cls.load_quotas('scode', codes[:5] + codes[:5])
+        assert mocks['quotas_for_service'].mock_calls == [
+            call(self.cls, 'scode')
+        ]
+        assert mocks['_get_quotas_by_code'].mock_calls == [
+            call(self.cls, 'scode', codes[:5])
+        ]
+
+    def test_targeted(self):
+        self.cls._by_code = {'scode': {'L-2': None}}
+        with patch.multiple(
+            pb, autospec=True, quotas_for_service=DEFAULT,
+            _get_quotas_by_code=DEFAULT
+        ) as mocks:
+            self.cls.load_quotas('scode', ['L-3', 'L-2', 'L-1'])
+        assert mocks['quotas_for_service'].mock_calls == []
+        assert mocks['_get_quotas_by_code'].mock_calls == [
+            call(self.cls, 'scode', ['L-1', 'L-3'])
+        ]
+
+
+class TestGetQuotasByCode(object):
+
+    def setup(self):
+        self.cls = ServiceQuotasClient({'foo': 'bar'})
+
+    def test_empty(self):
+        with patch('%s.connect' % pb, autospec=True) as m_connect:
+            self.cls._get_quotas_by_code('scode', [])
+        assert m_connect.mock_calls == []
+        assert self.cls._by_code == {}
+
+    def test_get(self):
+        q1 = quota('L-1', 'One')
+
+        def se_get(_, service_code, quota_code):
+            if quota_code == 'L-1':
+                return q1
+            return None
+
+        self.cls._by_code = {'scode': {'L-0': None}}
+        with patch('%s.connect' % pb, autospec=True) as m_connect:
+            with patch('%s._get_service_quota' % pb,
+                       autospec=True) as m_get:
+                m_get.side_effect = se_get
+                self.cls._get_quotas_by_code('scode', ['L-1', 'L-2'])
+        assert m_connect.mock_calls == [call(self.cls)]
+        assert sorted(m_get.mock_calls) == [
+            call(self.cls, 'scode', 'L-1'),
+            call(self.cls, 'scode', 'L-2')
+        ]
+        assert self.cls._by_code == {
+            'scode': {'L-0': None, 'L-1': q1, 'L-2': None}
+        }
+
+
+class TestGetServiceQuota(object):
+
+    def setup(self):
+        self.cls = ServiceQuotasClient({'foo': 'bar'})
+        self.cls.conn = Mock()
+
+    def test_happy_path(self):
+        q = quota('L-1', 'One')
+        self.cls.conn.get_service_quota.return_value = {'Quota': q}
+        assert self.cls._get_service_quota('scode', 'L-1') == q
+        assert self.cls.conn.mock_calls == [
+            call.get_service_quota(ServiceCode='scode', QuotaCode='L-1')
+        ]
+
+    def test_no_such_resource(self):
+        self.cls.conn.get_service_quota.side_effect = ClientError(
+            {'Error': {'Code': 'NoSuchResourceException', 'Message': 'x'}},
+            'GetServiceQuota'
+        )
+        assert self.cls._get_service_quota('scode', 'L-1') is None
+
+    def test_other_exception(self):
+        self.cls.conn.get_service_quota.side_effect = ClientError(
+            {'Error': {'Code': 'AccessDeniedException', 'Message': 'x'}},
+            'GetServiceQuota'
+        )
+        with pytest.raises(ClientError):
+            self.cls._get_service_quota('scode', 'L-1')
+
+
+class TestGetQuotaValueByCode(object):
+
+    def setup(self):
+        self.cls = ServiceQuotasClient({'foo': 'bar'})
+
+    def test_cached_code(self):
+        self.cls._by_code = {'scode': {'L-1': quota('L-1', 'Other Name')}}
+        with patch('%s._get_quotas_by_code' % pb, autospec=True) as m_get:
+            res = self.cls.get_quota_value('scode', 'Name', quota_code='L-1')
+        assert res == 12.3
+        assert m_get.mock_calls == []
+
+    def test_get_code(self):
+
+        def se_get(cls, service_code, quota_codes):
+            cls._by_code.setdefault(service_code, {})['L-1'] = quota(
+                'L-1', 'Name', value=7
+            )
+
+        with patch('%s._get_quotas_by_code' % pb, autospec=True) as m_get:
+            m_get.side_effect = se_get
+            res = self.cls.get_quota_value('scode', 'Name', quota_code='L-1')
+        assert res == 7
+        assert m_get.mock_calls == [call(self.cls, 'scode', ['L-1'])]
+
+    def test_name_fallback_keeps_codes(self):
+        # L-1 was got by code, L-2 does not exist; falling back to listing
+        # the service by name must not forget L-1
+        self.cls._by_code = {'scode': {'L-1': quota('L-1', 'One', value=1)}}
+        self.cls.conn = Mock()
+        self.cls.conn.get_service_quota.side_effect = ClientError(
+            {'Error': {'Code': 'NoSuchResourceException', 'Message': 'x'}},
+            'GetServiceQuota'
+        )
+        self.cls.conn.get_paginator.return_value.paginate.return_value = [
+            {'Quotas': [quota('L-9', 'Two', value=2)]}
+        ]
+        with patch('%s.connect' % pb, autospec=True):
+            assert self.cls.get_quota_value(
+                'scode', 'Two', quota_code='L-2'
+            ) == 2
+            assert self.cls.get_quota_value(
+                'scode', 'One', quota_code='L-1'
+            ) == 1
+        assert self.cls._cache == {'scode': {'two': quota('L-9', 'Two', 2)}}
+        assert self.cls._by_code == {'scode': {
+            'L-1': quota('L-1', 'One', value=1),
+            'L-2': None,
+            'L-9': quota('L-9', 'Two', value=2)
+        }}
+        assert self.cls.conn.get_paginator.call_count == 1
+
+    def test_listed_missing_code_falls_back_to_name(self):
+        q = quota('L-9', 'Name', value=4)
+        self.cls._cache = {'scode': {'name': q}}
+        self.cls._by_code = {'scode': {'L-9': q}}
+        with patch('%s._get_quotas_by_code' % pb, autospec=True) as m_get:
+            res = self.cls.get_quota_value('scode', 'NAME', quota_code='L-1')
+        assert res == 4
+        assert m_get.mock_calls == []
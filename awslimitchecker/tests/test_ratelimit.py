@@ -0,0 +1,269 @@
+"""
+awslimitchecker/tests/test_ratelimit.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import sys
+
+import boto3
+import pytest
+from botocore.awsrequest import AWSResponse
+
+from awslimitchecker.ratelimit import RateLimiter, TokenBucket, DEFAULT_RATE
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, call, Mock
+else:
+    from unittest.mock import patch, call, Mock
+
+pbm = 'awslimitchecker.ratelimit'
+
+
+class FakeClock(object):
+    """Stand-in for the ratelimit module's ``time`` module."""
+
+    def __init__(self, now=100.0):
+        self.now = now
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, secs):
+        self.sleeps.append(secs)
+        self.now += secs
+
+
+class TestTokenBucket(object):
+
+    def setup(self):
+        self.clock = FakeClock()
+        with patch('%s.time' % pbm, self.clock):
+            self.cls = TokenBucket(2.0)
+
+    def test_init(self):
+        assert self.cls.rate == 2.0
+        assert self.cls.max_rate == 2.0
+        assert self.cls.min_rate == 0.5
+        assert TokenBucket(0.25).min_rate == 0.25
+
+    def test_acquire_burst_then_wait(self):
+        with patch('%s.time' % pbm, self.clock):
+            assert self.cls.acquire() == 0
+            assert self.cls.acquire() == 0
+            assert self.cls.acquire() == 0.5
+            assert self.cls.acquire() == 0.5
+        assert self.clock.sleeps == [0.5, 0.5]
+
+    def test_acquire_refills(self):
+        with patch('%s.time' % pbm, self.clock):
+            self.cls.acquire()
+            self.cls.acquire()
+            self.clock.now += 10
+            # the bucket holds at most one second's worth of tokens
+            assert self.cls.acquire() == 0
+            assert self.cls.acquire() == 0
+            assert self.cls.acquire() == 0.5
+
+    def test_on_throttle(self):
+        with patch('%s.time' % pbm, self.clock):
+            self.cls.on_throttle()
+            assert self.cls.rate == 1.0
+            # within the cooldown
+            self.clock.now += 0.5
+            self.cls.on_throttle()
+            assert self.cls.rate == 1.0
+            self.clock.now += 1
+            self.cls.on_throttle()
+            assert self.cls.rate == 0.5
+            self.clock.now += 1
+            self.cls.on_throttle()
+            assert self.cls.rate == 0.5
+            # capacity shrinks with the rate
+            assert self.cls._tokens == 1.0
+
+    def test_on_success(self):
+        with patch('%s.time' % pbm, self.clock):
+            self.cls.on_success()
+            assert self.cls.rate == 2.0
+            self.cls.on_throttle()
+            self.clock.now += 0.5
+            self.cls.on_success()
+            assert self.cls.rate == 1.5
+            self.clock.now += 10
+            self.cls.on_success()
+            assert self.cls.rate == 2.0
+
+
+class TestRateLimiter(object):
+
+    def setup(self):
+        self.cls = RateLimiter()
+
+    def test_defaults(self):
+        assert self.cls.default_rate == DEFAULT_RATE
+        assert self.cls.get_rates() == {}
+
+    def test_bucket(self):
+        self.cls.set_rate('ec2', 10)
+        b1 = self.cls.bucket('123', 'us-east-1', 'ec2')
+        assert self.cls.bucket('123', 'us-east-1', 'ec2') is b1
+        assert b1.rate == 10
+        b2 = self.cls.bucket(None, 'us-east-1', 'ec2')
+        assert b2 is not b1
+        assert self.cls.bucket(None, 'us-west-2', 's3').rate == DEFAULT_RATE
+        assert self.cls.get_rates() == {
+            ('123', 'us-east-1', 'ec2'): 10,
+            (None, 'us-east-1', 'ec2'): 10,
+            (None, 'us-west-2', 's3'): DEFAULT_RATE
+        }
+
+    def test_set_rate_replaces_buckets(self):
+        b1 = self.cls.bucket('123', 'us-east-1', 'ec2')
+        b2 = self.cls.bucket('123', 'us-east-1', 's3')
+        self.cls.set_rate('ec2', 5.5)
+        b3 = self.cls.bucket('123', 'us-east-1', 'ec2')
+        assert b3 is not b1
+        assert b3.rate == 5.5
+        assert self.cls.bucket('123', 'us-east-1', 's3') is b2
+
+    def test_set_rate_invalid(self):
+        with pytest.raises(ValueError) as excinfo:
+            self.cls.set_rate('ec2', 0)
+        assert str(excinfo.value) == 'Rate for ec2 API must be greater than 0'
+
+    def test_reset(self):
+        self.cls.set_rate('ec2', 5)
+        self.cls.bucket('123', 'us-east-1', 'ec2')
+        self.cls.reset()
+        assert self.cls.get_rates() == {}
+        assert self.cls.bucket('123', 'us-east-1', 'ec2').rate == DEFAULT_RATE
+
+    def test_register(self):
+        client = Mock()
+        client.meta.region_name = 'rname'
+        self.cls.register(client, 'ec2', account_id='123')
+        calls = client.meta.events.register.mock_calls
+        assert [c[1][0] for c in calls] == ['before-send', 'needs-retry']
+        assert calls[0][1][1].func == self.cls._before_send
+        assert calls[0][1][1].args == (('123', 'rname', 'ec2'),)
+        assert calls[1][1][1].func == self.cls._needs_retry
+        assert calls[1][1][1].args == (('123', 'rname', 'ec2'),)
+
+    def test_before_send(self):
+        bucket = Mock(spec_set=TokenBucket)
+        bucket.acquire.side_effect = [0, 0.25]
+        with patch('%s.RateLimiter.bucket' % pbm) as mock_bucket:
+            mock_bucket.return_value = bucket
+            with patch('%s.logger' % pbm) as mock_logger:
+                assert self.cls._before_send(('a', 'r', 'ec2'), x=1) is None
+                assert self.cls._before_send(('a', 'r', 'ec2'), x=1) is None
+        assert mock_bucket.call_args_list == [
+            call('a', 'r', 'ec2'), call('a', 'r', 'ec2')
+        ]
+        assert bucket.mock_calls == [call.acquire(), call.acquire()]
+        assert mock_logger.mock_calls == [
+            call.debug('Waited %.3fs for %s API rate limit', 0.25,
+                       ('a', 'r', 'ec2'))
+        ]
+
+    def test_needs_retry(self):
+        key = ('a', 'r', 'ec2')
+        bucket = Mock(spec_set=TokenBucket)
+        with patch('%s.RateLimiter.bucket' % pbm) as mock_bucket:
+            mock_bucket.return_value = bucket
+            self.cls._needs_retry(key, response=None, caught_exception=Mock())
+            assert bucket.mock_calls == []
+            self.cls._needs_retry(key, response=(
+                Mock(status_code=503),
+                {'Error': {'Code': 'RequestLimitExceeded'}}
+            ))
+            assert bucket.mock_calls == [call.on_throttle()]
+            self.cls._needs_retry(key, response=(
+                Mock(status_code=400), {'Error': {'Code': 'InvalidParameter'}}
+            ))
+            assert bucket.mock_calls == [call.on_throttle()]
+            self.cls._needs_retry(key, response=(Mock(status_code=200), {}))
+        assert bucket.mock_calls == [call.on_throttle(), call.on_success()]
+
+
+class RawBody(object):
+
+    def __init__(self, body):
+        self.body = body
+
+    def stream(self, **kwargs):
+        yield self.body
+
+
+class TestRateLimiterClient(object):
+
+    def test_throttled_client(self):
+        """the limiter sees every attempt of a real botocore client"""
+        throttled = b'<Response><Errors><Error><Code>RequestLimitExceeded' \
+                    b'</Code><Message>x</Message></Error></Errors>' \
+                    b'<RequestID>1</RequestID></Response>'
+        ok = b'<DescribeVpcsResponse><vpcSet/></DescribeVpcsResponse>'
+        bodies = [(503, throttled), (200, ok)]
+
+        def fake_send(request, **kwargs):
+            status, body = bodies.pop(0)
+            return AWSResponse(request.url, status, {}, RawBody(body))
+
+        cls = RateLimiter()
+        client = boto3.client(
+            'ec2', region_name='us-east-1', aws_access_key_id='ak',
+            aws_secret_access_key='sk'
+        )
+        cls.register(client, 'ec2', account_id='123')
+        client.meta.events.register('before-send', fake_send)
+        bucket = cls.bucket('123', 'us-east-1', 'ec2')
+        with patch.object(bucket, 'acquire', wraps=bucket.acquire) as m_acq:
+            with patch.object(
+                bucket, 'on_throttle', wraps=bucket.on_throttle
+            ) as m_thr:
+                # skip the retry backoff
+                with patch('time.sleep'):
+                    assert client.describe_vpcs()['Vpcs'] == []
+        assert len(m_acq.mock_calls) == 2
+        assert m_thr.mock_calls == [call()]
+        assert bodies == []
@@ -38,16 +38,24 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 import argparse
+import os
+import subprocess
 import pytest
 import sys
 import logging
 import json
+import time
+import tabulate
 import termcolor
 from freezegun import freeze_time
 
 from awslimitchecker.runner import Runner, console_entry_point
+from awslimitchecker.catalog import LimitCatalog
 from awslimitchecker.checker import AwsLimitChecker
+from awslimitchecker.services import _services
 from awslimitchecker.limit import AwsLimit, AwsLimitUsage
+from awslimitchecker.limitindex import LimitIndex
+from awslimitchecker.multiregion import MultiRegionChecker
 from awslimitchecker.utils import StoreKeyValuePair
 from .support import sample_limits, sample_limits_api
 
@@ -57,9 +65,11 @@ if (
         sys.version_info[0] < 3 or
         sys.version_info[0] == 3 and sys.version_info[1] < 4
 ):
-    from mock import patch, call, Mock, mock_open, PropertyMock
+    from mock import patch, call, Mock, mock_open, PropertyMock, DEFAULT
 else:
-    from unittest.mock import patch, call, Mock, mock_open, PropertyMock
+    from unittest.mock import (
+        patch, call, Mock, mock_open, PropertyMock, DEFAULT
+    )
 
 
 def red(s):
@@ -103,6 +113,9 @@ class TestInit(RunnerTester):
     def test_init(self):
         assert self.cls.colorize is True
         assert self.cls.checker is None
+        assert self.cls.catalog is None
+        assert self.cls.region is None
+        assert self.cls.multi_region is False
         assert self.cls.skip_ta is False
         assert self.cls.service_name is None
         assert len(self.cls.skip_check) == 0
@@ -141,7 +154,10 @@ class TestParseArgs(RunnerTester):
                  'information on the source code location.'
         with patch('awslimitchecker.runner.argparse.ArgumentParser',
                    spec_set=argparse.ArgumentParser) as mock_parser:
-            mock_result = Mock(ta_refresh_wait=True)
+            mock_result = Mock(
+                ta_refresh_wait=True, run_timeout=None, service_timeout=[],
+                api_rate={}, service=None
+            )
             mock_parser.return_value.parse_args.return_value = mock_result
             self.cls.parse_args(argv)
         assert mock_parser.mock_calls == [
@@ -231,7 +247,9 @@ class TestParseArgs(RunnerTester):
             call().add_argument('-r', '--region', action='store',
                                 type=str, default=None,
                                 help='AWS region name to connect to; required '
-                                'for STS'),
+                                'for STS. A comma-separated list of region '
+                                'names, or "all" for every enabled region, '
+                                'checks several regions concurrently'),
             call().add_argument('--role-partition', action='store', type=str,
                                 default='aws',
                                 help='AWS partition name to use for '
@@ -279,12 +297,51 @@ class TestParseArgs(RunnerTester):
                                      'wait up to this number of seconds '
                                      'before continuing on anyway.',
                                 type=int),
+            call().add_argument('--no-ta-cache', action='store_false',
+                                default=True, dest='ta_cache',
+                                help='do not cache Trusted Advisor results '
+                                     'on disk'),
+            call().add_argument('--columnar-thresholds', action='store_true',
+                                default=False, dest='columnar_thresholds',
+                                help='evaluate all thresholds in one '
+                                     'vectorized pass (uses numpy if '
+                                     'installed)'),
+            call().add_argument('--run-timeout', dest='run_timeout',
+                                type=float, action='store', default=None,
+                                metavar='SECONDS',
+                                help='stop collecting usage after this many '
+                                     'seconds; services that have not '
+                                     'finished are reported as unknown, and '
+                                     'thresholds are checked for the rest'),
+            call().add_argument('--service-timeout', dest='service_timeout',
+                                action='append', default=[],
+                                metavar='[SERVICE=]SECONDS',
+                                help='abandon a service that takes longer '
+                                     'than this many seconds to collect '
+                                     'usage, reporting it as unknown. '
+                                     'Without a service name, applies to all '
+                                     'services. Can be specified multiple '
+                                     'times.'),
+            call().add_argument('--api-rate', action=StoreKeyValuePair,
+                                dest='api_rate', metavar='API=RATE',
+                                help='limit requests to an AWS API (e.g. '
+                                     '"ec2") to at most this many per '
+                                     'second, per account and region; the '
+                                     'rate is lowered automatically when '
+                                     'requests are throttled. Can be '
+                                     'specified multiple times.'),
             call().add_argument('--no-color', action='store_true',
                                 default=False,
                                 help='do not colorize output'),
             call().add_argument('--no-check-version', action='store_false',
                                 default=True, dest='check_version',
                                 help='do not check latest version at startup'),
+            call().add_argument('--version-check-interval',
+                                dest='version_check_interval',
+                                type=int, action='store', default=86400,
+                                help='cache the latest version check result '
+                                     'for this many seconds (default: 86400);'
+                                     ' 0 to disable the cache'),
             call().add_argument('-v', '--verbose', dest='verbose',
                                 action='count',
                                 default=0,
@@ -429,6 +486,103 @@ class TestParseArgs(RunnerTester):
         assert res.role_partition == 'foo'
         assert res.ta_api_region == 'bar'
 
+    def test_no_ta_cache(self):
+        assert self.cls.parse_args([]).ta_cache is True
+        assert self.cls.parse_args(['--no-ta-cache']).ta_cache is False
+
+    def test_columnar_thresholds(self):
+        assert self.cls.parse_args([]).columnar_thresholds is False
+        res = self.cls.parse_args(['--columnar-thresholds'])
+        assert res.columnar_thresholds is True
+
+    def test_run_timeout(self):
+        assert self.cls.parse_args([]).run_timeout is None
+        assert self.cls.parse_args(['--run-timeout=90']).run_timeout == 90.0
+
+    def test_run_timeout_invalid(self, capsys):
+        with pytest.raises(SystemExit):
+            self.cls.parse_args(['--run-timeout=0'])
+        out, err = capsys.readouterr()
+        assert '--run-timeout must be greater than zero' in err
+
+    def test_service_timeout(self):
+        assert self.cls.parse_args([]).service_timeout is None
+        res = self.cls.parse_args(['--service-timeout=30'])
+        assert res.service_timeout == 30.0
+        res = self.cls.parse_args(['--service-timeout=EC2=60'])
+        assert res.service_timeout == {'EC2': 60.0}
+
+    def test_service_timeout_default_and_named(self):
+        with patch.dict(
+            '%s._services' % pb, {'EC2': Mock(), 'VPC': Mock()}, clear=True
+        ):
+            res = self.cls.parse_args([
+                '--service-timeout=EC2=60', '--service-timeout=30'
+            ])
+        assert res.service_timeout == {'EC2': 60.0, 'VPC': 30.0}
+
+    def test_service_timeout_invalid(self, capsys):
+        for value, msg in [
+            ('foo', 'invalid --service-timeout: foo'),
+            ('EC2=0', 'invalid --service-timeout: EC2=0'),
+            ('Foo=1', 'unknown service in --service-timeout: Foo')
+        ]:
+            with pytest.raises(SystemExit):
+                self.cls.parse_args(['--service-timeout=%s' % value])
+            out, err = capsys.readouterr()
+            assert msg in err
+
+    def test_service_unknown(self, capsys):
+        assert self.cls.parse_args(['-S', 'EC2', 'VPC']).service == [
+            'EC2', 'VPC'
+        ]
+        with pytest.raises(SystemExit) as excinfo:
+            self.cls.parse_args(['-S', 'EC2', 'Foo'])
+        assert excinfo.value.code == 2
+        out, err = capsys.readouterr()
+        assert 'unknown service in --service: Foo' in err
+
+    def test_api_rate(self):
+        assert self.cls.parse_args([]).api_rate == {}
+        res = self.cls.parse_args(['--api-rate=ec2=10', '--api-rate=elbv2=2.5'])
+        assert res.api_rate == {'ec2': 10.0, 'elbv2': 2.5}
+
+    def test_api_rate_invalid(self, capsys):
+        for value in ['ec2=foo', 'ec2=0']:
+            with pytest.raises(SystemExit):
+                self.cls.parse_args(['--api-rate=%s' % value])
+            out, err = capsys.readouterr()
+            assert 'invalid --api-rate: %s' % value in err
+
+    def test_version_check_interval(self):
+        assert self.cls.parse_args([]).version_check_interval == 86400
+        res = self.cls.parse_args(['--version-check-interval=0'])
+        assert res.version_check_interval == 0
+
+
+class TestRegions(RunnerTester):
+
+    @pytest.mark.parametrize('region, expected', [
+        (None, None),
+        ('us-east-1', None),
+        ('us-east-1,', None),
+        ('all', 'all'),
+        ('us-east-1,us-west-2', ['us-east-1', 'us-west-2']),
+        (' eu-west-1 , us-east-1', ['eu-west-1', 'us-east-1']),
+    ])
+    def test_regions(self, region, expected):
+        args = Mock(region=region)
+        assert self.cls._regions(args) == expected
+
+    def test_per_region_single(self):
+        assert self.cls._per_region({'foo': 1}) == [('', {'foo': 1})]
+
+    def test_per_region_multi(self):
+        self.cls.multi_region = True
+        assert self.cls._per_region({'r2': 2, 'r1': 1}) == [
+            ('r1/', 1), ('r2/', 2)
+        ]
+
 
 class TestListServices(RunnerTester):
 
@@ -447,6 +601,15 @@ class TestListServices(RunnerTester):
             call.get_service_names()
         ]
 
+    def test_catalog(self, capsys):
+        mock_catalog = Mock(spec_set=LimitCatalog)
+        mock_catalog.get_service_names.return_value = ['Foo', 'Bar']
+        self.cls.catalog = mock_catalog
+        self.cls.list_services()
+        out, err = capsys.readouterr()
+        assert out == 'Bar\nFoo\n'
+        assert mock_catalog.mock_calls == [call.get_service_names()]
+
 
 class TestIamPolicy(RunnerTester):
 
@@ -465,6 +628,15 @@ class TestIamPolicy(RunnerTester):
             call.get_required_iam_policy()
         ]
 
+    def test_catalog(self, capsys):
+        mock_catalog = Mock(spec_set=LimitCatalog)
+        mock_catalog.get_required_iam_policy.return_value = {'foo': 'bar'}
+        self.cls.catalog = mock_catalog
+        self.cls.iam_policy()
+        out, err = capsys.readouterr()
+        assert json.loads(out) == {'foo': 'bar'}
+        assert mock_catalog.mock_calls == [call.get_required_iam_policy()]
+
 
 class TestListDefaults(RunnerTester):
 
@@ -479,7 +651,7 @@ class TestListDefaults(RunnerTester):
         out, err = capsys.readouterr()
         assert out == 'd2cval\n'
         assert mock_checker.mock_calls == [
-            call.get_limits(service=None)
+            call.get_limits(service=None, use_ta=False, use_api=False)
         ]
         assert mock_d2c.mock_calls == [
             call({
@@ -503,7 +675,7 @@ class TestListDefaults(RunnerTester):
         out, err = capsys.readouterr()
         assert out == 'd2cval\n'
         assert mock_checker.mock_calls == [
-            call.get_limits(service=['SvcFoo'])
+            call.get_limits(service=['SvcFoo'], use_ta=False, use_api=False)
         ]
         assert mock_d2c.mock_calls == [
             call({
@@ -511,6 +683,191 @@ class TestListDefaults(RunnerTester):
             })
         ]
 
+    def test_catalog(self, capsys):
+        mock_catalog = Mock(spec_set=LimitCatalog)
+        mock_catalog.get_default_limits.return_value = {
+            'SvcBar': {'barlimit1': 1, 'bar limit2': None},
+            'SvcFoo': {'foo limit3': 3}
+        }
+        self.cls.catalog = mock_catalog
+        self.cls.region = 'us-east-1'
+        with patch('awslimitchecker.runner.dict2cols',
+                   autospec=True) as mock_d2c:
+            mock_d2c.return_value = 'd2cval'
+            self.cls.list_defaults()
+        out, err = capsys.readouterr()
+        assert out == 'd2cval\n'
+        assert mock_catalog.mock_calls == [
+            call.get_default_limits('us-east-1')
+        ]
+        assert mock_d2c.mock_calls == [
+            call({
+                'SvcBar/bar limit2': 'None',
+                'SvcBar/barlimit1': '1',
+                'SvcFoo/foo limit3': '3',
+            })
+        ]
+
+
+class TestMetadataCatalog(RunnerTester):
+
+    def setup(self):
+        super(TestMetadataCatalog, self).setup()
+        self.mock_catalog = Mock(spec_set=LimitCatalog)
+        self.mock_catalog.supports_region.return_value = True
+
+    def _run(self, argv, region='us-west-2'):
+        args = self.cls.parse_args(argv)
+        with patch('%s.LimitCatalog.load' % pb) as mock_load:
+            mock_load.return_value = self.mock_catalog
+            with patch('%s.Runner._configured_region' % pb) as mock_sess:
+                mock_sess.return_value = region
+                res = self.cls._metadata_catalog(args)
+        return res, mock_load, mock_sess
+
+    def test_not_metadata(self):
+        for argv in [[], ['-l'], ['--iam-policy', '-l'], ['-u']]:
+            res, mock_load, _ = self._run(argv)
+            assert res is None
+            assert mock_load.mock_calls == []
+
+    def test_overrides(self):
+        for argv in [
+            ['-s', '-V'],
+            ['--list-defaults', '-L', 'EC2/Foo=2'],
+            ['--iam-policy', '--limit-override-json=foo.json'],
+            ['-s', '--threshold-override-json=foo.json']
+        ]:
+            res, mock_load, _ = self._run(argv)
+            assert res is None
+            assert mock_load.mock_calls == []
+
+    def test_list_services(self):
+        res, mock_load, mock_sess = self._run(['-s'])
+        assert res == self.mock_catalog
+        assert mock_load.mock_calls == [call()]
+        assert mock_sess.mock_calls == []
+        assert self.cls.region is None
+
+    def test_iam_policy_selected(self):
+        res, _, mock_sess = self._run(['--iam-policy', '-S', 'EC2'])
+        assert res == self.mock_catalog.for_services.return_value
+        assert self.mock_catalog.mock_calls == [call.for_services(['EC2'])]
+        assert mock_sess.mock_calls == []
+
+    def test_unknown_service(self):
+        self.mock_catalog.for_services.return_value = None
+        res, _, _ = self._run(['-s', '-S', 'EC2'])
+        assert res is None
+
+    def test_no_catalog(self):
+        self.mock_catalog = None
+        res, _, _ = self._run(['-s'])
+        assert res is None
+
+    def test_list_defaults(self):
+        res, _, mock_sess = self._run(['--list-defaults', '-P', 'myprof'])
+        assert res == self.mock_catalog
+        assert self.cls.region == 'us-west-2'
+        assert mock_sess.mock_calls[0] == call('myprof')
+        assert self.mock_catalog.mock_calls == [
+            call.supports_region('us-west-2')
+        ]
+
+    def test_list_defaults_region_arg(self):
+        res, _, mock_sess = self._run(['--list-defaults', '-r', 'eu-west-1'])
+        assert res == self.mock_catalog
+        assert self.cls.region == 'eu-west-1'
+        assert mock_sess.mock_calls == []
+
+    def test_list_defaults_unsupported_region(self):
+        self.mock_catalog.supports_region.return_value = False
+        res, _, _ = self._run(['--list-defaults'], region='cn-north-1')
+        assert res is None
+
+    def test_list_defaults_no_region(self):
+        res, _, _ = self._run(['--list-defaults'], region=None)
+        assert res is None
+        assert self.mock_catalog.mock_calls == []
+
+    def test_list_defaults_session_error(self):
+        args = self.cls.parse_args(['--list-defaults'])
+        with patch('%s.LimitCatalog.load' % pb) as mock_load:
+            mock_load.return_value = self.mock_catalog
+            with patch('%s.Runner._configured_region' % pb) as mock_sess:
+                mock_sess.side_effect = RuntimeError('foo')
+                res = self.cls._metadata_catalog(args)
+        assert res is None
+
+
+class TestConfiguredRegion(RunnerTester):
+
+    def _run(self, tmpdir, profile_name=None, env=None, config=None):
+        path = str(tmpdir.join('config'))
+        if config is not None:
+            with open(path, 'w') as fh:
+                fh.write(config)
+        environ = {'AWS_CONFIG_FILE': path}
+        environ.update(env or {})
+        with patch.dict('os.environ', environ, clear=True):
+            return self.cls._configured_region(profile_name)
+
+    def test_env(self, tmpdir):
+        res = self._run(
+            tmpdir, profile_name='foo',
+            env={'AWS_DEFAULT_REGION': 'eu-west-1'},
+            config='[profile foo]\nregion = us-east-2\n'
+        )
+        assert res == 'eu-west-1'
+
+    def test_no_config(self, tmpdir):
+        assert self._run(tmpdir) is None
+
+    def test_default_profile(self, tmpdir):
+        res = self._run(
+            tmpdir, config='[default]\nregion = us-east-2\n'
+                           '[profile foo]\nregion = eu-west-1\n'
+        )
+        assert res == 'us-east-2'
+
+    def test_profile_name(self, tmpdir):
+        res = self._run(
+            tmpdir, profile_name='foo',
+            env={'AWS_PROFILE': 'bar'},
+            config='[default]\nregion = us-east-2\n'
+                   '[profile foo]\nregion = eu-west-1\n'
+                   '[profile bar]\nregion = ap-south-1\n'
+        )
+        assert res == 'eu-west-1'
+
+    def test_profile_env(self, tmpdir):
+        res = self._run(
+            tmpdir, env={'AWS_PROFILE': 'bar'},
+            config='[default]\nregion = us-east-2\n'
+                   '[profile bar]\nregion = ap-south-1\n'
+        )
+        assert res == 'ap-south-1'
+
+    def test_profile_no_region(self, tmpdir):
+        res = self._run(
+            tmpdir, profile_name='foo',
+            config='[default]\nregion = us-east-2\n[foo]\nregion = x\n'
+        )
+        assert res is None
+
+
+class TestPrintLicenseNotice(RunnerTester):
+
+    def test_notice(self, capsys):
+        with patch('%s._get_version_info' % pb) as mock_vi:
+            mock_vi.return_value = self.mock_ver_info
+            self.cls._print_license_notice()
+        out, err = capsys.readouterr()
+        assert out == ''
+        assert err == 'awslimitchecker 1.2.3@mytag is AGPL-licensed free ' \
+                      'software; all users have a right to the full source ' \
+                      'code of this version. See <http://myurl>\n'
+
 
 class TestListLimits(RunnerTester):
 
@@ -561,6 +918,31 @@ class TestListLimits(RunnerTester):
             })
         ]
 
+    def test_multi_region(self, capsys):
+        mock_checker = Mock(spec_set=MultiRegionChecker)
+        mock_checker.get_limits.return_value = {
+            'r2': {'SvcBar': sample_limits_api()['SvcBar']},
+            'r1': {'SvcBar': sample_limits_api()['SvcBar']},
+        }
+        self.cls.checker = mock_checker
+        self.cls.multi_region = True
+        with patch('awslimitchecker.runner.dict2cols') as mock_d2c:
+            mock_d2c.return_value = 'd2cval'
+            self.cls.list_limits()
+        out, err = capsys.readouterr()
+        assert out == 'd2cval\n'
+        assert mock_checker.mock_calls == [
+            call.get_limits(use_ta=True, service=None)
+        ]
+        assert mock_d2c.mock_calls == [
+            call({
+                'r1/SvcBar/bar limit2': '99',
+                'r1/SvcBar/barlimit1': '1',
+                'r2/SvcBar/bar limit2': '99',
+                'r2/SvcBar/barlimit1': '1',
+            })
+        ]
+
 
 class TestSetLimitOverride(RunnerTester):
 
@@ -609,7 +991,7 @@ class TestLoadJson(RunnerTester):
         with patch(
             '%s.open' % pb, mock_open(read_data=data), create=True
         ) as m_open:
-            with patch('%s.boto3.client' % pb) as m_client:
+            with patch('boto3.client') as m_client:
                 m_client.return_value = mock_client
                 res = self.cls.load_json('/foo/bar/baz.json')
         assert m_open.mock_calls == [
@@ -633,7 +1015,7 @@ class TestLoadJson(RunnerTester):
         with patch(
             '%s.open' % pb, mock_open(read_data=data), create=True
         ) as m_open:
-            with patch('%s.boto3.client' % pb) as m_client:
+            with patch('boto3.client') as m_client:
                 m_client.return_value = mock_client
                 res = self.cls.load_json(
                     's3://bucketname/key/foo/bar/baz.json'
@@ -657,7 +1039,7 @@ class TestLoadJson(RunnerTester):
         with patch(
             '%s.open' % pb, mock_open(read_data=data), create=True
         ) as m_open:
-            with patch('%s.boto3.client' % pb) as m_client:
+            with patch('boto3.client') as m_client:
                 m_client.return_value = mock_client
                 res = self.cls.load_json('/foo/bar/baz.json')
         assert m_open.mock_calls == [
@@ -681,7 +1063,7 @@ class TestLoadJson(RunnerTester):
         with patch(
             '%s.open' % pb, mock_open(read_data=data), create=True
         ) as m_open:
-            with patch('%s.boto3.client' % pb) as m_client:
+            with patch('boto3.client') as m_client:
                 m_client.return_value = mock_client
                 res = self.cls.load_json(
                     's3://bucketname/key/foo/bar/baz.json'
@@ -829,16 +1211,12 @@ class TestCheckThresholds(RunnerTester):
         mock_checker.check_thresholds.return_value = {}
         mock_lim1 = Mock()
         mock_lim2 = Mock()
-        mock_lim3 = Mock()
-        mock_checker.get_limits.return_value = {
-            'S1': {
-                'lim1': mock_lim1,
-                'lim2': mock_lim2
-            },
-            'S2': {
-                'lim3': mock_lim3
-            }
-        }
+        mock_index = Mock(spec_set=LimitIndex)
+        mock_index.iter_limits.return_value = iter([
+            ('S1', 'lim1', mock_lim1),
+            ('S1', 'lim2', mock_lim2)
+        ])
+        mock_checker.get_limit_index.return_value = mock_index
         mock_metrics = Mock()
         self.cls.checker = mock_checker
         self.cls.service_name = ['S1']
@@ -849,7 +1227,8 @@ class TestCheckThresholds(RunnerTester):
         assert out == '\n'
         assert mock_checker.mock_calls == [
             call.check_thresholds(use_ta=True, service=['S1']),
-            call.get_limits()
+            call.get_limit_index(),
+            call.get_limit_index().iter_limits(['S1'])
         ]
         assert res == (0, {}, '')
         assert mock_metrics.mock_calls == [
@@ -945,6 +1324,75 @@ class TestCheckThresholds(RunnerTester):
             },
         }, 'd2cval')
 
+    def test_multi_region(self):
+        mock_limit1 = Mock(spec_set=AwsLimit)
+        type(mock_limit1).name = 'limit1'
+        mock_w1 = Mock(spec_set=AwsLimitUsage)
+        mock_limit1.get_warnings.return_value = [mock_w1]
+        mock_limit1.get_criticals.return_value = []
+        mock_limit2 = Mock(spec_set=AwsLimit)
+        type(mock_limit2).name = 'limit1'
+        mock_c1 = Mock(spec_set=AwsLimitUsage)
+        mock_limit2.get_warnings.return_value = []
+        mock_limit2.get_criticals.return_value = [mock_c1]
+        problems = {
+            'r2': {'svc1': {'limit1': mock_limit2}},
+            'r1': {'svc1': {'limit1': mock_limit1}},
+        }
+        mock_checker = Mock(spec=MultiRegionChecker)
+        mock_checker.check_thresholds.return_value = problems
+        mock_index1 = Mock(spec_set=LimitIndex)
+        mock_index1.iter_limits.return_value = iter([
+            ('svc1', 'limit1', mock_limit1)
+        ])
+        mock_index2 = Mock(spec_set=LimitIndex)
+        mock_index2.iter_limits.return_value = iter([
+            ('svc1', 'limit1', mock_limit2)
+        ])
+        mock_checker.checkers = {
+            'r1': Mock(spec_set=AwsLimitChecker),
+            'r2': Mock(spec_set=AwsLimitChecker),
+        }
+        mock_checker.checkers['r1'].get_limit_index.return_value = \
+            mock_index1
+        mock_checker.checkers['r2'].get_limit_index.return_value = \
+            mock_index2
+        mock_m1 = Mock()
+        mock_m2 = Mock()
+
+        def se_print(s, l, c, w, colorize=True):
+            return ('{s}/{l}'.format(s=s, l=l.name), '')
+
+        self.cls.checker = mock_checker
+        self.cls.multi_region = True
+        self.cls.colorize = False
+        with patch('%s.issue_string_tuple' % pb,
+                   autospec=True) as mock_print:
+            mock_print.side_effect = se_print
+            with patch('awslimitchecker.runner.dict2cols') as mock_d2c:
+                mock_d2c.return_value = 'd2cval'
+                res = self.cls.check_thresholds(
+                    metrics={'r2': mock_m2, 'r1': mock_m1}
+                )
+        assert mock_checker.mock_calls == [
+            call.check_thresholds(use_ta=True, service=None)
+        ]
+        assert mock_index1.mock_calls == [call.iter_limits(None)]
+        assert mock_index2.mock_calls == [call.iter_limits(None)]
+        assert mock_m1.mock_calls == [call.add_limit(mock_limit1)]
+        assert mock_m2.mock_calls == [call.add_limit(mock_limit2)]
+        assert mock_print.mock_calls == [
+            call('svc1', mock_limit1, [], [mock_w1], colorize=False),
+            call('svc1', mock_limit2, [mock_c1], [], colorize=False)
+        ]
+        assert mock_d2c.mock_calls == [
+            call({
+                'r1/svc1/limit1': '',
+                'r2/svc1/limit1': '',
+            })
+        ]
+        assert res == (2, problems, 'd2cval')
+
     def test_when_skip_check(self):
         """lots of problems"""
         mock_limit1 = Mock(spec_set=AwsLimit)
@@ -1136,13 +1584,130 @@ class TestCheckThresholds(RunnerTester):
         }, '  \n')
 
 
+class TestCheckThresholdsTimeLimited(RunnerTester):
+
+    def test_unknown(self):
+        mock_limit = Mock(spec_set=AwsLimit)
+        type(mock_limit).name = 'limit1'
+        mock_limit.get_warnings.return_value = []
+        mock_limit.get_criticals.return_value = []
+        mock_checker = Mock(spec_set=AwsLimitChecker)
+        mock_checker.check_thresholds.return_value = {}
+        mock_checker.get_unknown_services.return_value = {
+            'S2': 'did not finish within its 5 second budget'
+        }
+        self.cls.checker = mock_checker
+        self.cls.time_limited = True
+        self.cls.colorize = False
+        with patch('awslimitchecker.runner.dict2cols') as mock_d2c:
+            mock_d2c.return_value = 'd2cval'
+            res = self.cls.check_thresholds()
+        assert mock_checker.mock_calls == [
+            call.check_thresholds(use_ta=True, service=None),
+            call.get_unknown_services()
+        ]
+        assert mock_d2c.mock_calls == [
+            call({'S2': 'UNKNOWN: did not finish within its 5 second budget'})
+        ]
+        assert res == (1, {}, 'd2cval')
+
+    def test_unknown_multi_region(self):
+        mock_checker = Mock(spec_set=MultiRegionChecker)
+        mock_checker.check_thresholds.return_value = {'r1': {}, 'r2': {}}
+        mock_checker.get_unknown_services.return_value = {
+            'r1': {}, 'r2': {'S1': 'slow'}
+        }
+        self.cls.checker = mock_checker
+        self.cls.multi_region = True
+        self.cls.time_limited = True
+        self.cls.colorize = False
+        with patch('awslimitchecker.runner.dict2cols') as mock_d2c:
+            mock_d2c.return_value = 'd2cval'
+            res = self.cls.check_thresholds()
+        assert mock_d2c.mock_calls == [call({'r2/S1': 'UNKNOWN: slow'})]
+        assert res[0] == 1
+
+    def test_metrics_skip_unknown(self):
+        mock_checker = Mock(spec_set=AwsLimitChecker)
+        mock_checker.check_thresholds.return_value = {}
+        mock_checker.get_unknown_services.return_value = {'S1': 'slow'}
+        mock_lim1 = Mock(unknown_reason=None)
+        mock_lim2 = Mock(unknown_reason='slow')
+        mock_index = Mock(spec_set=LimitIndex)
+        mock_index.iter_limits.return_value = iter([
+            ('S1', 'lim1', mock_lim1),
+            ('S1', 'lim2', mock_lim2)
+        ])
+        mock_checker.get_limit_index.return_value = mock_index
+        mock_metrics = Mock()
+        self.cls.checker = mock_checker
+        self.cls.time_limited = True
+        with patch('awslimitchecker.runner.dict2cols') as mock_d2c:
+            mock_d2c.return_value = ''
+            self.cls.check_thresholds(metrics=mock_metrics)
+        assert mock_metrics.mock_calls == [call.add_limit(mock_lim1)]
+
+
+class TestLogServiceDurations(RunnerTester):
+
+    def test_single_region(self):
+        mock_checker = Mock(spec_set=AwsLimitChecker)
+        mock_checker.get_service_durations.return_value = {
+            'S1': 0.5, 'S2': 12.25, 'S3': 0.5
+        }
+        self.cls.checker = mock_checker
+        with patch('%s.logger' % pb, autospec=True) as mock_logger:
+            self.cls._log_service_durations()
+        assert mock_logger.mock_calls == [
+            call.info(
+                'Usage collection time per service:\n%s',
+                tabulate.tabulate(
+                    [['S2', '12.250'], ['S1', '0.500'], ['S3', '0.500']],
+                    headers=['Service', 'Seconds'], tablefmt='simple_outline'
+                )
+            )
+        ]
+
+    def test_multi_region(self):
+        mock_checker = Mock(spec_set=MultiRegionChecker)
+        mock_checker.get_service_durations.return_value = {
+            'r1': {'G1': 2.0, 'S1': 1.0},
+            'r2': {'S1': 3.0}
+        }
+        self.cls.checker = mock_checker
+        self.cls.multi_region = True
+        with patch('%s.logger' % pb, autospec=True) as mock_logger:
+            self.cls._log_service_durations()
+        assert mock_logger.mock_calls == [
+            call.info(
+                'Usage collection time per service:\n%s',
+                tabulate.tabulate(
+                    [
+                        ['r2/S1', '3.000'],
+                        ['r1/G1', '2.000'],
+                        ['r1/S1', '1.000']
+                    ],
+                    headers=['Service', 'Seconds'], tablefmt='simple_outline'
+                )
+            )
+        ]
+
+    def test_none(self):
+        mock_checker = Mock(spec_set=AwsLimitChecker)
+        mock_checker.get_service_durations.return_value = {}
+        self.cls.checker = mock_checker
+        with patch('%s.logger' % pb, autospec=True) as mock_logger:
+            self.cls._log_service_durations()
+        assert mock_logger.mock_calls == []
+
+
 class TestConsoleEntryPoint(RunnerTester):
 
     def test_version(self, capsys):
         argv = ['awslimitchecker', '-V']
         expected = 'awslimitchecker ver (see <foo> for source code)\n'
         with patch.object(sys, 'argv', argv):
-            with patch('%s.AwsLimitChecker' % pb,
+            with patch('awslimitchecker.checker.AwsLimitChecker',
                        spec_set=AwsLimitChecker) as mock_alc:
                 mock_alc.return_value.get_project_url.return_value = 'foo'
                 mock_alc.return_value.get_version.return_value = 'ver'
@@ -1165,9 +1730,16 @@ class TestConsoleEntryPoint(RunnerTester):
                 ta_refresh_mode=None,
                 ta_refresh_timeout=None,
                 check_version=True,
+                version_check_interval=86400,
+                ta_cache=True,
+                columnar_thresholds=False,
+                run_timeout=None,
+                service_timeout=None,
                 role_partition='aws',
                 ta_api_region='us-east-1',
-                skip_quotas=False
+                skip_quotas=False,
+                duration_history=True,
+                services=None
             ),
             call().get_project_url(),
             call().get_version()
@@ -1208,6 +1780,38 @@ class TestConsoleEntryPoint(RunnerTester):
             call(self.cls)
         ]
 
+    @pytest.mark.parametrize('action, method', [
+        ('-s', 'list_services'),
+        ('--list-defaults', 'list_defaults'),
+        ('--iam-policy', 'iam_policy'),
+    ])
+    def test_metadata_from_catalog(self, action, method):
+        argv = ['awslimitchecker', action]
+        mock_catalog = Mock(spec_set=LimitCatalog)
+        with patch.object(sys, 'argv', argv):
+            with patch.multiple(
+                '%s.Runner' % pb,
+                autospec=True,
+                _metadata_catalog=DEFAULT,
+                _print_license_notice=DEFAULT,
+                list_services=DEFAULT,
+                list_defaults=DEFAULT,
+                iam_policy=DEFAULT
+            ) as mocks:
+                mocks['_metadata_catalog'].return_value = mock_catalog
+                with patch('awslimitchecker.checker.AwsLimitChecker') as mock_alc:
+                    with pytest.raises(SystemExit) as excinfo:
+                        self.cls.console_entry_point()
+        assert excinfo.value.code == 0
+        assert mock_alc.mock_calls == []
+        assert self.cls.catalog == mock_catalog
+        assert mocks['_print_license_notice'].mock_calls == [call(self.cls)]
+        for name in ['list_services', 'list_defaults', 'iam_policy']:
+            if name == method:
+                assert mocks[name].mock_calls == [call(self.cls)]
+            else:
+                assert mocks[name].mock_calls == []
+
     def test_list_limits(self):
         argv = ['awslimitchecker', '-l']
         with patch.object(sys, 'argv', argv):
@@ -1226,7 +1830,7 @@ class TestConsoleEntryPoint(RunnerTester):
             with patch('%s.Runner.check_thresholds' % pb,
                        autospec=True) as mock_check:
                 mock_check.return_value = 2, {'Foo': {'Bar': Mock()}}, 'foo'
-                with patch('%s.AwsLimitChecker' % pb, autospec=True) as mock_c:
+                with patch('awslimitchecker.checker.AwsLimitChecker', autospec=True) as mock_c:
                     with pytest.raises(SystemExit) as excinfo:
                         self.cls.console_entry_point()
         assert excinfo.value.code == 2
@@ -1236,7 +1840,14 @@ class TestConsoleEntryPoint(RunnerTester):
                  profile_name=None, region=None, ta_refresh_mode=None,
                  ta_refresh_timeout=None, warning_threshold=80,
                  check_version=True, role_partition='aws',
-                 ta_api_region='us-east-1', skip_quotas=False)
+                 version_check_interval=86400,
+                 ta_cache=True,
+                 columnar_thresholds=False,
+                 run_timeout=None,
+                 service_timeout=None,
+                 ta_api_region='us-east-1', skip_quotas=False,
+                 duration_history=True,
+                 services=None)
         ]
 
     def test_role_partition(self):
@@ -1245,7 +1856,7 @@ class TestConsoleEntryPoint(RunnerTester):
             with patch('%s.Runner.check_thresholds' % pb,
                        autospec=True) as mock_check:
                 mock_check.return_value = 2, {'Foo': {'Bar': Mock()}}, 'foo'
-                with patch('%s.AwsLimitChecker' % pb, autospec=True) as mock_c:
+                with patch('awslimitchecker.checker.AwsLimitChecker', autospec=True) as mock_c:
                     with pytest.raises(SystemExit) as excinfo:
                         self.cls.console_entry_point()
         assert excinfo.value.code == 2
@@ -1255,16 +1866,55 @@ class TestConsoleEntryPoint(RunnerTester):
                  profile_name=None, region=None, ta_refresh_mode=None,
                  ta_refresh_timeout=None, warning_threshold=80,
                  check_version=True, role_partition='foo',
-                 ta_api_region='us-east-1', skip_quotas=False)
+                 version_check_interval=86400,
+                 ta_cache=True,
+                 columnar_thresholds=False,
+                 run_timeout=None,
+                 service_timeout=None,
+                 ta_api_region='us-east-1', skip_quotas=False,
+                 duration_history=True,
+                 services=None)
+        ]
+
+    def test_api_rate(self):
+        argv = ['awslimitchecker', '--api-rate=ec2=10', '--api-rate=elb=5']
+        with patch.object(sys, 'argv', argv):
+            with patch('%s.Runner.check_thresholds' % pb,
+                       autospec=True) as mock_check:
+                mock_check.return_value = 0, {}, ''
+                with patch('awslimitchecker.checker.AwsLimitChecker', autospec=True):
+                    with patch('%s.rate_limiter' % pb) as mock_rl:
+                        with pytest.raises(SystemExit) as excinfo:
+                            self.cls.console_entry_point()
+        assert excinfo.value.code == 0
+        assert mock_rl.mock_calls == [
+            call.set_rate('ec2', 10.0),
+            call.set_rate('elb', 5.0)
         ]
 
+    def test_time_limits(self):
+        argv = [
+            'awslimitchecker', '--run-timeout=300', '--service-timeout=60'
+        ]
+        with patch.object(sys, 'argv', argv):
+            with patch('%s.Runner.check_thresholds' % pb,
+                       autospec=True) as mock_check:
+                mock_check.return_value = 0, {}, ''
+                with patch('awslimitchecker.checker.AwsLimitChecker', autospec=True) as mock_c:
+                    with pytest.raises(SystemExit) as excinfo:
+                        self.cls.console_entry_point()
+        assert excinfo.value.code == 0
+        assert mock_c.mock_calls[0][2]['run_timeout'] == 300.0
+        assert mock_c.mock_calls[0][2]['service_timeout'] == 60.0
+        assert self.cls.time_limited is True
+
     def test_ta_api_region_skip_quotas(self):
         argv = ['awslimitchecker', '--ta-api-region=foo', '--skip-quotas']
         with patch.object(sys, 'argv', argv):
             with patch('%s.Runner.check_thresholds' % pb,
                        autospec=True) as mock_check:
                 mock_check.return_value = 2, {'Foo': {'Bar': Mock()}}, 'foo'
-                with patch('%s.AwsLimitChecker' % pb, autospec=True) as mock_c:
+                with patch('awslimitchecker.checker.AwsLimitChecker', autospec=True) as mock_c:
                     with pytest.raises(SystemExit) as excinfo:
                         self.cls.console_entry_point()
         assert excinfo.value.code == 2
@@ -1274,7 +1924,14 @@ class TestConsoleEntryPoint(RunnerTester):
                  profile_name=None, region=None, ta_refresh_mode=None,
                  ta_refresh_timeout=None, warning_threshold=80,
                  check_version=True, role_partition='aws',
-                 ta_api_region='foo', skip_quotas=True)
+                 version_check_interval=86400,
+                 ta_cache=True,
+                 columnar_thresholds=False,
+                 run_timeout=None,
+                 service_timeout=None,
+                 ta_api_region='foo', skip_quotas=True,
+                 duration_history=True,
+                 services=None)
         ]
 
     def test_skip_service(self):
@@ -1283,7 +1940,7 @@ class TestConsoleEntryPoint(RunnerTester):
             with patch('%s.Runner.check_thresholds' % pb,
                        autospec=True) as mock_check:
                 mock_check.return_value = 2, {'Foo': {'Bar': Mock()}}, 'foo'
-                with patch('%s.AwsLimitChecker' % pb, autospec=True) as mock_c:
+                with patch('awslimitchecker.checker.AwsLimitChecker', autospec=True) as mock_c:
                     with pytest.raises(SystemExit) as excinfo:
                         self.cls.console_entry_point()
         assert excinfo.value.code == 2
@@ -1293,7 +1950,14 @@ class TestConsoleEntryPoint(RunnerTester):
                  profile_name=None, region=None, ta_refresh_mode=None,
                  ta_refresh_timeout=None, warning_threshold=80,
                  check_version=True, role_partition='aws',
-                 ta_api_region='us-east-1', skip_quotas=False),
+                 version_check_interval=86400,
+                 ta_cache=True,
+                 columnar_thresholds=False,
+                 run_timeout=None,
+                 service_timeout=None,
+                 ta_api_region='us-east-1', skip_quotas=False,
+                 duration_history=True,
+                 services=sorted(_services.keys())),
             call().remove_services(['foo'])
         ]
 
@@ -1307,7 +1971,7 @@ class TestConsoleEntryPoint(RunnerTester):
             with patch('%s.Runner.check_thresholds' % pb,
                        autospec=True) as mock_check:
                 mock_check.return_value = 2, {'Foo': {'Bar': Mock()}}, 'foo'
-                with patch('%s.AwsLimitChecker' % pb, autospec=True) as mock_c:
+                with patch('awslimitchecker.checker.AwsLimitChecker', autospec=True) as mock_c:
                     with pytest.raises(SystemExit) as excinfo:
                         self.cls.console_entry_point()
         assert excinfo.value.code == 2
@@ -1317,7 +1981,14 @@ class TestConsoleEntryPoint(RunnerTester):
                  profile_name=None, region=None, ta_refresh_mode=None,
                  ta_refresh_timeout=None, warning_threshold=80,
                  check_version=True, role_partition='aws',
-                 ta_api_region='us-east-1', skip_quotas=False),
+                 version_check_interval=86400,
+                 ta_cache=True,
+                 columnar_thresholds=False,
+                 run_timeout=None,
+                 service_timeout=None,
+                 ta_api_region='us-east-1', skip_quotas=False,
+                 duration_history=True,
+                 services=sorted(_services.keys())),
             call().remove_services(['foo', 'bar'])
         ]
 
@@ -1330,7 +2001,7 @@ class TestConsoleEntryPoint(RunnerTester):
             with patch('%s.Runner.check_thresholds' % pb,
                        autospec=True) as mock_check:
                 mock_check.return_value = 2, {'Foo': {'Bar': Mock()}}, 'foo'
-                with patch('%s.AwsLimitChecker' % pb, autospec=True) as mock_c:
+                with patch('awslimitchecker.checker.AwsLimitChecker', autospec=True) as mock_c:
                     with pytest.raises(SystemExit) as excinfo:
                         self.cls.console_entry_point()
         assert excinfo.value.code == 2
@@ -1340,7 +2011,14 @@ class TestConsoleEntryPoint(RunnerTester):
                  profile_name=None, region=None, ta_refresh_mode=None,
                  ta_refresh_timeout=None, warning_threshold=80,
                  check_version=True, role_partition='aws',
-                 ta_api_region='us-east-1', skip_quotas=False),
+                 version_check_interval=86400,
+                 ta_cache=True,
+                 columnar_thresholds=False,
+                 run_timeout=None,
+                 service_timeout=None,
+                 ta_api_region='us-east-1', skip_quotas=False,
+                 duration_history=True,
+                 services=None),
         ]
         assert self.cls.skip_check == [
             'EC2/Max launch specifications per spot fleet',
@@ -1356,7 +2034,7 @@ class TestConsoleEntryPoint(RunnerTester):
             with patch('%s.Runner.check_thresholds' % pb,
                        autospec=True) as mock_check:
                 mock_check.return_value = 2, {'Foo': {'Bar': Mock()}}, 'foo'
-                with patch('%s.AwsLimitChecker' % pb, autospec=True) as mock_c:
+                with patch('awslimitchecker.checker.AwsLimitChecker', autospec=True) as mock_c:
                     with pytest.raises(SystemExit) as excinfo:
                         self.cls.console_entry_point()
         assert excinfo.value.code == 2
@@ -1366,7 +2044,14 @@ class TestConsoleEntryPoint(RunnerTester):
                  profile_name=None, region=None, ta_refresh_mode=None,
                  ta_refresh_timeout=None, warning_threshold=80,
                  check_version=True, role_partition='aws',
-                 ta_api_region='us-east-1', skip_quotas=False),
+                 version_check_interval=86400,
+                 ta_cache=True,
+                 columnar_thresholds=False,
+                 run_timeout=None,
+                 service_timeout=None,
+                 ta_api_region='us-east-1', skip_quotas=False,
+                 duration_history=True,
+                 services=None),
         ]
         assert self.cls.skip_check == [
             'EC2/Max launch specifications per spot fleet',
@@ -1465,7 +2150,7 @@ class TestConsoleEntryPoint(RunnerTester):
         assert self.cls.skip_ta is True
 
     def test_service_name(self, capsys):
-        argv = ['awslimitchecker', '-S', 'foo']
+        argv = ['awslimitchecker', '-S', 'Lambda']
         with patch.object(sys, 'argv', argv):
             with patch('%s.Runner.check_thresholds' % pb,
                        autospec=True) as mock_ct:
@@ -1475,7 +2160,17 @@ class TestConsoleEntryPoint(RunnerTester):
         out, err = capsys.readouterr()
         assert out == ''
         assert excinfo.value.code == 6
-        assert self.cls.service_name == ['foo']
+        assert self.cls.service_name == ['Lambda']
+        assert list(self.cls.checker.services.keys()) == ['Lambda']
+
+    def test_service_name_unknown(self, capsys):
+        argv = ['awslimitchecker', '-S', 'foo']
+        with patch.object(sys, 'argv', argv):
+            with pytest.raises(SystemExit) as excinfo:
+                self.cls.console_entry_point()
+        assert excinfo.value.code == 2
+        out, err = capsys.readouterr()
+        assert 'unknown service in --service: foo' in err
 
     def test_no_service_name(self, capsys):
         argv = ['awslimitchecker']
@@ -1495,7 +2190,7 @@ class TestConsoleEntryPoint(RunnerTester):
         with patch.object(sys, 'argv', argv):
             with patch('%s.Runner.check_thresholds' % pb,
                        autospec=True) as mock_ct:
-                with patch('%s.AwsLimitChecker' % pb,
+                with patch('awslimitchecker.checker.AwsLimitChecker',
                            spec_set=AwsLimitChecker) as mock_alc:
                     with pytest.raises(SystemExit) as excinfo:
                         mock_ct.return_value = 6, {'Foo': {'Bar': Mock()}}, 'f'
@@ -1517,9 +2212,16 @@ class TestConsoleEntryPoint(RunnerTester):
                 ta_refresh_mode=None,
                 ta_refresh_timeout=None,
                 check_version=True,
+                version_check_interval=86400,
+                ta_cache=True,
+                columnar_thresholds=False,
+                run_timeout=None,
+                service_timeout=None,
                 role_partition='aws',
                 ta_api_region='us-east-1',
-                skip_quotas=False
+                skip_quotas=False,
+                duration_history=True,
+                services=None
             )
         ]
         assert self.cls.service_name is None
@@ -1537,7 +2239,7 @@ class TestConsoleEntryPoint(RunnerTester):
         with patch.object(sys, 'argv', argv):
             with patch('%s.Runner.check_thresholds' % pb,
                        autospec=True) as mock_ct:
-                with patch('%s.AwsLimitChecker' % pb,
+                with patch('awslimitchecker.checker.AwsLimitChecker',
                            spec_set=AwsLimitChecker) as mock_alc:
                     with pytest.raises(SystemExit) as excinfo:
                         mock_ct.return_value = 6, {'Foo': {'Bar': Mock()}}, 'f'
@@ -1559,9 +2261,16 @@ class TestConsoleEntryPoint(RunnerTester):
                 ta_refresh_mode=None,
                 ta_refresh_timeout=None,
                 check_version=True,
+                version_check_interval=86400,
+                ta_cache=True,
+                columnar_thresholds=False,
+                run_timeout=None,
+                service_timeout=None,
                 role_partition='aws',
                 ta_api_region='us-east-1',
-                skip_quotas=False
+                skip_quotas=False,
+                duration_history=True,
+                services=None
             )
         ]
         assert self.cls.service_name is None
@@ -1582,7 +2291,7 @@ class TestConsoleEntryPoint(RunnerTester):
         with patch.object(sys, 'argv', argv):
             with patch('%s.Runner.check_thresholds' % pb,
                        autospec=True) as mock_ct:
-                with patch('%s.AwsLimitChecker' % pb,
+                with patch('awslimitchecker.checker.AwsLimitChecker',
                            spec_set=AwsLimitChecker) as mock_alc:
                     with pytest.raises(SystemExit) as excinfo:
                         mock_ct.return_value = 6, {'Foo': {'Bar': Mock()}}, 'f'
@@ -1604,9 +2313,16 @@ class TestConsoleEntryPoint(RunnerTester):
                 ta_refresh_mode=None,
                 ta_refresh_timeout=None,
                 check_version=False,
+                version_check_interval=86400,
+                ta_cache=True,
+                columnar_thresholds=False,
+                run_timeout=None,
+                service_timeout=None,
                 role_partition='aws',
                 ta_api_region='us-east-1',
-                skip_quotas=False
+                skip_quotas=False,
+                duration_history=True,
+                services=None
             )
         ]
         assert self.cls.service_name is None
@@ -1626,6 +2342,38 @@ class TestConsoleEntryPoint(RunnerTester):
         assert excinfo.value.code == 6
         assert mock_set_level.mock_calls == [call(logging.INFO)]
 
+    def test_verbose_durations(self):
+        argv = ['awslimitchecker', '-v']
+        with patch.object(sys, 'argv', argv):
+            with patch.multiple(
+                '%s.Runner' % pb,
+                check_thresholds=DEFAULT,
+                _log_service_durations=DEFAULT,
+                autospec=True,
+            ) as mocks:
+                with patch('awslimitchecker.runner.logger.setLevel'):
+                    mocks['check_thresholds'].return_value = 0, {}, ''
+                    with pytest.raises(SystemExit) as excinfo:
+                        self.cls.console_entry_point()
+        assert excinfo.value.code == 0
+        assert mocks['_log_service_durations'].mock_calls == [call(self.cls)]
+
+    def test_show_usage_verbose_durations(self):
+        argv = ['awslimitchecker', '-u', '-v']
+        with patch.object(sys, 'argv', argv):
+            with patch.multiple(
+                '%s.Runner' % pb,
+                show_usage=DEFAULT,
+                _log_service_durations=DEFAULT,
+                autospec=True,
+            ) as mocks:
+                with patch('awslimitchecker.runner.logger.setLevel'):
+                    with pytest.raises(SystemExit) as excinfo:
+                        self.cls.console_entry_point()
+        assert excinfo.value.code == 0
+        assert mocks['show_usage'].mock_calls == [call(self.cls)]
+        assert mocks['_log_service_durations'].mock_calls == [call(self.cls)]
+
     def test_debug(self, capsys):
         argv = ['awslimitchecker', '-vv']
         with patch.object(sys, 'argv', argv):
@@ -1644,7 +2392,7 @@ class TestConsoleEntryPoint(RunnerTester):
     def test_warning(self):
         argv = ['awslimitchecker', '-W', '50']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.AwsLimitChecker' % pb, autospec=True) as mock_alc:
+            with patch('awslimitchecker.checker.AwsLimitChecker', autospec=True) as mock_alc:
                 with patch('%s.Runner.check_thresholds' % pb,
                            autospec=True) as mock_ct:
                     with pytest.raises(SystemExit) as excinfo:
@@ -1665,16 +2413,23 @@ class TestConsoleEntryPoint(RunnerTester):
                 ta_refresh_mode=None,
                 ta_refresh_timeout=None,
                 check_version=True,
+                version_check_interval=86400,
+                ta_cache=True,
+                columnar_thresholds=False,
+                run_timeout=None,
+                service_timeout=None,
                 role_partition='aws',
                 ta_api_region='us-east-1',
-                skip_quotas=False
+                skip_quotas=False,
+                duration_history=True,
+                services=None
             )
         ]
 
     def test_warning_profile_name(self):
         argv = ['awslimitchecker', '-W', '50', '-P', 'myprof']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.AwsLimitChecker' % pb, autospec=True) as mock_alc:
+            with patch('awslimitchecker.checker.AwsLimitChecker', autospec=True) as mock_alc:
                 with patch('%s.Runner.check_thresholds' % pb,
                            autospec=True) as mock_ct:
                     with pytest.raises(SystemExit) as excinfo:
@@ -1695,16 +2450,23 @@ class TestConsoleEntryPoint(RunnerTester):
                 ta_refresh_mode=None,
                 ta_refresh_timeout=None,
                 check_version=True,
+                version_check_interval=86400,
+                ta_cache=True,
+                columnar_thresholds=False,
+                run_timeout=None,
+                service_timeout=None,
                 role_partition='aws',
                 ta_api_region='us-east-1',
-                skip_quotas=False
+                skip_quotas=False,
+                duration_history=True,
+                services=None
             )
         ]
 
     def test_critical(self):
         argv = ['awslimitchecker', '-C', '95']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.AwsLimitChecker' % pb, autospec=True) as mock_alc:
+            with patch('awslimitchecker.checker.AwsLimitChecker', autospec=True) as mock_alc:
                 with patch('%s.Runner.check_thresholds' % pb,
                            autospec=True) as mock_ct:
                     with pytest.raises(SystemExit) as excinfo:
@@ -1725,9 +2487,16 @@ class TestConsoleEntryPoint(RunnerTester):
                 ta_refresh_mode=None,
                 ta_refresh_timeout=None,
                 check_version=True,
+                version_check_interval=86400,
+                ta_cache=True,
+                columnar_thresholds=False,
+                run_timeout=None,
+                service_timeout=None,
                 role_partition='aws',
                 ta_api_region='us-east-1',
-                skip_quotas=False
+                skip_quotas=False,
+                duration_history=True,
+                services=None
             )
         ]
 
@@ -1735,7 +2504,7 @@ class TestConsoleEntryPoint(RunnerTester):
         argv = ['awslimitchecker', '-C', '95', '--ta-refresh-timeout=123',
                 '--ta-refresh-older=456']
         with patch.object(sys, 'argv', argv):
-            with patch('%s.AwsLimitChecker' % pb, autospec=True) as mock_alc:
+            with patch('awslimitchecker.checker.AwsLimitChecker', autospec=True) as mock_alc:
                 with patch('%s.Runner.check_thresholds' % pb,
                            autospec=True) as mock_ct:
                     with pytest.raises(SystemExit) as excinfo:
@@ -1756,9 +2525,16 @@ class TestConsoleEntryPoint(RunnerTester):
                 ta_refresh_mode=456,
                 ta_refresh_timeout=123,
                 check_version=True,
+                version_check_interval=86400,
+                ta_cache=True,
+                columnar_thresholds=False,
+                run_timeout=None,
+                service_timeout=None,
                 role_partition='aws',
                 ta_api_region='us-east-1',
-                skip_quotas=False
+                skip_quotas=False,
+                duration_history=True,
+                services=None
             )
         ]
 
@@ -1808,7 +2584,7 @@ class TestConsoleEntryPoint(RunnerTester):
                     m_gpbn.return_value = mock_alerter
                     with pytest.raises(RuntimeError) as excinfo:
                         with patch(
-                                '%s.AwsLimitChecker' % pb,
+                                'awslimitchecker.checker.AwsLimitChecker',
                                 spec_set=AwsLimitChecker
                         ) as mock_alc:
                             type(mock_alc.return_value).region_name = mock_rn
@@ -1844,7 +2620,7 @@ class TestConsoleEntryPoint(RunnerTester):
                     m_gpbn.return_value = mock_alerter
                     with pytest.raises(SystemExit) as excinfo:
                         with patch(
-                                '%s.AwsLimitChecker' % pb,
+                                'awslimitchecker.checker.AwsLimitChecker',
                                 spec_set=AwsLimitChecker
                         ) as mock_alc:
                             type(mock_alc.return_value).region_name = mock_rn
@@ -1880,7 +2656,7 @@ class TestConsoleEntryPoint(RunnerTester):
                     m_gpbn.return_value = mock_alerter
                     with pytest.raises(SystemExit) as excinfo:
                         with patch(
-                                '%s.AwsLimitChecker' % pb,
+                                'awslimitchecker.checker.AwsLimitChecker',
                                 spec_set=AwsLimitChecker
                         ) as mock_alc:
                             type(mock_alc.return_value).region_name = mock_rn
@@ -1916,7 +2692,7 @@ class TestConsoleEntryPoint(RunnerTester):
                     m_gpbn.return_value = mock_alerter
                     with pytest.raises(SystemExit) as excinfo:
                         with patch(
-                                '%s.AwsLimitChecker' % pb,
+                                'awslimitchecker.checker.AwsLimitChecker',
                                 spec_set=AwsLimitChecker
                         ) as mock_alc:
                             type(mock_alc.return_value).region_name = mock_rn
@@ -1951,9 +2727,48 @@ class TestConsoleEntryPoint(RunnerTester):
                 ) as m_gpbn:
                     m_gpbn.return_value = mock_prov
                     with patch(
-                        '%s.AwsLimitChecker' % pb, spec_set=AwsLimitChecker
+                        'awslimitchecker.checker.AwsLimitChecker', spec_set=AwsLimitChecker
+                    ) as mock_alc:
+                        type(mock_alc.return_value).region_name = mock_rn
+                        mock_alc.return_value.get_ta_refresh_latency\
+                            .return_value = None
+                        with pytest.raises(SystemExit) as excinfo:
+                            mock_ct.return_value = 10, {}, 'foo'
+                            self.cls.console_entry_point()
+        assert excinfo.value.code == 10
+        assert mock_ct.mock_calls == [
+            call(self.cls, mock_prov.return_value)
+        ]
+        assert mock_prov.mock_calls == [
+            call('rname', foo='bar', baz='blam'),
+            call().set_run_duration(6),
+            call().flush()
+        ]
+
+    @freeze_time("2016-12-16 10:40:42", tz_offset=0, auto_tick_seconds=6)
+    def test_check_thresholds_with_metrics_ta_latency(self):
+        argv = [
+            'awslimitchecker',
+            '--metrics-provider=FooProvider',
+            '--metrics-config=foo=bar',
+            '--metrics-config=baz=blam'
+        ]
+        mock_prov = Mock()
+        mock_rn = PropertyMock(return_value='rname')
+        with patch.object(sys, 'argv', argv):
+            with patch(
+                '%s.Runner.check_thresholds' % pb, autospec=True
+            ) as mock_ct:
+                with patch(
+                    '%s.MetricsProvider.get_provider_by_name' % pb
+                ) as m_gpbn:
+                    m_gpbn.return_value = mock_prov
+                    with patch(
+                        'awslimitchecker.checker.AwsLimitChecker', spec_set=AwsLimitChecker
                     ) as mock_alc:
                         type(mock_alc.return_value).region_name = mock_rn
+                        mock_alc.return_value.get_ta_refresh_latency\
+                            .return_value = 12.5
                         with pytest.raises(SystemExit) as excinfo:
                             mock_ct.return_value = 10, {}, 'foo'
                             self.cls.console_entry_point()
@@ -1964,9 +2779,83 @@ class TestConsoleEntryPoint(RunnerTester):
         assert mock_prov.mock_calls == [
             call('rname', foo='bar', baz='blam'),
             call().set_run_duration(6),
+            call().set_ta_refresh_latency(12.5),
             call().flush()
         ]
 
+    @freeze_time("2016-12-16 10:40:42", tz_offset=0, auto_tick_seconds=6)
+    def test_check_thresholds_multi_region_with_metrics(self):
+        argv = [
+            'awslimitchecker',
+            '--region=r1,r2',
+            '--metrics-provider=FooProvider',
+            '--metrics-config=foo=bar'
+        ]
+        mock_prov = Mock()
+        mock_r1 = Mock()
+        mock_r2 = Mock()
+        mock_prov.side_effect = [mock_r1, mock_r2]
+        with patch.object(sys, 'argv', argv):
+            with patch(
+                '%s.Runner.check_thresholds' % pb, autospec=True
+            ) as mock_ct:
+                with patch(
+                    '%s.MetricsProvider.get_provider_by_name' % pb
+                ) as m_gpbn:
+                    m_gpbn.return_value = mock_prov
+                    with patch(
+                        'awslimitchecker.checker.AwsLimitChecker'
+                    ) as mock_alc, patch(
+                        'awslimitchecker.multiregion.MultiRegionChecker'
+                    ) as mock_mrc:
+                        mock_mrc.return_value.regions = ['r1', 'r2']
+                        mock_mrc.return_value.checkers = {
+                            'r1': Mock(spec_set=AwsLimitChecker),
+                            'r2': Mock(spec_set=AwsLimitChecker),
+                        }
+                        checkers = mock_mrc.return_value.checkers
+                        checkers['r1'].get_ta_refresh_latency.return_value = \
+                            None
+                        checkers['r2'].get_ta_refresh_latency.return_value = \
+                            3.5
+                        with pytest.raises(SystemExit) as excinfo:
+                            mock_ct.return_value = 1, {}, 'foo'
+                            self.cls.console_entry_point()
+        assert excinfo.value.code == 1
+        assert self.cls.multi_region is True
+        assert mock_alc.mock_calls == []
+        assert mock_mrc.mock_calls == [
+            call(['r1', 'r2'], account_id=None, account_role=None,
+                 critical_threshold=99, external_id=None,
+                 mfa_serial_number=None, mfa_token=None,
+                 profile_name=None, ta_refresh_mode=None,
+                 ta_refresh_timeout=None, warning_threshold=80,
+                 check_version=True, role_partition='aws',
+                 version_check_interval=86400, ta_cache=True,
+                 columnar_thresholds=False,
+                 run_timeout=None,
+                 service_timeout=None,
+                 ta_api_region='us-east-1', skip_quotas=False,
+                 duration_history=True,
+                 services=None)
+        ]
+        assert mock_ct.mock_calls == [
+            call(self.cls, {'r1': mock_r1, 'r2': mock_r2})
+        ]
+        assert mock_prov.mock_calls == [
+            call('r1', foo='bar'),
+            call('r2', foo='bar')
+        ]
+        assert mock_r1.mock_calls == [
+            call.set_run_duration(6),
+            call.flush()
+        ]
+        assert mock_r2.mock_calls == [
+            call.set_run_duration(6),
+            call.set_ta_refresh_latency(3.5),
+            call.flush()
+        ]
+
     def test_list_metrics_providers(self, capsys):
         argv = ['awslimitchecker', '--list-metrics-providers']
         with patch.object(sys, 'argv', argv):
@@ -2019,3 +2908,52 @@ class TestConsoleEntryPoint(RunnerTester):
                     with pytest.raises(SystemExit):
                         self.cls.console_entry_point()
         assert self.cls.colorize is False
+
+
+class TestStartupClients(RunnerTester):
+    """
+    Startup benchmark; constructing the checker and answering metadata-only
+    commands must not instantiate any boto3 clients.
+    """
+
+    @pytest.mark.parametrize(
+        'action', ['--list-defaults', '--list-services', '--iam-policy']
+    )
+    def test_no_clients(self, action, capsys):
+        argv = ['awslimitchecker', '--no-check-version', action]
+        with patch.object(sys, 'argv', argv):
+            with patch(
+                'botocore.session.Session.create_client', autospec=True
+            ) as m_create:
+                start = time.time()
+                with pytest.raises(SystemExit) as excinfo:
+                    self.cls.console_entry_point()
+                duration = time.time() - start
+        assert excinfo.value.code == 0
+        assert m_create.mock_calls == [], \
+            '%s created clients (took %.3fs)' % (action, duration)
+
+    @pytest.mark.parametrize(
+        'action', [['--list-services'], ['--list-defaults', '-r', 'us-east-1']]
+    )
+    def test_no_boto3_import(self, action):
+        # run in a fresh interpreter, as this one has already imported boto3
+        code = '\n'.join([
+            'import sys',
+            'from awslimitchecker.runner import console_entry_point',
+            'sys.argv = %r' % (['awslimitchecker', '--no-check-version'] +
+                               action),
+            'try:',
+            '    console_entry_point()',
+            'except SystemExit as ex:',
+            '    assert ex.code == 0, ex.code',
+            'assert "boto3" not in sys.modules, "boto3 imported"',
+            'assert "botocore" not in sys.modules, "botocore imported"',
+        ])
+        env = dict(os.environ)
+        env.pop('AWS_DEFAULT_REGION', None)
+        proc = subprocess.run(
+            [sys.executable, '-c', code], env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        assert proc.returncode == 0, proc.stderr.decode()
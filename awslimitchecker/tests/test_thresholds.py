@@ -0,0 +1,334 @@
+"""
+awslimitchecker/tests/test_thresholds.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import importlib.util
+import os
+import pytest
+import random
+import subprocess
+import sys
+from array import array
+from awslimitchecker.limit import AwsLimit, AwsLimitUsage, ThresholdResult
+from awslimitchecker.services.base import _AwsService
+from awslimitchecker.thresholds import ColumnarThresholds, _import_numpy
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch, Mock
+else:
+    from unittest.mock import patch, Mock
+
+pbm = 'awslimitchecker.thresholds'
+
+numpy = _import_numpy()
+
+requires_numpy = pytest.mark.skipif(numpy is None,
+                                    reason='numpy is not installed')
+
+
+def make_limits(seed, count=200, compact_usage=False, retain_top=None):
+    """
+    Return ``count`` pseudo-random limits with usage, covering default,
+    overridden and per-resource limits, unlimited and zero limits, and count
+    and percent thresholds.
+    """
+    rnd = random.Random(seed)
+    svc = Mock(spec_set=_AwsService)
+    limits = []
+    for i in range(count):
+        lim = AwsLimit(
+            'limit%d' % i, svc, rnd.choice([None, 0, 5, 10, 100, 1000]),
+            rnd.choice([40, 80]), rnd.choice([90, 99]),
+            compact_usage=compact_usage, retain_top=retain_top
+        )
+        if rnd.random() < 0.2:
+            lim.set_limit_override(rnd.choice([0, 1, 20, 250]))
+        if rnd.random() < 0.3:
+            lim.set_threshold_override(
+                warn_percent=rnd.choice([None, 10, 50]),
+                warn_count=rnd.choice([None, 3, 50]),
+                crit_percent=rnd.choice([None, 60, 95]),
+                crit_count=rnd.choice([None, 8, 500])
+            )
+        for j in range(rnd.randint(0, 5)):
+            maximum = None
+            if rnd.random() < 0.3:
+                maximum = rnd.choice([0, 10, 60])
+            lim._add_current_usage(
+                rnd.choice([0, 1, 4, 9, 50, 95.5, 99, 240, 1000]),
+                maximum=maximum, resource_id='res%d' % j
+            )
+        limits.append(lim)
+    return limits
+
+
+def scalar_results(limits):
+    res = []
+    for lim in limits:
+        res.append((lim.check_thresholds(), list(lim.get_warnings()),
+                    list(lim.get_criticals())))
+    return res
+
+
+def columnar_results(limits, use_numpy):
+    ok = ColumnarThresholds(
+        limits, use_numpy=use_numpy, min_usages=1
+    ).evaluate()
+    return [
+        (ok[i], list(lim.get_warnings()), list(lim.get_criticals()))
+        for i, lim in enumerate(limits)
+    ]
+
+
+def usage_ids(results):
+    """make results comparable across two sets of limits"""
+    return [
+        (ok, [u.resource_id for u in warns], [u.resource_id for u in crits])
+        for ok, warns, crits in results
+    ]
+
+
+class TestColumnarThresholds(object):
+
+    def test_init_default(self):
+        with patch('%s._import_numpy' % pbm) as mock_import:
+            mock_import.return_value = None
+            cls = ColumnarThresholds([])
+        assert cls.use_numpy is False
+        assert cls.limits == []
+
+    def test_init_numpy_missing(self):
+        with patch('%s._import_numpy' % pbm) as mock_import:
+            mock_import.return_value = None
+            with pytest.raises(ValueError) as excinfo:
+                ColumnarThresholds([], use_numpy=True)
+        assert str(excinfo.value) == 'numpy is not installed'
+
+    def test_init_no_numpy_import(self):
+        with patch('%s._import_numpy' % pbm) as mock_import:
+            cls = ColumnarThresholds([], use_numpy=False)
+        assert cls.use_numpy is False
+        assert mock_import.mock_calls == []
+
+    def test_numpy_not_imported(self):
+        # run in a fresh interpreter, as this one may have imported numpy
+        proc = subprocess.run(
+            [sys.executable, '-c', '; '.join([
+                'import sys',
+                'import awslimitchecker.checker',
+                'assert "numpy" not in sys.modules, "numpy imported"'
+            ])],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        assert proc.returncode == 0, proc.stderr.decode()
+
+    def test_pack(self):
+        svc = Mock(spec_set=_AwsService)
+        lim1 = AwsLimit('lim1', svc, 10, 40, 80)
+        lim1.set_threshold_override(warn_count=2)
+        lim1._add_current_usage(1, resource_id='a')
+        lim1._add_current_usage(9, maximum=20, resource_id='b')
+        lim2 = AwsLimit('lim2', svc, None, 40, 80)
+        lim2._add_current_usage(5)
+        lim2._add_current_usage(5, maximum=50)
+        lim3 = AwsLimit('lim3', svc, 0, 40, 80)
+        lim3._add_current_usage(5)
+        lim4 = AwsLimit('lim4', svc, 5, 40, 80)
+        cls = ColumnarThresholds(
+            [lim1, lim2, lim3, lim4], use_numpy=False, min_usages=1
+        )
+        assert cls._packed == [0, 1]
+        assert cls._unpacked == [3]
+        assert cls._sources == [
+            (lim1._current_usage, [0, 1]),
+            (lim2._current_usage, [1])
+        ]
+        assert cls._starts == [0, 2]
+        assert cls._counts == array('l', [2, 1])
+        assert cls._usage == array('d', [1, 9, 5])
+        assert cls._limit == array('d', [10, 20, 50])
+        assert cls._warn_pct == array('d', [40, 40])
+        assert cls._crit_pct == array('d', [80, 80])
+        assert cls._warn_int[0] == 2
+        for val in cls._warn_int[1:]:
+            assert val != val
+        for val in cls._crit_int:
+            assert val != val
+
+    def test_pack_calls_get_limit_once(self):
+        svc = Mock(spec_set=_AwsService)
+        lim = AwsLimit('lim', svc, 10, 40, 80)
+        for i in range(5):
+            lim._add_current_usage(i)
+        with patch.object(AwsLimit, 'get_limit', autospec=True) as m_gl:
+            m_gl.return_value = 10
+            ColumnarThresholds([lim], use_numpy=False, min_usages=1)
+        assert len(m_gl.mock_calls) == 1
+
+    def test_min_usages(self):
+        svc = Mock(spec_set=_AwsService)
+        lim1 = AwsLimit('lim1', svc, 10, 40, 80)
+        lim1._add_current_usage(9)
+        lim2 = AwsLimit('lim2', svc, 10, 40, 80)
+        for i in range(3):
+            lim2._add_current_usage(i)
+        cls = ColumnarThresholds([lim1, lim2], use_numpy=False, min_usages=2)
+        assert cls._unpacked == [0]
+        assert cls._packed == [1]
+        with patch.object(
+            AwsLimit, 'check_thresholds', autospec=True
+        ) as m_ct:
+            m_ct.return_value = False
+            assert cls.evaluate() == [False, True]
+        assert len(m_ct.mock_calls) == 1
+        assert m_ct.mock_calls[0][1] == (lim1,)
+
+    def test_evaluate_no_usage(self):
+        svc = Mock(spec_set=_AwsService)
+        lim = AwsLimit('lim', svc, 10, 40, 80)
+        assert ColumnarThresholds(
+            [lim], use_numpy=False
+        ).evaluate() == [True]
+
+    def test_evaluate_array(self):
+        svc = Mock(spec_set=_AwsService)
+        lim = AwsLimit('lim', svc, 10, 40, 60)
+        u1 = AwsLimitUsage(lim, 4, resource_id='foo4bar')
+        u2 = AwsLimitUsage(lim, 1, resource_id='foo3bar')
+        u3 = AwsLimitUsage(lim, 7, resource_id='foo2bar')
+        lim._current_usage = [u1, u2, u3]
+        lim2 = AwsLimit('lim2', svc, 10, 40, 60)
+        lim2._add_current_usage(1)
+        res = ColumnarThresholds(
+            [lim, lim2], use_numpy=False, min_usages=1
+        ).evaluate()
+        assert res == [False, True]
+        assert lim.get_warnings() == [u1]
+        assert lim.get_criticals() == [u3]
+        assert lim2.get_warnings() == []
+        assert lim2.get_criticals() == []
+
+    def test_evaluate_results(self):
+        svc = Mock(spec_set=_AwsService)
+        lim1 = AwsLimit('lim1', svc, 10, 40, 60)
+        lim1._add_current_usage(7)
+        lim2 = AwsLimit('lim2', svc, 0, 40, 60)
+        lim2._add_current_usage(7)
+        lim3 = AwsLimit('lim3', svc, 10, 40, 60)
+        cls = ColumnarThresholds(
+            [lim1, lim2, lim3], use_numpy=False, min_usages=1
+        )
+        for _ in range(2):
+            assert cls.evaluate() == [False, True, True]
+            assert lim1.get_threshold_result() == ThresholdResult(
+                False, (), tuple(lim1.get_current_usage())
+            )
+            assert lim2.get_threshold_result() == ThresholdResult(
+                True, (), ()
+            )
+            assert lim3.get_threshold_result() == ThresholdResult(
+                True, (), ()
+            )
+
+    @pytest.mark.parametrize('seed', [1, 2, 3])
+    def test_matches_scalar_array(self, seed):
+        expected = usage_ids(scalar_results(make_limits(seed)))
+        actual = usage_ids(columnar_results(make_limits(seed), False))
+        assert actual == expected
+
+    @requires_numpy
+    @pytest.mark.parametrize('seed', [1, 2, 3])
+    def test_matches_scalar_numpy(self, seed):
+        expected = usage_ids(scalar_results(make_limits(seed)))
+        actual = usage_ids(columnar_results(make_limits(seed), True))
+        assert actual == expected
+
+    @pytest.mark.parametrize('seed', [1, 2, 3])
+    def test_matches_scalar_compact(self, seed):
+        expected = usage_ids(scalar_results(make_limits(seed)))
+        compact = usage_ids(
+            scalar_results(make_limits(seed, compact_usage=True))
+        )
+        assert compact == expected
+        actual = usage_ids(columnar_results(
+            make_limits(seed, compact_usage=True), numpy is not None
+        ))
+        assert actual == expected
+
+    @pytest.mark.parametrize('seed', [1, 2, 3])
+    def test_matches_scalar_retain_top(self, seed):
+        expected = scalar_results(make_limits(seed, retain_top=2))
+        actual = columnar_results(
+            make_limits(seed, retain_top=2), numpy is not None
+        )
+        assert usage_ids(actual) == usage_ids(expected)
+        # retention never changes whether a limit passes
+        full = scalar_results(make_limits(seed))
+        assert [x[0] for x in expected] == [x[0] for x in full]
+
+
+class TestBenchmarkScript(object):
+    """
+    Smoke test that ``dev/benchmark.py`` (not shipped in the package) still
+    imports and runs against the current code.
+    """
+
+    path = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__)
+        ))), 'dev', 'benchmark.py'
+    )
+
+    def test_thresholds(self, capsys):
+        if not os.path.exists(self.path):
+            pytest.skip('dev/benchmark.py is not present')
+        spec = importlib.util.spec_from_file_location(
+            'awslimitchecker_benchmark', self.path
+        )
+        mod = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(mod)
+        args = mod.parse_args(['-r', '1', '-n', '5', '-u', '3', 'thresholds'])
+        assert args.benchmark == ['thresholds']
+        mod.bench_thresholds(args)
+        out, err = capsys.readouterr()
+        assert 'ColumnarThresholds (array)' in out
@@ -38,12 +38,16 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 import sys
+import os
+import json
+import threading
 from botocore.exceptions import ClientError
 from awslimitchecker.trustedadvisor import TrustedAdvisor, datetime_now
 from awslimitchecker.services.base import _AwsService
 from awslimitchecker.limit import AwsLimit
+from awslimitchecker.limitindex import LimitIndex
 import pytest
-from datetime import datetime
+from datetime import datetime, timedelta
 from freezegun import freeze_time
 from pytz import utc
 
@@ -86,9 +90,15 @@ class TestInit(object):
             'region_name': 'us-east-1'
         }
         assert cls.all_services == {}
+        assert isinstance(cls.limit_index, LimitIndex)
+        assert len(cls.limit_index) == 0
         assert cls.limits_updated is False
         assert cls.refresh_mode is None
         assert cls.refresh_timeout is None
+        assert cls.cache_results is False
+        assert cls._sts_conn is None
+        assert cls._account_id is None
+        assert cls._cached_check is None
 
     def test_boto_kwargs(self):
         mock_svc = Mock(spec_set=_AwsService)
@@ -219,6 +229,128 @@ class TestUpdateLimits(object):
         assert mocks['_poll'].mock_calls == []
         assert mocks['_update_services'].mock_calls == []
 
+    def test_background(self):
+        mock_results = Mock()
+        with patch.multiple(
+            pb,
+            connect=DEFAULT,
+            _poll=DEFAULT,
+            _update_services=DEFAULT,
+            _dont_use_ta=DEFAULT,
+            autospec=True
+        ) as mocks:
+            mocks['_poll'].return_value = mock_results
+            mocks['_dont_use_ta'].return_value = False
+            self.cls.start_update_limits()
+            assert self.cls._poll_thread.daemon is True
+            self.cls._poll_thread.join()
+            # results are not applied until update_limits()
+            assert mocks['_update_services'].mock_calls == []
+            assert self.cls.limits_updated is False
+            self.cls.update_limits()
+        assert mocks['connect'].mock_calls == [call(self.cls), call(self.cls)]
+        assert mocks['_poll'].mock_calls == [call(self.cls)]
+        assert mocks['_update_services'].mock_calls == [
+            call(self.cls, mock_results)
+        ]
+        assert self.cls._poll_thread is None
+        assert self.cls.limits_updated is True
+
+    def test_background_dont_use(self):
+        with patch.multiple(
+            pb,
+            connect=DEFAULT,
+            _poll=DEFAULT,
+            _update_services=DEFAULT,
+            _dont_use_ta=DEFAULT,
+            autospec=True
+        ) as mocks:
+            mocks['_dont_use_ta'].return_value = True
+            self.cls.start_update_limits()
+            self.cls.update_limits()
+        assert mocks['_poll'].mock_calls == []
+        assert mocks['_update_services'].mock_calls == []
+        assert self.cls.limits_updated is False
+
+    def test_background_exception(self):
+        with patch.multiple(
+            pb,
+            connect=DEFAULT,
+            _poll=DEFAULT,
+            _update_services=DEFAULT,
+            _dont_use_ta=DEFAULT,
+            autospec=True
+        ) as mocks:
+            mocks['_poll'].side_effect = RuntimeError('foo')
+            mocks['_dont_use_ta'].return_value = False
+            self.cls.start_update_limits()
+            with pytest.raises(RuntimeError) as excinfo:
+                self.cls.update_limits()
+        assert str(excinfo.value) == 'foo'
+        assert mocks['_update_services'].mock_calls == []
+        assert self.cls._poll_exception is None
+        assert self.cls.limits_updated is False
+
+    def test_background_timeout(self):
+        mock_results = Mock()
+        release = threading.Event()
+
+        def se_poll(cls):
+            release.wait(5)
+            return mock_results
+
+        start = datetime(2016, 12, 16, hour=11, minute=30, tzinfo=utc)
+        with patch.multiple(
+            pb,
+            connect=DEFAULT,
+            _poll=DEFAULT,
+            _update_services=DEFAULT,
+            _dont_use_ta=DEFAULT,
+            autospec=True
+        ) as mocks:
+            mocks['_poll'].side_effect = se_poll
+            mocks['_dont_use_ta'].return_value = False
+            with patch('%s.datetime_now' % pbm) as mock_dt_now:
+                mock_dt_now.return_value = start
+                self.cls.start_update_limits(timeout=30)
+            assert self.cls._poll_cutoff == start + timedelta(seconds=30)
+            with patch('%s.logger' % pbm) as mock_logger:
+                self.cls.update_limits(timeout=0.05)
+            # not applied, but the poll is kept for a later call
+            assert mocks['_update_services'].mock_calls == []
+            assert self.cls.limits_updated is False
+            assert self.cls._poll_thread is not None
+            assert mock_logger.mock_calls == [
+                call.debug('Waiting for background Trusted Advisor poll'),
+                call.warning(
+                    'Trusted Advisor poll did not finish within %.1f '
+                    'seconds (the run deadline); not using Trusted Advisor '
+                    'limits for this run', 0.05
+                )
+            ]
+            release.set()
+            self.cls.update_limits()
+        assert mocks['_poll'].mock_calls == [call(self.cls)]
+        assert mocks['_update_services'].mock_calls == [
+            call(self.cls, mock_results)
+        ]
+        assert self.cls.limits_updated is True
+
+    def test_start_already_updated(self):
+        self.cls.limits_updated = True
+        with patch('%s.connect' % pb, autospec=True) as mock_connect:
+            self.cls.start_update_limits()
+        assert mock_connect.mock_calls == []
+        assert self.cls._poll_thread is None
+
+    def test_start_already_started(self):
+        mock_thread = Mock()
+        self.cls._poll_thread = mock_thread
+        with patch('%s.connect' % pb, autospec=True) as mock_connect:
+            self.cls.start_update_limits()
+        assert mock_connect.mock_calls == []
+        assert self.cls._poll_thread == mock_thread
+
 
 class TestDontUseTa():
 
@@ -280,6 +412,222 @@ class TestDontUseTa():
         assert self.cls._dont_use_ta() is False
 
 
+class TestConnect(object):
+
+    def test_no_cache(self):
+        cls = TrustedAdvisor({}, {})
+        with patch('%s.Connectable.connect' % pbm, autospec=True) as m_conn:
+            with patch('%s.boto3_client' % pbm) as m_client:
+                cls.connect()
+        assert m_conn.mock_calls == [call(cls)]
+        assert m_client.mock_calls == []
+        assert cls._sts_conn is None
+
+    def test_cache(self):
+        cls = TrustedAdvisor({}, {}, cache_results=True)
+        with patch('%s.Connectable.connect' % pbm, autospec=True) as m_conn:
+            with patch('%s.boto3_client' % pbm) as m_client:
+                cls.connect()
+                cls.connect()
+        assert m_conn.mock_calls == [call(cls), call(cls)]
+        assert m_client.mock_calls == [
+            call('sts', region_name='us-east-1')
+        ]
+        assert cls._sts_conn == m_client.return_value
+
+
+class TestResultsCache(object):
+
+    def setup(self):
+        self.mock_conn = Mock()
+        self.mock_sts = Mock()
+        self.mock_sts.get_caller_identity.return_value = {
+            'Account': '123456789012'
+        }
+        self.cls = TrustedAdvisor({}, {}, cache_results=True)
+        self.cls.conn = self.mock_conn
+        self.cls._sts_conn = self.mock_sts
+        self.limits = {'EC2': {'Foo': 5}, 'IAM': {'Users': 'Unlimited'}}
+        self.m_summaries = \
+            self.mock_conn.describe_trusted_advisor_check_summaries
+        self.m_summaries.return_value = {
+            'summaries': [{'timestamp': '2015-06-15T20:27:42Z'}]
+        }
+
+    def set_cache(self, tmpdir, **kwargs):
+        data = {
+            'check_id': 'chkid',
+            'metadata': ['Region', 'Service'],
+            'regions': {
+                'us-west-2': {
+                    'timestamp': '2015-06-15T20:27:42Z',
+                    'limits': self.limits
+                }
+            }
+        }
+        data.update(kwargs)
+        tmpdir.join('trustedadvisor_123456789012.json').write(json.dumps(data))
+
+    def get_cache(self, tmpdir):
+        return json.loads(
+            tmpdir.join('trustedadvisor_123456789012.json').read()
+        )
+
+    def test_cache_filename(self):
+        assert self.cls._cache_filename == 'trustedadvisor_123456789012.json'
+        assert self.cls._cache_filename == 'trustedadvisor_123456789012.json'
+        assert self.mock_sts.mock_calls == [call.get_caller_identity()]
+
+    def test_hit(self, tmpdir):
+        self.set_cache(tmpdir)
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            res = self.cls._get_cached_limits('us-west-2')
+        assert res == self.limits
+        assert self.m_summaries.mock_calls == [call(checkIds=['chkid'])]
+        assert self.cls._cached_check == ('chkid', ['Region', 'Service'])
+
+    def test_stale(self, tmpdir):
+        self.set_cache(tmpdir)
+        self.m_summaries.return_value = {
+            'summaries': [{'timestamp': '2015-06-16T20:27:42Z'}]
+        }
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            res = self.cls._get_cached_limits('us-west-2')
+        assert res is None
+        assert self.cls._cached_check == ('chkid', ['Region', 'Service'])
+
+    def test_other_region(self, tmpdir):
+        self.set_cache(tmpdir)
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            res = self.cls._get_cached_limits('us-east-1')
+        assert res is None
+        assert self.m_summaries.mock_calls == []
+        assert self.cls._cached_check is None
+
+    def test_no_cache_file(self, tmpdir):
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            assert self.cls._get_cached_limits('us-west-2') is None
+        assert self.m_summaries.mock_calls == []
+
+    def test_summaries_error(self, tmpdir):
+        self.set_cache(tmpdir)
+        self.m_summaries.side_effect = ClientError(
+            {'Error': {'Code': 'SubscriptionRequiredException'}},
+            'DescribeTrustedAdvisorCheckSummaries'
+        )
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            assert self.cls._get_cached_limits('us-west-2') is None
+        assert self.cls._cached_check is None
+
+    def test_disabled(self, tmpdir):
+        self.set_cache(tmpdir)
+        self.cls.cache_results = False
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            assert self.cls._get_cached_limits('us-west-2') is None
+            self.cls._set_cached_limits(
+                'us-east-1', 'chkid', [], '2015-06-16T20:27:42Z', {}
+            )
+        assert self.get_cache(tmpdir)['regions'].keys() == {'us-west-2'}
+        assert self.m_summaries.mock_calls == []
+        assert self.mock_sts.mock_calls == []
+
+    def test_refresh_modes(self, tmpdir):
+        self.set_cache(tmpdir)
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            for mode in ['wait', 'trigger']:
+                self.cls.refresh_mode = mode
+                assert self.cls._get_cached_limits('us-west-2') is None
+            assert self.m_summaries.mock_calls == []
+
+    @freeze_time("2015-06-15 21:27:42", tz_offset=0)
+    def test_refresh_older(self, tmpdir):
+        self.set_cache(tmpdir)
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            self.cls.refresh_mode = 7200
+            assert self.cls._get_cached_limits('us-west-2') == self.limits
+            self.cls.refresh_mode = 1800
+            assert self.cls._get_cached_limits('us-west-2') is None
+
+    def test_set_new(self, tmpdir):
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            self.cls._set_cached_limits(
+                'us-west-2', 'chkid', ['Region'], '2015-06-15T20:27:42Z',
+                self.limits
+            )
+        assert self.get_cache(tmpdir) == {
+            'check_id': 'chkid',
+            'metadata': ['Region'],
+            'regions': {
+                'us-west-2': {
+                    'timestamp': '2015-06-15T20:27:42Z',
+                    'limits': self.limits
+                }
+            }
+        }
+
+    def test_set_add_region(self, tmpdir):
+        self.set_cache(tmpdir)
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            self.cls._set_cached_limits(
+                'us-east-1', 'chkid', ['Region'], '2015-06-16T20:27:42Z', {}
+            )
+        data = self.get_cache(tmpdir)
+        assert sorted(data['regions'].keys()) == ['us-east-1', 'us-west-2']
+        assert data['regions']['us-east-1'] == {
+            'timestamp': '2015-06-16T20:27:42Z', 'limits': {}
+        }
+
+    def test_set_other_check_id(self, tmpdir):
+        self.set_cache(tmpdir)
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            self.cls._set_cached_limits(
+                'us-east-1', 'newid', ['Region'], '2015-06-16T20:27:42Z', {}
+            )
+        data = self.get_cache(tmpdir)
+        assert data['check_id'] == 'newid'
+        assert list(data['regions'].keys()) == ['us-east-1']
+
+    def test_set_locked(self, tmpdir):
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            with patch('%s._cache_file_lock' % pbm) as mock_lock:
+                self.cls._set_cached_limits(
+                    'us-east-1', 'chkid', [], '2015-06-16T20:27:42Z', {}
+                )
+        assert mock_lock.mock_calls[0] == call(
+            'trustedadvisor_123456789012.json'
+        )
+        assert mock_lock.return_value.__enter__.call_count == 1
+        assert mock_lock.return_value.__exit__.call_count == 1
+        assert self.get_cache(tmpdir)['check_id'] == 'chkid'
+
+    def test_set_no_timestamp(self, tmpdir):
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            self.cls._set_cached_limits('us-east-1', 'id', [], None, {})
+        assert tmpdir.listdir() == []
+
+    def test_set_sts_error(self, tmpdir):
+        self.mock_sts.get_caller_identity.side_effect = RuntimeError()
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            self.cls._set_cached_limits(
+                'us-east-1', 'id', [], '2015-06-16T20:27:42Z', {}
+            )
+        assert tmpdir.listdir() == []
+
+
 class TestGetLimitCheckId(object):
 
     def setup(self):
@@ -569,6 +917,59 @@ class TestPoll(object):
             }
         }
 
+    def test_cached(self):
+        self.cls.ta_region = 'us-west-2'
+        with patch.multiple(
+            pb,
+            _get_cached_limits=DEFAULT,
+            _get_limit_check_id=DEFAULT,
+            _get_refreshed_check_result=DEFAULT,
+            _set_cached_limits=DEFAULT,
+            autospec=True
+        ) as mocks:
+            mocks['_get_cached_limits'].return_value = {'EC2': {'Foo': 1}}
+            res = self.cls._poll()
+        assert res == {'EC2': {'Foo': 1}}
+        assert mocks['_get_cached_limits'].mock_calls == [
+            call(self.cls, 'us-west-2')
+        ]
+        assert mocks['_get_limit_check_id'].mock_calls == []
+        assert mocks['_get_refreshed_check_result'].mock_calls == []
+        assert mocks['_set_cached_limits'].mock_calls == []
+
+    def test_cached_check_id(self):
+        checks = {
+            'result': {
+                'timestamp': '2015-06-15T20:27:42Z',
+                'flaggedResources': [{
+                    'region': 'us-east-1',
+                    'metadata': ['us-east-1', 'EC2', 'Foo', '10']
+                }]
+            }
+        }
+        metadata = ['Region', 'Service', 'Limit Name', 'Limit Amount']
+        self.cls._cached_check = ('chkid', metadata)
+        with patch.multiple(
+            pb,
+            _get_cached_limits=DEFAULT,
+            _get_limit_check_id=DEFAULT,
+            _get_refreshed_check_result=DEFAULT,
+            _set_cached_limits=DEFAULT,
+            autospec=True
+        ) as mocks:
+            mocks['_get_cached_limits'].return_value = None
+            mocks['_get_refreshed_check_result'].return_value = checks
+            res = self.cls._poll()
+        assert res == {'EC2': {'Foo': 10}}
+        assert mocks['_get_limit_check_id'].mock_calls == []
+        assert mocks['_get_refreshed_check_result'].mock_calls == [
+            call(self.cls, 'chkid')
+        ]
+        assert mocks['_set_cached_limits'].mock_calls == [
+            call(self.cls, 'us-east-1', 'chkid', metadata,
+                 '2015-06-15T20:27:42Z', {'EC2': {'Foo': 10}})
+        ]
+
     def test_no_timestamp(self):
         poll_return_val = {
             'result': {
@@ -1233,22 +1634,40 @@ class TestPollForRefresh(object):
         self.cls.refresh_timeout = None
         check_dt = datetime(2016, 12, 16, hour=10, minute=30, second=12,
                             tzinfo=utc)
-        now_dt = datetime(2016, 12, 16, hour=11, minute=30, second=12,
-                          tzinfo=utc)
+        start_dt = datetime(2016, 12, 16, hour=11, minute=30, second=0)
+        now_dts = [
+            start_dt,
+            start_dt,
+            start_dt + timedelta(seconds=2),
+            start_dt + timedelta(seconds=6),
+            start_dt + timedelta(seconds=14),
+            start_dt + timedelta(seconds=15),
+        ]
+        year = timedelta(days=365).total_seconds()
         statuses = [
             {'statuses': [{'status': 'none'}]},
             {'statuses': [{'status': 'enqueued'}]},
-            {'statuses': [{'status': 'processing'}]},
+            {'statuses': [{
+                'status': 'processing', 'millisUntilNextRefreshable': 1234
+            }]},
             {'statuses': [{'status': 'success'}]}
         ]
         m_s = self.mock_conn.describe_trusted_advisor_check_refresh_statuses
         with patch('%s.logger' % pbm, autospec=True) as mock_logger:
             with patch('%s.sleep' % pbm, autospec=True) as mock_sleep:
-                with patch('%s._get_check_result' % pb, autospec=True) as gcr:
+                with patch.multiple(
+                    pb,
+                    _get_check_result=DEFAULT,
+                    _next_poll_delay=DEFAULT,
+                    autospec=True
+                ) as mocks:
                     with patch('%s.datetime_now' % pbm) as mock_dt_now:
-                        mock_dt_now.return_value = now_dt
+                        mock_dt_now.side_effect = now_dts
                         m_s.side_effect = statuses
-                        gcr.return_value = ({'foo': 'bar'}, check_dt)
+                        mocks['_get_check_result'].return_value = (
+                            {'foo': 'bar'}, check_dt
+                        )
+                        mocks['_next_poll_delay'].side_effect = [2, 4, 8]
                         res = self.cls._poll_for_refresh('abc123')
         assert res == {'foo': 'bar'}
         assert self.mock_conn.mock_calls == [
@@ -1261,24 +1680,29 @@ class TestPollForRefresh(object):
             call.describe_trusted_advisor_check_refresh_statuses(
                 checkIds=['abc123'])
         ]
-        assert gcr.mock_calls == [call(self.cls, 'abc123')]
-        assert mock_sleep.mock_calls == [
-            call(30), call(30), call(30)
+        assert mocks['_get_check_result'].mock_calls == [
+            call(self.cls, 'abc123')
         ]
-        assert mock_dt_now.mock_calls == [
-            call(), call(), call(), call(), call()
+        assert mocks['_next_poll_delay'].mock_calls == [
+            call(self.cls, 0, None, year),
+            call(self.cls, 1, None, year - 2),
+            call(self.cls, 2, 1234, year - 6)
         ]
+        assert mock_sleep.mock_calls == [call(2), call(4), call(8)]
+        assert mock_dt_now.mock_calls == [call()] * 6
+        assert self.cls.refresh_latency == 15.0
         assert mock_logger.mock_calls == [
             call.warning('Polling for TA check %s refresh...', 'abc123'),
             call.debug('Checking refresh status'),
-            call.info('Refresh status: %s; sleeping 30s', 'none'),
+            call.info('Refresh status: %s; sleeping %.1fs', 'none', 2),
             call.debug('Checking refresh status'),
-            call.info('Refresh status: %s; sleeping 30s', 'enqueued'),
+            call.info('Refresh status: %s; sleeping %.1fs', 'enqueued', 4),
             call.debug('Checking refresh status'),
-            call.info('Refresh status: %s; sleeping 30s', 'processing'),
+            call.info('Refresh status: %s; sleeping %.1fs', 'processing', 8),
             call.debug('Checking refresh status'),
             call.info('Refresh status: %s; done polling', 'success'),
-            call.info('Done polling for check refresh'),
+            call.info('Done polling for check refresh after %.1f seconds',
+                      15.0),
             call.debug('Check shows last refresh time of: %s', check_dt)
         ]
 
@@ -1291,16 +1715,25 @@ class TestPollForRefresh(object):
             datetime(2016, 12, 16, hour=11, minute=30, second=0, tzinfo=utc),
             datetime(2016, 12, 16, hour=11, minute=30, second=30, tzinfo=utc),
             datetime(2016, 12, 16, hour=11, minute=31, second=0, tzinfo=utc),
+            datetime(2016, 12, 16, hour=11, minute=31, second=1, tzinfo=utc),
         ]
         status = {'statuses': [{'status': 'processing'}]}
         m_s = self.mock_conn.describe_trusted_advisor_check_refresh_statuses
         with patch('%s.logger' % pbm, autospec=True) as mock_logger:
             with patch('%s.sleep' % pbm, autospec=True) as mock_sleep:
-                with patch('%s._get_check_result' % pb, autospec=True) as gcr:
+                with patch.multiple(
+                    pb,
+                    _get_check_result=DEFAULT,
+                    _next_poll_delay=DEFAULT,
+                    autospec=True
+                ) as mocks:
                     with patch('%s.datetime_now' % pbm) as mock_dt_now:
                         mock_dt_now.side_effect = now_dts
                         m_s.return_value = status
-                        gcr.return_value = ({'foo': 'bar'}, check_dt)
+                        mocks['_get_check_result'].return_value = (
+                            {'foo': 'bar'}, check_dt
+                        )
+                        mocks['_next_poll_delay'].side_effect = [30, 15]
                         res = self.cls._poll_for_refresh('abc123')
         assert res == {'foo': 'bar'}
         assert self.mock_conn.mock_calls == [
@@ -1309,25 +1742,57 @@ class TestPollForRefresh(object):
             call.describe_trusted_advisor_check_refresh_statuses(
                 checkIds=['abc123'])
         ]
-        assert gcr.mock_calls == [call(self.cls, 'abc123')]
-        assert mock_sleep.mock_calls == [
-            call(30), call(30)
-        ]
-        assert mock_dt_now.mock_calls == [
-            call(), call(), call(), call()
+        assert mocks['_next_poll_delay'].mock_calls == [
+            call(self.cls, 0, None, 45.0),
+            call(self.cls, 1, None, 15.0)
         ]
+        assert mock_sleep.mock_calls == [call(30), call(15)]
+        assert mock_dt_now.mock_calls == [call()] * 5
+        assert self.cls.refresh_latency == 61.0
         assert mock_logger.mock_calls == [
             call.warning('Polling for TA check %s refresh...', 'abc123'),
             call.debug('Checking refresh status'),
-            call.info('Refresh status: %s; sleeping 30s', 'processing'),
+            call.info('Refresh status: %s; sleeping %.1fs', 'processing', 30),
             call.debug('Checking refresh status'),
-            call.info('Refresh status: %s; sleeping 30s', 'processing'),
+            call.info('Refresh status: %s; sleeping %.1fs', 'processing', 15),
             call.error('Timed out waiting for TA Check refresh; status=%s',
                        'processing'),
-            call.info('Done polling for check refresh'),
+            call.info('Done polling for check refresh after %.1f seconds',
+                      61.0),
             call.debug('Check shows last refresh time of: %s', check_dt)
         ]
 
+    def test_run_deadline(self):
+        self.cls.refresh_timeout = 45
+        start_dt = datetime(2016, 12, 16, hour=11, minute=30, tzinfo=utc)
+        # start_update_limits() was given less time than the refresh timeout
+        self.cls._poll_cutoff = start_dt + timedelta(seconds=20)
+        now_dts = [
+            start_dt,
+            start_dt,
+            start_dt + timedelta(seconds=21),
+            start_dt + timedelta(seconds=21),
+        ]
+        m_s = self.mock_conn.describe_trusted_advisor_check_refresh_statuses
+        with patch('%s.sleep' % pbm, autospec=True) as mock_sleep:
+            with patch.multiple(
+                pb,
+                _get_check_result=DEFAULT,
+                _next_poll_delay=DEFAULT,
+                autospec=True
+            ) as mocks:
+                with patch('%s.datetime_now' % pbm) as mock_dt_now:
+                    mock_dt_now.side_effect = now_dts
+                    m_s.return_value = {'statuses': [{'status': 'processing'}]}
+                    mocks['_get_check_result'].return_value = ({}, None)
+                    mocks['_next_poll_delay'].return_value = 20
+                    self.cls._poll_for_refresh('abc123')
+        assert mocks['_next_poll_delay'].mock_calls == [
+            call(self.cls, 0, None, 20.0)
+        ]
+        assert mock_sleep.mock_calls == [call(20)]
+        assert self.cls.refresh_latency == 21.0
+
     def test_none(self):
         self.cls.refresh_timeout = None
         check_dt = datetime(2016, 12, 16, hour=10, minute=30, second=12,
@@ -1343,48 +1808,91 @@ class TestPollForRefresh(object):
         m_s = self.mock_conn.describe_trusted_advisor_check_refresh_statuses
         with patch('%s.logger' % pbm, autospec=True) as mock_logger:
             with patch('%s.sleep' % pbm, autospec=True) as mock_sleep:
-                with patch('%s._get_check_result' % pb, autospec=True) as gcr:
+                with patch.multiple(
+                    pb,
+                    _get_check_result=DEFAULT,
+                    _next_poll_delay=DEFAULT,
+                    autospec=True
+                ) as mocks:
                     with patch('%s.datetime_now' % pbm) as mock_dt_now:
                         mock_dt_now.return_value = now_dt
                         m_s.side_effect = statuses
-                        gcr.return_value = ({'foo': 'bar'}, check_dt)
+                        mocks['_get_check_result'].return_value = (
+                            {'foo': 'bar'}, check_dt
+                        )
+                        mocks['_next_poll_delay'].return_value = 1.5
                         res = self.cls._poll_for_refresh('abc123')
         assert res == {'foo': 'bar'}
-        assert self.mock_conn.mock_calls == [
-            call.describe_trusted_advisor_check_refresh_statuses(
-                checkIds=['abc123']),
-            call.describe_trusted_advisor_check_refresh_statuses(
-                checkIds=['abc123']),
-            call.describe_trusted_advisor_check_refresh_statuses(
-                checkIds=['abc123']),
-            call.describe_trusted_advisor_check_refresh_statuses(
-                checkIds=['abc123'])
-        ]
-        assert gcr.mock_calls == [call(self.cls, 'abc123')]
-        assert mock_sleep.mock_calls == [
-            call(30), call(30), call(30)
-        ]
-        assert mock_dt_now.mock_calls == [
-            call(), call(), call(), call(), call()
-        ]
+        assert len(self.mock_conn.mock_calls) == 4
+        assert mock_sleep.mock_calls == [call(1.5), call(1.5), call(1.5)]
+        assert self.cls.refresh_latency == 0.0
         assert mock_logger.mock_calls == [
             call.warning('Polling for TA check %s refresh...', 'abc123'),
             call.debug('Checking refresh status'),
-            call.info('Refresh status: %s; sleeping 30s', 'none'),
+            call.info('Refresh status: %s; sleeping %.1fs', 'none', 1.5),
             call.debug('Checking refresh status'),
-            call.info('Refresh status: %s; sleeping 30s', 'enqueued'),
+            call.info('Refresh status: %s; sleeping %.1fs', 'enqueued', 1.5),
             call.debug('Checking refresh status'),
-            call.info('Refresh status: %s; sleeping 30s', 'processing'),
+            call.info('Refresh status: %s; sleeping %.1fs', 'processing',
+                      1.5),
             call.debug('Checking refresh status'),
             call.warning('Trusted Advisor check refresh status went '
                          'from "%s" to "%s"; refresh is either complete '
                          'or timed out on AWS side. Continuing',
                          'processing', 'none'),
-            call.info('Done polling for check refresh'),
+            call.info('Done polling for check refresh after %.1f seconds',
+                      0.0),
             call.debug('Check shows last refresh time of: %s', check_dt)
         ]
 
 
+class TestNextPollDelay(object):
+
+    def setup(self):
+        self.cls = TrustedAdvisor({}, {})
+
+    def test_backoff(self):
+        with patch('%s.random.uniform' % pbm) as mock_uniform:
+            mock_uniform.side_effect = lambda a, b: b
+            res = [
+                self.cls._next_poll_delay(x, None, 1000) for x in range(6)
+            ]
+        assert res == [2.0, 4.0, 8.0, 16.0, 30.0, 30.0]
+
+    def test_jitter(self):
+        with patch('%s.random.uniform' % pbm) as mock_uniform:
+            mock_uniform.return_value = 0.25
+            res = self.cls._next_poll_delay(1, None, 1000)
+        assert res == 2.25
+        assert mock_uniform.mock_calls == [call(0, 2.0)]
+
+    def test_jitter_bounds(self):
+        for attempt in range(100):
+            res = self.cls._next_poll_delay(attempt, None, 1000)
+            cap = min(30.0, 2.0 * (2 ** min(attempt, 16)))
+            assert cap / 2.0 <= res <= cap
+
+    def test_millis_until_refreshable(self):
+        with patch('%s.random.uniform' % pbm) as mock_uniform:
+            mock_uniform.side_effect = lambda a, b: b
+            assert self.cls._next_poll_delay(4, 2500, 1000) == 2.5
+            assert self.cls._next_poll_delay(0, 60000, 1000) == 2.0
+            assert self.cls._next_poll_delay(4, 0, 1000) == 30.0
+
+    def test_millis_until_refreshable_floor(self):
+        with patch('%s.random.uniform' % pbm) as mock_uniform:
+            mock_uniform.side_effect = lambda a, b: b
+            assert self.cls._next_poll_delay(4, 1, 1000) == 2.0
+            assert self.cls._next_poll_delay(0, 1, 1000) == 2.0
+            assert self.cls._next_poll_delay(4, 1, 0.5) == 0.5
+
+    def test_remaining(self):
+        with patch('%s.random.uniform' % pbm) as mock_uniform:
+            mock_uniform.side_effect = lambda a, b: b
+            assert self.cls._next_poll_delay(4, None, 12.5) == 12.5
+            assert self.cls._next_poll_delay(4, None, -1) == 0.0
+
+
 class TestUpdateServices(object):
 
     def setup(self):
@@ -1438,9 +1946,11 @@ class TestUpdateServices(object):
                 'VPC Elastic IP addresses (EIPs)': 11,
             }
         }
+        self.cls.limit_index = Mock(spec_set=LimitIndex)
+        self.cls.limit_index.get_ta_service_limits.side_effect = \
+            ta_services.get
         with patch('awslimitchecker.trustedadvisor'
                    '.logger', autospec=True) as mock_logger:
-            self.cls.ta_services = ta_services
             self.cls._update_services(ta_results)
         assert mock_logger.mock_calls == [
             call.debug("Updating TA limits on all services"),
@@ -1467,7 +1977,7 @@ class TestUpdateServices(object):
         ]
 
 
-class TestMakeTAServiceDict(object):
+class TestLimitIndex(object):
 
     def setup(self):
         self.mock_conn = Mock()
@@ -1486,6 +1996,7 @@ class TestMakeTAServiceDict(object):
 
     def test_simple(self):
         mock_ec2 = Mock(spec_set=_AwsService)
+        type(mock_ec2).service_name = 'EC2'
         mock_el1 = Mock(spec_set=AwsLimit)
         type(mock_el1).name = 'el1'
         type(mock_el1).ta_service_name = 'EC2'
@@ -1500,6 +2011,7 @@ class TestMakeTAServiceDict(object):
         }
 
         mock_vpc = Mock(spec_set=_AwsService)
+        type(mock_vpc).service_name = 'VPC'
         mock_vl1 = Mock(spec_set=AwsLimit)
         type(mock_vl1).name = 'vl1'
         type(mock_vl1).ta_service_name = 'VPC'
@@ -1530,8 +2042,16 @@ class TestMakeTAServiceDict(object):
                 'other limit': mock_vl2
             }
         }
-        self.cls.all_services = svcs
-        assert self.cls._make_ta_service_dict() == expected
+        cls = TrustedAdvisor(svcs, {})
+        assert cls.all_services == svcs
+        for ta_svc, ta_limits in expected.items():
+            assert cls.limit_index.get_ta_service_limits(ta_svc) == ta_limits
+        assert cls.limit_index.get_ta_service_limits('Bar') is None
+
+    def test_shared(self):
+        idx = LimitIndex()
+        cls = TrustedAdvisor(self.services, {}, limit_index=idx)
+        assert cls.limit_index is idx
 
 
 class TestDatetimeNow(object):
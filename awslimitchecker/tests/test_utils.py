@@ -38,16 +38,22 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 import argparse
+import fcntl
+import json
+import os
 import pytest
 import sys
+import time
 import termcolor
 
 from awslimitchecker.limit import AwsLimit, AwsLimitUsage
 from awslimitchecker.utils import (
     StoreKeyValuePair, dict2cols, paginate_dict, _get_dict_value_by_path,
     _set_dict_value_by_path, _get_latest_version, color_output,
-    issue_string_tuple
+    issue_string_tuple, _cache_dir, _LatestVersionCheck, _read_cache_file,
+    _write_cache_file, _DurationHistory, _cache_file_lock
 )
+from awslimitchecker.version import _VERSION
 
 # https://code.google.com/p/mock/issues/detail?id=249
 # py>=3.4 should use unittest.mock not the mock package on pypi
@@ -467,6 +473,187 @@ class TestGetCurrentVersion(object):
         assert mock_logger.mock_calls == []
 
 
+class TestCacheDir(object):
+
+    def test_env_var(self):
+        with patch.dict(os.environ, {'AWSLIMITCHECKER_CACHE_DIR': '/foo/bar'}):
+            assert _cache_dir() == '/foo/bar'
+
+    def test_xdg(self):
+        env = {'AWSLIMITCHECKER_CACHE_DIR': '', 'XDG_CACHE_HOME': '/xdg'}
+        with patch.dict(os.environ, env):
+            assert _cache_dir() == '/xdg/awslimitchecker'
+
+    def test_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            with patch('%s.os.path.expanduser' % pbm) as mock_eu:
+                mock_eu.return_value = '/home/me'
+                assert _cache_dir() == '/home/me/.cache/awslimitchecker'
+
+
+class TestCacheFiles(object):
+
+    def test_round_trip(self, tmpdir):
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir.join('a', 'b'))}
+        with patch.dict(os.environ, env):
+            assert _read_cache_file('foo.json') is None
+            _write_cache_file('foo.json', {'foo': [1, 2]})
+            assert _read_cache_file('foo.json') == {'foo': [1, 2]}
+        assert tmpdir.join('a', 'b').listdir() == [
+            tmpdir.join('a', 'b', 'foo.json')
+        ]
+
+    def test_read_invalid(self, tmpdir):
+        tmpdir.join('foo.json').write('{foo')
+        with patch.dict(os.environ, {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}):
+            assert _read_cache_file('foo.json') is None
+
+    def test_write_error(self, tmpdir):
+        tmpdir.join('notadir').write('')
+        path = str(tmpdir.join('notadir'))
+        with patch.dict(os.environ, {'AWSLIMITCHECKER_CACHE_DIR': path}):
+            with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+                _write_cache_file('foo.json', {})
+        assert mock_logger.mock_calls == [
+            call.debug('Unable to write cache file %s',
+                       os.path.join(path, 'foo.json'), exc_info=True)
+        ]
+
+
+class TestCacheFileLock(object):
+
+    def test_lock(self, tmpdir):
+        path = str(tmpdir.join('a'))
+        with patch.dict(os.environ, {'AWSLIMITCHECKER_CACHE_DIR': path}):
+            with patch('%s.fcntl.flock' % pbm) as mock_flock:
+                with _cache_file_lock('foo.json'):
+                    assert tmpdir.join('a', 'foo.json.lock').exists()
+        assert len(mock_flock.mock_calls) == 1
+        assert mock_flock.mock_calls[0][1][1] == fcntl.LOCK_EX
+
+    def test_lock_error(self, tmpdir):
+        tmpdir.join('notadir').write('')
+        path = str(tmpdir.join('notadir'))
+        ran = []
+        with patch.dict(os.environ, {'AWSLIMITCHECKER_CACHE_DIR': path}):
+            with patch('%s.logger' % pbm, autospec=True) as mock_logger:
+                with _cache_file_lock('foo.json'):
+                    ran.append(True)
+        assert ran == [True]
+        assert mock_logger.mock_calls == [
+            call.debug('Unable to lock cache file %s',
+                       os.path.join(path, 'foo.json.lock'), exc_info=True)
+        ]
+
+
+class TestDurationHistory(object):
+
+    def test_round_trip(self, tmpdir):
+        with patch.dict(os.environ, {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}):
+            cls = _DurationHistory('123/us-east-1', weight=0.25)
+            assert cls.get() == {}
+            cls.update({})
+            assert tmpdir.listdir() == []
+            cls.update({'EC2': 8.0, 'S3': 1.0})
+            cls.update({'EC2': 4.0})
+            _DurationHistory('other/region').update({'EC2': 2.0})
+            assert cls.get() == {'EC2': 7.0, 'S3': 1.0}
+        assert json.loads(tmpdir.join('service_durations.json').read()) == {
+            '123/us-east-1': {'EC2': 7.0, 'S3': 1.0},
+            'other/region': {'EC2': 2.0}
+        }
+
+    def test_invalid(self, tmpdir):
+        tmpdir.join('service_durations.json').write('[1, 2]')
+        with patch.dict(os.environ, {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}):
+            cls = _DurationHistory('k')
+            assert cls.get() == {}
+            cls.update({'EC2': 1.0})
+            assert cls.get() == {'EC2': 1.0}
+
+    def test_update_locked(self, tmpdir):
+        with patch.dict(os.environ, {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}):
+            with patch('%s._cache_file_lock' % pbm) as mock_lock:
+                _DurationHistory('k').update({'EC2': 1.0})
+        assert mock_lock.mock_calls[0] == call('service_durations.json')
+        assert mock_lock.return_value.__enter__.call_count == 1
+        assert mock_lock.return_value.__exit__.call_count == 1
+
+
+class TestLatestVersionCheck(object):
+
+    def setup(self):
+        self.cls = _LatestVersionCheck(cache_interval=3600)
+
+    def write_cache(self, tmpdir, **kwargs):
+        data = {'checked': time.time(), 'running': _VERSION, 'latest': '9.9.9'}
+        data.update(kwargs)
+        tmpdir.join('latest_version.json').write(json.dumps(data))
+
+    def test_init(self):
+        assert self.cls.cache_interval == 3600
+        assert self.cls.latest_version is None
+        assert self.cls._thread is None
+        assert self.cls.result() == (False, None)
+
+    def test_start_uncached(self, tmpdir):
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir.join('sub'))}
+        with patch.dict(os.environ, env):
+            with patch('%s._get_latest_version' % pbm) as mock_glv:
+                mock_glv.return_value = '1.2.3'
+                self.cls.start()
+                assert self.cls.result(timeout=5) == (True, '1.2.3')
+                self.cls._thread.join()
+        assert mock_glv.mock_calls == [call()]
+        assert self.cls._thread.daemon is True
+        data = json.loads(tmpdir.join('sub', 'latest_version.json').read())
+        assert data['running'] == _VERSION
+        assert data['latest'] == '1.2.3'
+        assert time.time() - data['checked'] < 60
+
+    def test_start_cached(self, tmpdir):
+        self.write_cache(tmpdir)
+        env = {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}
+        with patch.dict(os.environ, env):
+            with patch('%s._get_latest_version' % pbm) as mock_glv:
+                self.cls.start()
+        assert mock_glv.mock_calls == []
+        assert self.cls._thread is None
+        assert self.cls.result() == (True, '9.9.9')
+
+    def test_cache_expired(self, tmpdir):
+        self.write_cache(tmpdir, checked=time.time() - 3601)
+        with patch.dict(os.environ, {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}):
+            assert self.cls._read_cache() is None
+
+    def test_cache_other_version(self, tmpdir):
+        self.write_cache(tmpdir, running='0.0.1')
+        with patch.dict(os.environ, {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}):
+            assert self.cls._read_cache() is None
+
+    def test_cache_invalid(self, tmpdir):
+        tmpdir.join('latest_version.json').write('{foo')
+        with patch.dict(os.environ, {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}):
+            assert self.cls._read_cache() is None
+
+    def test_cache_disabled(self, tmpdir):
+        self.write_cache(tmpdir)
+        self.cls.cache_interval = 0
+        with patch.dict(os.environ, {'AWSLIMITCHECKER_CACHE_DIR': str(tmpdir)}):
+            assert self.cls._read_cache() is None
+            self.cls.latest_version = '1.0.0'
+            self.cls._write_cache()
+        data = json.loads(tmpdir.join('latest_version.json').read())
+        assert data['latest'] == '9.9.9'
+
+    def test_run_exception_sets_done(self):
+        with patch('%s._get_latest_version' % pbm) as mock_glv:
+            mock_glv.side_effect = RuntimeError('foo')
+            with pytest.raises(RuntimeError):
+                self.cls._run()
+        assert self.cls.result() == (True, None)
+
+
 class TestColorOutput(object):
 
     def test_colored(self):
@@ -0,0 +1,195 @@
+"""
+awslimitchecker/tests/test_workqueue.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import sqlite3
+import sys
+
+import pytest
+
+from awslimitchecker.workqueue import WorkQueue
+
+# https://code.google.com/p/mock/issues/detail?id=249
+# py>=3.4 should use unittest.mock not the mock package on pypi
+if (
+        sys.version_info[0] < 3 or
+        sys.version_info[0] == 3 and sys.version_info[1] < 4
+):
+    from mock import patch
+else:
+    from unittest.mock import patch
+
+pbm = 'awslimitchecker.workqueue'
+
+UNITS = [('1', 'r1', 'S1'), ('1', 'r1', 'S2'), ('2', 'r1', 'S1')]
+
+
+class TestWorkQueue(object):
+
+    def setup(self):
+        self.now = 1000.0
+
+    def queue(self, tmpdir):
+        return WorkQueue(str(tmpdir.join('queue.db')))
+
+    def at(self, now):
+        self.now = now
+        return patch('%s.time.time' % pbm, side_effect=lambda: self.now)
+
+    def test_empty(self, tmpdir):
+        q = self.queue(tmpdir)
+        assert q.get_run_data() == (None, None)
+        assert q.lease('w1') is None
+        assert q.reap() == 0
+        assert q.counts() == {
+            'pending': 0, 'leased': 0, 'done': 0, 'failed': 0
+        }
+        assert q.is_finished() is True
+        assert q.finished_items() == []
+        q.close()
+
+    def test_start_run(self, tmpdir):
+        q = self.queue(tmpdir)
+        run_id = q.start_run(UNITS, {'foo': 'bar'})
+        assert q.get_run_data() == (run_id, {'foo': 'bar'})
+        assert q.counts()['pending'] == 3
+        assert q.is_finished() is False
+        # another connection sees the same run
+        assert self.queue(tmpdir).get_run_data() == (run_id, {'foo': 'bar'})
+
+    def test_start_run_replaces_previous(self, tmpdir):
+        q = self.queue(tmpdir)
+        q.start_run(UNITS, {})
+        item = q.lease('w1')
+        run_id = q.start_run(UNITS[:1], {'a': 1})
+        assert q.counts()['pending'] == 1
+        assert q.lease('w1') == {
+            'id': 4, 'run_id': run_id, 'account_id': '1', 'region': 'r1',
+            'service': 'S1', 'attempts': 1
+        }
+        # a stale worker cannot complete an item of the old run
+        assert q.complete(item['id'], 'w1', {}, 1.0) is False
+
+    def test_start_run_bad_attempts(self, tmpdir):
+        with pytest.raises(ValueError) as excinfo:
+            self.queue(tmpdir).start_run(UNITS, {}, max_attempts=0)
+        assert str(excinfo.value) == 'max_attempts must be at least 1'
+
+    def test_lease_and_complete(self, tmpdir):
+        q = self.queue(tmpdir)
+        run_id = q.start_run(UNITS, {})
+        with self.at(1000.0):
+            i1 = q.lease('w1')
+            i2 = q.lease('w2')
+        assert i1 == {
+            'id': 1, 'run_id': run_id, 'account_id': '1', 'region': 'r1',
+            'service': 'S1', 'attempts': 1
+        }
+        assert i2['service'] == 'S2'
+        assert q.counts() == {
+            'pending': 1, 'leased': 2, 'done': 0, 'failed': 0
+        }
+        # only the lease owner may complete an item
+        assert q.complete(i1['id'], 'w2', {'x': 1}, 2.0) is False
+        assert q.complete(i1['id'], 'w1', {'x': 1}, 2.0) is True
+        assert q.complete(i1['id'], 'w1', {'x': 2}, 2.0) is False
+        assert q.finished_items() == [{
+            'account_id': '1', 'region': 'r1', 'service': 'S1',
+            'state': 'done', 'duration': 2.0, 'result': {'x': 1},
+            'error': None
+        }]
+
+    def test_fail_and_retry(self, tmpdir):
+        q = self.queue(tmpdir)
+        q.start_run(UNITS[:1], {}, max_attempts=2)
+        item = q.lease('w1')
+        assert q.fail(item['id'], 'w2', 'nope') is False
+        assert q.fail(item['id'], 'w1', 'E: one') is True
+        assert q.counts()['pending'] == 1
+        item = q.lease('w2')
+        assert item['attempts'] == 2
+        assert q.fail(item['id'], 'w2', 'E: two') is True
+        assert q.lease('w1') is None
+        assert q.is_finished() is True
+        assert q.finished_items() == [{
+            'account_id': '1', 'region': 'r1', 'service': 'S1',
+            'state': 'failed', 'duration': None, 'result': None,
+            'error': 'E: two'
+        }]
+
+    def test_retry_then_complete(self, tmpdir):
+        q = self.queue(tmpdir)
+        q.start_run(UNITS[:1], {})
+        item = q.lease('w1')
+        q.fail(item['id'], 'w1', 'E: one')
+        item = q.lease('w1')
+        assert q.complete(item['id'], 'w1', [], 1.5) is True
+        assert q.finished_items()[0]['error'] is None
+
+    def test_lease_expiry(self, tmpdir):
+        q = self.queue(tmpdir)
+        q.start_run(UNITS[:2], {}, lease_seconds=10, max_attempts=2)
+        with self.at(1000.0):
+            i1 = q.lease('w1')
+            q.lease('w1')
+        with self.at(1005.0):
+            assert q.reap() == 0
+        with self.at(1011.0):
+            # both expired leases are reclaimed; the first is re-leased
+            i3 = q.lease('w2')
+            assert q.counts()['pending'] == 1
+        assert i3['id'] == i1['id']
+        assert i3['attempts'] == 2
+        # the first worker's late result is discarded
+        assert q.complete(i1['id'], 'w1', {}, 1.0) is False
+        with self.at(1022.0):
+            assert q.reap() == 1
+        assert q.counts() == {
+            'pending': 1, 'leased': 0, 'done': 0, 'failed': 1
+        }
+        assert q.finished_items()[0]['error'] == 'Lease expired after 2 ' \
+                                                 'attempt(s)'
+
+    def test_transaction_rollback(self, tmpdir):
+        q = self.queue(tmpdir)
+        q.start_run(UNITS, {})
+        with pytest.raises(sqlite3.OperationalError):
+            with q._transaction() as cur:
+                cur.execute('DELETE FROM items')
+                cur.execute('SELECT nothing FROM nowhere')
+        assert q.counts()['pending'] == 3
@@ -0,0 +1,318 @@
+"""
+awslimitchecker/thresholds.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+from array import array
+from operator import attrgetter
+import logging
+
+from awslimitchecker.limit import ThresholdResult
+
+logger = logging.getLogger(__name__)
+
+#: Used for unset count thresholds; comparisons against NaN are always False.
+_NAN = float('nan')
+
+
+def _import_numpy():
+    """
+    Import NumPy only when :py:class:`~.ColumnarThresholds` needs it, as it
+    is slow to import and most runs never evaluate thresholds columnarly.
+
+    :returns: the :py:mod:`numpy` module, or None if it is not installed
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class ColumnarThresholds(object):
+
+    def __init__(self, limits, use_numpy=None, min_usages=32):
+        """
+        Evaluate the thresholds of many :py:class:`~.AwsLimit` instances in
+        one pass. The usage and effective maximum of every
+        :py:class:`~.AwsLimitUsage` are packed into contiguous columns, and
+        the four thresholds into per-limit columns, so that
+        :py:meth:`~.AwsLimit.get_limit` and
+        :py:meth:`~.AwsLimit._get_thresholds` are called once per limit
+        rather than once per usage. The columns are
+        :py:class:`array.array` instances, which NumPy (when importable) reads
+        without copying.
+
+        Packing has a fixed per-limit cost, so limits with fewer than
+        ``min_usages`` usages are evaluated with
+        :py:meth:`~.AwsLimit.check_thresholds` instead.
+
+        :py:meth:`~.evaluate` gives the same results (and stores the same
+        :py:class:`~.ThresholdResult` on each limit) as calling
+        :py:meth:`~.AwsLimit.check_thresholds` on each limit.
+
+        :param limits: the limits to evaluate
+        :type limits: :py:obj:`list` of :py:class:`~.AwsLimit`
+        :param use_numpy: whether to use NumPy; defaults to True if it can be
+          imported. Passing True when it is not installed raises ValueError.
+        :type use_numpy: bool
+        :param min_usages: minimum number of usages for a limit to be packed
+        :type min_usages: int
+        :raises: ValueError
+        """
+        self._numpy = None
+        if use_numpy is None or use_numpy:
+            self._numpy = _import_numpy()
+        if use_numpy is None:
+            use_numpy = self._numpy is not None
+        if use_numpy and self._numpy is None:
+            raise ValueError('numpy is not installed')
+        self.use_numpy = use_numpy
+        self.min_usages = min_usages
+        self.limits = list(limits)
+        #: indexes of limits evaluated by :py:meth:`~.AwsLimit.check_thresholds`
+        self._unpacked = []
+        #: indexes (into ``self.limits``) of the packed limits
+        self._packed = []
+        #: per-packed-limit 2-tuple of the limit's usage (a list of
+        #: :py:class:`~.AwsLimitUsage` or a :py:class:`~.CompactUsageStore`)
+        #: and the indexes into it that were packed (None for all)
+        self._sources = []
+        #: per-packed-limit index of its first row
+        self._starts = []
+        #: per-row usage values
+        self._usage = array('d')
+        #: per-row effective limit (usage maximum, or the limit's value)
+        self._limit = array('d')
+        #: per-packed-limit number of rows
+        self._counts = array('l')
+        #: per-packed-limit thresholds; unset count thresholds are NaN
+        self._warn_int = array('d')
+        self._warn_pct = array('d')
+        self._crit_int = array('d')
+        self._crit_pct = array('d')
+        self._pack()
+
+    def _pack(self):
+        """
+        Fill the column arrays from ``self.limits``. Usages whose effective
+        limit is unlimited (None) or zero are not packed, as
+        :py:meth:`~.AwsLimit.check_thresholds` skips them.
+        """
+        get_value = attrgetter('value')
+        get_maximum = attrgetter('maximum')
+        values = []
+        counts = []
+        thresholds = []
+        for idx, lim in enumerate(self.limits):
+            # read the usage container directly, so a CompactUsageStore or
+            # TopUsageStore is packed without creating AwsLimitUsage objects
+            usages = lim._current_usage
+            if len(usages) < self.min_usages or len(usages) == 0:
+                self._unpacked.append(idx)
+                continue
+            effective = lim.get_limit()
+            if lim._uses_usage_store():
+                maxima = usages.get_maxima()
+            else:
+                maxima = list(map(get_maximum, usages))
+            keep = None
+            if any(maxima):
+                # per-resource maximums; skip rows without a usable limit
+                usable = effective is not None and effective != 0
+                keep = [i for i, m in enumerate(maxima) if m or usable]
+                self._limit.extend([maxima[i] or effective for i in keep])
+            elif effective is None or effective == 0:
+                continue
+            else:
+                self._limit.extend(array('d', [effective]) * len(usages))
+            if lim._uses_usage_store():
+                vals = usages.get_values()
+            else:
+                vals = list(map(get_value, usages))
+            if keep is not None:
+                if len(keep) == 0:
+                    continue
+                vals = [vals[i] for i in keep]
+            self._packed.append(idx)
+            self._sources.append((usages, keep))
+            self._starts.append(len(values))
+            counts.append(len(vals))
+            values.extend(vals)
+            thresholds.append(lim._get_thresholds())
+        self._usage = array('d', values)
+        self._counts = array('l', counts)
+        for name, col in zip(
+            ['_warn_int', '_warn_pct', '_crit_int', '_crit_pct'],
+            zip(*thresholds)
+        ):
+            setattr(self, name, array(
+                'd', [_NAN if x is None else x for x in col]
+            ))
+        logger.debug('Packed %d usage(s) of %d limit(s) for threshold '
+                     'evaluation; %d limit(s) evaluated individually',
+                     len(self._usage), len(self._packed),
+                     len(self._unpacked))
+
+    def _classify_numpy(self):
+        """
+        Classify every row with NumPy.
+
+        :returns: 3-tuple of dicts, each of packed limit position to a list of
+          the row indexes of that limit (ascending) that crossed a count
+          critical threshold, a percent critical threshold, or a warning
+          threshold, respectively
+        :rtype: tuple
+        """
+        numpy = self._numpy
+        owner = numpy.repeat(
+            numpy.arange(len(self._counts)),
+            numpy.frombuffer(self._counts, dtype=numpy.dtype('l'))
+        )
+
+        def column(arr):
+            return numpy.frombuffer(arr, dtype=numpy.float64)
+
+        def per_row(arr):
+            return column(arr)[owner]
+
+        def by_limit(mask):
+            rows = numpy.flatnonzero(mask)
+            if len(rows) == 0:
+                return {}
+            owners = owner[rows]
+            bounds = numpy.flatnonzero(owners[1:] != owners[:-1]) + 1
+            starts = numpy.concatenate(([0], bounds))
+            return dict(zip(
+                owners[starts].tolist(),
+                [x.tolist() for x in numpy.split(rows, bounds)]
+            ))
+
+        usage = column(self._usage)
+        pct = (usage / column(self._limit)) * 100
+        crit_count = usage >= per_row(self._crit_int)
+        remaining = ~crit_count
+        crit = remaining & (pct >= per_row(self._crit_pct))
+        remaining &= ~crit
+        warn = remaining & (
+            (usage >= per_row(self._warn_int)) |
+            (pct >= per_row(self._warn_pct))
+        )
+        return by_limit(crit_count), by_limit(crit), by_limit(warn)
+
+    def _classify_array(self):
+        """
+        Classify every row in pure Python; see :py:meth:`~._classify_numpy`.
+
+        :rtype: tuple
+        """
+        crit_count = {}
+        crit = {}
+        warn = {}
+        start = 0
+        for pos, count in enumerate(self._counts):
+            end = start + count
+            warn_int = self._warn_int[pos]
+            warn_pct = self._warn_pct[pos]
+            crit_int = self._crit_int[pos]
+            crit_pct = self._crit_pct[pos]
+            for i, usage, limit in zip(
+                range(start, end), self._usage[start:end],
+                self._limit[start:end]
+            ):
+                pct = (usage / limit) * 100
+                if usage >= crit_int:
+                    crit_count.setdefault(pos, []).append(i)
+                elif pct >= crit_pct:
+                    crit.setdefault(pos, []).append(i)
+                elif usage >= warn_int or pct >= warn_pct:
+                    warn.setdefault(pos, []).append(i)
+            start = end
+        return crit_count, crit, warn
+
+    def evaluate(self):
+        """
+        Evaluate all usages against their thresholds, storing a new
+        :py:class:`~.ThresholdResult` on each limit exactly as
+        :py:meth:`~.AwsLimit.check_thresholds` does.
+
+        :returns: for each limit passed to the constructor (in order), True if
+          its usage is within thresholds, False otherwise
+        :rtype: :py:obj:`list` of :py:obj:`bool`
+        """
+        ok = [True] * len(self.limits)
+        warnings = {}
+        criticals = {}
+        if len(self._usage) > 0:
+            if self.use_numpy:
+                crit_count, crit, warn = self._classify_numpy()
+            else:
+                crit_count, crit, warn = self._classify_array()
+            for pos in crit_count:
+                ok[self._packed[pos]] = False
+            for pos, rows in crit.items():
+                criticals[self._packed[pos]] = self._get_usages(pos, rows)
+                ok[self._packed[pos]] = False
+            for pos, rows in warn.items():
+                warnings[self._packed[pos]] = self._get_usages(pos, rows)
+                ok[self._packed[pos]] = False
+        unpacked = set(self._unpacked)
+        for idx, lim in enumerate(self.limits):
+            if idx in unpacked:
+                ok[idx] = lim.check_thresholds()
+                continue
+            lim._threshold_result = ThresholdResult(
+                ok[idx], warnings.get(idx, ()), criticals.get(idx, ())
+            )
+        return ok
+
+    def _get_usages(self, pos, rows):
+        """
+        Return the :py:class:`~.AwsLimitUsage` instances for some rows of a
+        packed limit.
+
+        :param pos: position of the limit in the packed limits
+        :type pos: int
+        :param rows: row indexes
+        :type rows: list
+        :rtype: tuple
+        """
+        usages, keep = self._sources[pos]
+        start = self._starts[pos]
+        if keep is None:
+            return tuple([usages[i - start] for i in rows])
+        return tuple([usages[keep[i - start]] for i in rows])
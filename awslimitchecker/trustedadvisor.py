@@ -38,17 +38,24 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 """
 
 import os
+import random
+import threading
 from botocore.exceptions import ClientError
 from dateutil import parser
 import logging
-from .connectable import Connectable
+from .connectable import Connectable, _client_lock, boto3_client
+from .limitindex import LimitIndex
+from .utils import _read_cache_file, _write_cache_file, _cache_file_lock
 from datetime import datetime, timedelta
 from pytz import utc
 from time import sleep
-from copy import deepcopy
 
 logger = logging.getLogger(__name__)
 
+#: Guards read-modify-write of the per-account results cache file, which
+#: checkers for several regions of one account may update concurrently.
+_cache_lock = threading.Lock()
+
 
 class TrustedAdvisor(Connectable):
     """
@@ -59,9 +66,16 @@ class TrustedAdvisor(Connectable):
     service_name = 'TrustedAdvisor'
     api_name = 'support'
 
+    #: seconds to wait before the first check refresh status re-poll
+    poll_initial_interval = 2.0
+
+    #: maximum seconds to wait between check refresh status polls
+    poll_max_interval = 30.0
+
     def __init__(self, all_services, boto_connection_kwargs,
                  ta_refresh_mode=None, ta_refresh_timeout=None,
-                 ta_api_region='us-east-1'):
+                 ta_api_region='us-east-1', cache_results=False,
+                 limit_index=None):
         """
         Class to contain all TrustedAdvisor-related logic.
 
@@ -116,40 +130,148 @@ class TrustedAdvisor(Connectable):
           TrustedAdvisor API. This is always us-east-1 for
           non GovCloud accounts.
         :type ta_api_region: str
+        :param cache_results: Whether to cache the parsed Service Limits
+          check results on disk (per account and region), and reuse them
+          while the check's timestamp is unchanged.
+        :type cache_results: bool
+        :param limit_index: the :py:class:`~.LimitIndex` used to look up limits
+          by Trusted Advisor service and limit name. If None, one is built
+          from ``all_services``.
+        :type limit_index: :py:class:`~.LimitIndex`
         """
         self.conn = None
+        self.cache_results = cache_results
+        self._sts_conn = None
+        self._account_id = None
+        self._cached_check = None
         self.have_ta = True
         self.ta_region = boto_connection_kwargs.get('region_name')
-        ta_kwargs = deepcopy(boto_connection_kwargs)
+        ta_kwargs = dict(boto_connection_kwargs)
         ta_kwargs['region_name'] = ta_api_region
         self._boto3_connection_kwargs = ta_kwargs
         self.refresh_mode = ta_refresh_mode
         self.refresh_timeout = ta_refresh_timeout
         self.all_services = all_services
-        self.ta_services = self._make_ta_service_dict()
+        if limit_index is None:
+            limit_index = LimitIndex(all_services)
+        self.limit_index = limit_index
         self.limits_updated = False
+        self._poll_thread = None
+        self._poll_result = None
+        self._poll_exception = None
+        self._poll_cutoff = None
+        self.refresh_latency = None
 
-    def update_limits(self):
+    def connect(self):
         """
-        Poll 'Service Limits' check results from Trusted Advisor, if possible.
-        Iterate over all :py:class:`~.AwsLimit` objects for the given services
-        and update their limits from TA if present in TA checks.
+        Connect to the Support API (see :py:meth:`~.Connectable.connect`)
+        and, if results are cached, to STS to look up the account ID that
+        the cache is keyed on.
+        """
+        super(TrustedAdvisor, self).connect()
+        if self.cache_results and self._sts_conn is None:
+            with _client_lock:
+                self._sts_conn = boto3_client(
+                    'sts', **self._boto3_connection_kwargs
+                )
 
-        :param services: dict of service name (string) to
-          :py:class:`~._AwsService` objects
-        :type services: dict
+    def start_update_limits(self, timeout=None):
         """
-        if self.limits_updated:
-            logger.debug('Already polled TA; skipping update')
+        Begin polling Trusted Advisor (including any refresh and wait
+        required by ``ta_refresh_mode``) in a background thread, so that it
+        overlaps with usage collection. The results are only applied to the
+        :py:class:`~.AwsLimit` objects by the next call to
+        :py:meth:`~.update_limits`, which waits for the poll to finish (or for
+        ``ta_refresh_timeout`` to expire).
+
+        The client is created in the calling thread, as boto3 client creation
+        is not thread-safe; only API calls happen in the background.
+
+        :param timeout: if set, the number of seconds from now after which
+          any refresh wait gives up, even if ``ta_refresh_timeout`` is longer
+          or unset (i.e. the time left before the run deadline)
+        :type timeout: :py:obj:`float` or :py:data:`None`
+        """
+        if self.limits_updated or self._poll_thread is not None:
             return
+        self._poll_cutoff = None
+        if timeout is not None:
+            self._poll_cutoff = datetime_now() + timedelta(seconds=timeout)
+        self.connect()
+        self._poll_result = None
+        self._poll_exception = None
+        self._poll_thread = threading.Thread(
+            target=self._background_poll, name='awslimitchecker-ta-poll'
+        )
+        self._poll_thread.daemon = True
+        self._poll_thread.start()
+
+    def _background_poll(self):
+        """
+        Target of the background thread started by
+        :py:meth:`~.start_update_limits`; store the result of
+        :py:meth:`~._fetch_limits`, or the exception it raised.
+        """
+        try:
+            self._poll_result = self._fetch_limits()
+        except Exception as ex:
+            self._poll_exception = ex
+
+    def _fetch_limits(self):
+        """
+        Connect and poll Trusted Advisor, if it should be used.
+
+        :return: results of :py:meth:`~._poll`, or None if Trusted Advisor
+          should not be used
+        :rtype: :py:obj:`dict` or :py:data:`None`
+        """
         self.connect()
         if self._dont_use_ta():
             logger.info(
                 'Not using Trusted Advisor in regions outside of China or '
                 'GovCloud; export FORCE_USE_TA=true to override.'
             )
+            return None
+        return self._poll()
+
+    def update_limits(self, timeout=None):
+        """
+        Poll 'Service Limits' check results from Trusted Advisor, if possible.
+        Iterate over all :py:class:`~.AwsLimit` objects for the given services
+        and update their limits from TA if present in TA checks.
+
+        If :py:meth:`~.start_update_limits` was called, wait for its
+        background poll to finish and use its results; any exception raised
+        by the poll is re-raised here.
+
+        :param timeout: if set, the number of seconds to wait for the
+          background poll; if it has not finished by then, its limits are not
+          applied (the poll keeps running, and a later call can use it).
+        :type timeout: :py:obj:`float` or :py:data:`None`
+        """
+        if self.limits_updated:
+            logger.debug('Already polled TA; skipping update')
+            return
+        if self._poll_thread is None:
+            ta_results = self._fetch_limits()
+        else:
+            logger.debug('Waiting for background Trusted Advisor poll')
+            self._poll_thread.join(timeout)
+            if self._poll_thread.is_alive():
+                logger.warning(
+                    'Trusted Advisor poll did not finish within %.1f '
+                    'seconds (the run deadline); not using Trusted Advisor '
+                    'limits for this run', timeout
+                )
+                return
+            self._poll_thread = None
+            if self._poll_exception is not None:
+                ex = self._poll_exception
+                self._poll_exception = None
+                raise ex
+            ta_results = self._poll_result
+        if ta_results is None:
             return
-        ta_results = self._poll()
         self._update_services(ta_results)
         self.limits_updated = True
 
@@ -194,7 +316,12 @@ class TrustedAdvisor(Connectable):
 
         """
         logger.info("Beginning TrustedAdvisor poll")
-        tmp = self._get_limit_check_id()
+        region = self.ta_region or self.conn._client_config.region_name
+        cached = self._get_cached_limits(region)
+        if cached is not None:
+            logger.info("Finished TrustedAdvisor poll (cached results)")
+            return cached
+        tmp = self._cached_check or self._get_limit_check_id()
         if not self.have_ta:
             logger.info('TrustedAdvisor.have_ta is False; not polling TA')
             return {}
@@ -204,7 +331,6 @@ class TrustedAdvisor(Connectable):
             return {}
         check_id, metadata = tmp
         checks = self._get_refreshed_check_result(check_id)
-        region = self.ta_region or self.conn._client_config.region_name
         res = {}
         if checks['result'].get('status', '') == 'not_available':
             logger.warning(
@@ -238,9 +364,113 @@ class TrustedAdvisor(Connectable):
                                  'limit for %s - %s', data['Service'],
                                  data['Limit Name'])
             res[data['Service']][data['Limit Name']] = val
+        self._set_cached_limits(
+            region, check_id, metadata, checks['result'].get('timestamp'), res
+        )
         logger.info("Finished TrustedAdvisor poll")
         return res
 
+    @property
+    def _cache_filename(self):
+        """
+        Return the name of the results cache file for the current account.
+
+        :rtype: str
+        """
+        if self._account_id is None:
+            self._account_id = self._sts_conn.get_caller_identity()['Account']
+        return 'trustedadvisor_%s.json' % self._account_id
+
+    def _get_cached_limits(self, region):
+        """
+        Return the cached :py:meth:`~._poll` result for ``region``, if
+        caching is enabled and the check's current timestamp (from the
+        lightweight ``DescribeTrustedAdvisorCheckSummaries`` API) matches
+        the cached one. Otherwise return None.
+
+        If the summary call succeeds, the cached check ID and metadata are
+        reused even when the results are stale, so the
+        ``DescribeTrustedAdvisorChecks`` call can be skipped as well.
+
+        Cached results are not used when ``refresh_mode`` is "wait" or
+        "trigger", or when it is an integer and the cached results are older
+        than that many seconds, as those modes need to refresh the check.
+
+        :param region: region the results are for
+        :type region: str
+        :rtype: :py:obj:`dict` or :py:data:`None`
+        """
+        if not self.cache_results:
+            return None
+        if self.refresh_mode is not None and \
+                not isinstance(self.refresh_mode, type(1)):
+            return None
+        try:
+            data = _read_cache_file(self._cache_filename)
+            entry = data['regions'][region]
+            summary = self.conn.describe_trusted_advisor_check_summaries(
+                checkIds=[data['check_id']]
+            )['summaries'][0]
+        except Exception:
+            logger.debug('No usable Trusted Advisor results cache',
+                         exc_info=True)
+            return None
+        # the summary call succeeded, so the cached check ID is still valid
+        self._cached_check = (data['check_id'], data['metadata'])
+        if summary.get('timestamp') != entry['timestamp']:
+            logger.debug('Trusted Advisor check timestamp is %s; cached '
+                         'results are from %s', summary.get('timestamp'),
+                         entry['timestamp'])
+            return None
+        if isinstance(self.refresh_mode, type(1)):
+            cached_dt = parser.parse(entry['timestamp'])
+            if cached_dt < datetime.now(utc) - timedelta(
+                seconds=self.refresh_mode
+            ):
+                logger.debug('Cached Trusted Advisor results are older than '
+                             'refresh threshold of %d seconds',
+                             self.refresh_mode)
+                return None
+        logger.debug('Using cached Trusted Advisor results from %s',
+                     entry['timestamp'])
+        return entry['limits']
+
+    def _set_cached_limits(self, region, check_id, metadata, timestamp,
+                           limits):
+        """
+        Store a :py:meth:`~._poll` result in the on-disk cache, if caching is
+        enabled and the check result had a timestamp.
+
+        :param region: region the results are for
+        :type region: str
+        :param check_id: the Trusted Advisor check ID
+        :type check_id: str
+        :param metadata: the check's metadata column names
+        :type metadata: list
+        :param timestamp: the check result's ``timestamp`` string
+        :type timestamp: str
+        :param limits: the parsed results, as returned by :py:meth:`~._poll`
+        :type limits: dict
+        """
+        if not self.cache_results or timestamp is None:
+            return
+        try:
+            filename = self._cache_filename
+        except Exception:
+            logger.debug('Unable to determine account ID for Trusted Advisor '
+                         'results cache', exc_info=True)
+            return
+        with _cache_lock, _cache_file_lock(filename):
+            data = _read_cache_file(filename)
+            if not isinstance(data, dict) or \
+                    data.get('check_id') != check_id:
+                data = {'check_id': check_id, 'regions': {}}
+            data['metadata'] = metadata
+            data['regions'][region] = {
+                'timestamp': timestamp, 'limits': limits
+            }
+            _write_cache_file(filename, data)
+
     def _get_limit_check_id(self):
         """
         Query currently-available TA checks, return the check ID and metadata
@@ -333,6 +563,11 @@ class TrustedAdvisor(Connectable):
         Given a Trusted Advisor check_id that has just been refreshed, poll
         until the refresh is complete. Once complete, return the check result.
 
+        Polls start :py:attr:`~.poll_initial_interval` seconds apart and back
+        off exponentially (see :py:meth:`~._next_poll_delay`). The time taken
+        for the refresh to complete (or time out) is stored in
+        :py:attr:`~.refresh_latency`.
+
         :param check_id: the Trusted Advisor check ID
         :type check_id: str
         :returns: dict check result. The return value of
@@ -340,17 +575,29 @@ class TrustedAdvisor(Connectable):
         :rtype: dict
         """
         logger.warning('Polling for TA check %s refresh...', check_id)
+        start = datetime_now()
         if self.refresh_timeout is None:
             # no timeout...
-            cutoff = datetime_now() + timedelta(days=365)
+            cutoff = start + timedelta(days=365)
         else:
-            cutoff = datetime_now() + timedelta(seconds=self.refresh_timeout)
+            cutoff = start + timedelta(seconds=self.refresh_timeout)
+        if self._poll_cutoff is not None and self._poll_cutoff < cutoff:
+            # don't wait past the run deadline given to start_update_limits
+            cutoff = self._poll_cutoff
+        status = None
         last_status = None
-        while datetime_now() <= cutoff:
+        attempt = 0
+        while True:
+            now = datetime_now()
+            if now > cutoff:
+                logger.error('Timed out waiting for TA Check refresh; '
+                             'status=%s', status)
+                break
             logger.debug('Checking refresh status')
-            status = self.conn.describe_trusted_advisor_check_refresh_statuses(
+            refresh = self.conn.describe_trusted_advisor_check_refresh_statuses(
                 checkIds=[check_id]
-            )['statuses'][0]['status']
+            )['statuses'][0]
+            status = refresh['status']
             if status in ['success', 'abandoned']:
                 logger.info('Refresh status: %s; done polling', status)
                 break
@@ -361,16 +608,54 @@ class TrustedAdvisor(Connectable):
                                last_status, status)
                 break
             last_status = status
-            logger.info('Refresh status: %s; sleeping 30s', status)
-            sleep(30)
-        else:
-            logger.error('Timed out waiting for TA Check refresh; status=%s',
-                         status)
-        logger.info('Done polling for check refresh')
+            delay = self._next_poll_delay(
+                attempt, refresh.get('millisUntilNextRefreshable'),
+                (cutoff - now).total_seconds()
+            )
+            attempt += 1
+            logger.info('Refresh status: %s; sleeping %.1fs', status, delay)
+            sleep(delay)
+        self.refresh_latency = (datetime_now() - start).total_seconds()
+        logger.info('Done polling for check refresh after %.1f seconds',
+                    self.refresh_latency)
         result, last_dt = self._get_check_result(check_id)
         logger.debug('Check shows last refresh time of: %s', last_dt)
         return result
 
+    def _next_poll_delay(self, attempt, millis_until_refreshable, remaining):
+        """
+        Return the number of seconds to sleep before the next refresh status
+        poll. This is :py:attr:`~.poll_initial_interval` doubled for each
+        previous attempt, capped at :py:attr:`~.poll_max_interval`, with
+        "equal jitter" (a random delay between half and all of that). It is
+        shortened when Trusted Advisor reports that the check will be
+        refreshable again sooner (``millisUntilNextRefreshable``), though
+        never below :py:attr:`~.poll_initial_interval`, and never extends
+        past the refresh timeout.
+
+        :param attempt: number of polls already slept after (0-based)
+        :type attempt: int
+        :param millis_until_refreshable: the ``millisUntilNextRefreshable``
+          value from the last refresh status, if any
+        :type millis_until_refreshable: :py:obj:`int` or :py:data:`None`
+        :param remaining: seconds remaining until the refresh timeout
+        :type remaining: float
+        :return: seconds to sleep
+        :rtype: float
+        """
+        delay = min(
+            self.poll_max_interval,
+            self.poll_initial_interval * (2 ** min(attempt, 16))
+        )
+        delay = (delay / 2.0) + random.uniform(0, delay / 2.0)
+        if millis_until_refreshable is not None and \
+                millis_until_refreshable > 0:
+            # floor the hint, so a tiny value can't make us poll in a loop
+            delay = min(delay, max(
+                self.poll_initial_interval, millis_until_refreshable / 1000.0
+            ))
+        return max(0.0, min(delay, remaining))
+
     def _can_refresh_check(self, check_id):
         """
         Determine if the given check_id can be refreshed yet.
@@ -442,11 +727,11 @@ class TrustedAdvisor(Connectable):
         logger.debug("Updating TA limits on all services")
         for svc_name in sorted(ta_results.keys()):
             svc_results = ta_results[svc_name]
-            if svc_name not in self.ta_services:
+            svc_limits = self.limit_index.get_ta_service_limits(svc_name)
+            if svc_limits is None:
                 logger.info("TrustedAdvisor returned check results for "
                             "unknown service '%s'", svc_name)
                 continue
-            svc_limits = self.ta_services[svc_name]
             for lim_name in sorted(svc_results):
                 if lim_name not in svc_limits:
                     logger.info("TrustedAdvisor returned check results for "
@@ -461,23 +746,6 @@ class TrustedAdvisor(Connectable):
                     svc_limits[lim_name]._set_ta_limit(val)
         logger.info("Done updating TA limits on all services")
 
-    def _make_ta_service_dict(self):
-        """
-        Build our service and limits dict. This is laid out identical to
-        ``self.all_services``, but keys limits by their ``ta_service_name``
-        and ``ta_limit_name`` properties.
-
-        :return: dict of TA service names to TA limit names to AwsLimit objects.
-        """
-        res = {}
-        for svc_name in self.all_services:
-            svc_obj = self.all_services[svc_name]
-            for lim_name, lim in svc_obj.get_limits().items():
-                if lim.ta_service_name not in res:
-                    res[lim.ta_service_name] = {}
-                res[lim.ta_service_name][lim.ta_limit_name] = lim
-        return res
-
 
 def datetime_now():
     """
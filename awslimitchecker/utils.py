@@ -39,6 +39,10 @@ Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
 
 import argparse
 import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
 from copy import deepcopy
 import json
 import urllib3
@@ -46,6 +50,12 @@ import termcolor
 from awslimitchecker.version import _VERSION_TUP, _VERSION
 from typing import Optional
 
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # not available on Windows; cache updates are then only atomic, not locked
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -269,6 +279,256 @@ def _get_latest_version():
     return None
 
 
+def _cache_dir():
+    """
+    Return the directory that awslimitchecker uses for on-disk caches. This is
+    the ``AWSLIMITCHECKER_CACHE_DIR`` environment variable if set, otherwise
+    an ``awslimitchecker`` directory under ``XDG_CACHE_HOME`` (defaulting to
+    ``~/.cache``). The directory is not created.
+
+    :return: absolute path to the cache directory
+    :rtype: str
+    """
+    if os.environ.get('AWSLIMITCHECKER_CACHE_DIR'):
+        return os.path.abspath(os.environ['AWSLIMITCHECKER_CACHE_DIR'])
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.cache'
+    )
+    return os.path.join(os.path.abspath(base), 'awslimitchecker')
+
+
+def _read_cache_file(filename):
+    """
+    Return the JSON-decoded contents of ``filename`` in
+    :py:func:`~._cache_dir`, or None if it does not exist or cannot be read.
+
+    :param filename: name of the cache file
+    :type filename: str
+    :rtype: object
+    """
+    path = os.path.join(_cache_dir(), filename)
+    try:
+        with open(path, 'r') as fh:
+            return json.loads(fh.read())
+    except Exception:
+        logger.debug('Unable to read cache file %s', path, exc_info=True)
+    return None
+
+
+def _write_cache_file(filename, data):
+    """
+    Write ``data`` as JSON to ``filename`` in :py:func:`~._cache_dir`,
+    creating the directory if needed. The file is replaced atomically, so
+    concurrent readers never see a partial write. Errors are logged at debug
+    level and otherwise ignored, as the caches are only an optimization.
+
+    :param filename: name of the cache file
+    :type filename: str
+    :param data: JSON-serializable data to write
+    :type data: object
+    """
+    path = os.path.join(_cache_dir(), filename)
+    tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+    try:
+        if not os.path.exists(_cache_dir()):
+            os.makedirs(_cache_dir())
+        with open(tmp_path, 'w') as fh:
+            fh.write(json.dumps(data, sort_keys=True))
+        os.replace(tmp_path, path)
+    except Exception:
+        logger.debug('Unable to write cache file %s', path, exc_info=True)
+
+
+@contextmanager
+def _cache_file_lock(filename):
+    """
+    Context manager holding an exclusive advisory lock (``flock``) on a
+    ``.lock`` file next to ``filename`` in :py:func:`~._cache_dir`, so that
+    read-modify-write updates of a cache file from several processes do not
+    lose each other's changes. If the lock cannot be taken (or on platforms
+    without :py:mod:`fcntl`), the body runs unlocked; the write itself is
+    still atomic.
+
+    :param filename: name of the cache file to lock
+    :type filename: str
+    """
+    path = os.path.join(_cache_dir(), filename + '.lock')
+    fh = None
+    try:
+        if not os.path.exists(_cache_dir()):
+            os.makedirs(_cache_dir())
+        fh = open(path, 'a')
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+    except Exception:
+        logger.debug('Unable to lock cache file %s', path, exc_info=True)
+    try:
+        yield
+    finally:
+        if fh is not None:
+            # closing the file releases the lock
+            fh.close()
+
+
+class _LatestVersionCheck(object):
+
+    #: file name of the on-disk cache, under :py:func:`~._cache_dir`
+    cache_filename = 'latest_version.json'
+
+    def __init__(self, cache_interval=86400):
+        """
+        Check PyPI for a newer awslimitchecker release (via
+        :py:func:`~._get_latest_version`) in a background daemon thread, so
+        that the check never delays usage collection. The result is cached on
+        disk for ``cache_interval`` seconds, so only one run per interval has
+        to reach PyPI at all. Failed checks are cached too, so runners that
+        cannot reach PyPI do not retry on every invocation.
+
+        :param cache_interval: number of seconds to reuse a cached result
+          for; 0 disables the on-disk cache.
+        :type cache_interval: int
+        """
+        self.cache_interval = cache_interval
+        self.latest_version = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Use the cached result if it is still fresh; otherwise start the
+        background thread to query PyPI.
+        """
+        cached = self._read_cache()
+        if cached is not None:
+            logger.debug('Using cached latest version check result')
+            self.latest_version = cached['latest']
+            self._done.set()
+            return
+        self._thread = threading.Thread(
+            target=self._run, name='awslimitchecker-version-check'
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        """Background thread target; query PyPI and cache the result."""
+        try:
+            self.latest_version = _get_latest_version()
+            self._write_cache()
+        finally:
+            self._done.set()
+
+    def result(self, timeout=0):
+        """
+        Return whether the check has finished (waiting up to ``timeout``
+        seconds for it) and, if so, the newer version found, if any.
+
+        :param timeout: number of seconds to wait for the check to finish
+        :type timeout: float
+        :return: 2-tuple of (finished, newer version string or None)
+        :rtype: tuple
+        """
+        finished = self._done.wait(timeout)
+        if not finished:
+            return False, None
+        return True, self.latest_version
+
+    def _read_cache(self):
+        """
+        Return the cached result dict if it exists, was written by this
+        version of awslimitchecker and is younger than ``cache_interval``;
+        otherwise return None.
+
+        :rtype: :py:obj:`dict` or :py:data:`None`
+        """
+        if self.cache_interval <= 0:
+            return None
+        data = _read_cache_file(self.cache_filename)
+        try:
+            if data['running'] != _VERSION:
+                return None
+            if time.time() - data['checked'] >= self.cache_interval:
+                return None
+            return data
+        except (KeyError, TypeError):
+            return None
+
+    def _write_cache(self):
+        """Write the current result to the on-disk cache, if enabled."""
+        if self.cache_interval <= 0:
+            return
+        _write_cache_file(self.cache_filename, {
+            'checked': time.time(),
+            'running': _VERSION,
+            'latest': self.latest_version
+        })
+
+
+#: lock serializing read-modify-write updates of the durations history
+#: between threads; :py:func:`~._cache_file_lock` covers other processes
+_history_lock = threading.Lock()
+
+
+class _DurationHistory(object):
+
+    #: file name of the on-disk history, under :py:func:`~._cache_dir`
+    cache_filename = 'service_durations.json'
+
+    def __init__(self, key, weight=0.5):
+        """
+        Small on-disk history of how long each service took to collect
+        usage, kept per ``key`` (account and region) as an exponentially
+        weighted moving average of the recorded durations. As with the
+        other caches, errors reading or writing the file are ignored.
+
+        :param key: key of the account and region the durations are for
+        :type key: str
+        :param weight: weight of newly recorded durations, from 0 to 1
+        :type weight: float
+        """
+        self.key = key
+        self.weight = weight
+
+    def get(self):
+        """
+        Return the recorded durations for this key.
+
+        :returns: dict of service name to seconds
+        :rtype: dict
+        """
+        data = _read_cache_file(self.cache_filename)
+        if not isinstance(data, dict) or \
+                not isinstance(data.get(self.key), dict):
+            return {}
+        return data[self.key]
+
+    def update(self, durations):
+        """
+        Blend ``durations`` into the history for this key and write it to
+        disk. The file is re-read and updated under a lock, so concurrent
+        updates from other threads and processes are merged, not lost.
+
+        :param durations: dict of service name to seconds
+        :type durations: dict
+        """
+        if len(durations) == 0:
+            return
+        with _history_lock, _cache_file_lock(self.cache_filename):
+            data = _read_cache_file(self.cache_filename)
+            if not isinstance(data, dict):
+                data = {}
+            history = data.get(self.key)
+            if not isinstance(history, dict):
+                history = {}
+            for svc, secs in durations.items():
+                if svc in history:
+                    secs = self.weight * secs + \
+                        (1 - self.weight) * history[svc]
+                history[svc] = round(secs, 3)
+            data[self.key] = history
+            _write_cache_file(self.cache_filename, data)
+
+
 def color_output(s, color, colorize=True):
     if not colorize:
         return s
@@ -0,0 +1,344 @@
+"""
+awslimitchecker/workqueue.py
+
+The latest version of this package is available at:
+<https://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS meta ('
+    'id INTEGER PRIMARY KEY CHECK (id = 1), run_id TEXT, '
+    'lease_seconds REAL, max_attempts INTEGER, data TEXT)',
+    'CREATE TABLE IF NOT EXISTS items ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, run_id TEXT, account_id TEXT, '
+    'region TEXT, service TEXT, state TEXT, attempts INTEGER DEFAULT 0, '
+    'owner TEXT, lease_expires REAL, duration REAL, result TEXT, error TEXT)',
+    'CREATE INDEX IF NOT EXISTS items_state ON items (state, id)'
+]
+
+
+class WorkQueue(object):
+
+    def __init__(self, path, timeout=60):
+        """
+        Durable queue of (account ID, region, service name) work items in a
+        SQLite database file, shared by a coordinator and any number of
+        worker processes, on one or more hosts.
+
+        Workers :py:meth:`~.lease` one pending item at a time. A lease lasts
+        ``lease_seconds`` (set by :py:meth:`~.start_run`). Items whose worker
+        fails are retried, as are items whose lease expires before
+        :py:meth:`~.complete` or :py:meth:`~.fail` is called, such as when a
+        worker dies. In both cases the item is marked failed after
+        ``max_attempts`` attempts. Each item's state is one of ``pending``,
+        ``leased``, ``done`` or ``failed``.
+
+        Lease expiry uses the clock of each host, so the hosts' clocks must
+        be roughly in sync. On network storage, the file system must
+        support the locking SQLite relies on.
+
+        :param path: path to the SQLite database file; created if needed
+        :type path: str
+        :param timeout: seconds to wait for another process's lock on the
+          database before giving up
+        :type timeout: float
+        """
+        self.path = path
+        self._conn = sqlite3.connect(
+            path, timeout=timeout, isolation_level=None
+        )
+        for stmt in _SCHEMA:
+            self._conn.execute(stmt)
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        self._conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Context manager for a write transaction, yielding a cursor. The
+        database is locked for writing for the whole transaction, so that
+        reading and updating an item is atomic across processes.
+        """
+        cur = self._conn.cursor()
+        cur.execute('BEGIN IMMEDIATE')
+        try:
+            yield cur
+        except Exception:
+            cur.execute('ROLLBACK')
+            raise
+        cur.execute('COMMIT')
+
+    def start_run(self, units, data, lease_seconds=900, max_attempts=3):
+        """
+        Start a new run: discard all items of any previous run and enqueue
+        ``units`` as pending items.
+
+        :param units: (account ID, region, service name) work units
+        :type units: list
+        :param data: JSON-serializable run settings for the workers; see
+          :py:meth:`~.get_run_data`
+        :type data: dict
+        :param lease_seconds: how long a worker may work on an item before it
+          is given to another worker
+        :type lease_seconds: float
+        :param max_attempts: how many times an item is attempted before it is
+          marked failed
+        :type max_attempts: int
+        :returns: the new run ID
+        :rtype: str
+        :raises: :py:exc:`ValueError` if ``max_attempts`` is less than 1
+        """
+        if max_attempts < 1:
+            raise ValueError('max_attempts must be at least 1')
+        run_id = uuid.uuid4().hex
+        with self._transaction() as cur:
+            cur.execute('DELETE FROM items')
+            cur.execute(
+                'INSERT OR REPLACE INTO meta (id, run_id, lease_seconds, '
+                'max_attempts, data) VALUES (1, ?, ?, ?, ?)',
+                (run_id, lease_seconds, max_attempts, json.dumps(data))
+            )
+            cur.executemany(
+                'INSERT INTO items (run_id, account_id, region, service, '
+                'state) VALUES (?, ?, ?, ?, \'pending\')',
+                [(run_id, a, r, s) for a, r, s in units]
+            )
+        logger.info('Started work queue run %s with %d item(s)', run_id,
+                    len(units))
+        return run_id
+
+    def get_run_data(self):
+        """
+        Return the run ID and run settings given to :py:meth:`~.start_run`.
+
+        :returns: 2-tuple of (run ID, settings dict), or (None, None) if no
+          run has been started
+        :rtype: tuple
+        """
+        row = self._conn.execute(
+            'SELECT run_id, data FROM meta WHERE id = 1'
+        ).fetchone()
+        if row is None:
+            return None, None
+        return row[0], json.loads(row[1])
+
+    def _reap(self, cur, max_attempts):
+        """
+        Return the items with expired leases to pending, or mark them failed
+        if they have had ``max_attempts`` attempts.
+
+        :param cur: cursor in a write transaction
+        :type cur: :py:class:`sqlite3.Cursor`
+        :param max_attempts: maximum number of attempts per item
+        :type max_attempts: int
+        :returns: number of expired leases
+        :rtype: int
+        """
+        cur.execute(
+            'UPDATE items SET owner = NULL, lease_expires = NULL, '
+            'error = CASE WHEN attempts >= ? THEN \'Lease expired after \' '
+            '|| attempts || \' attempt(s)\' ELSE error END, '
+            'state = CASE WHEN attempts >= ? THEN \'failed\' '
+            'ELSE \'pending\' END '
+            'WHERE state = \'leased\' AND lease_expires < ?',
+            (max_attempts, max_attempts, time.time())
+        )
+        if cur.rowcount > 0:
+            logger.warning('Reclaimed %d work item(s) with expired leases',
+                           cur.rowcount)
+        return cur.rowcount
+
+    def reap(self):
+        """
+        Reclaim items whose leases have expired; see :py:meth:`~._reap`.
+
+        :returns: number of expired leases
+        :rtype: int
+        """
+        with self._transaction() as cur:
+            row = cur.execute(
+                'SELECT max_attempts FROM meta WHERE id = 1'
+            ).fetchone()
+            if row is None:
+                return 0
+            return self._reap(cur, row[0])
+
+    def lease(self, owner):
+        """
+        Lease the oldest pending item to ``owner``, reclaiming expired leases
+        first.
+
+        :param owner: unique name of the worker
+        :type owner: str
+        :returns: the item, as a dict with ``id``, ``run_id``,
+          ``account_id``, ``region``, ``service`` and ``attempts`` keys, or
+          None if no item is pending
+        :rtype: :py:obj:`dict` or :py:data:`None`
+        """
+        with self._transaction() as cur:
+            meta = cur.execute(
+                'SELECT lease_seconds, max_attempts FROM meta WHERE id = 1'
+            ).fetchone()
+            if meta is None:
+                return None
+            self._reap(cur, meta[1])
+            row = cur.execute(
+                'SELECT id, run_id, account_id, region, service, attempts '
+                'FROM items WHERE state = \'pending\' ORDER BY id LIMIT 1'
+            ).fetchone()
+            if row is None:
+                return None
+            cur.execute(
+                'UPDATE items SET state = \'leased\', owner = ?, '
+                'attempts = attempts + 1, lease_expires = ? WHERE id = ?',
+                (owner, time.time() + meta[0], row[0])
+            )
+        return {
+            'id': row[0], 'run_id': row[1], 'account_id': row[2],
+            'region': row[3], 'service': row[4], 'attempts': row[5] + 1
+        }
+
+    def complete(self, item_id, owner, result, duration):
+        """
+        Record the result of a leased item. This is ignored if ``owner`` no
+        longer holds the item's lease, such as when it expired and the item
+        was given to another worker.
+
+        :param item_id: ID of the item
+        :type item_id: int
+        :param owner: unique name of the worker
+        :type owner: str
+        :param result: JSON-serializable result
+        :type result: object
+        :param duration: seconds taken to work on the item
+        :type duration: float
+        :returns: whether the result was recorded
+        :rtype: bool
+        """
+        with self._transaction() as cur:
+            cur.execute(
+                'UPDATE items SET state = \'done\', result = ?, duration = ?, '
+                'error = NULL, owner = NULL, lease_expires = NULL '
+                'WHERE id = ? AND owner = ? AND state = \'leased\'',
+                (json.dumps(result), duration, item_id, owner)
+            )
+            return cur.rowcount == 1
+
+    def fail(self, item_id, owner, error):
+        """
+        Record that working on a leased item failed. The item is returned to
+        pending for another attempt, unless it has had ``max_attempts``
+        attempts, in which case it is marked failed. This is ignored if
+        ``owner`` no longer holds the item's lease.
+
+        :param item_id: ID of the item
+        :type item_id: int
+        :param owner: unique name of the worker
+        :type owner: str
+        :param error: description of the error
+        :type error: str
+        :returns: whether the failure was recorded
+        :rtype: bool
+        """
+        with self._transaction() as cur:
+            cur.execute(
+                'UPDATE items SET owner = NULL, lease_expires = NULL, '
+                'error = ?, state = CASE WHEN attempts >= '
+                '(SELECT max_attempts FROM meta WHERE id = 1) '
+                'THEN \'failed\' ELSE \'pending\' END '
+                'WHERE id = ? AND owner = ? AND state = \'leased\'',
+                (error, item_id, owner)
+            )
+            return cur.rowcount == 1
+
+    def counts(self):
+        """
+        Return the number of items in each state.
+
+        :returns: dict of state to count
+        :rtype: dict
+        """
+        res = dict((x, 0) for x in ('pending', 'leased', 'done', 'failed'))
+        for state, count in self._conn.execute(
+            'SELECT state, COUNT(*) FROM items GROUP BY state'
+        ):
+            res[state] = count
+        return res
+
+    def is_finished(self):
+        """
+        Return whether every item is done or failed.
+
+        :rtype: bool
+        """
+        counts = self.counts()
+        return counts['pending'] == 0 and counts['leased'] == 0
+
+    def finished_items(self):
+        """
+        Return all items that are done or failed, in the order they were
+        enqueued.
+
+        :returns: list of dicts with ``account_id``, ``region``, ``service``,
+          ``state``, ``duration``, ``result`` (JSON-decoded, or None) and
+          ``error`` keys
+        :rtype: list
+        """
+        res = []
+        for row in self._conn.execute(
+            'SELECT account_id, region, service, state, duration, result, '
+            'error FROM items WHERE state IN (\'done\', \'failed\') '
+            'ORDER BY id'
+        ):
+            res.append({
+                'account_id': row[0], 'region': row[1], 'service': row[2],
+                'state': row[3], 'duration': row[4],
+                'result': None if row[5] is None else json.loads(row[5]),
+                'error': row[6]
+            })
+        return res
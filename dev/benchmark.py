@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""
+Development script to benchmark awslimitchecker internals with synthetic
+limits and usage; no AWS credentials or API calls are needed.
+
+The latest version of this package is available at:
+<http://github.com/jantman/awslimitchecker>
+
+##############################################################################
+Copyright 2015-2019 Jason Antman <jason@jasonantman.com>
+
+    This file is part of awslimitchecker, also known as awslimitchecker.
+
+    awslimitchecker is free software: you can redistribute it and/or modify
+    it under the terms of the GNU Affero General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    awslimitchecker is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU Affero General Public License for more details.
+
+    You should have received a copy of the GNU Affero General Public License
+    along with awslimitchecker.  If not, see <http://www.gnu.org/licenses/>.
+
+The Copyright and Authors attributions contained herein may not be removed or
+otherwise altered, except to add the Author attribution of a contributor to
+this work. (Additional Terms pursuant to Section 7b of the AGPL v3)
+##############################################################################
+While not legally required, I sincerely request that anyone who finds
+bugs please submit them at <https://github.com/jantman/awslimitchecker> or
+to me via email, and that you send any contributions or improvements
+either as a pull request on GitHub, or to me via email.
+##############################################################################
+
+AUTHORS:
+Jason Antman <jason@jasonantman.com> <http://www.jasonantman.com>
+##############################################################################
+"""
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+import random
+
+from awslimitchecker.checker import AwsLimitChecker
+from awslimitchecker.limit import AwsLimit
+from awslimitchecker.thresholds import ColumnarThresholds, _import_numpy
+
+
+class FakeService(object):
+    """Stand-in for an :py:class:`~._AwsService`; limits only need a name."""
+
+    service_name = 'Benchmark'
+    quotas_service_code = None
+
+
+def make_limits(num_limits, usages_per_limit, seed=0):
+    """
+    Build ``num_limits`` limits, each with ``usages_per_limit`` per-resource
+    usages, some of which cross their warning or critical thresholds.
+    """
+    rnd = random.Random(seed)
+    svc = FakeService()
+    limits = []
+    for i in range(num_limits):
+        lim = AwsLimit('Limit %d' % i, svc, 100, 80, 99)
+        for j in range(usages_per_limit):
+            lim._add_current_usage(
+                rnd.randint(0, 100), resource_id='res-%d-%d' % (i, j)
+            )
+        limits.append(lim)
+    return limits
+
+
+def timed(func, limits, repeat):
+    """Return the best wall-clock time of ``repeat`` calls of func(limits)."""
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func(limits)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def scalar_thresholds(limits):
+    return [lim.check_thresholds() for lim in limits]
+
+
+def array_thresholds(limits):
+    return ColumnarThresholds(limits, use_numpy=False).evaluate()
+
+
+def numpy_thresholds(limits):
+    return ColumnarThresholds(limits, use_numpy=True).evaluate()
+
+
+def bench_thresholds(args):
+    """Compare per-limit and columnar threshold evaluation."""
+    limits = make_limits(args.limits, args.usages)
+    print('Threshold evaluation: %d limits x %d usages (best of %d)' % (
+        args.limits, args.usages, args.repeat
+    ))
+    impls = [('AwsLimit.check_thresholds', scalar_thresholds),
+             ('ColumnarThresholds (array)', array_thresholds)]
+    if _import_numpy() is not None:
+        impls.append(('ColumnarThresholds (numpy)', numpy_thresholds))
+    else:
+        print('numpy is not installed; skipping the numpy engine')
+    baseline = None
+    for name, func in impls:
+        elapsed = timed(func, limits, args.repeat)
+        if baseline is None:
+            baseline = elapsed
+        print('%-30s %10.4fs %8.2fx' % (name, elapsed, baseline / elapsed))
+
+
+def cached_limits(limits):
+    for lim in limits:
+        lim.get_limit()
+        lim.get_limit_source()
+
+
+def uncached_limits(limits):
+    # get_limit() and get_limit_source() each walked the precedence chain
+    for lim in limits:
+        lim._resolve_limit()
+        lim._resolve_limit()
+
+
+def bench_limits(args):
+    """Time effective limit lookups for every limit of every service."""
+    checker = AwsLimitChecker(region='us-east-1', check_version=False)
+    limits = [
+        lim
+        for svc_limits in checker.get_limits(
+            use_ta=False, use_api=False
+        ).values()
+        for lim in svc_limits.values()
+    ]
+    # look each limit up once per usage, as check_thresholds did
+    limits = limits * args.usages
+    print('Effective limit lookups: %d services, %d limits x %d (best of '
+          '%d)' % (len(checker.services), len(limits) // args.usages,
+                   args.usages, args.repeat))
+    baseline = None
+    for name, func in [('uncached (_resolve_limit)', uncached_limits),
+                       ('cached (get_limit)', cached_limits)]:
+        elapsed = timed(func, limits, args.repeat)
+        if baseline is None:
+            baseline = elapsed
+        print('%-30s %10.4fs %8.2fx' % (name, elapsed, baseline / elapsed))
+
+
+class DictUsage(object):
+    """
+    The pre-``__slots__`` layout of :py:class:`~.AwsLimitUsage` (a plain
+    object with a ``__dict__``), used as the memory baseline.
+    """
+
+    def __init__(self, limit, value, maximum=None, resource_id=None,
+                 aws_type=None):
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+        self.resource_id = resource_id
+        self.aws_type = aws_type
+
+
+def make_dict_usage(limit, rows):
+    for value, maximum, resource_id, aws_type in rows:
+        limit._current_usage.append(
+            DictUsage(limit, value, maximum, resource_id, aws_type)
+        )
+
+
+def make_slots_usage(limit, rows):
+    for value, maximum, resource_id, aws_type in rows:
+        limit._add_current_usage(
+            value, maximum=maximum, resource_id=resource_id,
+            aws_type=aws_type
+        )
+
+
+def bench_memory(args):
+    """Compare the memory used by usage objects and the compact store."""
+    rnd = random.Random(0)
+    rows = [
+        (
+            rnd.randint(0, 100), rnd.choice([None, 60, 120]),
+            'sg-%017x' % rnd.getrandbits(68),
+            # build a new string each time, as parsed API responses do
+            ''.join(['AWS::EC2::', 'SecurityGroup'])
+        )
+        for _ in range(args.limits * args.usages)
+    ]
+    print('Usage memory: %d limits x %d usages (tracemalloc)' % (
+        args.limits, args.usages
+    ))
+    impls = [
+        ('AwsLimitUsage (no __slots__)', {}, make_dict_usage),
+        ('AwsLimitUsage (__slots__)', {}, make_slots_usage),
+        ('CompactUsageStore', {'compact_usage': True}, make_slots_usage),
+        ('TopUsageStore (retain_top=10)', {'retain_top': 10},
+         make_slots_usage),
+    ]
+    svc = FakeService()
+    baseline = None
+    for name, kwargs, func in impls:
+        limits = [
+            AwsLimit('Limit %d' % i, svc, 100, 80, 99, **kwargs)
+            for i in range(args.limits)
+        ]
+        gc.collect()
+        tracemalloc.start()
+        for i, lim in enumerate(limits):
+            func(lim, rows[i * args.usages:(i + 1) * args.usages])
+        size, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if baseline is None:
+            baseline = size
+        print('%-30s %8.2f MiB %8.2fx' % (
+            name, size / 1048576.0, baseline / float(size)
+        ))
+        del limits
+
+
+BENCHMARKS = {
+    'limits': bench_limits,
+    'memory': bench_memory,
+    'thresholds': bench_thresholds,
+}
+
+
+def parse_args(argv):
+    p = argparse.ArgumentParser(description='Benchmark awslimitchecker '
+                                            'internals')
+    p.add_argument('-r', '--repeat', dest='repeat', type=int, default=5,
+                   help='number of times to run each benchmark (default: 5)')
+    p.add_argument('-n', '--limits', dest='limits', type=int, default=200,
+                   help='number of limits to create (default: 200)')
+    p.add_argument('-u', '--usages', dest='usages', type=int, default=500,
+                   help='number of usages per limit (default: 500)')
+    p.add_argument('benchmark', nargs='*',
+                   help='benchmarks to run; one or more of: %s (default: all)'
+                   '' % ', '.join(sorted(BENCHMARKS.keys())))
+    args = p.parse_args(argv)
+    for name in args.benchmark:
+        if name not in BENCHMARKS:
+            p.error('unknown benchmark: %s' % name)
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    for name in args.benchmark or sorted(BENCHMARKS.keys()):
+        BENCHMARKS[name](args)
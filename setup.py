@@ -76,9 +76,11 @@ setup(
     author='Jason Antman',
     author_email='jason@jasonantman.com',
     packages=find_packages(),
+    package_data={'awslimitchecker': ['catalog.json']},
     entry_points="""
     [console_scripts]
     awslimitchecker = awslimitchecker.runner:console_entry_point
+    awslimitchecker-accounts = awslimitchecker.multiaccount:console_entry_point
     """,
     url=_PROJECT_URL,
     description='A script and python module to check your AWS service limits and usage, and warn when usage approaches limits.',